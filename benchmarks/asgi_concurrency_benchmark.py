@@ -0,0 +1,181 @@
+"""
+Compares the throughput of one sync, one threaded and one ASGI worker on an I/O-bound endpoint,
+GET /user asks the profile to a local stand-in auth server that answers after AUTH_LATENCY seconds
+
+Run from the root of the repo:
+    python -m benchmarks.asgi_concurrency_benchmark
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+from create_application import create_application_with_controller
+from src.asgi_adapter import AsgiAdapter
+from src.controller import Controller
+from src.services.auth_server import AuthServer
+from src.services.media_server import MediaServer
+from src.database.videos.video_ram_database import RamVideoDatabase
+from src.database.friends.ram_friend_database import RamFriendDatabase
+from src.database.statistics.ram_statistics_database import RamStatisticsDatabase
+from src.events.local_event_bus import LocalEventBus
+from src.register_api_call_decorator import set_statistics_database
+
+AUTH_LATENCY = 0.1
+SYNC_REQUESTS = 30
+THREADED_REQUESTS = 320
+THREADS = 16
+ASGI_REQUESTS = 1000
+ASGI_CONCURRENCY = [50, 200]
+
+
+class StandInAuthServer(BaseHTTPRequestHandler):
+    """
+    Answers like the auth server after some latency
+    """
+
+    def answer(self, body: Dict):
+        time.sleep(AUTH_LATENCY)
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.answer({"api_key": "benchmark"})
+
+    def do_GET(self):
+        self.answer({"email": "benchmark@chotuve.com", "fullname": "Benchmark", "phone_number": "1111",
+                     "photo": None, "admin": False})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stand_in_server() -> ThreadingHTTPServer:
+    """
+    Starts the stand-in auth server in a thread
+
+    :return: the server
+    """
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInAuthServer)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def benchmark_sync(app) -> float:
+    """
+    Measures the requests per second of a sync worker, that handles one request at a time
+
+    :param app: the flask app
+    :return: the requests per second
+    """
+    with app.test_client() as c:
+        start = time.perf_counter()
+        for _ in range(SYNC_REQUESTS):
+            assert c.get('/user', query_string={"email": "benchmark@chotuve.com"}).status_code == 200
+        return SYNC_REQUESTS / (time.perf_counter() - start)
+
+
+def benchmark_threads(app, threads: int) -> float:
+    """
+    Measures the requests per second of a threaded worker (gunicorn's gthread)
+
+    :param app: the flask app
+    :param threads: the amount of threads of the worker
+    :return: the requests per second
+    """
+    def get(_):
+        with app.test_client() as c:
+            return c.get('/user', query_string={"email": "benchmark@chotuve.com"}).status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        assert set(executor.map(get, range(THREADED_REQUESTS))) == {200}
+    return THREADED_REQUESTS / (time.perf_counter() - start)
+
+
+async def asgi_get(app: AsgiAdapter, path: str, query_string: bytes) -> int:
+    """
+    Does a GET request to an ASGI app like an ASGI server would
+
+    :param app: the ASGI app
+    :param path: the path of the request
+    :param query_string: the query string of the request
+    :return: the status of the response
+    """
+    scope = {"type": "http", "http_version": "1.1", "method": "GET", "scheme": "http", "path": path,
+             "query_string": query_string, "headers": [(b"host", b"localhost")]}
+    received = asyncio.get_event_loop().create_future()
+    messages = [{"type": "http.request", "body": b"", "more_body": False}]
+    status = {}
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await received
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["status"] = message["status"]
+        elif not message.get("more_body"):
+            received.set_result(None)
+
+    await app(scope, receive, send)
+    return status["status"]
+
+
+def benchmark_asgi(app: AsgiAdapter, concurrency: int) -> float:
+    """
+    Measures the requests per second of an ASGI worker
+
+    :param app: the ASGI app
+    :param concurrency: the amount of requests in flight at the same time
+    :return: the requests per second
+    """
+    async def client(requests: int):
+        for _ in range(requests):
+            assert await asgi_get(app, "/user", b"email=benchmark%40chotuve.com") == 200
+
+    async def run():
+        await asyncio.gather(*[client(ASGI_REQUESTS // concurrency) for _ in range(concurrency)])
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    return (ASGI_REQUESTS // concurrency) * concurrency / (time.perf_counter() - start)
+
+
+def main():
+    logging.disable(logging.INFO)
+    server = start_stand_in_server()
+    os.environ["BENCHMARK_AUTH_URL"] = "http://127.0.0.1:%d" % server.server_address[1]
+    os.environ["BENCHMARK_MEDIA_URL"] = "http://127.0.0.1:%d" % server.server_address[1]
+    statistics_database = RamStatisticsDatabase()
+    set_statistics_database(statistics_database)
+    # GET /user sends no notifications
+    controller = Controller(AuthServer("BENCHMARK_AUTH_URL", "BENCHMARK_SECRET", "BENCHMARK_ALIAS",
+                                       "BENCHMARK_HEALTH"),
+                            MediaServer("BENCHMARK_MEDIA_URL"), RamVideoDatabase(), RamFriendDatabase(),
+                            statistics_database, None, LocalEventBus())
+    app = create_application_with_controller(controller)
+    print("Auth server latency: %.0f ms" % (1000 * AUTH_LATENCY))
+    print("Sync worker: %.1f requests/s" % benchmark_sync(app))
+    print("Threaded worker, %d threads: %.1f requests/s" % (THREADS, benchmark_threads(app, THREADS)))
+    for concurrency in ASGI_CONCURRENCY:
+        print("ASGI worker, %d threads, %d concurrent requests: %.1f requests/s" %
+              (concurrency, concurrency, benchmark_asgi(AsgiAdapter(app, concurrency), concurrency)))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
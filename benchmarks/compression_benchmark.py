@@ -0,0 +1,108 @@
+"""
+Compares the size and the cpu time of the responses of the listing endpoints
+without compression, with gzip and with brotli (if installed)
+
+Run from the root of the repo:
+    python -m benchmarks.compression_benchmark
+"""
+import logging
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+from benchmarks import asgi_concurrency_benchmark
+from benchmarks.asgi_concurrency_benchmark import start_stand_in_server
+from create_application import create_application_with_controller
+from src import response_compression
+from src.controller import Controller
+from src.services.auth_server import AuthServer
+from src.services.media_server import MediaServer
+from src.database.videos.video_database import VideoData
+from src.database.videos.video_ram_database import RamVideoDatabase
+from src.database.friends.ram_friend_database import RamFriendDatabase
+from src.database.statistics.ram_statistics_database import RamStatisticsDatabase
+from src.events.local_event_bus import LocalEventBus
+from src.register_api_call_decorator import set_statistics_database
+
+USERS = 20
+VIDEOS_PER_USER = 10
+COMMENTS = 500
+ROUNDS = 20
+WORDS = ["video", "gatito", "perro", "jugando", "futbol", "partido", "receta", "torta", "chocolate",
+         "tutorial", "python", "viaje", "bariloche", "playa", "musica", "rock", "nacional", "clase"]
+ENDPOINTS = [("/videos/top", {}),
+             ("/videos/search", {"query": "video gatito"}),
+             ("/user/videos", {"email": "user0@chotuve.com"}),
+             ("/videos/comments", {"other_user_email": "user0@chotuve.com", "video_title": "Video 0"})]
+
+
+def fill_video_database(video_database: RamVideoDatabase):
+    """
+    Adds videos with long descriptions and comments
+
+    :param video_database: the database
+    """
+    rand = random.Random(0)
+    for user in range(USERS):
+        for video in range(VIDEOS_PER_USER):
+            description = " ".join(rand.choice(WORDS) for _ in range(rand.randint(20, 80)))
+            video_database.add_video("user%d@chotuve.com" % user,
+                                     VideoData(title="Video %d" % video, location="Buenos Aires",
+                                               creation_time=datetime.now() - timedelta(minutes=video),
+                                               file_location="https://firebasestorage.googleapis.com/v0/b/"
+                                                             "chotuve/o/user%d_video%d.mp4" % (user, video),
+                                               visible=True, description=description))
+    for comment in range(COMMENTS):
+        video_database.comment_video("user%d@chotuve.com" % rand.randrange(USERS), "user0@chotuve.com", "Video 0",
+                                     " ".join(rand.choice(WORDS) for _ in range(rand.randint(3, 30))))
+
+
+def measure(body: bytes, encoding: str) -> Tuple[int, float]:
+    """
+    Compresses a body several times
+
+    :param body: the body
+    :param encoding: the encoding
+    :return: the compressed size and the mean milliseconds to compress it
+    """
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        compressed = response_compression.compress(body, encoding)
+    return len(compressed), 1000 * (time.perf_counter() - start) / ROUNDS
+
+
+def main():
+    logging.disable(logging.INFO)
+    asgi_concurrency_benchmark.AUTH_LATENCY = 0
+    server = start_stand_in_server()
+    os.environ["BENCHMARK_AUTH_URL"] = "http://127.0.0.1:%d" % server.server_address[1]
+    os.environ["BENCHMARK_MEDIA_URL"] = "http://127.0.0.1:%d" % server.server_address[1]
+    statistics_database = RamStatisticsDatabase()
+    set_statistics_database(statistics_database)
+    video_database = RamVideoDatabase()
+    fill_video_database(video_database)
+    controller = Controller(AuthServer("BENCHMARK_AUTH_URL", "BENCHMARK_SECRET", "BENCHMARK_ALIAS",
+                                       "BENCHMARK_HEALTH"),
+                            MediaServer("BENCHMARK_MEDIA_URL"), video_database, RamFriendDatabase(),
+                            statistics_database, None, LocalEventBus())
+    app = create_application_with_controller(controller)
+    encodings = response_compression.available_encodings()
+    with app.test_client() as c:
+        for path, query_string in ENDPOINTS:
+            response = c.get(path, query_string=query_string, headers={"Authorization": "Bearer benchmark"})
+            assert response.status_code == 200
+            body = response.get_data()
+            results: List[str] = []
+            for encoding in encodings:
+                size, milliseconds = measure(body, encoding)
+                results.append("%s %.1f KB (%.0f%%) in %.2f ms" % (encoding, size / 1024, 100 * size / len(body),
+                                                                   milliseconds))
+            print("%s: %.1f KB, %s" % (path, len(body) / 1024, ", ".join(results)))
+    if not response_compression.brotli:
+        print("brotli is not installed")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
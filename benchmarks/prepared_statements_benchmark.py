@@ -0,0 +1,73 @@
+"""
+Compares the latency of the hot queries run as plain queries and as prepared statements,
+the difference is mostly the planning time saved by the prepared ones
+
+Needs the chotuve schema and the POSTGRES_HOST, POSTGRES_USER, POSTGRES_PASSWORD
+and POSTGRES_DATABASE environment variables, run from the root of the repo:
+    python -m benchmarks.prepared_statements_benchmark
+"""
+import time
+from typing import Tuple
+from src.database.friends.postgres_friend_database import PostgresFriendDatabase
+from src.database.videos.postgres_video_database import PostgresVideoDatabase
+from src.database.utils.postgres_connection import PostgresUtils, PreparedQuery
+
+ROUNDS = 2000
+USER_EMAIL = "benchmark@chotuve.com"
+OTHER_EMAIL = "other_benchmark@chotuve.com"
+ENV_NAMES = ["POSTGRES_HOST", "POSTGRES_USER", "POSTGRES_PASSWORD", "POSTGRES_DATABASE"]
+
+
+def benchmark_query(conn, query: PreparedQuery, params: Tuple, prepared: bool) -> float:
+    """
+    Measures the mean latency of a query
+
+    :param conn: the postgres connection
+    :param query: the query to run
+    :param params: the params of the query
+    :param prepared: whether to run it as a prepared statement
+    :return: the mean latency in milliseconds
+    """
+    cursor = conn.cursor()
+
+    def run():
+        if prepared:
+            PostgresUtils.execute_prepared(conn, cursor, query, params)
+        else:
+            cursor.execute(query.query, params)
+        cursor.fetchall()
+
+    run()
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        run()
+    elapsed = time.perf_counter() - start
+    conn.rollback()
+    cursor.close()
+    return 1000 * elapsed / ROUNDS
+
+
+def main():
+    video_database = PostgresVideoDatabase("chotuve.videos", "chotuve.users", "chotuve.video_reactions",
+                                           "chotuve.video_comments", "chotuve.resource_versions", *ENV_NAMES)
+    friend_database = PostgresFriendDatabase("chotuve.friends", "chotuve.friend_requests", "chotuve.user_messages",
+                                             "chotuve.users", "chotuve.deleted_conversations",
+                                             "chotuve.conversations", "chotuve.conversation_sequences",
+                                             "chotuve.resource_versions", *ENV_NAMES)
+    cases = [(friend_database, "check_friends", (OTHER_EMAIL, USER_EMAIL)),
+             (friend_database, "all_friends", (USER_EMAIL, USER_EMAIL)),
+             (friend_database, "friend_request", (USER_EMAIL,)),
+             (friend_database, "get_conversations", (USER_EMAIL,)),
+             (video_database, "list_user_videos", (USER_EMAIL,)),
+             (video_database, "reaction_search", (USER_EMAIL, OTHER_EMAIL, "video")),
+             (video_database, "get_videos_page", (21,))]
+    for database, name, params in cases:
+        query = database.queries[name]
+        plain = benchmark_query(database.conn, query, params, prepared=False)
+        prepared = benchmark_query(database.conn, query, params, prepared=True)
+        print("%s: plain %.3f ms, prepared %.3f ms (%.1f%% saved)" %
+              (name, plain, prepared, 100 * (plain - prepared) / plain))
+
+
+if __name__ == "__main__":
+    main()
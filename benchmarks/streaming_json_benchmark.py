@@ -0,0 +1,77 @@
+"""
+Compares the time to first byte and the peak memory of encoding a big comments listing
+all at once and streamed, the rows come from a generator like the ones of a server side cursor
+
+Run from the root of the repo:
+    python -m benchmarks.streaming_json_benchmark
+"""
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, Iterator, Tuple
+from src.database.videos.video_database import Comment
+from src.response_encoder import dumps, stream_json
+
+COMMENTS = [10000, 100000]
+ROW_FETCH_SECONDS = 0.000005
+
+
+def comment_rows(amount: int) -> Iterator[Tuple[Dict, Comment]]:
+    """
+    Yields the comments like a server side cursor, with some latency per row
+
+    :param amount: the amount of comments
+    :return: the (user data, comment) rows
+    """
+    for i in range(amount):
+        deadline = time.perf_counter() + ROW_FETCH_SECONDS
+        while time.perf_counter() < deadline:
+            pass
+        yield ({"email": "user%d@chotuve.com" % i, "fullname": "User %d" % i, "phone_number": "11111111",
+                "photo_hash": None}, Comment(content="Comentario numero %d del video" % i, timestamp=datetime.now()))
+
+
+def buffered(amount: int) -> Iterator[bytes]:
+    """
+    Encodes the whole listing and sends it in one chunk
+    """
+    yield dumps([{"user": u, "comment": c} for u, c in comment_rows(amount)])
+
+
+def streamed(amount: int) -> Iterator[bytes]:
+    """
+    Encodes the listing while the rows are read
+    """
+    return stream_json({"user": u, "comment": c} for u, c in comment_rows(amount))
+
+
+def measure(encode: Callable[[int], Iterator[bytes]], amount: int) -> Tuple[float, float, int]:
+    """
+    Sends a response to nowhere
+
+    :param encode: the function that encodes the response in chunks
+    :param amount: the amount of comments
+    :return: the time to first byte, the total time and the peak of memory allocated
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    first_byte = None
+    for _ in encode(amount):
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+    total = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return first_byte, total, peak
+
+
+def main():
+    for amount in COMMENTS:
+        for name, encode in [("All at once", buffered), ("Streamed", streamed)]:
+            first_byte, total, peak = measure(encode, amount)
+            print("%s, %d comments: first byte %.1f ms, total %.1f ms, peak memory %.1f MB" %
+                  (name, amount, 1000 * first_byte, 1000 * total, peak / 2 ** 20))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Compares the throughput of the search tokenizers and how much their tokens agree
+
+Run from the root of the repo:
+    python -m benchmarks.tokenizers_benchmark
+"""
+import random
+import time
+from typing import List, Tuple
+from src.search.tokenizer import Tokenizer
+from src.search.search_profile import SearchProfile, cached_search_profile, PROFILE_CACHE_SIZE
+
+WORDS = ["video", "gatito", "perro", "jugando", "futbol", "partido", "receta", "torta", "chocolate",
+         "tutorial", "python", "viaje", "bariloche", "playa", "musica", "rock", "nacional", "clase",
+         "análisis", "matemático", "¿qué", "pasó?", "¡increíble!", "1,000", "10:30", "bien-hecho",
+         "don't", "it's", "e-mail", "3.5", "...", "--", "(en", "vivo)", "mañana"]
+PUNCTUATION = [".", ",", "!", "?", ";", ":"]
+CORPUS_SIZE = 5000
+ROUNDS = 3
+
+
+def random_text(rand: random.Random, length: int) -> str:
+    """
+    Builds a random spanish-like text
+
+    :param rand: the random generator
+    :param length: the amount of words
+    :return: the text
+    """
+    words = [rand.choice(WORDS) + (rand.choice(PUNCTUATION) if rand.random() < 0.1 else "")
+             for _ in range(length)]
+    return " ".join(words)
+
+
+def build_corpus(size: int) -> List[Tuple[str, str]]:
+    """
+    Builds the (title, description) corpus
+
+    :param size: the amount of videos
+    :return: the corpus as a list of tuples
+    """
+    rand = random.Random(42)
+    return [(random_text(rand, rand.randint(2, 10)), random_text(rand, rand.randint(10, 120)))
+            for _ in range(size)]
+
+
+def benchmark_tokenizer(tokenizer: Tokenizer, corpus) -> float:
+    """
+    Measures the tokenized videos per second
+
+    :param tokenizer: the tokenizer to measure
+    :param corpus: the corpus of videos
+    :return: the videos per second
+    """
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for title, description in corpus:
+            SearchProfile.from_video(tokenizer, title, description)
+    return ROUNDS * len(corpus) / (time.perf_counter() - start)
+
+
+def benchmark_cached_profiles(tokenizer: Tokenizer, corpus) -> float:
+    """
+    Measures the scored videos per second when the profiles are already cached
+
+    :param tokenizer: the tokenizer to use
+    :param corpus: the corpus of videos
+    :return: the videos per second
+    """
+    corpus = corpus[:PROFILE_CACHE_SIZE]
+    for title, description in corpus:
+        cached_search_profile(tokenizer, title, description)
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for title, description in corpus:
+            cached_search_profile(tokenizer, title, description)
+    return ROUNDS * len(corpus) / (time.perf_counter() - start)
+
+
+def token_agreement(first: Tokenizer, second: Tokenizer, corpus) -> float:
+    """
+    Fraction of texts both tokenizers split the same way
+
+    :param first: a tokenizer
+    :param second: the other tokenizer
+    :param corpus: the corpus of videos
+    :return: the fraction of equal tokenizations
+    """
+    texts = [text.lower() for video in corpus for text in video]
+    equal = sum(1 for text in texts if first.tokenize(text) == second.tokenize(text))
+    return equal / len(texts)
+
+
+def main():
+    corpus = build_corpus(CORPUS_SIZE)
+    regex_tokenizer = Tokenizer.factory("RegexTokenizer")
+    print("RegexTokenizer: %.0f videos/s" % benchmark_tokenizer(regex_tokenizer, corpus))
+    try:
+        nltk_tokenizer = Tokenizer.factory("NltkTokenizer")
+        nltk_tokenizer.tokenize("probando nltk.")
+    except (ImportError, LookupError) as e:
+        print("NltkTokenizer not available: %s" % type(e).__name__)
+    else:
+        print("NltkTokenizer: %.0f videos/s" % benchmark_tokenizer(nltk_tokenizer, corpus))
+        print("Token agreement: %.2f%%" % (100 * token_agreement(regex_tokenizer, nltk_tokenizer, corpus)))
+    print("Cached profiles: %.0f videos/s" % benchmark_cached_profiles(regex_tokenizer, corpus))
+
+
+if __name__ == "__main__":
+    main()
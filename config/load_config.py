@@ -1,4 +1,4 @@
-from typing import NamedTuple
+from typing import NamedTuple, Optional
 from yaml import load
 from yaml import Loader
 from src.services.auth_server import AuthServer
@@ -7,6 +7,8 @@ from src.database.videos.video_database import VideoDatabase
 from src.database.friends.friend_database import FriendDatabase
 from src.database.statistics.statistics_database import StatisticsDatabase
 from src.database.notifications.notification_database import NotificationDatabase
+from src.events.event_bus import EventBus
+from src.database.response_cache.shared_response_cache import SharedResponseCache
 
 class AppServerConfig(NamedTuple):
     auth_server: AuthServer
@@ -15,6 +17,8 @@ class AppServerConfig(NamedTuple):
     friend_database: FriendDatabase
     statistics_database: StatisticsDatabase
     notifications_database: NotificationDatabase
+    event_bus: EventBus
+    shared_response_cache: Optional[SharedResponseCache] = None
 
 def load_config(config_path: str) -> AppServerConfig:
     """
@@ -41,9 +45,19 @@ def load_config(config_path: str) -> AppServerConfig:
     notifications_database = NotificationDatabase.factory(config_dict["notification_database"],
                                                           **config_dict["notification_databases"][config_dict["notification_database"]])
 
+    event_bus = EventBus.factory(config_dict["event_bus"], **config_dict["event_buses"][config_dict["event_bus"]])
+
+    shared_response_cache = None
+    if config_dict.get("shared_response_cache"):
+        shared_response_cache = SharedResponseCache.factory(
+            config_dict["shared_response_cache"],
+            **config_dict["shared_response_caches"][config_dict["shared_response_cache"]])
+
 
     return AppServerConfig(auth_server=auth_server, media_server=media_server,
                            video_database=video_database, friend_database=friend_database,
                            statistics_database=stat_database,
-                           notifications_database=notifications_database)
+                           notifications_database=notifications_database,
+                           event_bus=event_bus,
+                           shared_response_cache=shared_response_cache)
 
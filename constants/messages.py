@@ -13,4 +13,8 @@ INTERNAL_ERROR_CONTACT_ADMINISTRATION = "Internal server error, please contact t
 UNEXISTENT_FRIEND_REQUEST = "Unexistent friend request from %s to %s"
 UNEXISTENT_REACTION = "Unexistent reaction '%s'"
 NO_MORE_PAGES_ERROR = "No more pages"
-UNEXISTENT_VIDEO_ERROR = "Unexistent video '%s' from user %s"
\ No newline at end of file
+UNEXISTENT_VIDEO_ERROR = "Unexistent video '%s' from user %s"
+INVALID_QUERY_PARAM_ERROR = "Invalid value for query param: %s"
+UNEXISTENT_PHOTO_ERROR = "Unexistent photo '%s'"
+INVALID_PHOTO_ERROR = "The photo '%s' is not a valid image"
+RESPONSE_INTERRUPTED_ERROR = "The response was interrupted by an internal error"
\ No newline at end of file
@@ -1,11 +1,16 @@
-from flask import Flask, send_from_directory
+from flask import Flask, send_from_directory, request
 from src.controller import Controller
 from logging.config import fileConfig
 from config.load_config import load_config
 from typing import Optional
 from flask_swagger_ui import get_swaggerui_blueprint
 from flask_cors import CORS
-from src.register_api_call_decorator import set_statistics_database
+from src.register_api_call_decorator import set_statistics_database, register_api_call
+from src.asgi_adapter import AsgiAdapter, DEFAULT_MAX_WORKERS
+from src.database.utils.postgres_connection import PostgresUtils
+from src.response_compression import compress_response
+from src.response_cache import ResponseCache
+from src.database.videos.video_database import ALL_VIDEOS_RESOURCE
 
 
 fileConfig('config/logging_conf.ini')
@@ -24,16 +29,40 @@ def create_application(config_path: Optional[str] = None):
     """
     if not config_path:
         config_path = DEFAULT_CONFIG_FILE
+    PostgresUtils.cooperate_with_gevent()
     config = load_config(config_path)
+    # The backends checked their connections, give them back before serving
+    PostgresUtils.release_connections()
     set_statistics_database(config.statistics_database)
     controller = Controller(config.auth_server,config.media_server,
                             config.video_database,config.friend_database,
                             config.statistics_database,
-                            config.notifications_database)
+                            config.notifications_database,
+                            config.event_bus,
+                            ResponseCache(config.event_bus, config.shared_response_cache))
     return create_application_with_controller(controller)
 
+def create_asgi_application(config_path: Optional[str] = None, max_workers: int = DEFAULT_MAX_WORKERS):
+    """
+    Creates the flask application served as an ASGI application
+
+    :param config_path: the path to the configuration
+    :param max_workers: the maximum amount of requests handled at the same time
+    :return: an ASGI app
+    """
+    return AsgiAdapter(create_application(config_path), max_workers)
+
 def create_application_with_controller(controller: Controller):
     app = Flask(__name__)
+    response_cache = controller.response_cache
+
+    @app.teardown_request
+    def release_connections(exception):
+        PostgresUtils.release_connections()
+
+    @app.after_request
+    def compress(response):
+        return compress_response(request, response)
 
     swaggerui_blueprint = get_swaggerui_blueprint(SWAGGER_URL, API_URL,
                                                   config= {"app_name": "Chotuve App Server"})
@@ -65,6 +94,8 @@ def create_application_with_controller(controller: Controller):
                      controller.users_delete, methods=['DELETE'])
     app.add_url_rule('/user', 'users_profile_update',
                      controller.users_profile_update, methods=['PUT'])
+    app.add_url_rule('/user/photo/<photo_hash>', 'user_photo',
+                     controller.user_photo, methods=['GET'])
     app.add_url_rule('/user/recover_password', 'users_recover_password',
                      controller.users_send_recovery_email, methods=["POST"])
     app.add_url_rule('/user/new_password', 'users_new_password',
@@ -79,7 +110,9 @@ def create_application_with_controller(controller: Controller):
     app.add_url_rule('/videos', 'list_videos',
                      controller.list_videos, methods=["GET"])
     app.add_url_rule('/videos/top', 'list_top_videos',
-                     controller.list_top_videos, methods=["GET"])
+                     register_api_call(response_cache.cached(controller.list_top_videos, ttl=30,
+                                                             tags=[ALL_VIDEOS_RESOURCE])),
+                     methods=["GET"])
     app.add_url_rule('/videos/search', 'search_videos',
                      controller.search_videos, methods=["GET"])
     app.add_url_rule('/videos/reaction', 'video_reaction_get',
@@ -117,11 +150,18 @@ def create_application_with_controller(controller: Controller):
                      controller.delete_messages, methods=["DELETE"])
     app.add_url_rule('/user/last_conversations', 'last_conversations',
                      controller.get_last_conversations, methods=["GET"])
+    app.add_url_rule('/user/unread_counts', 'user_unread_counts',
+                     controller.get_unread_counts, methods=["GET"])
+    app.add_url_rule('/user/events', 'user_events',
+                     controller.user_events, methods=["GET"])
 
     app.add_url_rule('/api_call_statistics', 'api_call_statistics',
                      controller.api_call_statistics, methods=["GET"])
 
+    app.add_url_rule('/single_flight_statistics', 'single_flight_statistics',
+                     controller.single_flight_statistics, methods=["GET"])
+
     app.add_url_rule('/app_servers', 'app_servers',
-                     controller.app_server_statuses, methods=["GET"])
+                     response_cache.cached(controller.app_server_statuses, ttl=10), methods=["GET"])
 
     return app
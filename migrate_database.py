@@ -0,0 +1,39 @@
+from yaml import load
+from yaml import Loader
+from typing import Dict
+from src.database.migrations.postgres_migrator import PostgresMigrator
+import argparse
+
+DEFAULT_CONFIG_PATH = "config/deploy_conf.yml"
+BACKEND_SECTIONS = ["video_databases", "friend_databases", "statistics_databases",
+                    "notification_databases", "shared_response_caches"]
+
+
+def configured_table_names(config_dict: Dict) -> Dict[str, str]:
+    """
+    Gets the names of the tables of the backends in a configuration, the migrations run on them
+
+    :param config_dict: the configuration
+    :return: the names of the tables by their key, like videos_table_name
+    """
+    table_names = {}
+    for section in BACKEND_SECTIONS:
+        for backend_config in config_dict.get(section, {}).values():
+            table_names.update({key: value for key, value in (backend_config or {}).items()
+                                if key.endswith("_table_name") or key.endswith("_table")})
+    return table_names
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Chotuve app server database migrations')
+    parser.add_argument('--config', help="The config file to use", default=DEFAULT_CONFIG_PATH)
+    args = parser.parse_args()
+    with open(args.config, "r") as yaml_file:
+        config_dict = load(yaml_file, Loader=Loader)
+    migrations_config = dict(config_dict["migrations"])
+    # The tables no backend uses, only the migrations
+    table_names = dict(migrations_config.pop("table_names", None) or {}, **configured_table_names(config_dict))
+    migrator = PostgresMigrator(table_names=table_names, **migrations_config)
+    print("Applied migrations: %s" % migrator.migrate())
+    migrator.verify_indexes()
+    print("All the required indexes exist")
@@ -0,0 +1,168 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Callable, Dict, List, Tuple, Optional
+import asyncio
+import threading
+import sys
+import logging
+
+DEFAULT_MAX_WORKERS = 200
+
+
+class AsgiAdapter:
+    """
+    Serves a WSGI application (the flask app) as an ASGI application
+
+    The event loop owns the connections and reads the request bodies, so slow clients and idle keep-alive
+    connections do not hold a thread, then every request runs in a thread of a pool. The handlers spend
+    most of the time waiting the auth server, the media server or postgres with the GIL released,
+    so one process serves as many concurrent requests as threads in the pool
+    """
+    logger = logging.getLogger(__module__)
+
+    def __init__(self, wsgi_application: Callable, max_workers: int = DEFAULT_MAX_WORKERS):
+        """
+
+        :param wsgi_application: the wsgi application to serve
+        :param max_workers: the maximum amount of requests handled at the same time
+        """
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="asgi-worker")
+
+    async def __call__(self, scope: Dict, receive: Callable, send: Callable):
+        """
+        The ASGI entrypoint
+
+        :param scope: the connection scope
+        :param receive: the coroutine to receive messages from the server
+        :param send: the coroutine to send messages to the server
+        """
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self.handle_http(scope, receive, send)
+
+    async def lifespan(self, receive: Callable, send: Callable):
+        """
+        Answers the startup and shutdown of the server, the threads are stopped on shutdown
+
+        :param receive: the coroutine to receive messages from the server
+        :param send: the coroutine to send messages to the server
+        """
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def handle_http(self, scope: Dict, receive: Callable, send: Callable):
+        """
+        Reads the whole body and runs the request in the thread pool
+
+        :param scope: the connection scope
+        :param receive: the coroutine to receive messages from the server
+        :param send: the coroutine to send messages to the server
+        """
+        body = BytesIO()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body.write(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body.seek(0)
+        loop = asyncio.get_event_loop()
+        disconnected = threading.Event()
+
+        async def wait_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        disconnect_watcher = loop.create_task(wait_disconnect())
+        try:
+            await loop.run_in_executor(self.executor, self.run_wsgi, self.build_environ(scope, body),
+                                       lambda message: asyncio.run_coroutine_threadsafe(send(message),
+                                                                                        loop).result(),
+                                       disconnected)
+        finally:
+            disconnect_watcher.cancel()
+
+    def run_wsgi(self, environ: Dict, send: Callable, disconnected: threading.Event):
+        """
+        Runs the wsgi application and sends its response, called from the thread pool
+        Streamed responses stop after the client disconnects
+
+        :param environ: the wsgi environ of the request
+        :param send: the function to send messages to the server
+        :param disconnected: set when the client disconnects
+        """
+        response_start = {}
+
+        def start_response(status: str, headers: List[Tuple[str, str]], exc_info=None):
+            if exc_info and response_start.get("sent"):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response_start.update(status=int(status.split(" ", 1)[0]),
+                                  headers=[(k.lower().encode("latin-1"), v.encode("latin-1"))
+                                           for k, v in headers])
+
+        def send_start():
+            if not response_start.get("sent"):
+                send({"type": "http.response.start", "status": response_start["status"],
+                      "headers": response_start["headers"]})
+                response_start["sent"] = True
+
+        result = self.wsgi_application(environ, start_response)
+        try:
+            for chunk in result:
+                if disconnected.is_set():
+                    self.logger.debug("Client disconnected from %s" % environ["PATH_INFO"])
+                    return
+                if chunk:
+                    send_start()
+                    send({"type": "http.response.body", "body": chunk, "more_body": True})
+            send_start()
+            send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+
+    @staticmethod
+    def build_environ(scope: Dict, body: BytesIO) -> Dict:
+        """
+        Builds the wsgi environ of a request
+
+        :param scope: the connection scope
+        :param body: the request body
+        :return: the environ
+        """
+        server: Optional[Tuple] = scope.get("server") or ("localhost", 80)
+        environ = {"REQUEST_METHOD": scope["method"],
+                   "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin-1"),
+                   "PATH_INFO": scope["path"].encode("utf8").decode("latin-1"),
+                   "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+                   "SERVER_NAME": server[0],
+                   "SERVER_PORT": str(server[1]),
+                   "SERVER_PROTOCOL": "HTTP/%s" % scope.get("http_version", "1.1"),
+                   "wsgi.version": (1, 0),
+                   "wsgi.url_scheme": scope.get("scheme", "http"),
+                   "wsgi.input": body,
+                   "wsgi.errors": sys.stderr,
+                   "wsgi.multithread": True,
+                   "wsgi.multiprocess": True,
+                   "wsgi.run_once": False}
+        if scope.get("client"):
+            environ["REMOTE_ADDR"] = scope["client"][0]
+        for name, value in scope.get("headers", []):
+            name = name.decode("latin-1").upper().replace("-", "_")
+            value = value.decode("latin-1")
+            if name in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+                environ[name] = value
+                continue
+            name = "HTTP_" + name
+            environ[name] = environ[name] + "," + value if name in environ else value
+        return environ
@@ -0,0 +1,62 @@
+from typing import NamedTuple, List, Optional, Any
+from datetime import datetime
+from flask import Request, Response
+from src.database.utils.resource_versions import ResourceVersion
+import hashlib
+import time
+
+# The validators also change every this amount of seconds, the listings have user data that the auth
+# server updates and the ranking of the top videos changes with the time
+VALIDATOR_LIFETIME_SECONDS = 60
+
+
+class Validator(NamedTuple):
+    """
+    The validators of a response, sent in the ETag and Last-Modified headers
+
+    etag: the (weak) entity tag
+    last_modified: the utc time of the last change
+    """
+    etag: str
+    last_modified: datetime
+
+    @classmethod
+    def from_versions(cls, versions: List[ResourceVersion], *parts: Any) -> 'Validator':
+        """
+        Creates the validator of a response from the versions of the resources it has
+
+        :param versions: the versions of the resources of the response
+        :param parts: anything else the response depends on, like if the requester can see private videos
+        :return: the validator
+        """
+        period = int(time.time() // VALIDATOR_LIFETIME_SECONDS)
+        key = ":".join(str(part) for part in [period] + [v.version for v in versions] + list(parts))
+        last_modified = max([v.last_modified for v in versions] +
+                            [datetime.utcfromtimestamp(period * VALIDATOR_LIFETIME_SECONDS)])
+        return cls(etag=hashlib.sha1(key.encode()).hexdigest()[:20],
+                   last_modified=last_modified.replace(microsecond=0))
+
+    def not_modified(self, request: Request) -> Optional[Response]:
+        """
+        Answers a conditional request, only by the ETag. The If-Modified-Since is ignored, the Last-Modified
+        has a resolution of a second and does not tell apart the variants of a response
+
+        :param request: the request
+        :return: a 304 response if the client has the current response, None if not
+        """
+        if not request.if_none_match or not request.if_none_match.contains_weak(self.etag):
+            return None
+        return self.add_to(Response(status=304))
+
+    def add_to(self, response: Response) -> Response:
+        """
+        Adds the validators to a response, the clients should revalidate it every time they use it
+
+        :param response: the response
+        :return: the response with the validators
+        """
+        response.set_etag(self.etag, weak=True)
+        response.last_modified = self.last_modified
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
@@ -1,12 +1,13 @@
 import json
 import logging
 from typing import Optional, Tuple
-from flask import request
+from flask import request, Response
 from flask_httpauth import HTTPTokenAuth
 from constants import messages
 from flask_cors import cross_origin
 from src.services.auth_server import AuthServer
 from src.model.photo import Photo
+from src.model.exceptions.not_an_image_exception import NotAnImageException
 from src.services.exceptions.invalid_credentials_error import InvalidCredentialsError
 from src.services.exceptions.user_already_registered_error import UserAlreadyRegisteredError
 from src.services.exceptions.invalid_login_token_error import InvalidLoginTokenError
@@ -17,7 +18,7 @@ from src.services.exceptions.invalid_recovery_token_error import InvalidRecovery
 from src.services.exceptions.unauthorized_user_error import UnauthorizedUserError
 from src.services.exceptions.invalid_video_format_error import InvalidVideoFormatError
 from src.database.videos.video_database import VideoDatabase, VideoData, Reaction
-from src.database.friends.friend_database import FriendDatabase
+from src.database.friends.friend_database import FriendDatabase, CONVERSATION_PREVIEW_LENGTH
 from src.database.statistics.statistics_database import StatisticsDatabase, ApiCallsStatistics
 from src.database.friends.exceptions.users_already_friends_error import UsersAlreadyFriendsError
 from src.database.friends.exceptions.unexistent_friend_requests import UnexistentFriendRequest
@@ -26,11 +27,17 @@ from src.database.friends.exceptions.unexistent_target_user_error import Unexist
 from src.database.friends.exceptions.users_are_not_friends_error import UsersAreNotFriendsError
 from src.database.friends.exceptions.no_more_messages_error import NoMoreMessagesError
 from src.database.videos.exceptions.no_more_videos_error import NoMoreVideosError
+from src.database.videos.exceptions.invalid_cursor_error import InvalidCursorError
 from src.services.exceptions.no_more_pages_error import NoMorePagesError
 from src.services.media_server import MediaServer
 from src.database.notifications.notification_database import NotificationDatabase
+from src.events.event_bus import EventBus, Event
 from datetime import datetime
 from src.register_api_call_decorator import register_api_call
+from src.response_encoder import json_response, streamed_json_response, encode_reactions
+from src.conditional_response import Validator
+from src.response_cache import ResponseCache
+from src.single_flight import single_flights
 
 auth = HTTPTokenAuth(scheme='Bearer')
 
@@ -46,6 +53,40 @@ VIDEO_REACTION_DELETE_MANDATORY_FIELDS = {"target_email", "video_title"}
 SEND_MESSAGE_MANDATORY_FIELDS = {"other_user_email", "message"}
 VIDEO_COMMENT_MANDATORY_FIELDS = {"target_email", "video_title", "comment"}
 
+MAX_SEARCH_RESULTS = 100
+MAX_VIDEOS_PAGE_SIZE = 100
+MAX_COMMENTS_PAGE_SIZE = 100
+MAX_MESSAGES_PAGE_SIZE = 100
+# Private, the photos are only sent to logged users
+PHOTO_CACHE_CONTROL = "private, max-age=31536000, immutable"
+# A comment is sent when there are no events so proxies keep the stream open
+EVENTS_KEEPALIVE_SECONDS = 25
+
+
+def int_query_param(name: str, default: Optional[int], minimum: int = 1,
+                    maximum: Optional[int] = None) -> Optional[int]:
+    """
+    Parses an integer query param of the request
+
+    :param name: the name of the query param
+    :param default: the value if the query param is not sent
+    :param minimum: the minimum valid value
+    :param maximum: the values over it are lowered to it, None for no maximum
+    :return: the value or None if it is not an integer or it is under the minimum
+    """
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        return None
+    if value < minimum:
+        return None
+    if maximum is not None:
+        value = min(value, maximum)
+    return value
+
 
 class Controller:
     logger = logging.getLogger(__module__)
@@ -55,9 +96,12 @@ class Controller:
                  video_database: VideoDatabase,
                  friend_database: FriendDatabase,
                  statistic_database: StatisticsDatabase,
-                 notification_database: NotificationDatabase):
+                 notification_database: NotificationDatabase,
+                 event_bus: EventBus,
+                 response_cache: Optional[ResponseCache] = None):
         """
         Here the init should receive all the parameters needed to know how to answer all the queries
+        The response cache of the public routes only caches in process if it is not sent
         """
         self.auth_server = auth_server
         self.media_server = media_server
@@ -65,6 +109,8 @@ class Controller:
         self.friend_database = friend_database
         self.statistic_database = statistic_database
         self.notification_database = notification_database
+        self.event_bus = event_bus
+        self.response_cache = response_cache or ResponseCache(event_bus)
 
         @auth.verify_token
         def verify_token(token) -> Optional[Tuple[str, str]]:
@@ -81,6 +127,19 @@ class Controller:
             except InvalidLoginTokenError:
                 return
 
+    def publish_event(self, user_email: str, event: Event):
+        """
+        Publishes an event to a user, the events are sent after the changes are saved so the
+        errors are only logged to answer the request as successful anyway
+
+        :param user_email: the email of the user receiving the event
+        :param event: the event
+        """
+        try:
+            self.event_bus.publish(user_email, event)
+        except Exception:
+            self.logger.exception("Unable to publish a %s event" % event.kind)
+
     @register_api_call
     def api_health(self):
         """
@@ -146,7 +205,7 @@ class Controller:
         if "notification_token" in content:
             self.notification_database.set_notification_token(content["email"], content["notification_token"])
 
-        return json.dumps(login_dict), 200
+        return json_response(login_dict)
 
     @register_api_call
     @cross_origin()
@@ -164,7 +223,7 @@ class Controller:
         except UnexistentUserError:
             self.logger.debug(messages.USER_NOT_FOUND_MESSAGE % email_query)
             return messages.ERROR_JSON % (messages.USER_NOT_FOUND_MESSAGE % email_query), 404
-        return json.dumps(user_data), 200
+        return json_response(user_data)
 
     @register_api_call
     @cross_origin()
@@ -300,9 +359,8 @@ class Controller:
         video_data = VideoData(title=title, location=location, creation_time=datetime.now(),
                                file_location=file_location, visible=visible, description=description)
         self.video_database.add_video(user_email=email_token, video_data=video_data)
-        response_dict = video_data._asdict()
-        response_dict["creation_time"] = response_dict["creation_time"].isoformat()
-        return json.dumps(response_dict), 200
+        self.response_cache.invalidate(*VideoDatabase.changed_resources(email_token))
+        return json_response(video_data)
 
     @register_api_call
     @cross_origin()
@@ -327,6 +385,7 @@ class Controller:
             self.logger.debug((messages.UNEXISTENT_VIDEO_ERROR % (video_title, email_token)))
             return messages.UNEXISTENT_VIDEO_ERROR % (video_title, email_token), 404
         self.video_database.delete_video(user_email, video_title)
+        self.response_cache.invalidate(*VideoDatabase.changed_resources(user_email))
         return messages.SUCCESS_JSON, 200
 
     @register_api_call
@@ -341,60 +400,62 @@ class Controller:
             self.logger.debug((messages.MISSING_FIELDS_ERROR % "email"))
             return messages.ERROR_JSON % (messages.MISSING_FIELDS_ERROR % "email"), 400
         email_token = auth.current_user()[0]
+        sees_private = email_query == email_token or self.friend_database.are_friends(email_query, email_token)
+        validator = Validator.from_versions([self.video_database.get_videos_version(email_query)], sees_private)
+        not_modified = validator.not_modified(request)
+        if not_modified:
+            return not_modified
         user_videos = self.video_database.list_user_videos(email_query)
-        user_videos = [(video_data._asdict(), reaction_data) for video_data, reaction_data in user_videos]
-        if email_query != email_token and not self.friend_database.are_friends(email_query, email_token):
-            user_videos = [data for data in user_videos if data[0]["visible"]]
-        for i in range(len(user_videos)):
-            user_videos[i][0]["creation_time"] = user_videos[i][0]["creation_time"].isoformat()
-            user_videos[i] = (user_videos[i][0], {k.name: v for k, v in user_videos[i][1].items()})
-        user_videos = [{"video": video_data, "reactions": reaction_data} for video_data, reaction_data in user_videos]
-        return json.dumps(user_videos), 200
+        if not sees_private:
+            user_videos = [data for data in user_videos if data[0].visible]
+        return validator.add_to(json_response([{"video": video_data, "reactions": encode_reactions(reaction_data)}
+                                               for video_data, reaction_data in user_videos]))
 
-    @register_api_call
     def list_top_videos(self):
         """
-        List top videos
+        List top videos, the api call is registered with the route so the cached responses are counted
         :return: a json with the videos data or an error in another case
         """
+        validator = Validator.from_versions([self.video_database.get_videos_version()])
+        not_modified = validator.not_modified(request)
+        if not_modified:
+            return not_modified
         top_videos_data = self.video_database.list_top_videos()
-        user_videos = [data[1]._asdict() for data in top_videos_data]
-        user_emails = [data[0] for data in top_videos_data]
-        user_reactions = [{k.name: v for k, v in data[2].items()} for data in top_videos_data]
-        for i in range(len(user_videos)):
-            user_videos[i]["creation_time"] = user_videos[i]["creation_time"].isoformat()
-        return json.dumps([{"user": u, "video": v, "reactions": r}
-                           for v, u, r in zip(user_videos, user_emails, user_reactions)]), 200
+        return validator.add_to(json_response([{"user": u, "video": v, "reactions": encode_reactions(r)}
+                                               for u, v, r in top_videos_data]))
 
     @register_api_call
     @auth.login_required
     def search_videos(self):
         """
         Searches for a video
+        If a limit or a cursor is sent the results are paginated
         :return: a json with the videos data or an error in another case
         """
         query = request.args.get('query')
         if not query:
             self.logger.debug((messages.MISSING_FIELDS_ERROR % "query"))
             return messages.ERROR_JSON % (messages.MISSING_FIELDS_ERROR % "query"), 400
-        videos_data = self.video_database.search_videos(query)
-        user_videos = [data[1]._asdict() for data in videos_data]
-        user_emails = [data[0] for data in videos_data]
-        user_reactions = [{k.name: v for k, v in data[2].items()} for data in videos_data]
-
+        paginated = 'limit' in request.args or 'cursor' in request.args
+        limit = int_query_param('limit', MAX_SEARCH_RESULTS, maximum=MAX_SEARCH_RESULTS)
+        if limit is None:
+            self.logger.debug(messages.INVALID_QUERY_PARAM_ERROR % "limit")
+            return messages.ERROR_JSON % (messages.INVALID_QUERY_PARAM_ERROR % "limit"), 400
         email_token = auth.current_user()[0]
-        filtered_videos = []
-        filtered_users = []
-        filtered_reactions = []
-        for v, u, r in zip(user_videos, user_emails, user_reactions):
-            if v["visible"] or (u["email"] == email_token or self.friend_database.are_friends(u["email"], email_token)):
-                filtered_videos.append(v)
-                filtered_users.append(u)
-                filtered_reactions.append(r)
-        for i in range(len(user_videos)):
-            filtered_videos[i]["creation_time"] = filtered_videos[i]["creation_time"].isoformat()
-        return json.dumps([{"user": u, "video": v, "reactions": r}
-                           for v, u, r in zip(filtered_videos, filtered_users, filtered_reactions)]), 200
+        private_owners = [email_token] + self.friend_database.get_friends(email_token)
+        try:
+            search_page = self.video_database.search_videos(query, limit=limit,
+                                                            cursor=request.args.get('cursor'),
+                                                            with_total=request.args.get('with_total') == "true",
+                                                            private_owners=private_owners)
+        except InvalidCursorError:
+            self.logger.debug(messages.INVALID_QUERY_PARAM_ERROR % "cursor")
+            return messages.ERROR_JSON % (messages.INVALID_QUERY_PARAM_ERROR % "cursor"), 400
+        results = [{"user": u, "video": v, "reactions": encode_reactions(r)} for u, v, r in search_page.results]
+        if not paginated:
+            return json_response(results)
+        return json_response({"results": results, "next_cursor": search_page.next_cursor,
+                              "total": search_page.total})
 
     @register_api_call
     @cross_origin()
@@ -402,32 +463,68 @@ class Controller:
     def list_videos(self):
         """
         List videos paginated
+        If a limit or a cursor is sent the videos are paginated with cursors instead of page numbers
         :return: a json with the videos data and pages or an error in another case
         """
+        by_cursor = 'limit' in request.args or 'cursor' in request.args
         page = request.args.get('page')
         per_page = request.args.get('per_page')
-        if not page or not per_page:
+        if not by_cursor and (not page or not per_page):
             self.logger.debug((messages.MISSING_FIELDS_ERROR % "page or per_page"))
             return messages.ERROR_JSON % (messages.MISSING_FIELDS_ERROR % "page or per_page"), 400
         email_token = auth.current_user()[0]
         if not self.auth_server.profile_query(email_token)["admin"]:
             self.logger.debug(messages.USER_NOT_AUTHORIZED_ERROR)
             return messages.ERROR_JSON % messages.USER_NOT_AUTHORIZED_ERROR, 403
-        try:
-            videos_data, pages = self.video_database.get_paginated_videos(int(page), int(per_page))
-        except NoMoreVideosError:
-            self.logger.debug(messages.NO_MORE_PAGES_ERROR)
-            return messages.NO_MORE_PAGES_ERROR, 404
-        user_videos = [data[1]._asdict() for data in videos_data]
-        user_data = [data[0] for data in videos_data]
-        user_reactions = [{k.name: v for k, v in data[2].items()} for data in videos_data]
+        if by_cursor:
+            limit = int_query_param('limit', MAX_VIDEOS_PAGE_SIZE, maximum=MAX_VIDEOS_PAGE_SIZE)
+            if limit is None:
+                self.logger.debug(messages.INVALID_QUERY_PARAM_ERROR % "limit")
+                return messages.ERROR_JSON % (messages.INVALID_QUERY_PARAM_ERROR % "limit"), 400
+            try:
+                videos_page = self.video_database.get_videos_page(limit, request.args.get('cursor'))
+            except InvalidCursorError:
+                self.logger.debug(messages.INVALID_QUERY_PARAM_ERROR % "cursor")
+                return messages.ERROR_JSON % (messages.INVALID_QUERY_PARAM_ERROR % "cursor"), 400
+            videos_data = videos_page.results
+        else:
+            try:
+                videos_data, pages = self.video_database.stream_paginated_videos(int(page), int(per_page))
+            except NoMoreVideosError:
+                self.logger.debug(messages.NO_MORE_PAGES_ERROR)
+                return messages.NO_MORE_PAGES_ERROR, 404
+        results = ({"user": u, "video": v, "reactions": encode_reactions(r)} for u, v, r in videos_data)
+        if by_cursor:
+            return json_response({"results": list(results), "next_cursor": videos_page.next_cursor,
+                                  "total": videos_page.total})
+        # The page is read from a database cursor while it is sent
+        return streamed_json_response({"results": results, "pages": pages})
 
-        for i in range(len(user_videos)):
-            user_videos[i]["creation_time"] = user_videos[i]["creation_time"].isoformat()
-        return json.dumps({"results":
-                               [{"user": u, "video": v, "reactions": r}
-                           for v, u, r in zip(user_videos, user_data, user_reactions)],
-                           "pages": pages}), 200
+    @register_api_call
+    @cross_origin()
+    @auth.login_required
+    def user_photo(self, photo_hash: str):
+        """
+        Gets the photo of an user by the hash sent in the listings, only to the logged users like the listings
+        The photos never change for a hash so they can be cached forever
+        :return: the image or an error in another case
+        """
+        if photo_hash in request.if_none_match:
+            response = Response(status=304)
+        else:
+            photo_base64 = self.video_database.get_user_photo(photo_hash)
+            if not photo_base64:
+                self.logger.debug(messages.UNEXISTENT_PHOTO_ERROR % photo_hash)
+                return messages.ERROR_JSON % (messages.UNEXISTENT_PHOTO_ERROR % photo_hash), 404
+            try:
+                photo = Photo(photo_base64)
+            except NotAnImageException:
+                self.logger.warning(messages.INVALID_PHOTO_ERROR % photo_hash)
+                return messages.ERROR_JSON % (messages.INVALID_PHOTO_ERROR % photo_hash), 404
+            response = Response(photo.get_bytes(), mimetype=photo.get_mimetype())
+        response.set_etag(photo_hash)
+        response.headers["Cache-Control"] = PHOTO_CACHE_CONTROL
+        return response
 
     @register_api_call
     @auth.login_required
@@ -458,10 +555,11 @@ class Controller:
         except UnexistentRequestorUserError:
             self.logger.debug(messages.INTERNAL_ERROR_CONTACT_ADMINISTRATION)
             return messages.ERROR_JSON % messages.INTERNAL_ERROR_CONTACT_ADMINISTRATION, 500
+        payload = {"kind": "friendship_request", "from": email_token}
         self.notification_database.notify(content["other_user_email"],
                                           "New friendship request", "From %s" % email_token,
-                                          {"kind": "friendship_request",
-                                           "from": email_token})
+                                          payload)
+        self.publish_event(content["other_user_email"], Event(kind="friendship_request", payload=payload))
         return messages.SUCCESS_JSON, 200
 
     @register_api_call
@@ -474,7 +572,7 @@ class Controller:
         email_token = auth.current_user()[0]
         friend_emails = self.friend_database.get_friend_requests(email_token)
         friends = [self.auth_server.profile_query(email) for email in friend_emails]
-        return json.dumps(friends), 200
+        return json_response(friends)
 
     @register_api_call
     @auth.login_required
@@ -543,9 +641,13 @@ class Controller:
         if email_token != email_query and not self.friend_database.are_friends(email_token, email_query):
             self.logger.debug(messages.USER_NOT_AUTHORIZED_ERROR)
             return messages.ERROR_JSON % messages.USER_NOT_AUTHORIZED_ERROR, 403
+        validator = Validator.from_versions([self.friend_database.get_friends_version(email_query)])
+        not_modified = validator.not_modified(request)
+        if not_modified:
+            return not_modified
         friend_emails = self.friend_database.get_friends(email_query)
         friends = [self.auth_server.profile_query(email) for email in friend_emails]
-        return json.dumps(friends), 200
+        return validator.add_to(json_response(friends))
 
     @register_api_call
     @auth.login_required
@@ -576,14 +678,8 @@ class Controller:
             self.logger.debug(messages.MISSING_FIELDS_ERROR % "other")
             return messages.ERROR_JSON % messages.MISSING_FIELDS_ERROR % "other", 400
         email_token = auth.current_user()[0]
-        response = "no_contact"
-        if self.friend_database.are_friends(email_token, email_query):
-            response = "friends"
-        elif self.friend_database.exists_friend_request(email_query, email_token):
-            response = "received"
-        elif self.friend_database.exists_friend_request(email_token, email_query):
-            response = "sent"
-        return json.dumps({"status": response}), 200
+        relationship = self.friend_database.get_relationship(email_token, email_query)
+        return json_response({"status": relationship.name})
 
     @register_api_call
     @auth.login_required
@@ -601,7 +697,7 @@ class Controller:
         reaction = self.video_database.get_video_reaction(email_token, target_email, video_title)
         if reaction:
             reaction = reaction.name
-        return json.dumps({"reaction": reaction}), 200
+        return json_response({"reaction": reaction})
 
     @register_api_call
     @auth.login_required
@@ -627,6 +723,7 @@ class Controller:
             return messages.ERROR_JSON % messages.UNEXISTENT_REACTION % content["reaction"], 400
         self.video_database.react_video(email_token, content["target_email"],
                                         content["video_title"], reaction[0])
+        self.response_cache.invalidate(*VideoDatabase.changed_resources(content["target_email"]))
         return messages.SUCCESS_JSON, 200
 
     @register_api_call
@@ -643,6 +740,7 @@ class Controller:
             return messages.ERROR_JSON % messages.MISSING_FIELDS_ERROR % "target_email or video_title", 400
         email_token = auth.current_user()[0]
         self.video_database.delete_reaction(email_token, target_email, video_title)
+        self.response_cache.invalidate(*VideoDatabase.changed_resources(target_email))
         return messages.SUCCESS_JSON, 200
 
     @register_api_call
@@ -670,12 +768,15 @@ class Controller:
         except UsersAreNotFriendsError:
             self.logger.debug(messages.USER_NOT_AUTHORIZED_ERROR)
             return messages.ERROR_JSON % messages.USER_NOT_AUTHORIZED_ERROR, 403
+        payload = {"kind": "message", "from": email_token, "message": content["message"]}
         self.notification_database.notify(content["other_user_email"],
                                           "Message from %s" % email_token,
                                           "%s" % content["message"],
-                                          {"kind": "message",
-                                           "from": email_token,
-                                           "message": content["message"]})
+                                          payload)
+        # The events carry a preview, the whole message is read from the conversation
+        self.publish_event(content["other_user_email"],
+                           Event(kind="message",
+                                 payload=dict(payload, message=content["message"][:CONVERSATION_PREVIEW_LENGTH])))
         return messages.SUCCESS_JSON, 200
 
     @register_api_call
@@ -683,15 +784,47 @@ class Controller:
     def get_messages(self):
         """
         Get the messages between two users paginated
+        If a limit or a before cursor is sent the messages are paginated with cursors instead of page numbers
+        If a since sequence number is sent only the messages newer than it are returned, oldest first
+        Getting the newest messages marks the conversation as read, with since only up to the last message returned
         :return: a json with the messages on success or an error in another case
         """
         other_user_email = request.args.get('other_user_email')
+        by_cursor = 'limit' in request.args or 'before' in request.args
         page = request.args.get('page')
         per_page = request.args.get('per_page')
-        if not other_user_email or not page or not per_page:
+        if not other_user_email or ('since' not in request.args and not by_cursor and (not page or not per_page)):
             self.logger.debug(messages.MISSING_FIELDS_ERROR % "query params")
             return messages.ERROR_JSON % messages.MISSING_FIELDS_ERROR % "query params", 400
         email_token = auth.current_user()[0]
+        if 'since' in request.args:
+            since = int_query_param('since', None, minimum=0)
+            if since is None:
+                self.logger.debug(messages.INVALID_QUERY_PARAM_ERROR % "since")
+                return messages.ERROR_JSON % (messages.INVALID_QUERY_PARAM_ERROR % "since"), 400
+            limit = int_query_param('limit', MAX_MESSAGES_PAGE_SIZE, maximum=MAX_MESSAGES_PAGE_SIZE)
+            if limit is None:
+                self.logger.debug(messages.INVALID_QUERY_PARAM_ERROR % "limit")
+                return messages.ERROR_JSON % (messages.INVALID_QUERY_PARAM_ERROR % "limit"), 400
+            new_messages = self.friend_database.get_messages_since(email_token, other_user_email, since, limit)
+            if new_messages:
+                self.friend_database.mark_conversation_read(email_token, other_user_email,
+                                                            up_to_seq=new_messages[-1].seq)
+            return json_response({"messages": new_messages})
+        if by_cursor:
+            limit = int_query_param('limit', MAX_MESSAGES_PAGE_SIZE, maximum=MAX_MESSAGES_PAGE_SIZE)
+            if limit is None:
+                self.logger.debug(messages.INVALID_QUERY_PARAM_ERROR % "limit")
+                return messages.ERROR_JSON % (messages.INVALID_QUERY_PARAM_ERROR % "limit"), 400
+            try:
+                messages_page = self.friend_database.get_conversation_page(email_token, other_user_email, limit,
+                                                                           request.args.get('before'))
+            except InvalidCursorError:
+                self.logger.debug(messages.INVALID_QUERY_PARAM_ERROR % "before")
+                return messages.ERROR_JSON % (messages.INVALID_QUERY_PARAM_ERROR % "before"), 400
+            if not request.args.get('before'):
+                self.friend_database.mark_conversation_read(email_token, other_user_email)
+            return json_response({"messages": messages_page.messages, "next_cursor": messages_page.next_cursor})
         page = int(page)
         per_page = int(per_page)
         # App sends starting with 1 but we start at 0
@@ -701,10 +834,19 @@ class Controller:
         except NoMoreMessagesError:
             self.logger.debug(messages.NO_MORE_PAGES_ERROR)
             return messages.NO_MORE_PAGES_ERROR, 404
-        message_list = [{k:v for k,v in m._asdict().items() if k != "hidden_to"} for m in message_list]
-        for i in range(len(message_list)):
-            message_list[i]["timestamp"] = message_list[i]["timestamp"].isoformat()
-        return json.dumps({"messages": message_list, "pages": pages}), 200
+        if page == 0:
+            self.friend_database.mark_conversation_read(email_token, other_user_email)
+        return json_response({"messages": message_list, "pages": pages})
+
+    @register_api_call
+    @auth.login_required
+    def get_unread_counts(self):
+        """
+        Get the amount of unread messages of each conversation
+        :return: a json with the email of the other user to the amount of unread messages, only the ones with any
+        """
+        email_token = auth.current_user()[0]
+        return json_response(self.friend_database.get_unread_counts(email_token))
 
     @register_api_call
     @auth.login_required
@@ -731,13 +873,35 @@ class Controller:
         """
         email_token = auth.current_user()[0]
         user_data, last_messages = self.friend_database.get_conversations(email_token)
-        last_messages = [{k:v for k,v in m._asdict().items() if k != "hidden_to"} for m in last_messages]
-        for i in range(len(last_messages)):
-            last_messages[i]["timestamp"] = last_messages[i]["timestamp"].isoformat()
-        response = []
-        for i in range(len(last_messages)):
-            response.append({"user": user_data[i], "last_message": last_messages[i]})
-        return json.dumps(response), 200
+        return json_response([{"user": user, "last_message": last_message}
+                              for user, last_message in zip(user_data, last_messages)])
+
+    @register_api_call
+    @auth.login_required
+    def user_events(self):
+        """
+        Streams the new messages and friend requests of the user as server-sent events
+        The token is verified once when connecting instead of on every poll
+        :return: a text/event-stream response that stays open
+        """
+        email_token = auth.current_user()[0]
+        subscription = self.event_bus.subscribe(email_token)
+
+        def stream():
+            try:
+                # Sent right away so the client knows it is connected
+                yield ": connected\n\n"
+                while True:
+                    event = subscription.get(EVENTS_KEEPALIVE_SECONDS)
+                    if event:
+                        yield "event: %s\ndata: %s\n\n" % (event.kind, json.dumps(event.payload))
+                    else:
+                        yield ": keepalive\n\n"
+            finally:
+                self.event_bus.unsubscribe(subscription)
+
+        return Response(stream(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
     @register_api_call
     @auth.login_required
@@ -759,6 +923,7 @@ class Controller:
         email_token = auth.current_user()[0]
         self.video_database.comment_video(email_token, content["target_email"],
                                           content["video_title"], content["comment"])
+        self.response_cache.invalidate(*VideoDatabase.changed_resources(content["target_email"]))
         return messages.SUCCESS_JSON, 200
 
     @register_api_call
@@ -766,6 +931,7 @@ class Controller:
     def get_video_comments(self):
         """
         Get the comments for one video
+        If a limit or a cursor is sent the comments are paginated
         :return: a json with [{user data, comment}] or an error in other case
         """
         other_user_email = request.args.get('other_user_email')
@@ -773,11 +939,33 @@ class Controller:
         if not other_user_email or not video_title:
             self.logger.debug(messages.MISSING_FIELDS_ERROR % "query params")
             return messages.ERROR_JSON % messages.MISSING_FIELDS_ERROR % "query params", 400
-        users_data, comments = self.video_database.get_comments(other_user_email, video_title)
-        response = [{"user": u,
-                     "comment": {"content":c.content, "timestamp": c.timestamp.isoformat()}}
-                    for u,c in zip(users_data, comments)]
-        return json.dumps(response), 200
+        validator = Validator.from_versions([self.video_database.get_videos_version(other_user_email)],
+                                            video_title, request.query_string.decode())
+        not_modified = validator.not_modified(request)
+        if not_modified:
+            return not_modified
+        paginated = 'limit' in request.args or 'cursor' in request.args
+        if paginated:
+            limit = int_query_param('limit', MAX_COMMENTS_PAGE_SIZE, maximum=MAX_COMMENTS_PAGE_SIZE)
+            if limit is None:
+                self.logger.debug(messages.INVALID_QUERY_PARAM_ERROR % "limit")
+                return messages.ERROR_JSON % (messages.INVALID_QUERY_PARAM_ERROR % "limit"), 400
+            try:
+                comments_page = self.video_database.get_comments_page(other_user_email, video_title, limit,
+                                                                      request.args.get('cursor'))
+            except InvalidCursorError:
+                self.logger.debug(messages.INVALID_QUERY_PARAM_ERROR % "cursor")
+                return messages.ERROR_JSON % (messages.INVALID_QUERY_PARAM_ERROR % "cursor"), 400
+            users_comments = zip(comments_page.users, comments_page.comments)
+        else:
+            users_comments = self.video_database.stream_comments(other_user_email, video_title)
+        response = ({"user": u, "comment": c} for u, c in users_comments)
+        if paginated:
+            return validator.add_to(json_response({"results": list(response),
+                                                   "next_cursor": comments_page.next_cursor,
+                                                   "total": comments_page.total}))
+        # The comments are read from a database cursor while they are sent
+        return validator.add_to(streamed_json_response(response))
 
     @register_api_call
     @cross_origin()
@@ -803,7 +991,7 @@ class Controller:
         except NoMorePagesError:
             self.logger.debug(messages.NO_MORE_PAGES_ERROR)
             return messages.NO_MORE_PAGES_ERROR, 404
-        return json.dumps(data_page), 200
+        return json_response(data_page)
 
 
     @cross_origin()
@@ -824,16 +1012,32 @@ class Controller:
         last_days_users_logins = {k.isoformat(): v for k, v in api_call_statistics.last_days_users_logins.items()}
         last_days_api_call_amount = {k.isoformat(): v for k, v in api_call_statistics.last_days_api_call_amount.items()}
         last_day_mean_api_call_time = {k.isoformat(): v for k, v in api_call_statistics.last_day_mean_api_call_time.items()}
-        return json.dumps({"last_days_uploaded_videos": last_days_uploaded_videos,
-                           "last_days_user_registrations": last_days_user_registrations,
-                           "last_days_users_logins": last_days_users_logins,
-                           "last_days_api_call_amount": last_days_api_call_amount,
-                           "last_day_mean_api_call_time": last_day_mean_api_call_time,
-                           "last_days_api_calls_by_path": api_call_statistics.last_days_api_calls_by_path,
-                           "last_days_api_calls_by_status": api_call_statistics.last_days_api_calls_by_status,
-                           "last_days_api_calls_response_times_sample": api_call_statistics.last_days_api_calls_response_times_sample,
-                           "last_days_api_calls_by_method": api_call_statistics.last_days_api_calls_by_method
-                           })
+        return json_response({"last_days_uploaded_videos": last_days_uploaded_videos,
+                              "last_days_user_registrations": last_days_user_registrations,
+                              "last_days_users_logins": last_days_users_logins,
+                              "last_days_api_call_amount": last_days_api_call_amount,
+                              "last_day_mean_api_call_time": last_day_mean_api_call_time,
+                              "last_days_api_calls_by_path": api_call_statistics.last_days_api_calls_by_path,
+                              "last_days_api_calls_by_status": api_call_statistics.last_days_api_calls_by_status,
+                              "last_days_api_calls_response_times_sample": api_call_statistics.last_days_api_calls_response_times_sample,
+                              "last_days_api_calls_by_method": api_call_statistics.last_days_api_calls_by_method
+                              })
+
+    @auth.login_required
+    def single_flight_statistics(self):
+        """
+        Gets how many of the identical calls to the databases in flight
+        at the same time were coalesced in this process, only for admins
+        :return: a json with the statistics of each method
+        """
+        email_token = auth.current_user()[0]
+        if not self.auth_server.profile_query(email_token)["admin"]:
+            self.logger.debug(messages.USER_NOT_AUTHORIZED_ERROR)
+            return messages.ERROR_JSON % messages.USER_NOT_AUTHORIZED_ERROR, 403
+        return json_response({name: {"calls": statistics.calls, "executions": statistics.executions,
+                                     "coalesced": statistics.coalesced,
+                                     "coalescing_ratio": statistics.coalescing_ratio}
+                              for name, statistics in single_flights.get_statistics().items()})
 
     @cross_origin()
     def app_server_statuses(self):
@@ -847,7 +1051,7 @@ class Controller:
                 statuses[i]["metrics"] = self.statistic_database.technical_metrics_from_server(statuses[i]["server_alias"])._asdict()
             except Exception:
                 continue
-        return json.dumps(statuses)
+        return json_response(statuses)
 
     @auth.login_required
     def login_get(self):
@@ -856,7 +1060,7 @@ class Controller:
 
         :return: the user behind the login token or 401
         """
-        return json.dumps({"user_email": auth.current_user()[0]}), 200
+        return json_response({"user_email": auth.current_user()[0]})
 
 
 
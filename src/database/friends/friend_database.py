@@ -1,6 +1,19 @@
 from typing import NoReturn, List, NamedTuple, Tuple, Dict, Optional, Set
 from abc import abstractmethod
+from enum import Enum
 from datetime import datetime
+from src.database.videos.exceptions.invalid_cursor_error import InvalidCursorError
+from src.database.videos.video_database import CURSOR_DATETIME_FORMAT
+from src.database.utils.resource_versions import ResourceVersion
+import base64
+import binascii
+import json
+
+# The last message of each conversation is listed truncated to this length
+CONVERSATION_PREVIEW_LENGTH = 200
+
+# The versioned friends list of a user
+FRIENDS_RESOURCE = "friends:%s"
 
 
 class PrivateMessage(NamedTuple):
@@ -11,7 +24,28 @@ class PrivateMessage(NamedTuple):
     to_user: str
     timestamp: datetime
     message: str
-    hidden_to: Optional[Set[str]] = None
+    seq: Optional[int] = None
+
+
+class MessagesPage(NamedTuple):
+    """
+    A page of a conversation ordered from the newest to the oldest message
+
+    messages: the messages
+    next_cursor: the cursor for getting the older messages, None if this is the last page
+    """
+    messages: List[PrivateMessage]
+    next_cursor: Optional[str] = None
+
+
+class Relationship(Enum):
+    """
+    Relationship of a user with another one
+    """
+    friends = 1
+    received = 2
+    sent = 3
+    no_contact = 4
 
 
 class FriendDatabase:
@@ -78,6 +112,15 @@ class FriendDatabase:
         :return: a list of emails
         """
 
+    @abstractmethod
+    def get_friends_version(self, user_email: str) -> ResourceVersion:
+        """
+        Gets the version of the friends of a user, it changes when a friendship is accepted or deleted
+
+        :param user_email: the user
+        :return: the version
+        """
+
     @abstractmethod
     def delete_friendship(self, user_email1: str, user_email2: str) -> NoReturn:
         """
@@ -97,6 +140,27 @@ class FriendDatabase:
         :return: a boolean indicating whether user1 is friend user2's friend
         """
 
+    @abstractmethod
+    def are_friends_many(self, user_email: str, candidate_emails: List[str]) -> Set[str]:
+        """
+        Check which of the candidates are friends of the user
+
+        :param user_email: the user email
+        :param candidate_emails: the emails of the users to check
+        :return: the set of candidates that are friends of the user
+        """
+
+    @abstractmethod
+    def get_relationship(self, user_email: str, other_user_email: str) -> Relationship:
+        """
+        Get the relationship of a user with another one
+
+        :param user_email: the user email
+        :param other_user_email: the other user email
+        :return: friends if they are friends, received or sent if there is a friend request
+        from or to the other user, no_contact otherwise
+        """
+
     @abstractmethod
     def exists_friend_request(self, from_user_email: str, to_user_email: str) -> bool:
         """
@@ -137,10 +201,62 @@ class FriendDatabase:
         :return: the list of private messages and the number of pages
         """
 
+    @abstractmethod
+    def get_conversation_page(self, requestor_email: str, other_user_email: str, limit: int,
+                              before: Optional[str] = None) -> MessagesPage:
+        """
+        Get a page of the conversation between user1 and user2 using a cursor instead of a page number
+        The messages are ordered by timestamp and id descending
+
+        :raises:
+            InvalidCursorError: the cursor is malformed
+
+        :param requestor_email: the email of user1
+        :param other_user_email: the email of user2
+        :param limit: the maximum amount of messages in the page
+        :param before: the cursor returned with the previous page, None for the newest messages
+        :return: a page of messages
+        """
+
+    @abstractmethod
+    def get_messages_since(self, requestor_email: str, other_user_email: str, since: int,
+                           limit: int) -> List[PrivateMessage]:
+        """
+        Get the messages of the conversation between user1 and user2 newer than a sequence number
+        Every message of a conversation has the sequence number following the one of the previous message
+
+        :param requestor_email: the email of user1
+        :param other_user_email: the email of user2
+        :param since: the sequence number of the last message known
+        :param limit: the maximum amount of messages to return
+        :return: the oldest messages after since ordered by sequence number
+        """
+
+    @abstractmethod
+    def get_unread_counts(self, user_email: str) -> Dict[str, int]:
+        """
+        Get the amount of messages received and not read in each conversation
+
+        :param user_email: the email of the user
+        :return: a dict of the email of the other user to the amount of unread messages, only the ones with any
+        """
+
+    @abstractmethod
+    def mark_conversation_read(self, user_email: str, other_user_email: str,
+                               up_to_seq: Optional[int] = None) -> NoReturn:
+        """
+        Marks the messages received in a conversation as read
+
+        :param user_email: the email of the user that read the conversation
+        :param other_user_email: the email of the other user of the conversation
+        :param up_to_seq: the sequence number of the last message read, None for all of them
+        """
+
     @abstractmethod
     def get_conversations(self, user_email: str) -> Tuple[List[Dict], List[PrivateMessage]]:
         """
         Get all the conversations ordered by recent activity
+        The last messages are truncated to CONVERSATION_PREVIEW_LENGTH characters
 
         :param user_email: the email of the user for getting the conversations
         :return: a tuple (list of user data, list of last private message)
@@ -155,6 +271,38 @@ class FriendDatabase:
         :param deleted_email: the email of the other user of the conversation
         """
 
+    @staticmethod
+    def encode_messages_cursor(timestamp: datetime, message_id: int) -> str:
+        """
+        Encodes the position of a message in a conversation as an opaque cursor
+
+        :param timestamp: the timestamp of the message
+        :param message_id: the id of the message
+        :return: the cursor
+        """
+        return base64.urlsafe_b64encode(json.dumps([timestamp.strftime(CURSOR_DATETIME_FORMAT),
+                                                    message_id]).encode()).decode()
+
+    @staticmethod
+    def decode_messages_cursor(cursor: str) -> Tuple[datetime, int]:
+        """
+        Decodes a cursor created with encode_messages_cursor
+
+        :raises:
+            InvalidCursorError: the cursor is malformed
+
+        :param cursor: the cursor to decode
+        :return: a tuple (timestamp, message id)
+        """
+        try:
+            timestamp, message_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            timestamp = datetime.strptime(timestamp, CURSOR_DATETIME_FORMAT)
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+            raise InvalidCursorError
+        if not isinstance(message_id, int):
+            raise InvalidCursorError
+        return timestamp, message_id
+
     @classmethod
     def factory(cls, name: str, *args, **kwargs) -> 'FriendDatabase':
         """
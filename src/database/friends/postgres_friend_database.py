@@ -5,131 +5,272 @@ import os
 import json
 import requests
 import math
+import threading
 from typing import NoReturn, List, Dict, Set, Tuple
 from abc import abstractmethod
+from collections import OrderedDict
 from src.database.friends.exceptions.users_already_friends_error import UsersAlreadyFriendsError
 from src.database.friends.exceptions.unexistent_friend_requests import UnexistentFriendRequest
 from src.database.friends.exceptions.users_are_not_friends_error import UsersAreNotFriendsError
 from src.database.friends.exceptions.no_more_messages_error import NoMoreMessagesError
-from src.database.friends.friend_database import FriendDatabase, PrivateMessage
-from datetime import datetime
+from src.database.friends.friend_database import FriendDatabase, PrivateMessage, Relationship, MessagesPage, \
+    CONVERSATION_PREVIEW_LENGTH, FRIENDS_RESOURCE
+from datetime import datetime, timedelta
 from src.database.utils.postgres_connection import PostgresUtils
+from src.database.utils.resource_versions import ResourceVersion, INITIAL_VERSION, BUMP_RESOURCE_VERSIONS_QUERY, \
+    GET_RESOURCE_VERSION_QUERY, sorted_resources
+from src.single_flight import single_flight
+
+FRIENDS_CACHE_SECONDS = 30
+FRIENDS_CACHE_SIZE = 10000
 
 NEW_FRIEND_REQUEST_QUERY = """
-INSERT INTO {} ("from", "to", status, timestamp)
+INSERT INTO {friend_requests_table_name} ("from", "to", status, timestamp)
 VALUES (%s, %s, 'pending', %s)
 """
 
+# The prepared existence checks select a constant, so a later column of the tables
+# does not change their result type
 CHECK_FRIENDS_QUERY = """
-SELECT *
-FROM {}
-WHERE user1 = '%s' AND user2 = '%s'
+SELECT 1
+FROM {friends_table_name}
+WHERE user1 = %s AND user2 = %s
 """
 
 CHECK_FRIEND_REQUEST_QUERY = """
-SELECT *
-FROM {}
+SELECT 1
+FROM {friend_requests_table_name}
 WHERE "from" = %s AND "to" = %s
 """
 
+ARE_FRIENDS_MANY_QUERY = """
+SELECT CASE WHEN user1 = %s THEN user2 ELSE user1 END
+FROM {friends_table_name}
+WHERE (user1 = %s AND user2 = ANY(%s)) OR (user2 = %s AND user1 = ANY(%s))
+"""
+
 ALL_FRIENDS_QUERY = """
 SELECT user1, user2
-FROM {}
-WHERE user1 = '%s' OR user2 = '%s'
+FROM {friends_table_name}
+WHERE user1 = %s OR user2 = %s
 """
 
 FRIEND_REQUEST_QUERY = """
 SELECT "from"
-FROM {}
-WHERE "to" = '%s'
+FROM {friend_requests_table_name}
+WHERE "to" = %s
 """
 
 DELETE_FRIEND_REQUEST_QUERY = """
-DELETE FROM {}
+DELETE FROM {friend_requests_table_name}
 WHERE "from"=%s AND "to"=%s;
 """
 
-NEW_FRIENDS_QUERY = """
-INSERT INTO {} (user1, user2)
-VALUES (%s, %s)
+# The request is deleted and the friendship created in the same statement,
+# nothing is inserted if the request did not exist
+ACCEPT_FRIEND_REQUEST_QUERY = """
+WITH accepted_request AS (
+DELETE FROM {friend_requests_table_name}
+WHERE "from"=%s AND "to"=%s
+RETURNING "from"
+)
+INSERT INTO {friends_table_name} (user1, user2)
+SELECT %s, %s FROM accepted_request
+"""
+
+# Friends first, then received and sent requests
+GET_RELATIONSHIP_QUERY = """
+SELECT 1 FROM {friends_table_name} WHERE user1 = %s AND user2 = %s
+UNION ALL
+SELECT 2 FROM {friend_requests_table_name} WHERE "from" = %s AND "to" = %s
+UNION ALL
+SELECT 3 FROM {friend_requests_table_name} WHERE "from" = %s AND "to" = %s
+ORDER BY 1
+LIMIT 1
 """
 
 DELETE_FRIEND_QUERY = """
-DELETE FROM {}
+DELETE FROM {friends_table_name}
 WHERE user1 = %s AND user2 = %s;
 """
 
+# Also locks the conversation until the message is committed, so the sequence numbers are committed in order
+# The users are ordered by code point, like with the "C" collation, whatever the collation of the database is
+NEXT_CONVERSATION_SEQ_QUERY = """
+INSERT INTO {conversation_sequences_table_name} AS s (user1, user2, last_seq)
+VALUES (%s, %s, 1)
+ON CONFLICT (user1, user2) DO UPDATE
+  SET last_seq = s.last_seq + 1
+RETURNING last_seq
+"""
+
+LAST_CONVERSATION_SEQ_QUERY = """
+SELECT last_seq
+FROM {conversation_sequences_table_name}
+WHERE user1 = %s AND user2 = %s
+"""
+
 SEND_MESSAGE_QUERY = """
-INSERT INTO {} (from_user, to_user, message, datetime)
-VALUES (%s, %s, %s, %s)
+INSERT INTO {user_messages_table_name} (from_user, to_user, message, datetime, seq)
+VALUES (%s, %s, %s, %s, %s)
+RETURNING id
 """
 
-GET_PAGINATED_CONVERSATION_QUERY = """
-SELECT from_user, to_user, message, datetime
-FROM {user_messages_table_name}
-WHERE ((from_user=%s AND to_user=%s) OR (to_user=%s AND from_user=%s))
-AND id NOT IN (
-SELECT id FROM {user_deleted_messages_table_name} WHERE deletor = %s
+# The conversation deleted by a user is hidden up to its last message at that moment,
+# the messages after the watermark are a range of the conversation indexes
+HIDDEN_BEFORE_CTE = """
+hidden_before AS (
+SELECT COALESCE(MAX(datetime), '-infinity') as datetime, COALESCE(MAX(id), 0) as id
+FROM {deleted_conversations_table_name}
+WHERE deletor = %s AND peer = %s
 )
-ORDER BY datetime DESC
+"""
+
+GET_PAGINATED_CONVERSATION_QUERY = "WITH" + HIDDEN_BEFORE_CTE + """
+SELECT from_user, to_user, message, m.datetime, seq
+FROM {user_messages_table_name} m, hidden_before h
+WHERE ((from_user=%s AND to_user=%s) OR (to_user=%s AND from_user=%s))
+AND (m.datetime, m.id) > (h.datetime, h.id)
+ORDER BY m.datetime DESC
 LIMIT %s OFFSET %s;
 """
 
-COUNT_ROWS_CONVERSATION_QUERY = """
-SELECT COUNT(*) FROM {user_messages_table_name}
+COUNT_ROWS_CONVERSATION_QUERY = "WITH" + HIDDEN_BEFORE_CTE + """
+SELECT COUNT(*) FROM {user_messages_table_name} m, hidden_before h
 WHERE ((from_user=%s AND to_user=%s) OR (to_user=%s AND from_user=%s))
-AND id NOT IN (
-SELECT id FROM {user_deleted_messages_table_name} WHERE deletor = %s
-)
+AND (m.datetime, m.id) > (h.datetime, h.id)
+"""
+
+# Each direction of the conversation walks the (from_user, to_user, datetime, id) index
+# backwards from the cursor down to the watermark, so every page costs the same no matter how old it is
+GET_CONVERSATION_PAGE_QUERY = "WITH" + HIDDEN_BEFORE_CTE + """
+SELECT id, from_user, to_user, message, datetime, seq
+FROM (
+(SELECT m.id, from_user, to_user, message, m.datetime, seq
+FROM {user_messages_table_name} m, hidden_before h
+WHERE from_user=%s AND to_user=%s AND {keyset_condition}
+AND (m.datetime, m.id) > (h.datetime, h.id)
+ORDER BY m.datetime DESC, m.id DESC
+LIMIT %s)
+UNION ALL
+(SELECT m.id, from_user, to_user, message, m.datetime, seq
+FROM {user_messages_table_name} m, hidden_before h
+WHERE from_user=%s AND to_user=%s AND {keyset_condition}
+AND (m.datetime, m.id) > (h.datetime, h.id)
+ORDER BY m.datetime DESC, m.id DESC
+LIMIT %s)
+) as conversation
+ORDER BY datetime DESC, id DESC
+LIMIT %s
 """
 
+CONVERSATION_PAGE_KEYSET_CONDITION = "(m.datetime, m.id) < (%s, %s)"
+
+# Each direction of the conversation is a range of the (from_user, to_user, seq) index
+GET_MESSAGES_SINCE_QUERY = "WITH" + HIDDEN_BEFORE_CTE + """
+SELECT from_user, to_user, message, datetime, seq
+FROM (
+(SELECT from_user, to_user, message, m.datetime, seq
+FROM {user_messages_table_name} m, hidden_before h
+WHERE from_user=%s AND to_user=%s AND seq > %s
+AND (m.datetime, m.id) > (h.datetime, h.id)
+ORDER BY seq
+LIMIT %s)
+UNION ALL
+(SELECT from_user, to_user, message, m.datetime, seq
+FROM {user_messages_table_name} m, hidden_before h
+WHERE from_user=%s AND to_user=%s AND seq > %s
+AND (m.datetime, m.id) > (h.datetime, h.id)
+ORDER BY seq
+LIMIT %s)
+) as new_messages
+ORDER BY seq
+LIMIT %s
+"""
+
+GET_UNREAD_COUNTS_QUERY = """
+SELECT peer, unread
+FROM {conversations_table_name}
+WHERE user_email = %s AND unread > 0
+"""
+
+MARK_CONVERSATION_READ_QUERY = """
+UPDATE {conversations_table_name}
+SET unread = 0
+WHERE user_email = %s AND peer = %s AND unread > 0
+"""
+
+# The messages received after the last one read are a range of the (from_user, to_user, seq) index
+MARK_CONVERSATION_READ_UP_TO_QUERY = """
+UPDATE {conversations_table_name}
+SET unread = LEAST(unread, (SELECT count(*)
+                            FROM {user_messages_table_name}
+                            WHERE from_user = %s AND to_user = %s AND seq > %s))
+WHERE user_email = %s AND peer = %s AND unread > 0
+"""
+
+# The chat list is a range of the conversations summary of the user
 GET_CONVERSATIONS_QUERY = """
-SELECT u.email, u.fullname, u.phone_number, u.photo,
-messages.from_user, messages.to_user, messages.message, messages.datetime
-FROM
-(SELECT from_user, to_user, message, datetime,
-  CASE
-    WHEN from_user=%s THEN to_user
-    ELSE from_user
-  END 
-  AS other_user
-FROM {user_messages_table_name}
-WHERE from_user=%s OR to_user=%s
-ORDER BY datetime DESC) as messages
-INNER JOIN (
-SELECT max(datetime) as datetime,
+SELECT u.email, u.fullname, u.phone_number, md5(u.photo) as photo_hash,
+c.last_message_from_user,
   CASE
-    WHEN from_user=%s THEN to_user
-    ELSE from_user
-  END 
-  AS other_user
-FROM {user_messages_table_name}
-WHERE (from_user=%s OR to_user=%s)
-AND id NOT IN (
-SELECT id FROM {user_deleted_messages_table_name} WHERE deletor = %s
-)
-GROUP BY 2
-) as last_messages
-ON messages.other_user=last_messages.other_user AND messages.datetime=last_messages.datetime
+    WHEN c.last_message_from_user = c.user_email THEN c.peer
+    ELSE c.user_email
+  END,
+c.preview, c.last_message_datetime, c.last_message_seq
+FROM {conversations_table_name} c
 INNER JOIN {users_table_name} as u
-ON u.email=messages.other_user
-WHERE EXISTS (
+ON u.email = c.peer
+WHERE c.user_email = %s
+AND EXISTS (
     SELECT user1, user2
     FROM {friends_table_name}
-    WHERE (user1 = %s AND user2 = messages.other_user) OR (user1 = messages.other_user AND user2 = %s)
+    WHERE (user1 = c.user_email AND user2 = c.peer) OR (user1 = c.peer AND user2 = c.user_email)
 )
+ORDER BY c.last_message_datetime DESC, c.last_message_id DESC
 """
 
+# Updates the summary of the sender and the receiver, a concurrent older message never replaces a newer one
+UPDATE_CONVERSATIONS_QUERY = """
+INSERT INTO {conversations_table_name} AS c
+(user_email, peer, last_message_id, last_message_datetime, last_message_from_user, preview, last_message_seq,
+ unread)
+VALUES (%s, %s, %s, %s, %s, %s, %s, 0), (%s, %s, %s, %s, %s, %s, %s, 1)
+ON CONFLICT (user_email, peer) DO UPDATE
+  SET unread = c.unread + excluded.unread,
+  last_message_id = GREATEST(c.last_message_id, excluded.last_message_id),
+  last_message_datetime = CASE WHEN excluded.last_message_id > c.last_message_id
+                          THEN excluded.last_message_datetime ELSE c.last_message_datetime END,
+  last_message_from_user = CASE WHEN excluded.last_message_id > c.last_message_id
+                           THEN excluded.last_message_from_user ELSE c.last_message_from_user END,
+  preview = CASE WHEN excluded.last_message_id > c.last_message_id
+            THEN excluded.preview ELSE c.preview END,
+  last_message_seq = GREATEST(c.last_message_seq, excluded.last_message_seq)
+"""
+
+DELETE_CONVERSATION_SUMMARY_QUERY = """
+DELETE FROM {conversations_table_name}
+WHERE user_email = %s AND peer = %s
+"""
+
+# Moves the watermark of the deletor up to the last message of the conversation
 DELETE_CONVERSATION_QUERY = """
-INSERT INTO {user_deleted_messages_table_name}(id, deletor)
-SELECT ids_values.id, %s
-FROM (SELECT id FROM {user_messages_table_name}
-WHERE ((from_user=%s AND to_user=%s) OR (to_user=%s AND from_user=%s))
-AND id NOT IN (
-SELECT id FROM {user_deleted_messages_table_name} WHERE deletor = %s
-)) ids_values
+INSERT INTO {deleted_conversations_table_name} (deletor, peer, datetime, id)
+SELECT %s, %s, datetime, id
+FROM {user_messages_table_name}
+WHERE (from_user=%s AND to_user=%s) OR (from_user=%s AND to_user=%s)
+ORDER BY datetime DESC, id DESC
+LIMIT 1
+ON CONFLICT (deletor, peer) DO UPDATE
+  SET datetime = excluded.datetime, id = excluded.id
 """
 
+# The queries run on every request, these are planned once per connection
+PREPARED_QUERIES = {"check_friends", "are_friends_many", "check_friend_request", "get_relationship", "all_friends",
+                    "friend_request", "send_message", "get_paginated_conversation", "count_rows_conversation", "get_conversations",
+                    "get_conversation_page", "get_conversation_page_before", "last_conversation_seq",
+                    "get_messages_since", "get_unread_counts", "get_resource_version"}
+
 
 class PostgresFriendDatabase(FriendDatabase):
     """
@@ -139,15 +280,25 @@ class PostgresFriendDatabase(FriendDatabase):
 
     def __init__(self, friends_table_name: str, friend_requests_table_name: str,
                  user_messages_table_name: str, users_table_name: str,
-                 user_deleted_messages_table_name: str,
+                 deleted_conversations_table_name: str, conversations_table_name: str,
+                 conversation_sequences_table_name: str, resource_versions_table_name: str,
                  postgr_host_env_name: str, postgr_user_env_name: str,
-                 postgr_pass_env_name: str, postgr_database_env_name: str):
+                 postgr_pass_env_name: str, postgr_database_env_name: str,
+                 friends_cache_seconds: int = FRIENDS_CACHE_SECONDS):
 
         self.friends_table_name = friends_table_name
         self.friend_requests_table_name = friend_requests_table_name
         self.user_messages_table_name = user_messages_table_name
         self.users_table_name = users_table_name
-        self.user_deleted_messages_table_name = user_deleted_messages_table_name
+        self.deleted_conversations_table_name = deleted_conversations_table_name
+        self.conversations_table_name = conversations_table_name
+        self.conversation_sequences_table_name = conversation_sequences_table_name
+        self.resource_versions_table_name = resource_versions_table_name
+        self.queries = self.build_queries()
+        # user email -> (friends set, expiration), least recently used first
+        self.friends_cache = OrderedDict()
+        self.friends_cache_lock = threading.Lock()
+        self.friends_cache_seconds = friends_cache_seconds
         self.conn = PostgresUtils.get_postgres_connection(host=os.environ[postgr_host_env_name],
                                                           user=os.environ[postgr_user_env_name],
                                                           password=os.environ[postgr_pass_env_name],
@@ -158,6 +309,86 @@ class PostgresFriendDatabase(FriendDatabase):
             self.logger.error("Unable to connect to postgres database")
             raise ConnectionError("Unable to connect to postgres database")
 
+    def build_queries(self) -> Dict:
+        """
+        Formats the table names of the queries once
+
+        :return: a dict of query name to query or prepared query
+        """
+        table_names = {"friends_table_name": self.friends_table_name,
+                       "friend_requests_table_name": self.friend_requests_table_name,
+                       "user_messages_table_name": self.user_messages_table_name,
+                       "users_table_name": self.users_table_name,
+                       "deleted_conversations_table_name": self.deleted_conversations_table_name,
+                       "conversations_table_name": self.conversations_table_name,
+                       "conversation_sequences_table_name": self.conversation_sequences_table_name,
+                       "resource_versions_table_name": self.resource_versions_table_name}
+        queries = {"new_friend_request": NEW_FRIEND_REQUEST_QUERY, "check_friends": CHECK_FRIENDS_QUERY,
+                   "are_friends_many": ARE_FRIENDS_MANY_QUERY,
+                   "check_friend_request": CHECK_FRIEND_REQUEST_QUERY, "all_friends": ALL_FRIENDS_QUERY,
+                   "friend_request": FRIEND_REQUEST_QUERY, "delete_friend_request": DELETE_FRIEND_REQUEST_QUERY,
+                   "accept_friend_request": ACCEPT_FRIEND_REQUEST_QUERY,
+                   "get_relationship": GET_RELATIONSHIP_QUERY, "delete_friend": DELETE_FRIEND_QUERY,
+                   "send_message": SEND_MESSAGE_QUERY,
+                   "get_paginated_conversation": GET_PAGINATED_CONVERSATION_QUERY,
+                   "count_rows_conversation": COUNT_ROWS_CONVERSATION_QUERY,
+                   "get_conversations": GET_CONVERSATIONS_QUERY, "delete_conversation": DELETE_CONVERSATION_QUERY,
+                   "update_conversations": UPDATE_CONVERSATIONS_QUERY,
+                   "delete_conversation_summary": DELETE_CONVERSATION_SUMMARY_QUERY,
+                   "next_conversation_seq": NEXT_CONVERSATION_SEQ_QUERY,
+                   "last_conversation_seq": LAST_CONVERSATION_SEQ_QUERY,
+                   "get_messages_since": GET_MESSAGES_SINCE_QUERY, "get_unread_counts": GET_UNREAD_COUNTS_QUERY,
+                   "mark_conversation_read": MARK_CONVERSATION_READ_QUERY,
+                   "mark_conversation_read_up_to": MARK_CONVERSATION_READ_UP_TO_QUERY,
+                   "bump_resource_versions": BUMP_RESOURCE_VERSIONS_QUERY,
+                   "get_resource_version": GET_RESOURCE_VERSION_QUERY}
+        queries = {name: query.format(**table_names) for name, query in queries.items()}
+        queries["get_conversation_page"] = GET_CONVERSATION_PAGE_QUERY.format(keyset_condition="true",
+                                                                              **table_names)
+        queries["get_conversation_page_before"] = GET_CONVERSATION_PAGE_QUERY.format(
+            keyset_condition=CONVERSATION_PAGE_KEYSET_CONDITION, **table_names)
+        return PostgresUtils.prepare_queries(queries, PREPARED_QUERIES)
+
+    def _cached_friends(self, user_email: str) -> Optional[Set[str]]:
+        """
+        Gets the cached friends of a user
+
+        :param user_email: the user email
+        :return: the set of friends or None if they are not cached or expired
+        """
+        with self.friends_cache_lock:
+            cached = self.friends_cache.get(user_email)
+            if not cached or cached[1] < datetime.now():
+                return None
+            self.friends_cache.move_to_end(user_email)
+            return cached[0]
+
+    def _cache_friends(self, user_email: str, friend_emails: List[str]) -> NoReturn:
+        """
+        Caches the friends of a user, evicting the least recently used user if the cache is full
+
+        :param user_email: the user email
+        :param friend_emails: all the friends of the user
+        """
+        if self.friends_cache_seconds <= 0:
+            return
+        with self.friends_cache_lock:
+            self.friends_cache[user_email] = (set(friend_emails),
+                                              datetime.now() + timedelta(seconds=self.friends_cache_seconds))
+            self.friends_cache.move_to_end(user_email)
+            if len(self.friends_cache) > FRIENDS_CACHE_SIZE:
+                self.friends_cache.popitem(last=False)
+
+    def _invalidate_friends(self, *user_emails: str) -> NoReturn:
+        """
+        Removes the cached friends of the users
+
+        :param user_emails: the emails of the users whose friends changed
+        """
+        with self.friends_cache_lock:
+            for user_email in user_emails:
+                self.friends_cache.pop(user_email, None)
+
     def create_friend_request(self, from_user_email: str,
                               to_user_email: str) -> NoReturn:
         """
@@ -176,7 +407,7 @@ class PostgresFriendDatabase(FriendDatabase):
         self.logger.debug("Sending friend request for user with email %s" % from_user_email)
         cursor = self.conn.cursor()
         PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     NEW_FRIEND_REQUEST_QUERY.format(self.friend_requests_table_name),
+                                     self.queries["new_friend_request"],
                                      (from_user_email, to_user_email, datetime.now().isoformat()))
         self.conn.commit()
         cursor.close()
@@ -192,21 +423,19 @@ class PostgresFriendDatabase(FriendDatabase):
         :param from_user_email: the user that requested the friendship
         :param to_user_email: the target user of the request
         """
-        if from_user_email not in self.get_friend_requests(to_user_email):
-            raise UnexistentFriendRequest
-        cursor = self.conn.cursor()
-        PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     DELETE_FRIEND_REQUEST_QUERY.format(self.friend_requests_table_name),
-                                     (from_user_email, to_user_email))
-        self.conn.commit()
-
         friend_tuple = list(sorted([from_user_email, to_user_email]))
         friend_tuple = (friend_tuple[0], friend_tuple[1])
-        cursor.execute(NEW_FRIENDS_QUERY.format(self.friends_table_name),
-                       friend_tuple)
-        self.conn.commit()
 
-        cursor.close()
+        def accept(cursor):
+            PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                         self.queries["accept_friend_request"],
+                                         (from_user_email, to_user_email) + friend_tuple)
+            if not cursor.rowcount:
+                raise UnexistentFriendRequest
+            self.bump_friends_version(cursor, from_user_email, to_user_email)
+
+        PostgresUtils.run_transaction(self.logger, self.conn, accept)
+        self._invalidate_friends(from_user_email, to_user_email)
 
     def reject_friend_request(self, from_user_email: str,
                               to_user_email: str) -> NoReturn:
@@ -219,14 +448,14 @@ class PostgresFriendDatabase(FriendDatabase):
         :param from_user_email: the user that requested the friendship
         :param to_user_email: the target user of the request
         """
-        if from_user_email not in self.get_friend_requests(to_user_email):
-            raise UnexistentFriendRequest
-        cursor = self.conn.cursor()
-        PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     DELETE_FRIEND_REQUEST_QUERY.format(self.friend_requests_table_name),
-                                     (from_user_email, to_user_email))
-        self.conn.commit()
-        cursor.close()
+        def reject(cursor):
+            PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                         self.queries["delete_friend_request"],
+                                         (from_user_email, to_user_email))
+            if not cursor.rowcount:
+                raise UnexistentFriendRequest
+
+        PostgresUtils.run_transaction(self.logger, self.conn, reject)
 
     def get_friend_requests(self, user_email: str) -> List[str]:
         """
@@ -238,7 +467,7 @@ class PostgresFriendDatabase(FriendDatabase):
         self.logger.debug("Getting friend requests for %s" % user_email)
         cursor = self.conn.cursor()
         PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     FRIEND_REQUEST_QUERY.format(self.friend_requests_table_name) % user_email)
+                                     self.queries["friend_request"], (user_email,))
         result = cursor.fetchall()
         cursor.close()
         return [r[0] for r in result]
@@ -253,11 +482,13 @@ class PostgresFriendDatabase(FriendDatabase):
         self.logger.debug("Getting friends for %s" % user_email)
         cursor = self.conn.cursor()
         PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     ALL_FRIENDS_QUERY.format(self.friends_table_name) % (user_email, user_email))
+                                     self.queries["all_friends"], (user_email, user_email))
         result = cursor.fetchall()
         cursor.close()
         friend_emails = [t[0] for t in result] + [t[1] for t in result]
-        return [f for f in friend_emails if f != user_email]
+        friend_emails = [f for f in friend_emails if f != user_email]
+        self._cache_friends(user_email, friend_emails)
+        return friend_emails
 
     def delete_friendship(self, user_email1: str, user_email2: str) -> NoReturn:
         """
@@ -269,12 +500,46 @@ class PostgresFriendDatabase(FriendDatabase):
         friend_tuple = list(sorted([user_email1, user_email2]))
         friend_tuple = (friend_tuple[0], friend_tuple[1])
         self.logger.debug("Deleting friendship between %s and %s" % (user_email1, user_email2))
+
+        def delete(cursor):
+            PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                         self.queries["delete_friend"],
+                                         friend_tuple)
+            if cursor.rowcount:
+                self.bump_friends_version(cursor, user_email1, user_email2)
+
+        PostgresUtils.run_transaction(self.logger, self.conn, delete)
+        self._invalidate_friends(user_email1, user_email2)
+
+    def bump_friends_version(self, cursor, user_email1: str, user_email2: str) -> NoReturn:
+        """
+        Increments the version of the friends of two users, in the transaction that changes their friendship
+
+        :param cursor: the cursor of the transaction
+        :param user_email1: first user email
+        :param user_email2: second user email
+        """
+        PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                     self.queries["bump_resource_versions"],
+                                     (sorted_resources([FRIENDS_RESOURCE % user_email1,
+                                                        FRIENDS_RESOURCE % user_email2]),))
+
+    @single_flight
+    def get_friends_version(self, user_email: str) -> ResourceVersion:
+        """
+        Gets the version of the friends of a user, it changes when a friendship is accepted or deleted
+
+        :param user_email: the user
+        :return: the version
+        """
         cursor = self.conn.cursor()
         PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     DELETE_FRIEND_QUERY.format(self.friends_table_name),
-                                     friend_tuple)
-        cursor.close()
+                                     self.queries["get_resource_version"],
+                                     (FRIENDS_RESOURCE % user_email,))
+        result = cursor.fetchone()
         self.conn.commit()
+        cursor.close()
+        return ResourceVersion(*result) if result else INITIAL_VERSION
 
     def are_friends(self, user_email1: str, user_email2: str) -> bool:
         """
@@ -285,16 +550,68 @@ class PostgresFriendDatabase(FriendDatabase):
         :return: a boolean indicating whether user1 is friend user2's friend
         """
         self.logger.debug("Checking whether %s and %s are friends" % (user_email1, user_email2))
+        if self.friends_cache_seconds > 0:
+            friends = self._cached_friends(user_email1)
+            if friends is None:
+                friends = set(self.get_friends(user_email1))
+            return user_email2 in friends
         cursor = self.conn.cursor()
         friends_ordered = tuple(list(sorted([user_email1, user_email2])))
         PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     CHECK_FRIENDS_QUERY.format(self.friends_table_name) % friends_ordered)
+                                     self.queries["check_friends"], friends_ordered)
         result = cursor.fetchone()
         cursor.close()
         if not result:
             return False
         return True
 
+    def are_friends_many(self, user_email: str, candidate_emails: List[str]) -> Set[str]:
+        """
+        Check which of the candidates are friends of the user
+
+        :param user_email: the user email
+        :param candidate_emails: the emails of the users to check
+        :return: the set of candidates that are friends of the user
+        """
+        friends = self._cached_friends(user_email)
+        if friends is not None:
+            return friends.intersection(candidate_emails)
+        candidate_emails = list(set(candidate_emails))
+        if not candidate_emails:
+            return set()
+        self.logger.debug("Checking which of %d users are friends of %s" % (len(candidate_emails), user_email))
+        cursor = self.conn.cursor()
+        PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                     self.queries["are_friends_many"],
+                                     (user_email, user_email, candidate_emails, user_email, candidate_emails))
+        result = cursor.fetchall()
+        cursor.close()
+        return {r[0] for r in result}
+
+    def get_relationship(self, user_email: str, other_user_email: str) -> Relationship:
+        """
+        Get the relationship of a user with another one
+
+        :param user_email: the user email
+        :param other_user_email: the other user email
+        :return: friends if they are friends, received or sent if there is a friend request
+        from or to the other user, no_contact otherwise
+        """
+        friends = self._cached_friends(user_email)
+        if friends is not None and other_user_email in friends:
+            return Relationship.friends
+        self.logger.debug("Getting relationship between %s and %s" % (user_email, other_user_email))
+        friends_ordered = tuple(sorted([user_email, other_user_email]))
+        cursor = self.conn.cursor()
+        PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                     self.queries["get_relationship"],
+                                     friends_ordered + (other_user_email, user_email, user_email, other_user_email))
+        result = cursor.fetchone()
+        cursor.close()
+        if not result:
+            return Relationship.no_contact
+        return Relationship(result[0])
+
     def exists_friend_request(self, from_user_email: str, to_user_email: str) -> bool:
         """
         Check if exists friend request from 'requestor' to 'receiver'
@@ -306,7 +623,7 @@ class PostgresFriendDatabase(FriendDatabase):
         self.logger.debug("Checking whether %s sent a friend request to %s" % (from_user_email, to_user_email))
         cursor = self.conn.cursor()
         PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     CHECK_FRIEND_REQUEST_QUERY.format(self.friend_requests_table_name),
+                                     self.queries["check_friend_request"],
                                      (from_user_email, to_user_email))
         result = cursor.fetchone()
         cursor.close()
@@ -329,12 +646,26 @@ class PostgresFriendDatabase(FriendDatabase):
         if not self.are_friends(from_user_email, to_user_email):
             raise UsersAreNotFriendsError
         self.logger.debug("Sending user message")
-        cursor = self.conn.cursor()
-        PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     SEND_MESSAGE_QUERY.format(self.user_messages_table_name),
-                                     (from_user_email, to_user_email, message, datetime.now().isoformat()))
-        self.conn.commit()
-        cursor.close()
+        timestamp = datetime.now()
+        preview = message[:CONVERSATION_PREVIEW_LENGTH]
+
+        def send(cursor):
+            PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                         self.queries["next_conversation_seq"],
+                                         tuple(sorted((from_user_email, to_user_email))))
+            seq = cursor.fetchone()[0]
+            PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                         self.queries["send_message"],
+                                         (from_user_email, to_user_email, message, timestamp.isoformat(), seq))
+            message_id = cursor.fetchone()[0]
+            PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                         self.queries["update_conversations"],
+                                         (from_user_email, to_user_email, message_id, timestamp, from_user_email,
+                                          preview, seq,
+                                          to_user_email, from_user_email, message_id, timestamp, from_user_email,
+                                          preview, seq))
+
+        PostgresUtils.run_transaction(self.logger, self.conn, send)
 
     def get_conversation(self, requestor_email: str, other_user_email: str,
                          per_page: int, page: int) -> Tuple[List[PrivateMessage], int]:
@@ -355,11 +686,8 @@ class PostgresFriendDatabase(FriendDatabase):
         cursor = self.conn.cursor()
 
         PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     COUNT_ROWS_CONVERSATION_QUERY.format(
-                                         user_messages_table_name=self.user_messages_table_name,
-                                         user_deleted_messages_table_name=self.user_deleted_messages_table_name),
-                                     (requestor_email, other_user_email, requestor_email, other_user_email,
-                                      requestor_email))
+                                     self.queries["count_rows_conversation"],
+                                     (requestor_email, other_user_email) * 3)
         result = cursor.fetchone()
 
         pages = int(math.ceil(result[0] / per_page))
@@ -367,19 +695,122 @@ class PostgresFriendDatabase(FriendDatabase):
             raise NoMoreMessagesError()
 
         PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     GET_PAGINATED_CONVERSATION_QUERY.format(
-                                         user_messages_table_name=self.user_messages_table_name,
-                                         user_deleted_messages_table_name=self.user_deleted_messages_table_name),
-                                     (requestor_email, other_user_email, requestor_email, other_user_email,
-                                      requestor_email,
-                                      per_page, page * per_page))
+                                     self.queries["get_paginated_conversation"],
+                                     (requestor_email, other_user_email) * 3 + (per_page, page * per_page))
         result = cursor.fetchall()
         self.conn.commit()
         cursor.close()
         # from_user, to_user, message, datetime
-        result = [PrivateMessage(from_user=r[0], to_user=r[1], message=r[2], timestamp=r[3]) for r in result]
+        result = [PrivateMessage(from_user=r[0], to_user=r[1], message=r[2], timestamp=r[3], seq=r[4])
+                  for r in result]
         return result, pages
 
+    def get_conversation_page(self, requestor_email: str, other_user_email: str, limit: int,
+                              before: Optional[str] = None) -> MessagesPage:
+        """
+        Get a page of the conversation between user1 and user2 using a cursor instead of a page number
+        The messages are ordered by timestamp and id descending
+
+        :raises:
+            InvalidCursorError: the cursor is malformed
+
+        :param requestor_email: the email of user1
+        :param other_user_email: the email of user2
+        :param limit: the maximum amount of messages in the page
+        :param before: the cursor returned with the previous page, None for the newest messages
+        :return: a page of messages
+        """
+        query = self.queries["get_conversation_page"]
+        keyset_params = ()
+        if before:
+            query = self.queries["get_conversation_page_before"]
+            keyset_params = self.decode_messages_cursor(before)
+        self.logger.debug("Getting conversation page between %s and %s" % (requestor_email, other_user_email))
+        cursor = self.conn.cursor()
+        PostgresUtils.safe_query_run(self.logger, self.conn, cursor, query,
+                                     (requestor_email, other_user_email) +
+                                     (requestor_email, other_user_email) + keyset_params + (limit + 1,) +
+                                     (other_user_email, requestor_email) + keyset_params + (limit + 1, limit + 1))
+        result = cursor.fetchall()
+        self.conn.commit()
+        cursor.close()
+        next_cursor = None
+        if len(result) > limit:
+            result = result[:limit]
+            next_cursor = self.encode_messages_cursor(result[-1][4], result[-1][0])
+        # id, from_user, to_user, message, datetime
+        return MessagesPage(messages=[PrivateMessage(from_user=r[1], to_user=r[2], message=r[3], timestamp=r[4],
+                                                     seq=r[5])
+                                      for r in result],
+                            next_cursor=next_cursor)
+
+    def get_messages_since(self, requestor_email: str, other_user_email: str, since: int,
+                           limit: int) -> List[PrivateMessage]:
+        """
+        Get the messages of the conversation between user1 and user2 newer than a sequence number
+        If there are no new messages it is a single lookup of the last sequence number of the conversation
+
+        :param requestor_email: the email of user1
+        :param other_user_email: the email of user2
+        :param since: the sequence number of the last message known
+        :param limit: the maximum amount of messages to return
+        :return: the oldest messages after since ordered by sequence number
+        """
+        self.logger.debug("Getting messages between %s and %s since %d" % (requestor_email, other_user_email, since))
+        cursor = self.conn.cursor()
+        PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                     self.queries["last_conversation_seq"],
+                                     tuple(sorted((requestor_email, other_user_email))))
+        last_seq = cursor.fetchone()
+        result = []
+        if last_seq and last_seq[0] > since:
+            PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                         self.queries["get_messages_since"],
+                                         (requestor_email, other_user_email) +
+                                         (requestor_email, other_user_email, since, limit) +
+                                         (other_user_email, requestor_email, since, limit, limit))
+            result = cursor.fetchall()
+        self.conn.commit()
+        cursor.close()
+        # from_user, to_user, message, datetime, seq
+        return [PrivateMessage(from_user=r[0], to_user=r[1], message=r[2], timestamp=r[3], seq=r[4])
+                for r in result]
+
+    def get_unread_counts(self, user_email: str) -> Dict[str, int]:
+        """
+        Get the amount of messages received and not read in each conversation
+
+        :param user_email: the email of the user
+        :return: a dict of the email of the other user to the amount of unread messages, only the ones with any
+        """
+        cursor = self.conn.cursor()
+        PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                     self.queries["get_unread_counts"], (user_email,))
+        result = cursor.fetchall()
+        self.conn.commit()
+        cursor.close()
+        return {r[0]: r[1] for r in result}
+
+    def mark_conversation_read(self, user_email: str, other_user_email: str,
+                               up_to_seq: Optional[int] = None) -> NoReturn:
+        """
+        Marks the messages received in a conversation as read
+
+        :param user_email: the email of the user that read the conversation
+        :param other_user_email: the email of the other user of the conversation
+        :param up_to_seq: the sequence number of the last message read, None for all of them
+        """
+        cursor = self.conn.cursor()
+        if up_to_seq is None:
+            PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                         self.queries["mark_conversation_read"], (user_email, other_user_email))
+        else:
+            PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                         self.queries["mark_conversation_read_up_to"],
+                                         (other_user_email, user_email, up_to_seq, user_email, other_user_email))
+        self.conn.commit()
+        cursor.close()
+
     def get_conversations(self, user_email: str) -> Tuple[List[Dict], List[PrivateMessage]]:
         """
         Get all the conversations ordered by recent activity
@@ -391,20 +822,16 @@ class PostgresFriendDatabase(FriendDatabase):
 
         cursor = self.conn.cursor()
         PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     GET_CONVERSATIONS_QUERY.format(
-                                         friends_table_name=self.friends_table_name,
-                                         user_messages_table_name=self.user_messages_table_name,
-                                         users_table_name=self.users_table_name,
-                                         user_deleted_messages_table_name=self.user_deleted_messages_table_name),
-                                     (user_email,) * 9)
+                                     self.queries["get_conversations"], (user_email,))
         '''
-        u.email, u.fullname, u.phone_number, u.photo
-        messages.from_user, messages.to_user, messages.message, messages.datetime
+        u.email, u.fullname, u.phone_number, photo_hash
+        messages.from_user, messages.to_user, messages.message, messages.datetime, messages.seq
         '''
         result = cursor.fetchall()
         user_data = [{"email": r[0], "fullname": r[1],
-                      "phone_number": r[2], "photo": r[3]} for r in result]
-        videos_data = [PrivateMessage(from_user=r[4], to_user=r[5], message=r[6], timestamp=r[7]) for r in result]
+                      "phone_number": r[2], "photo_hash": r[3]} for r in result]
+        videos_data = [PrivateMessage(from_user=r[4], to_user=r[5], message=r[6], timestamp=r[7], seq=r[8])
+                       for r in result]
         self.conn.commit()
         cursor.close()
         return user_data, videos_data
@@ -417,12 +844,13 @@ class PostgresFriendDatabase(FriendDatabase):
         :param deleted_email: the email of the other user of the conversation
         """
         self.logger.debug("%s deleting conversation with %s" % (deletor_email, deleted_email))
-        cursor = self.conn.cursor()
-        PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     DELETE_CONVERSATION_QUERY.format(
-                                         user_messages_table_name=self.user_messages_table_name,
-                                         user_deleted_messages_table_name=self.user_deleted_messages_table_name),
-                                     (deletor_email, deletor_email, deleted_email, deletor_email, deleted_email,
-                                      deletor_email))
-        self.conn.commit()
-        cursor.close()
+
+        def delete(cursor):
+            PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                         self.queries["delete_conversation"],
+                                         (deletor_email, deleted_email) * 2 + (deleted_email, deletor_email))
+            PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                         self.queries["delete_conversation_summary"],
+                                         (deletor_email, deleted_email))
+
+        PostgresUtils.run_transaction(self.logger, self.conn, delete)
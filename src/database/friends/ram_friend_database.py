@@ -1,26 +1,51 @@
-from typing import NoReturn, List, Dict, Set, Tuple
+from typing import NoReturn, List, Dict, Set, Tuple, Optional
 from abc import abstractmethod
 from src.database.friends.exceptions.users_already_friends_error import UsersAlreadyFriendsError
 from src.database.friends.exceptions.unexistent_friend_requests import UnexistentFriendRequest
 from src.database.friends.exceptions.users_are_not_friends_error import UsersAreNotFriendsError
 from src.database.friends.exceptions.no_more_messages_error import NoMoreMessagesError
 import math
-from src.database.friends.friend_database import FriendDatabase, PrivateMessage
+from src.database.friends.friend_database import FriendDatabase, PrivateMessage, Relationship, MessagesPage, \
+    CONVERSATION_PREVIEW_LENGTH, FRIENDS_RESOURCE
 from datetime import datetime
+from src.database.utils.synchronized import synchronized
+from src.database.utils.resource_versions import RamResourceVersions, ResourceVersion
+import threading
 
 
 class RamFriendDatabase(FriendDatabase):
     """
     Friend database in ram
+
+    Every user has its own adjacency sets so the operations are proportional to its amount
+    of friends, requests or conversations instead of the amount of users
     """
-    friend_request: Dict[str, Set[str]]
-    friends: Set[Tuple[str, str]]
+    friends: Dict[str, Set[str]]
+    sent_requests: Dict[str, Set[str]]
+    received_requests: Dict[str, Dict[str, None]]
+    messages: Dict[Tuple[str, str], List[PrivateMessage]]
+    conversations: Dict[str, Set[str]]
+    hidden_before: Dict[Tuple[str, str, str], int]
+    sequences: Dict[Tuple[str, str], int]
+    unread: Dict[str, Dict[str, int]]
 
     def __init__(self):
-        self.friend_requests = {}
-        self.friends = set()
+        self.friends = {}
+        self.sent_requests = {}
+        # Dicts as ordered sets, the requests are listed in the order they were received
+        self.received_requests = {}
         self.messages = {}
-
+        self.conversations = {}
+        # (reader, sender, receiver) -> amount of messages hidden to the reader in that direction
+        self.hidden_before = {}
+        # (user1, user2) sorted -> sequence number of the last message of the conversation
+        self.sequences = {}
+        self.unread = {}
+        self.resource_versions = RamResourceVersions()
+        # The backend is shared by the requests served in threads
+        self.lock = threading.RLock()
+
+    @synchronized
     def create_friend_request(self, from_user_email: str,
                               to_user_email: str) -> NoReturn:
         """
@@ -36,11 +61,25 @@ class RamFriendDatabase(FriendDatabase):
         """
         if self.are_friends(from_user_email, to_user_email):
             raise UsersAlreadyFriendsError
-        if from_user_email not in self.friend_requests:
-            self.friend_requests[from_user_email] = {to_user_email}
-        else:
-            self.friend_requests[from_user_email].update([to_user_email])
+        self.sent_requests.setdefault(from_user_email, set()).add(to_user_email)
+        self.received_requests.setdefault(to_user_email, {})[from_user_email] = None
+
+    def _remove_friend_request(self, from_user_email: str, to_user_email: str) -> NoReturn:
+        """
+        Removes an existing friend request
+
+        :raises:
+            UnexistentFriendRequest: the friend request does not exist or is not pending
 
+        :param from_user_email: the user that requested the friendship
+        :param to_user_email: the target user of the request
+        """
+        if not self.exists_friend_request(from_user_email, to_user_email):
+            raise UnexistentFriendRequest
+        self.sent_requests[from_user_email].remove(to_user_email)
+        del self.received_requests[to_user_email][from_user_email]
+
+    @synchronized
     def accept_friend_request(self, from_user_email: str,
                               to_user_email: str) -> NoReturn:
         """
@@ -52,14 +91,12 @@ class RamFriendDatabase(FriendDatabase):
         :param from_user_email: the user that requested the friendship
         :param to_user_email: the target user of the request
         """
-        if from_user_email not in self.friend_requests or \
-                to_user_email not in self.friend_requests[from_user_email]:
-            raise UnexistentFriendRequest
-        self.friend_requests[from_user_email].remove(to_user_email)
-        friend_tuple = list(sorted([from_user_email,to_user_email]))
-        friend_tuple = (friend_tuple[0], friend_tuple[1])
-        self.friends.update([friend_tuple])
+        self._remove_friend_request(from_user_email, to_user_email)
+        self.friends.setdefault(from_user_email, set()).add(to_user_email)
+        self.friends.setdefault(to_user_email, set()).add(from_user_email)
+        self.resource_versions.bump(FRIENDS_RESOURCE % from_user_email, FRIENDS_RESOURCE % to_user_email)
 
+    @synchronized
     def reject_friend_request(self, from_user_email: str,
                               to_user_email: str) -> NoReturn:
         """
@@ -71,11 +108,9 @@ class RamFriendDatabase(FriendDatabase):
         :param from_user_email: the user that requested the friendship
         :param to_user_email: the target user of the request
         """
-        if from_user_email not in self.friend_requests or \
-                to_user_email not in self.friend_requests[from_user_email]:
-            raise UnexistentFriendRequest
-        self.friend_requests[from_user_email].remove(to_user_email)
+        self._remove_friend_request(from_user_email, to_user_email)
 
+    @synchronized
     def get_friend_requests(self, user_email: str) -> List[str]:
         """
         Gets all the user emails that have sent a user request to the user
@@ -83,8 +118,9 @@ class RamFriendDatabase(FriendDatabase):
         :param user_email: the user to query for its friend requests
         :return: a list of emails
         """
-        return list(k for k,v in self.friend_requests.items() if user_email in v)
+        return list(self.received_requests.get(user_email, {}))
 
+    @synchronized
     def get_friends(self, user_email: str) -> List[str]:
         """
         Gets all the user emails that are friends of the user
@@ -92,10 +128,9 @@ class RamFriendDatabase(FriendDatabase):
         :param user_email: the user to query for its friend
         :return: a list of emails
         """
-        friends = [f for t in self.friends for f in t if user_email in t]
-        friends = [f for f in friends if f!=user_email]
-        return friends
+        return list(self.friends.get(user_email, set()))
 
+    @synchronized
     def delete_friendship(self, user_email1: str, user_email2: str) -> NoReturn:
         """
         Delete friendship if exists
@@ -103,13 +138,22 @@ class RamFriendDatabase(FriendDatabase):
         :param user_email1: first user email
         :param user_email2: second user email
         """
-        friend_tuple = list(sorted([user_email1,user_email2]))
-        friend_tuple = (friend_tuple[0], friend_tuple[1])
-        try:
-            self.friends.remove(friend_tuple)
-        except KeyError:
+        if user_email2 not in self.friends.get(user_email1, set()):
             return
+        self.friends[user_email1].discard(user_email2)
+        self.friends.get(user_email2, set()).discard(user_email1)
+        self.resource_versions.bump(FRIENDS_RESOURCE % user_email1, FRIENDS_RESOURCE % user_email2)
+
+    def get_friends_version(self, user_email: str) -> ResourceVersion:
+        """
+        Gets the version of the friends of a user, it changes when a friendship is accepted or deleted
 
+        :param user_email: the user
+        :return: the version
+        """
+        return self.resource_versions.get(FRIENDS_RESOURCE % user_email)
+
+    @synchronized
     def are_friends(self, user_email1: str, user_email2: str) -> bool:
         """
         Check if user1 is friend with user2
@@ -118,10 +162,20 @@ class RamFriendDatabase(FriendDatabase):
         :param user_email2: the second user email
         :return: a boolean indicating whether user1 is friend user2's friend
         """
-        friend_tuple = list(sorted([user_email1,user_email2]))
-        friend_tuple = (friend_tuple[0], friend_tuple[1])
-        return friend_tuple in self.friends
+        return user_email2 in self.friends.get(user_email1, set())
+
+    @synchronized
+    def are_friends_many(self, user_email: str, candidate_emails: List[str]) -> Set[str]:
+        """
+        Check which of the candidates are friends of the user
 
+        :param user_email: the user email
+        :param candidate_emails: the emails of the users to check
+        :return: the set of candidates that are friends of the user
+        """
+        return self.friends.get(user_email, set()).intersection(candidate_emails)
+
+    @synchronized
     def exists_friend_request(self, from_user_email: str, to_user_email: str) -> bool:
         """
         Check if exists friend request from 'requestor' to 'receiver'
@@ -130,11 +184,27 @@ class RamFriendDatabase(FriendDatabase):
         :param to_user_email: the receiver of the request
         :return: a boolean indicating whether the friend request exists
         """
-        if from_user_email not in self.friend_requests or \
-                to_user_email not in self.friend_requests[from_user_email]:
-            return False
-        return True
+        return to_user_email in self.sent_requests.get(from_user_email, set())
+
+    @synchronized
+    def get_relationship(self, user_email: str, other_user_email: str) -> Relationship:
+        """
+        Get the relationship of a user with another one
 
+        :param user_email: the user email
+        :param other_user_email: the other user email
+        :return: friends if they are friends, received or sent if there is a friend request
+        from or to the other user, no_contact otherwise
+        """
+        if self.are_friends(user_email, other_user_email):
+            return Relationship.friends
+        if self.exists_friend_request(other_user_email, user_email):
+            return Relationship.received
+        if self.exists_friend_request(user_email, other_user_email):
+            return Relationship.sent
+        return Relationship.no_contact
+
+    @synchronized
     def send_message(self, from_user_email: str, to_user_email: str,
                      message: str) -> NoReturn:
         """
@@ -151,10 +221,17 @@ class RamFriendDatabase(FriendDatabase):
             raise UsersAreNotFriendsError
         if (from_user_email, to_user_email) not in self.messages:
             self.messages[(from_user_email, to_user_email)] = []
+            self.conversations.setdefault(from_user_email, set()).add(to_user_email)
+            self.conversations.setdefault(to_user_email, set()).add(from_user_email)
+        conversation_key = tuple(sorted((from_user_email, to_user_email)))
+        self.sequences[conversation_key] = self.sequences.get(conversation_key, 0) + 1
         message = PrivateMessage(from_user=from_user_email, to_user=to_user_email,
-                                 timestamp=datetime.now(), message=message)
+                                 timestamp=datetime.now(), message=message, seq=self.sequences[conversation_key])
         self.messages[(from_user_email, to_user_email)].append(message)
+        receiver_unread = self.unread.setdefault(to_user_email, {})
+        receiver_unread[from_user_email] = receiver_unread.get(from_user_email, 0) + 1
 
+    @synchronized
     def get_conversation(self, requestor_email: str, other_user_email: str,
                          per_page: int, page: int) -> Tuple[List[PrivateMessage], int]:
         """
@@ -169,72 +246,150 @@ class RamFriendDatabase(FriendDatabase):
         :param page: the page for the message, starting from 0
         :return: the list of private messages and the number of pages
         """
-        total_messages = []
-        if (requestor_email, other_user_email) in self.messages:
-            total_messages += self.messages[(requestor_email, other_user_email)]
-        if (other_user_email, requestor_email) in self.messages:
-            total_messages += self.messages[(other_user_email, requestor_email)]
-        total_messages = [m for m in total_messages if not m.hidden_to or requestor_email not in m.hidden_to]
+        total_messages = (self._visible_messages(requestor_email, (requestor_email, other_user_email)) +
+                          self._visible_messages(requestor_email, (other_user_email, requestor_email)))
         total_messages = sorted(total_messages, key=lambda x: x.timestamp, reverse=True)
         pages = int(math.ceil(len(total_messages)/per_page))
         if not page < pages and page != 0:
             raise NoMoreMessagesError()
         return total_messages[page*per_page:(page+1)*per_page], pages
 
+    @synchronized
+    def get_conversation_page(self, requestor_email: str, other_user_email: str, limit: int,
+                              before: Optional[str] = None) -> MessagesPage:
+        """
+        Get a page of the conversation between user1 and user2 using a cursor instead of a page number
+        The id of a message is its position in the conversation, messages are only appended
+
+        :raises:
+            InvalidCursorError: the cursor is malformed
+
+        :param requestor_email: the email of user1
+        :param other_user_email: the email of user2
+        :param limit: the maximum amount of messages in the page
+        :param before: the cursor returned with the previous page, None for the newest messages
+        :return: a page of messages
+        """
+        conversation = sorted(self.messages.get((requestor_email, other_user_email), []) +
+                              self.messages.get((other_user_email, requestor_email), []),
+                              key=lambda x: x.timestamp)
+        # The hidden messages are the oldest ones of the conversation
+        first_visible = (self.hidden_before.get((requestor_email, requestor_email, other_user_email), 0) +
+                         self.hidden_before.get((requestor_email, other_user_email, requestor_email), 0))
+        end = len(conversation)
+        if before:
+            end = min(self.decode_messages_cursor(before)[1], end)
+        start = max(end - limit, first_visible)
+        page = list(reversed(conversation[start:end]))
+        next_cursor = None
+        if start > first_visible:
+            next_cursor = self.encode_messages_cursor(page[-1].timestamp, start)
+        return MessagesPage(messages=page, next_cursor=next_cursor)
+
+    @synchronized
+    def get_messages_since(self, requestor_email: str, other_user_email: str, since: int,
+                           limit: int) -> List[PrivateMessage]:
+        """
+        Get the messages of the conversation between user1 and user2 newer than a sequence number
+        Every message of a conversation has the sequence number following the one of the previous message
+
+        :param requestor_email: the email of user1
+        :param other_user_email: the email of user2
+        :param since: the sequence number of the last message known
+        :param limit: the maximum amount of messages to return
+        :return: the oldest messages after since ordered by sequence number
+        """
+        if self.sequences.get(tuple(sorted((requestor_email, other_user_email))), 0) <= since:
+            return []
+        new_messages = [m for key in [(requestor_email, other_user_email), (other_user_email, requestor_email)]
+                        for m in self._visible_messages(requestor_email, key) if m.seq > since]
+        return sorted(new_messages, key=lambda x: x.seq)[:limit]
+
+    @synchronized
+    def get_unread_counts(self, user_email: str) -> Dict[str, int]:
+        """
+        Get the amount of messages received and not read in each conversation
+
+        :param user_email: the email of the user
+        :return: a dict of the email of the other user to the amount of unread messages, only the ones with any
+        """
+        return dict(self.unread.get(user_email, {}))
+
+    @synchronized
+    def mark_conversation_read(self, user_email: str, other_user_email: str,
+                               up_to_seq: Optional[int] = None) -> NoReturn:
+        """
+        Marks the messages received in a conversation as read
+
+        :param user_email: the email of the user that read the conversation
+        :param other_user_email: the email of the other user of the conversation
+        :param up_to_seq: the sequence number of the last message read, None for all of them
+        """
+        user_unread = self.unread.get(user_email, {})
+        if up_to_seq is None or other_user_email not in user_unread:
+            user_unread.pop(other_user_email, None)
+            return
+        still_unread = len([m for m in self.messages.get((other_user_email, user_email), []) if m.seq > up_to_seq])
+        if still_unread:
+            user_unread[other_user_email] = min(user_unread[other_user_email], still_unread)
+        else:
+            user_unread.pop(other_user_email)
+
+    @synchronized
     def get_conversations(self, user_email: str) -> Tuple[List[Dict], List[PrivateMessage]]:
         """
         Get all the conversations ordered by recent activity
+        The last messages are truncated to CONVERSATION_PREVIEW_LENGTH characters
 
         :param user_email: the email of the user for getting the conversations
         :return: a tuple (list of user data, list of last private message)
         """
-        user_messages_keys = [(u1, u2) for u1, u2 in self.messages.keys() if u1 == user_email or u2 == user_email]
         last_messages = []
-        for key in user_messages_keys:
-            visible_messages = [m for m in self.messages[key] if not m.hidden_to or user_email not in m.hidden_to]
-            if visible_messages:
-                last_messages.append(visible_messages[-1])
-        last_messages = sorted(last_messages, key=lambda x: x.timestamp, reverse=True)
-
-        already_considered_users = []
-        last_messages_per_user = []
-        for m in last_messages:
-            other_user = (m.from_user if m.from_user != user_email else m.to_user)
-            if other_user in already_considered_users or not self.are_friends(other_user, user_email):
+        for other_user in self.conversations.get(user_email, set()):
+            if not self.are_friends(other_user, user_email):
                 continue
-            already_considered_users.append(other_user)
-            last_messages_per_user.append(m)
+            candidates = [self._last_visible_message(user_email, (user_email, other_user)),
+                          self._last_visible_message(user_email, (other_user, user_email))]
+            candidates = [m for m in candidates if m]
+            if candidates:
+                last_messages.append((other_user, max(candidates, key=lambda x: x.timestamp)))
+        last_messages = sorted(last_messages, key=lambda x: x[1].timestamp, reverse=True)
 
-        already_considered_users = [{"email":e} for e in already_considered_users]
+        return [{"email": other_user} for other_user, _ in last_messages], \
+               [m._replace(message=m.message[:CONVERSATION_PREVIEW_LENGTH]) for _, m in last_messages]
 
-        return already_considered_users, last_messages_per_user
+    def _visible_messages(self, user_email: str, key: Tuple[str, str]) -> List[PrivateMessage]:
+        """
+        Gets the messages sent in one direction of a conversation not hidden to the user
+
+        :param user_email: the email of the user reading the conversation
+        :param key: the (sender, receiver) of the messages
+        :return: the visible messages, oldest first
+        """
+        return self.messages.get(key, [])[self.hidden_before.get((user_email,) + key, 0):]
+
+    def _last_visible_message(self, user_email: str, key: Tuple[str, str]) -> Optional[PrivateMessage]:
+        """
+        Gets the last message sent in one direction of a conversation not hidden to the user
+
+        :param user_email: the email of the user reading the conversation
+        :param key: the (sender, receiver) of the messages
+        :return: the last visible message or None if there is not any
+        """
+        messages = self.messages.get(key, [])
+        if len(messages) > self.hidden_before.get((user_email,) + key, 0):
+            return messages[-1]
+        return None
 
+    @synchronized
     def delete_conversation(self, deletor_email: str, deleted_email: str) -> NoReturn:
         """
         Deletes the conversation between two users but just for the deletor
+        The messages sent until now are hidden moving the watermark of each direction
 
         :param deletor_email: the email of the one that deletes the conversation
         :param deleted_email: the email of the other user of the conversation
         """
-        if (deletor_email, deleted_email) in self.messages:
-            for i in range(len(self.messages[(deletor_email, deleted_email)])):
-                if self.messages[(deletor_email, deleted_email)][i].hidden_to:
-                    self.messages[(deletor_email, deleted_email)][i].hidden_to.update([deletor_email])
-                else:
-                    previous_pm = self.messages[(deletor_email, deleted_email)][i]
-                    self.messages[(deletor_email, deleted_email)][i] = PrivateMessage(from_user=previous_pm.from_user,
-                                                                                      to_user=previous_pm.to_user,
-                                                                                      timestamp=previous_pm.timestamp,
-                                                                                      message=previous_pm.message,
-                                                                                      hidden_to={deletor_email})
-        if (deleted_email, deletor_email) in self.messages:
-            for i in range(len(self.messages[(deleted_email, deletor_email)])):
-                if self.messages[(deleted_email, deletor_email)][i].hidden_to:
-                    self.messages[(deleted_email, deletor_email)][i].hidden_to.update([deletor_email])
-                else:
-                    previous_pm = self.messages[(deleted_email, deletor_email)][i]
-                    self.messages[(deleted_email, deletor_email)][i] = PrivateMessage(from_user=previous_pm.from_user,
-                                                                                      to_user=previous_pm.to_user,
-                                                                                      timestamp=previous_pm.timestamp,
-                                                                                      message=previous_pm.message,
-                                                                                      hidden_to={deletor_email})
\ No newline at end of file
+        for key in [(deletor_email, deleted_email), (deleted_email, deletor_email)]:
+            self.hidden_before[(deletor_email,) + key] = len(self.messages.get(key, []))
+        self.mark_conversation_read(deletor_email, deleted_email)
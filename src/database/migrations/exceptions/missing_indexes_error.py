@@ -0,0 +1,2 @@
+class MissingIndexesError(AttributeError):
+    pass
\ No newline at end of file
@@ -0,0 +1,139 @@
+from typing import NoReturn, List, Set, Dict, Optional
+from datetime import datetime
+import logging
+import os
+from src.database.migrations.schema_migrations import Migration, IndexDefinition, IndexTemplate, MIGRATIONS, \
+    REQUIRED_INDEXES, DEFAULT_TABLE_NAMES
+from src.database.migrations.exceptions.missing_indexes_error import MissingIndexesError
+from src.database.utils.postgres_connection import PostgresUtils
+
+# Any number works, it just has to be the same for every app server migrating the database
+MIGRATIONS_LOCK_ID = 7201
+
+LOCK_MIGRATIONS_QUERY = """
+SELECT pg_advisory_xact_lock(%s)
+"""
+
+CREATE_MIGRATIONS_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS {migrations_table_name}
+(
+    version int PRIMARY KEY,
+    description varchar,
+    applied_at timestamp
+)
+"""
+
+APPLIED_VERSIONS_QUERY = """
+SELECT version FROM {migrations_table_name}
+"""
+
+REGISTER_MIGRATION_QUERY = """
+INSERT INTO {migrations_table_name} (version, description, applied_at)
+VALUES (%s, %s, %s)
+"""
+
+VALID_INDEX_QUERY = """
+SELECT indisvalid FROM pg_index
+WHERE indexrelid = to_regclass(%s)
+"""
+
+
+class PostgresMigrator:
+    """
+    Applies the schema migrations and verifies the indexes the postgres backends need
+    """
+    logger = logging.getLogger(__module__)
+
+    def __init__(self, migrations_table_name: str,
+                 postgr_host_env_name: str, postgr_user_env_name: str,
+                 postgr_pass_env_name: str, postgr_database_env_name: str,
+                 table_names: Optional[Dict[str, str]] = None):
+        """
+
+        :param migrations_table_name: the table of the applied versions
+        :param table_names: the names of the tables of the backends by their key in the configuration,
+                            the missing ones are the default
+        """
+        self.migrations_table_name = migrations_table_name
+        self.table_names = dict(DEFAULT_TABLE_NAMES, **(table_names or {}))
+        self.conn = PostgresUtils.get_postgres_connection(host=os.environ[postgr_host_env_name],
+                                                          user=os.environ[postgr_user_env_name],
+                                                          password=os.environ[postgr_pass_env_name],
+                                                          database=os.environ[postgr_database_env_name])
+        if self.conn.closed == 0:
+            self.logger.info("Connected to postgres database")
+        else:
+            self.logger.error("Unable to connect to postgres database")
+            raise ConnectionError("Unable to connect to postgres database")
+
+    def _applied_versions(self, cursor) -> Set[int]:
+        """
+        Gets the versions already applied, creating the migrations table if needed
+
+        :param cursor: the cursor of the migration transaction
+        :return: a set of versions
+        """
+        PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                     CREATE_MIGRATIONS_TABLE_QUERY.format(
+                                         migrations_table_name=self.migrations_table_name))
+        PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                     APPLIED_VERSIONS_QUERY.format(migrations_table_name=self.migrations_table_name))
+        return {r[0] for r in cursor.fetchall()}
+
+    def migrate(self, migrations: List[Migration] = MIGRATIONS) -> List[int]:
+        """
+        Applies the pending migrations in a single transaction, concurrent calls wait for each other
+
+        :param migrations: the migrations of the schema
+        :return: the versions applied
+        """
+        cursor = self.conn.cursor()
+        PostgresUtils.safe_query_run(self.logger, self.conn, cursor, LOCK_MIGRATIONS_QUERY, (MIGRATIONS_LOCK_ID,))
+        applied_versions = self._applied_versions(cursor)
+        applied = []
+        for migration in sorted(migrations, key=lambda m: m.version):
+            if migration.version in applied_versions:
+                continue
+            self.logger.info("Applying migration %d: %s" % (migration.version, migration.description))
+            for statement in migration.format(self.table_names).statements:
+                PostgresUtils.safe_query_run(self.logger, self.conn, cursor, statement)
+            PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                         REGISTER_MIGRATION_QUERY.format(
+                                             migrations_table_name=self.migrations_table_name),
+                                         (migration.version, migration.description, datetime.now().isoformat()))
+            applied.append(migration.version)
+        self.conn.commit()
+        cursor.close()
+        return applied
+
+    def missing_indexes(self, indexes: List[IndexTemplate] = REQUIRED_INDEXES) -> List[IndexDefinition]:
+        """
+        Gets the indexes that do not exist or are invalid
+
+        :param indexes: the indexes to check
+        :return: a list of the missing indexes
+        """
+        cursor = self.conn.cursor()
+        missing = []
+        for index in [index.definition(self.table_names) for index in indexes]:
+            PostgresUtils.safe_query_run(self.logger, self.conn, cursor, VALID_INDEX_QUERY, (index.name,))
+            result = cursor.fetchone()
+            if not result or not result[0]:
+                missing.append(index)
+        self.conn.commit()
+        cursor.close()
+        return missing
+
+    def verify_indexes(self, indexes: List[IndexTemplate] = REQUIRED_INDEXES) -> NoReturn:
+        """
+        Verifies that the indexes exist
+
+        :raises:
+            MissingIndexesError: some index does not exist or is invalid
+
+        :param indexes: the indexes to check
+        """
+        missing = self.missing_indexes(indexes)
+        if missing:
+            self.logger.error("Missing indexes: %s" % ", ".join([index.name for index in missing]))
+            raise MissingIndexesError
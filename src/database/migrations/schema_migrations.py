@@ -0,0 +1,261 @@
+from typing import NamedTuple, List, Dict
+from src.database.friends.friend_database import CONVERSATION_PREVIEW_LENGTH
+
+
+class IndexDefinition(NamedTuple):
+    """
+    An index needed by the queries of the postgres backends
+
+    name: the name of the index qualified with its schema
+    statement: the statement that creates the index if it does not exist
+    """
+    name: str
+    statement: str
+
+
+class IndexTemplate(NamedTuple):
+    """
+    An index of a table whose name comes from the configuration
+
+    name: the name of the index, it is created in the schema of its table
+    table: the key of the name of the table in the table names, like videos_table_name
+    columns: the indexed columns or expressions
+    """
+    name: str
+    table: str
+    columns: str
+
+    @property
+    def statement(self) -> str:
+        """
+        The statement that creates the index, with the name of its table as a placeholder
+        """
+        return "CREATE INDEX IF NOT EXISTS %s ON {%s} (%s)" % (self.name, self.table, self.columns)
+
+    def definition(self, table_names: Dict[str, str]) -> IndexDefinition:
+        """
+        Creates the definition of the index for some table names
+
+        :param table_names: the names of the tables by their key
+        :return: the index definition
+        """
+        schema, _, _ = table_names[self.table].rpartition(".")
+        return IndexDefinition(name="%s.%s" % (schema, self.name) if schema else self.name,
+                               statement=self.statement.format(**table_names))
+
+
+class Migration(NamedTuple):
+    """
+    A versioned change of the database schema, migrations are applied once and in order
+    The statements have the names of the tables as placeholders, like the queries of the backends
+
+    version: the version of the schema after applying the migration
+    description: a description of the change
+    statements: the statements of the migration
+    """
+    version: int
+    description: str
+    statements: List[str]
+
+    def format(self, table_names: Dict[str, str]) -> 'Migration':
+        """
+        Fills the names of the tables of the statements
+
+        :param table_names: the names of the tables by their key
+        :return: the migration with the statements to run
+        """
+        return self._replace(statements=[statement.format(**table_names) for statement in self.statements])
+
+
+# The tables of the default configuration, the keys are the ones of the postgres backends in the configuration
+DEFAULT_TABLE_NAMES = {
+    "videos_table_name": "chotuve.videos",
+    "users_table_name": "chotuve.users",
+    "video_reactions_table_name": "chotuve.video_reactions",
+    "video_comments_table_name": "chotuve.video_comments",
+    "friends_table_name": "chotuve.friends",
+    "friend_requests_table_name": "chotuve.friend_requests",
+    "user_messages_table_name": "chotuve.user_messages",
+    # Only read by the version 4, no backend uses it since then
+    "deleted_messages_table_name": "chotuve.deleted_messages",
+    "deleted_conversations_table_name": "chotuve.deleted_conversations",
+    "conversations_table_name": "chotuve.conversations",
+    "conversation_sequences_table_name": "chotuve.conversation_sequences",
+    "resource_versions_table_name": "chotuve.resource_versions",
+    "app_server_api_calls_table": "chotuve.app_server_api_calls",
+    "response_cache_table_name": "chotuve.response_cache"
+}
+
+# Indexes of the keyset paginated listings and the photos by hash
+LISTING_INDEXES = [
+    IndexTemplate(name="videos_creation_time_index", table="videos_table_name",
+                  columns="creation_time, user_email, title"),
+    IndexTemplate(name="video_comments_video_datetime_index", table="video_comments_table_name",
+                  columns="video_owner_email, video_title, datetime, id"),
+    IndexTemplate(name="users_photo_md5_index", table="users_table_name",
+                  columns="md5(photo)")
+]
+
+# Indexes of the lookups not covered by the primary keys
+LOOKUP_INDEXES = [
+    IndexTemplate(name="friends_user2_index", table="friends_table_name",
+                  columns="user2, user1"),
+    IndexTemplate(name="friend_requests_to_index", table="friend_requests_table_name",
+                  columns="\"to\", \"from\""),
+    IndexTemplate(name="user_messages_from_user_index", table="user_messages_table_name",
+                  columns="from_user, to_user, datetime"),
+    IndexTemplate(name="user_messages_to_user_index", table="user_messages_table_name",
+                  columns="to_user, from_user, datetime"),
+    IndexTemplate(name="deleted_messages_deletor_index", table="deleted_messages_table_name",
+                  columns="deletor, id"),
+    IndexTemplate(name="video_reactions_video_index", table="video_reactions_table_name",
+                  columns="target_email, video_title, reaction_type"),
+    IndexTemplate(name="app_server_api_calls_datetime_index", table="app_server_api_calls_table",
+                  columns="datetime"),
+    IndexTemplate(name="app_server_api_calls_alias_datetime_index", table="app_server_api_calls_table",
+                  columns="alias, datetime")
+]
+
+# Index of the keyset paginated conversations, each direction of a conversation is a range of it
+CONVERSATION_INDEXES = [
+    IndexTemplate(name="user_messages_conversation_index", table="user_messages_table_name",
+                  columns="from_user, to_user, datetime, id")
+]
+
+# Index of the chat list, the conversations of a user by last activity
+CONVERSATIONS_SUMMARY_INDEXES = [
+    IndexTemplate(name="conversations_last_message_index", table="conversations_table_name",
+                  columns="user_email, last_message_datetime, last_message_id")
+]
+
+# Index of the polls for new messages, each direction of a conversation is a range of it
+MESSAGE_SEQUENCE_INDEXES = [
+    IndexTemplate(name="user_messages_seq_index", table="user_messages_table_name",
+                  columns="from_user, to_user, seq")
+]
+
+REQUIRED_INDEXES = (LISTING_INDEXES + LOOKUP_INDEXES + CONVERSATION_INDEXES + CONVERSATIONS_SUMMARY_INDEXES +
+                    MESSAGE_SEQUENCE_INDEXES)
+
+MIGRATIONS = [
+    Migration(version=1, description="Comment counts, comment ids and listing indexes",
+              statements=["ALTER TABLE {videos_table_name} "
+                          "ADD COLUMN IF NOT EXISTS comment_count int DEFAULT 0 NOT NULL",
+                          "UPDATE {videos_table_name} v SET comment_count = ("
+                          "SELECT COUNT(*) FROM {video_comments_table_name} vc "
+                          "WHERE vc.video_owner_email = v.user_email AND vc.video_title = v.title)",
+                          "ALTER TABLE {video_comments_table_name} ADD COLUMN IF NOT EXISTS id serial"] +
+                         [index.statement for index in LISTING_INDEXES]),
+    Migration(version=2, description="Lookup indexes",
+              statements=[index.statement for index in LOOKUP_INDEXES]),
+    Migration(version=3, description="Conversation pagination index",
+              statements=[index.statement for index in CONVERSATION_INDEXES]),
+    Migration(version=4, description="Deleted conversations as watermarks instead of deleted messages",
+              statements=["CREATE TABLE IF NOT EXISTS {deleted_conversations_table_name} ("
+                          "deletor varchar CONSTRAINT deleted_conversations_users_email_fk "
+                          "REFERENCES {users_table_name}, "
+                          "peer varchar CONSTRAINT deleted_conversations_users_email_fk_2 "
+                          "REFERENCES {users_table_name}, "
+                          "datetime timestamp NOT NULL, "
+                          "id int NOT NULL, "
+                          "CONSTRAINT deleted_conversations_pk PRIMARY KEY (deletor, peer))",
+                          # Every deletion hid the whole conversation, so the last deleted message is the watermark
+                          "INSERT INTO {deleted_conversations_table_name} (deletor, peer, datetime, id) "
+                          "SELECT DISTINCT ON (d.deletor, peer) d.deletor, "
+                          "CASE WHEN m.from_user = d.deletor THEN m.to_user ELSE m.from_user END as peer, "
+                          "m.datetime, m.id "
+                          "FROM {deleted_messages_table_name} d "
+                          "INNER JOIN {user_messages_table_name} m ON m.id = d.id "
+                          "ORDER BY d.deletor, peer, m.datetime DESC, m.id DESC "
+                          "ON CONFLICT (deletor, peer) DO NOTHING",
+                          "DELETE FROM {deleted_messages_table_name}"]),
+    Migration(version=5, description="Conversations summary for the chat list",
+              statements=["CREATE TABLE IF NOT EXISTS {conversations_table_name} ("
+                          "user_email varchar CONSTRAINT conversations_users_email_fk REFERENCES {users_table_name}, "
+                          "peer varchar CONSTRAINT conversations_users_email_fk_2 REFERENCES {users_table_name}, "
+                          "last_message_id int NOT NULL, "
+                          "last_message_datetime timestamp NOT NULL, "
+                          "last_message_from_user varchar NOT NULL, "
+                          "preview varchar NOT NULL, "
+                          "unread int DEFAULT 0 NOT NULL, "
+                          "CONSTRAINT conversations_pk PRIMARY KEY (user_email, peer))",
+                          # The last message of each side of every conversation not hidden by a watermark,
+                          # with the preview cut like the backends cut it
+                          "INSERT INTO {conversations_table_name} "
+                          "(user_email, peer, last_message_id, last_message_datetime, "
+                          "last_message_from_user, preview) "
+                          "SELECT DISTINCT ON (p.user_email, p.peer) p.user_email, p.peer, m.id, m.datetime, "
+                          "m.from_user, LEFT(m.message, %d) "
+                          "FROM (SELECT from_user as user_email, to_user as peer, id FROM {user_messages_table_name} "
+                          "UNION ALL SELECT to_user, from_user, id FROM {user_messages_table_name}) p "
+                          "INNER JOIN {user_messages_table_name} m ON m.id = p.id "
+                          "LEFT JOIN {deleted_conversations_table_name} w "
+                          "ON w.deletor = p.user_email AND w.peer = p.peer "
+                          "WHERE w.deletor IS NULL OR (m.datetime, m.id) > (w.datetime, w.id) "
+                          "ORDER BY p.user_email, p.peer, m.datetime DESC, m.id DESC "
+                          "ON CONFLICT (user_email, peer) DO NOTHING" % CONVERSATION_PREVIEW_LENGTH] +
+                         [index.statement for index in CONVERSATIONS_SUMMARY_INDEXES]),
+    Migration(version=6, description="Per conversation message sequence numbers",
+              statements=["ALTER TABLE {user_messages_table_name} ADD COLUMN IF NOT EXISTS seq int",
+                          "UPDATE {user_messages_table_name} m SET seq = numbered.seq "
+                          "FROM (SELECT id, ROW_NUMBER() OVER (PARTITION BY LEAST(from_user, to_user), "
+                          "GREATEST(from_user, to_user) ORDER BY datetime, id) as seq "
+                          "FROM {user_messages_table_name}) numbered "
+                          "WHERE m.id = numbered.id",
+                          "CREATE TABLE IF NOT EXISTS {conversation_sequences_table_name} ("
+                          "user1 varchar CONSTRAINT conversation_sequences_users_email_fk "
+                          "REFERENCES {users_table_name}, "
+                          "user2 varchar CONSTRAINT conversation_sequences_users_email_fk_2 "
+                          "REFERENCES {users_table_name}, "
+                          "last_seq int NOT NULL, "
+                          "CONSTRAINT conversation_sequences_pk PRIMARY KEY (user1, user2))",
+                          "INSERT INTO {conversation_sequences_table_name} (user1, user2, last_seq) "
+                          "SELECT LEAST(from_user, to_user), GREATEST(from_user, to_user), MAX(seq) "
+                          "FROM {user_messages_table_name} "
+                          "GROUP BY LEAST(from_user, to_user), GREATEST(from_user, to_user) "
+                          "ON CONFLICT (user1, user2) DO NOTHING",
+                          "ALTER TABLE {conversations_table_name} "
+                          "ADD COLUMN IF NOT EXISTS last_message_seq int DEFAULT 0 NOT NULL",
+                          "UPDATE {conversations_table_name} c SET last_message_seq = m.seq "
+                          "FROM {user_messages_table_name} m WHERE m.id = c.last_message_id"] +
+                         [index.statement for index in MESSAGE_SEQUENCE_INDEXES]),
+    Migration(version=7, description="Resource versions for the conditional requests",
+              statements=["CREATE TABLE IF NOT EXISTS {resource_versions_table_name} ("
+                          "resource varchar PRIMARY KEY, "
+                          "version bigint NOT NULL, "
+                          "last_modified timestamp NOT NULL)"]),
+    Migration(version=8, description="Response cache shared by the workers",
+              statements=["CREATE UNLOGGED TABLE IF NOT EXISTS {response_cache_table_name} ("
+                          "key varchar PRIMARY KEY, "
+                          "tags varchar[] NOT NULL DEFAULT '{{}}', "
+                          "status int, "
+                          "headers text, "
+                          "body bytea, "
+                          "expires double precision, "
+                          "lease varchar, "
+                          "refreshing_until double precision)"]),
+    # The version 6 ordered the users of each conversation with the collation of the database, but the backend
+    # orders them by code point, like the "C" collation. With a case insensitive collation the backend started
+    # another sequence for the conversations with mixed case emails, repeating sequence numbers
+    Migration(version=9, description="Conversation sequences ordered by code point",
+              statements=["UPDATE {user_messages_table_name} m SET seq = numbered.seq "
+                          "FROM (SELECT um.id, ROW_NUMBER() OVER (PARTITION BY LEAST(um.from_user, um.to_user), "
+                          "GREATEST(um.from_user, um.to_user) ORDER BY um.datetime, um.id) as seq "
+                          "FROM {user_messages_table_name} um INNER JOIN {conversation_sequences_table_name} s "
+                          "ON s.user1 = um.to_user AND s.user2 = um.from_user "
+                          "OR s.user1 = um.from_user AND s.user2 = um.to_user "
+                          "WHERE s.user1 COLLATE \"C\" > s.user2 COLLATE \"C\") numbered "
+                          "WHERE m.id = numbered.id",
+                          "DELETE FROM {conversation_sequences_table_name} s "
+                          "USING {conversation_sequences_table_name} unordered "
+                          "WHERE unordered.user1 = s.user2 AND unordered.user2 = s.user1 "
+                          "AND unordered.user1 COLLATE \"C\" > unordered.user2 COLLATE \"C\"",
+                          "UPDATE {conversation_sequences_table_name} s "
+                          "SET user1 = s.user2, user2 = s.user1, last_seq = (SELECT MAX(m.seq) "
+                          "FROM {user_messages_table_name} m WHERE m.from_user = s.user1 AND m.to_user = s.user2 "
+                          "OR m.from_user = s.user2 AND m.to_user = s.user1) "
+                          "WHERE s.user1 COLLATE \"C\" > s.user2 COLLATE \"C\"",
+                          "UPDATE {conversations_table_name} c SET last_message_seq = m.seq "
+                          "FROM {user_messages_table_name} m "
+                          "WHERE m.id = c.last_message_id AND c.last_message_seq <> m.seq"])
+]
@@ -8,10 +8,12 @@ import logging
 import requests
 from src.database.utils.postgres_connection import PostgresUtils
 
-NOTIFICATION_TOKEN_SAVE = """
+NOTIFICATION_TOKEN_DELETE = """
 DELETE FROM {notification_tokens_table_name}
 WHERE token=%s;
+"""
 
+NOTIFICATION_TOKEN_SAVE = """
 INSERT INTO {notification_tokens_table_name} (user_email, token)
 VALUES (%s, %s)
 ON CONFLICT (user_email) DO UPDATE 
@@ -28,6 +30,9 @@ EXPO_SEND_NOTIFICATION_ENDPOINT = "http://exp.host/--/api/v2/push/send"
 
 NOTIFICATION_SEND_TIMEOUT = 5
 
+# The token is searched on every notification, it is planned once per connection
+PREPARED_QUERIES = {"search_notification_token"}
+
 
 class PostgresExpoNotificationDatabase(NotificationDatabase):
     """
@@ -39,6 +44,14 @@ class PostgresExpoNotificationDatabase(NotificationDatabase):
                  postgr_host_env_name: str, postgr_user_env_name: str,
                  postgr_pass_env_name: str, postgr_database_env_name: str):
         self.notification_tokens_table_name = notification_tokens_table_name
+        self.queries = PostgresUtils.prepare_queries(
+            {"notification_token_delete": NOTIFICATION_TOKEN_DELETE.format(
+                notification_tokens_table_name=notification_tokens_table_name),
+             "notification_token_save": NOTIFICATION_TOKEN_SAVE.format(
+                notification_tokens_table_name=notification_tokens_table_name),
+             "search_notification_token": SEARCH_NOTIFICATION_TOKEN.format(
+                 notification_tokens_table_name=notification_tokens_table_name)},
+            PREPARED_QUERIES)
         self.conn = PostgresUtils.get_postgres_connection(host=os.environ[postgr_host_env_name],
                                                           user=os.environ[postgr_user_env_name],
                                                           password=os.environ[postgr_pass_env_name],
@@ -57,16 +70,18 @@ class PostgresExpoNotificationDatabase(NotificationDatabase):
         :param token: the token to set
         """
         self.logger.debug("Setting notification token for %s" % user_email)
-        cursor = self.conn.cursor()
-        try:
+
+        def save_token(cursor):
+            PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                         self.queries["notification_token_delete"], (token,))
             PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                         NOTIFICATION_TOKEN_SAVE.format(
-                                             notification_tokens_table_name=self.notification_tokens_table_name),
-                                         (token, user_email, token))
+                                         self.queries["notification_token_save"],
+                                         (user_email, token))
+
+        try:
+            PostgresUtils.run_transaction(self.logger, self.conn, save_token)
         except Exception:
             self.logger.exception("Couldn't register notification token")
-        self.conn.commit()
-        cursor.close()
 
     def notify(self, user_email: str, title: str, body: str, payload: Dict) -> NoReturn:
         """
@@ -81,8 +96,7 @@ class PostgresExpoNotificationDatabase(NotificationDatabase):
         cursor = self.conn.cursor()
         try:
             PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                         SEARCH_NOTIFICATION_TOKEN.format(
-                                             notification_tokens_table_name=self.notification_tokens_table_name),
+                                         self.queries["search_notification_token"],
                                          (user_email,))
             result = cursor.fetchone()
         except Exception:
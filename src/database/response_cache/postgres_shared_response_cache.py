@@ -0,0 +1,137 @@
+from typing import NoReturn, List, Optional
+from src.database.response_cache.shared_response_cache import SharedResponseCache, CachedResponse
+from src.database.utils.postgres_connection import PostgresUtils
+import logging
+import json
+import time
+import uuid
+import os
+
+# Expired responses are kept a while, they are sent while a worker recomputes them
+STALE_SECONDS = 60
+
+GET_RESPONSE_QUERY = """
+SELECT status, headers, body, expires FROM {response_cache_table_name}
+WHERE key = %s AND body IS NOT NULL
+"""
+
+ACQUIRE_REFRESH_QUERY = """
+INSERT INTO {response_cache_table_name} (key, tags, lease, refreshing_until)
+VALUES (%s, %s, %s, %s)
+ON CONFLICT (key) DO UPDATE
+  SET tags = excluded.tags, lease = excluded.lease, refreshing_until = excluded.refreshing_until
+  WHERE {response_cache_table_name}.refreshing_until IS NULL OR {response_cache_table_name}.refreshing_until < %s
+RETURNING lease
+"""
+
+SET_RESPONSE_QUERY = """
+UPDATE {response_cache_table_name}
+SET status = %s, headers = %s, body = %s, expires = %s, lease = NULL, refreshing_until = NULL
+WHERE key = %s AND lease = %s
+"""
+
+DELETE_STALE_RESPONSES_QUERY = """
+DELETE FROM {response_cache_table_name}
+WHERE COALESCE(expires, 0) < %s AND COALESCE(refreshing_until, 0) < %s
+"""
+
+INVALIDATE_QUERY = """
+DELETE FROM {response_cache_table_name}
+WHERE tags && %s::varchar[]
+"""
+
+# Looked up on every request to a cached route that missed the in process cache
+PREPARED_QUERIES = {"get_response"}
+
+
+class PostgresSharedResponseCache(SharedResponseCache):
+    """
+    Responses cache shared through an unlogged postgres table
+    """
+    logger = logging.getLogger(__module__)
+
+    def __init__(self, response_cache_table_name: str,
+                 postgr_host_env_name: str, postgr_user_env_name: str,
+                 postgr_pass_env_name: str, postgr_database_env_name: str,
+                 stale_seconds: float = STALE_SECONDS):
+        self.stale_seconds = stale_seconds
+        queries = {"get_response": GET_RESPONSE_QUERY, "acquire_refresh": ACQUIRE_REFRESH_QUERY,
+                   "set_response": SET_RESPONSE_QUERY, "delete_stale_responses": DELETE_STALE_RESPONSES_QUERY,
+                   "invalidate": INVALIDATE_QUERY}
+        self.queries = PostgresUtils.prepare_queries(
+            {name: query.format(response_cache_table_name=response_cache_table_name)
+             for name, query in queries.items()}, PREPARED_QUERIES)
+        self.conn = PostgresUtils.get_postgres_connection(host=os.environ[postgr_host_env_name],
+                                                          user=os.environ[postgr_user_env_name],
+                                                          password=os.environ[postgr_pass_env_name],
+                                                          database=os.environ[postgr_database_env_name])
+        if self.conn.closed == 0:
+            self.logger.info("Connected to postgres database")
+        else:
+            self.logger.error("Unable to connect to postgres database")
+            raise ConnectionError("Unable to connect to postgres database")
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """
+        Gets a cached response, fresh or not
+
+        :param key: the key of the response
+        :return: the cached response or None if it is not cached
+        """
+        cursor = self.conn.cursor()
+        PostgresUtils.safe_query_run(self.logger, self.conn, cursor, self.queries["get_response"], (key,))
+        result = cursor.fetchone()
+        self.conn.commit()
+        cursor.close()
+        if not result:
+            return None
+        return CachedResponse(status=result[0], headers=[tuple(header) for header in json.loads(result[1])],
+                              body=bytes(result[2]), expires=result[3])
+
+    def acquire_refresh(self, key: str, tags: List[str], lease_seconds: float) -> Optional[str]:
+        """
+        Takes the right to recompute a response, only one worker gets it until the lease expires
+
+        :param key: the key of the response
+        :param tags: the tags to invalidate the response by
+        :param lease_seconds: the maximum amount of seconds the recomputation should take
+        :return: the id of the lease or None if another worker is recomputing the response
+        """
+        now = time.time()
+
+        def acquire(cursor):
+            PostgresUtils.safe_query_run(self.logger, self.conn, cursor, self.queries["acquire_refresh"],
+                                         (key, list(tags), uuid.uuid4().hex, now + lease_seconds, now))
+            result = cursor.fetchone()
+            return result[0] if result else None
+        return PostgresUtils.run_transaction(self.logger, self.conn, acquire)
+
+    def set(self, key: str, response: CachedResponse, lease: str) -> NoReturn:
+        """
+        Caches a recomputed response and releases its lease, the responses stale for too long are dropped
+        Nothing is cached if the response was invalidated while it was recomputed, it may be stale
+
+        :param key: the key of the response
+        :param response: the response
+        :param lease: the id returned by acquire_refresh
+        """
+        now = time.time()
+
+        def save(cursor):
+            PostgresUtils.safe_query_run(self.logger, self.conn, cursor, self.queries["set_response"],
+                                         (response.status, json.dumps(response.headers), response.body,
+                                          response.expires, key, lease))
+            PostgresUtils.safe_query_run(self.logger, self.conn, cursor, self.queries["delete_stale_responses"],
+                                         (now - self.stale_seconds, now))
+        PostgresUtils.run_transaction(self.logger, self.conn, save)
+
+    def invalidate(self, tags: List[str]) -> NoReturn:
+        """
+        Drops the responses with any of the tags
+
+        :param tags: the tags
+        """
+        cursor = self.conn.cursor()
+        PostgresUtils.safe_query_run(self.logger, self.conn, cursor, self.queries["invalidate"], (list(tags),))
+        self.conn.commit()
+        cursor.close()
@@ -0,0 +1,73 @@
+from typing import NamedTuple, NoReturn, List, Tuple, Optional
+from abc import abstractmethod
+
+
+class CachedResponse(NamedTuple):
+    """
+    A cached response
+
+    status: the status code
+    headers: the headers to send with the body, like the content type and the validators
+    body: the body, never compressed
+    expires: the epoch when the response stops being fresh
+    """
+    status: int
+    headers: List[Tuple[str, str]]
+    body: bytes
+    expires: float
+
+
+class SharedResponseCache:
+    """
+    Responses cache shared by every worker, the second tier behind the in process cache
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """
+        Gets a cached response, fresh or not
+
+        :param key: the key of the response
+        :return: the cached response or None if it is not cached
+        """
+
+    @abstractmethod
+    def acquire_refresh(self, key: str, tags: List[str], lease_seconds: float) -> Optional[str]:
+        """
+        Takes the right to recompute a response, only one worker gets it until the lease expires
+
+        :param key: the key of the response
+        :param tags: the tags to invalidate the response by
+        :param lease_seconds: the maximum amount of seconds the recomputation should take
+        :return: the id of the lease or None if another worker is recomputing the response
+        """
+
+    @abstractmethod
+    def set(self, key: str, response: CachedResponse, lease: str) -> NoReturn:
+        """
+        Caches a recomputed response and releases its lease
+        Nothing is cached if the response was invalidated while it was recomputed, it may be stale
+
+        :param key: the key of the response
+        :param response: the response
+        :param lease: the id returned by acquire_refresh
+        """
+
+    @abstractmethod
+    def invalidate(self, tags: List[str]) -> NoReturn:
+        """
+        Drops the responses with any of the tags
+
+        :param tags: the tags
+        """
+
+    @classmethod
+    def factory(cls, name: str, *args, **kwargs) -> 'SharedResponseCache':
+        """
+        Factory pattern for shared response cache
+
+        :param name: the name of the shared response cache to create in the factory
+        :return: a shared response cache object
+        """
+        cache_types = {cls.__name__: cls for cls in SharedResponseCache.__subclasses__()}
+        return cache_types[name](*args, **kwargs)
@@ -16,29 +16,32 @@ VALUES (%s, %s, %s, %s, %s, %s)
 
 COUNT_ROWS_API_CALLS_QUERY = """
 SELECT COUNT(*) FROM {app_server_api_calls_table}
-WHERE datetime > NOW() - INTERVAL '%s days'
+WHERE datetime > NOW() - %s * INTERVAL '1 day'
 """
 
 GET_PAGINATED_API_CALLS_QUERY = """
 SELECT path, status, datetime, "time", method
 FROM {app_server_api_calls_table}
-WHERE datetime > NOW() - INTERVAL '%s days'
+WHERE datetime > NOW() - %s * INTERVAL '1 day'
 LIMIT %s OFFSET %s;
 """
 
 GET_CALS_BY_STATUS_QUERY = """
 SELECT status, COUNT(*) as amount
 FROM {app_server_api_calls_table}
-WHERE datetime > NOW() - INTERVAL '%s days' AND alias = %s
+WHERE datetime > NOW() - %s * INTERVAL '1 day' AND alias = %s
 GROUP BY status
 """
 
 GET_MEAN_RESPONSE_TIMES_QUERY = """
 SELECT AVG("time")
 FROM {app_server_api_calls_table}
-WHERE datetime > NOW() - INTERVAL '%s days' AND alias = %s
+WHERE datetime > NOW() - %s * INTERVAL '1 day' AND alias = %s
 """
 
+# Api calls are registered on every request, the insert is planned once per connection
+PREPARED_QUERIES = {"add_api_call"}
+
 
 class PostgresStatisticsDatabase(StatisticsDatabase):
     """
@@ -53,6 +56,13 @@ class PostgresStatisticsDatabase(StatisticsDatabase):
 
         self.app_server_api_calls_table = app_server_api_calls_table
         self.server_alias = os.environ[server_alias_env_name]
+        queries = {"add_api_call": ADD_API_CALL_QUERY, "count_rows_api_calls": COUNT_ROWS_API_CALLS_QUERY,
+                   "get_paginated_api_calls": GET_PAGINATED_API_CALLS_QUERY,
+                   "get_cals_by_status": GET_CALS_BY_STATUS_QUERY,
+                   "get_mean_response_times": GET_MEAN_RESPONSE_TIMES_QUERY}
+        self.queries = PostgresUtils.prepare_queries(
+            {name: query.format(app_server_api_calls_table=app_server_api_calls_table)
+             for name, query in queries.items()}, PREPARED_QUERIES)
         self.conn = PostgresUtils.get_postgres_connection(host=os.environ[postgr_host_env_name],
                                                           user=os.environ[postgr_user_env_name],
                                                           password=os.environ[postgr_pass_env_name],
@@ -71,8 +81,7 @@ class PostgresStatisticsDatabase(StatisticsDatabase):
         """
         cursor = self.conn.cursor()
         PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     ADD_API_CALL_QUERY.format(
-                                         app_server_api_calls_table=self.app_server_api_calls_table),
+                                     self.queries["add_api_call"],
                                      (self.server_alias, api_call.path, api_call.status, api_call.timestamp.isoformat(),
                                       api_call.time, api_call.method))
         self.conn.commit()
@@ -88,16 +97,14 @@ class PostgresStatisticsDatabase(StatisticsDatabase):
         cursor = self.conn.cursor()
 
         PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     COUNT_ROWS_API_CALLS_QUERY.format(
-                                         app_server_api_calls_table=self.app_server_api_calls_table),
+                                     self.queries["count_rows_api_calls"],
                                      (days,))
         result = cursor.fetchone()
 
         pages = int(math.ceil(result[0] / DEFAULT_BATCH_SIZE))
         for page in range(pages):
             PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                         GET_PAGINATED_API_CALLS_QUERY.format(
-                                             app_server_api_calls_table=self.app_server_api_calls_table),
+                                         self.queries["get_paginated_api_calls"],
                                          (days, DEFAULT_BATCH_SIZE, page * DEFAULT_BATCH_SIZE))
             result = cursor.fetchall()
             # path, status, datetime, "time", method
@@ -117,8 +124,7 @@ class PostgresStatisticsDatabase(StatisticsDatabase):
         cursor = self.conn.cursor()
         stats = {"total": 0, 400: 0, 500: 0, "mean_time": 0.0}
         PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     GET_CALS_BY_STATUS_QUERY.format(
-                                         app_server_api_calls_table=self.app_server_api_calls_table),
+                                     self.queries["get_cals_by_status"],
                                      (7,alias))
         result = cursor.fetchall()
         if not result:
@@ -130,8 +136,7 @@ class PostgresStatisticsDatabase(StatisticsDatabase):
             if r[0] == 500:
                 stats[500] = r[1]
         PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     GET_MEAN_RESPONSE_TIMES_QUERY.format(
-                                         app_server_api_calls_table=self.app_server_api_calls_table),
+                                     self.queries["get_mean_response_times"],
                                      (7,alias))
         result = cursor.fetchall()
         for r in result:
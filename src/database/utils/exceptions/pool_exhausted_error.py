@@ -0,0 +1,2 @@
+class PoolExhaustedError(ConnectionError):
+    pass
\ No newline at end of file
@@ -1,34 +1,354 @@
-from typing import Tuple, Optional
+from typing import Tuple, Optional, NamedTuple, Dict, Union, Set, Callable, TypeVar, List, NoReturn, Iterator
+import hashlib
+import re
+import sys
+import threading
+import uuid
+import weakref
+import logging
+import os
 import psycopg2
+from src.database.utils.exceptions.pool_exhausted_error import PoolExhaustedError
 
-# Perdon por esto, hotfix rapido, TODO: hacer un singleton que no de verguenza
-
+# The connection pool of each (host, user, password, database), shared by all the backends
 postgres_connections = {}
 
+# The connections checked out by each thread (each greenlet when gevent patches threading)
+checked_out_connections = threading.local()
+
+# Every process has its own pools, the sizes of all of them plus the listening connections of the event bus
+# should fit in the max_connections of postgres
+POOL_SIZE_ENV_NAME = "POSTGRES_POOL_SIZE"
+DEFAULT_POOL_SIZE = 20
+# The maximum amount of seconds a thread waits for a connection of an exhausted pool
+POOL_TIMEOUT_ENV_NAME = "POSTGRES_POOL_TIMEOUT"
+DEFAULT_POOL_TIMEOUT = 30
+
+# The names of the statements already prepared in each connection
+prepared_statements = weakref.WeakKeyDictionary()
+
+PLACEHOLDER_REGEX = re.compile(r"%%|%s")
+
+# Serialization failures and deadlocks, the transaction can be retried from the start
+RETRYABLE_SQLSTATES = {"40001", "40P01"}
+MAX_TRANSACTION_RETRIES = 3
+
+# The rows fetched from a server side cursor at a time
+STREAM_FETCH_SIZE = 500
+
+T = TypeVar('T')
+
+
+class PreparedQuery(NamedTuple):
+    """
+    A query that runs as a server side prepared statement
+
+    query: the query with %s placeholders
+    name: the name of the prepared statement, a hash of the query so equal queries share it
+    prepare_statement: the PREPARE for creating the statement
+    execute_statement: the EXECUTE for running the statement with %s placeholders
+    """
+    query: str
+    name: str
+    prepare_statement: str
+    execute_statement: str
+
+    @classmethod
+    def from_query(cls, query: str) -> 'PreparedQuery':
+        """
+        Creates the prepared statement for a query
+
+        :param query: the query with %s placeholders
+        :return: the prepared query
+        """
+        name = "stmt_%s" % hashlib.md5(query.encode()).hexdigest()[:16]
+        param_count = 0
+
+        def to_positional(match) -> str:
+            nonlocal param_count
+            if match.group(0) == "%%":
+                return "%"
+            param_count += 1
+            return "$%d" % param_count
+
+        prepare_statement = "PREPARE %s AS %s" % (name, PLACEHOLDER_REGEX.sub(to_positional, query))
+        execute_statement = "EXECUTE %s" % name
+        if param_count:
+            execute_statement += " (%s)" % ", ".join(["%s"] * param_count)
+        return cls(query=query, name=name, prepare_statement=prepare_statement,
+                   execute_statement=execute_statement)
+
+
+class ThreadConnections:
+    """
+    The connections checked out by a thread, they are returned to their pools when the thread ends
+    """
+
+    def __init__(self):
+        self.connections = {}
+        finalizer = weakref.finalize(self, ThreadConnections.give_back, self.connections)
+        finalizer.atexit = False
+
+    @staticmethod
+    def give_back(connections: Dict['PooledConnection', object]) -> NoReturn:
+        """
+        Returns the connections of a thread that ended without releasing them
+
+        :param connections: a dict of pool to the connection checked out from it
+        """
+        for pool, connection in list(connections.items()):
+            pool.give_back(connection)
+        connections.clear()
+
+
+def thread_connections() -> Dict['PooledConnection', object]:
+    """
+    Gets the connections checked out by the current thread
+
+    :return: a dict of pool to the connection checked out from it
+    """
+    if not hasattr(checked_out_connections, "checked_out"):
+        checked_out_connections.checked_out = ThreadConnections()
+    return checked_out_connections.checked_out.connections
+
+
+class PooledConnection:
+    """
+    A pool of connections to a database that is used as a single connection
+
+    Each thread checks out its own connection the first time it uses the pool and keeps it until
+    PostgresUtils.release_connections is called, at the end of every request, or until the thread ends,
+    so concurrent requests never share a transaction. If all the connections are checked out the thread
+    waits for one
+    """
+    logger = logging.getLogger(__module__)
+
+    def __init__(self, max_connections: int, timeout: Optional[float] = None, **connection_params):
+        """
+
+        :param max_connections: the maximum amount of connections open at the same time
+        :param timeout: the maximum amount of seconds to wait for a connection, None to wait forever
+        :param connection_params: the params for psycopg2.connect
+        """
+        self.connection_params = connection_params
+        self.timeout = timeout
+        self.idle_connections: List = []
+        self.idle_lock = threading.Lock()
+        self.available = threading.BoundedSemaphore(max_connections)
+
+    def checkout(self):
+        """
+        Gets the connection of the current thread, checking out one from the pool if it has none
+
+        :raises:
+            PoolExhaustedError: no connection was returned to the pool before the timeout
+
+        :return: a postgres connection
+        """
+        connections = thread_connections()
+        if self in connections:
+            return connections[self]
+        if not self.available.acquire(timeout=self.timeout):
+            self.logger.error("No postgres connection available after %s seconds" % self.timeout)
+            raise PoolExhaustedError
+        try:
+            with self.idle_lock:
+                connection = self.idle_connections.pop() if self.idle_connections else None
+            if connection is None or connection.closed:
+                connection = psycopg2.connect(**self.connection_params)
+        except Exception as err:
+            self.available.release()
+            raise err
+        connections[self] = connection
+        return connection
+
+    def release(self) -> NoReturn:
+        """
+        Returns the connection of the current thread to the pool, rolling back any unfinished transaction
+        """
+        connection = thread_connections().pop(self, None)
+        if connection is not None:
+            self.give_back(connection)
+
+    def give_back(self, connection) -> NoReturn:
+        """
+        Returns a connection to the pool, rolling back any unfinished transaction
+
+        :param connection: the connection checked out
+        """
+        try:
+            if not connection.closed:
+                connection.rollback()
+                with self.idle_lock:
+                    self.idle_connections.append(connection)
+        except Exception:
+            self.logger.exception("Discarding connection that could not be rolled back")
+        finally:
+            self.available.release()
+
+    def __getattr__(self, name: str):
+        return getattr(self.checkout(), name)
+
+
 class PostgresUtils:
     @staticmethod
-    def get_postgres_connection(host: str, user: str, password: str, database: str):
+    def get_postgres_connection(host: str, user: str, password: str, database: str) -> PooledConnection:
         """
-        Gets a postgres connection or returns an existing one if was already created
+        Gets the connection pool of a postgres database, creating it if it does not exist
+        The pool is used as a connection, each thread gets its own one
+        The size and the timeout of the pools are read from the POSTGRES_POOL_SIZE and POSTGRES_POOL_TIMEOUT
+        environment variables
 
         :param host: host of the postgres db
         :param user: user
         :param password: password
         :param database: the database name
-        :return: a postgres connection
+        :return: a pooled postgres connection
         """
         global postgres_connections
-        if (host, user, password, database) in postgres_connections:
-            return postgres_connections[(host, user, password, database)]
-        else:
-            conn = psycopg2.connect(host=host, user=user,password=password,database=database)
-            postgres_connections[(host, user, password, database)] = conn
-            return conn
+        key = (host, user, password, database)
+        if key not in postgres_connections:
+            postgres_connections[key] = PooledConnection(
+                int(os.environ.get(POOL_SIZE_ENV_NAME, DEFAULT_POOL_SIZE)),
+                float(os.environ.get(POOL_TIMEOUT_ENV_NAME, DEFAULT_POOL_TIMEOUT)),
+                host=host, user=user, password=password, database=database)
+        return postgres_connections[key]
+
+    @staticmethod
+    def cooperate_with_gevent() -> bool:
+        """
+        If gevent patched the sockets (gevent workers) makes psycopg2 wait for postgres yielding
+        to the other greenlets instead of blocking the whole worker
+
+        :return: whether psycopg2 was made cooperative
+        """
+        monkey = sys.modules.get("gevent.monkey")
+        if not monkey or not monkey.is_module_patched("socket"):
+            return False
+        from gevent.socket import wait_read, wait_write
+
+        def gevent_wait_callback(connection, timeout=None):
+            while True:
+                state = connection.poll()
+                if state == psycopg2.extensions.POLL_OK:
+                    return
+                elif state == psycopg2.extensions.POLL_READ:
+                    wait_read(connection.fileno(), timeout=timeout)
+                elif state == psycopg2.extensions.POLL_WRITE:
+                    wait_write(connection.fileno(), timeout=timeout)
+                else:
+                    raise psycopg2.OperationalError("Bad result from poll: %r" % state)
+
+        psycopg2.extensions.set_wait_callback(gevent_wait_callback)
+        return True
+
+    @staticmethod
+    def release_connections() -> NoReturn:
+        """
+        Returns the connections checked out by the current thread to their pools, called at the end of each request
+        """
+        for pool in list(thread_connections().keys()):
+            pool.release()
+
+    @staticmethod
+    def prepare_queries(queries: Dict[str, str], prepared: Set[str]) -> Dict[str, Union[str, PreparedQuery]]:
+        """
+        Builds the queries of a backend, the table names should be already formatted
+
+        :param queries: a dict of query name to query
+        :param prepared: the names of the queries to run as prepared statements
+        :return: a dict of query name to query or prepared query
+        """
+        return {name: (PreparedQuery.from_query(query) if name in prepared else query)
+                for name, query in queries.items()}
+
+    @staticmethod
+    def execute_prepared(connection, cursor, query: PreparedQuery, params: Optional[Tuple] = None):
+        """
+        Runs a prepared query, the statement is prepared the first time it is used in the connection
+
+        :param connection: the connection
+        :param cursor: a cursor of the connection
+        :param query: the prepared query
+        :param params: the params of the query
+        """
+        if isinstance(connection, PooledConnection):
+            connection = connection.checkout()
+        connection_statements = prepared_statements.setdefault(connection, set())
+        if query.name not in connection_statements:
+            cursor.execute(query.prepare_statement)
+            connection_statements.add(query.name)
+        cursor.execute(query.execute_statement, params)
 
     @staticmethod
-    def safe_query_run(logger, connection, cursor, query: str, params: Optional[Tuple] = None):
+    def run_transaction(logger, connection, work: Callable[..., T],
+                        retries: int = MAX_TRANSACTION_RETRIES) -> T:
+        """
+        Runs several statements as a unit of work committed once at the end
+
+        If the transaction fails because of a serialization failure or a deadlock it is rolled back
+        and the work is run again, any other error rolls back the transaction and is raised
+
+        :param logger: the logger of the caller
+        :param connection: the connection
+        :param work: a function that receives a cursor and runs the statements with safe_query_run
+        :param retries: the maximum amount of retries
+        :return: what the work returns
+        """
+        attempt = 0
+        while True:
+            cursor = connection.cursor()
+            try:
+                result = work(cursor)
+                connection.commit()
+                return result
+            except Exception as err:
+                connection.rollback()
+                sqlstate = getattr(err, "pgcode", None) or getattr(err, "sqlstate", None)
+                if sqlstate not in RETRYABLE_SQLSTATES or attempt >= retries:
+                    raise err
+                attempt += 1
+                logger.warning("Retrying transaction after error %s (attempt %d)" % (sqlstate, attempt))
+            finally:
+                cursor.close()
+
+    @staticmethod
+    def stream_query(logger, connection, query: Union[str, PreparedQuery], params: Optional[Tuple] = None,
+                     fetch_size: int = STREAM_FETCH_SIZE) -> Iterator[Tuple]:
+        """
+        Runs a read only query in a server side cursor and yields its rows, they are fetched from postgres
+        a few at a time so the whole result is never in memory
+        A server side cursor can not be declared for an EXECUTE so the prepared queries run as plain queries
+        The transaction is rolled back when the rows are exhausted or the generator is closed
+
+        :param logger: the logger of the caller
+        :param connection: the connection
+        :param query: the query
+        :param params: the params of the query
+        :param fetch_size: the amount of rows fetched at a time
+        :return: the rows
+        """
+        if isinstance(query, PreparedQuery):
+            query = query.query
+        cursor = connection.cursor(name="stream_%s" % uuid.uuid4().hex)
+        cursor.itersize = fetch_size
         try:
             cursor.execute(query, params)
+            yield from cursor
+        except Exception as err:
+            logger.exception("Query error")
+            raise err
+        finally:
+            connection.rollback()
+
+    @staticmethod
+    def safe_query_run(logger, connection, cursor, query: Union[str, PreparedQuery],
+                       params: Optional[Tuple] = None):
+        try:
+            if isinstance(query, PreparedQuery):
+                PostgresUtils.execute_prepared(connection, cursor, query, params)
+            else:
+                cursor.execute(query, params)
         except Exception as err:
             logger.exception("Query error")
             connection.rollback()
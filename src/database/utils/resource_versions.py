@@ -0,0 +1,74 @@
+from typing import NamedTuple, Dict, NoReturn, List
+from datetime import datetime
+import threading
+
+BUMP_RESOURCE_VERSIONS_QUERY = """
+INSERT INTO {resource_versions_table_name} (resource, version, last_modified)
+SELECT resource, 1, NOW() AT TIME ZONE 'utc'
+FROM unnest(%s::varchar[]) AS resource
+ON CONFLICT (resource) DO UPDATE
+  SET version = {resource_versions_table_name}.version + 1,
+      last_modified = excluded.last_modified;
+"""
+
+GET_RESOURCE_VERSION_QUERY = """
+SELECT version, last_modified FROM {resource_versions_table_name}
+WHERE resource = %s
+"""
+
+
+class ResourceVersion(NamedTuple):
+    """
+    The version of a resource, it changes every time the resource changes
+
+    version: a counter of the changes
+    last_modified: the utc time of the last change
+    """
+    version: int
+    last_modified: datetime
+
+
+# The version of the resources that never changed
+INITIAL_VERSION = ResourceVersion(version=0, last_modified=datetime(1970, 1, 1))
+
+
+def sorted_resources(resources: List[str]) -> List[str]:
+    """
+    Sorts the resources bumped by a transaction, so concurrent transactions lock their rows in the same order
+
+    :param resources: the resources
+    :return: the resources without duplicates and sorted
+    """
+    return sorted(set(resources))
+
+
+class RamResourceVersions:
+    """
+    The versions of the resources of a ram backend
+    """
+    versions: Dict[str, ResourceVersion]
+
+    def __init__(self):
+        self.versions = {}
+        self.lock = threading.Lock()
+
+    def bump(self, *resources: str) -> NoReturn:
+        """
+        Increments the version of some resources
+
+        :param resources: the resources that changed
+        """
+        now = datetime.utcnow()
+        with self.lock:
+            for resource in resources:
+                self.versions[resource] = ResourceVersion(version=self.get(resource).version + 1,
+                                                          last_modified=now)
+
+    def get(self, resource: str) -> ResourceVersion:
+        """
+        Gets the version of a resource
+
+        :param resource: the resource
+        :return: its version
+        """
+        return self.versions.get(resource, INITIAL_VERSION)
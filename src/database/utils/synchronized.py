@@ -0,0 +1,17 @@
+from typing import Callable
+from functools import wraps
+
+
+def synchronized(method: Callable) -> Callable:
+    """
+    Runs a method holding the lock of its object, the object should have a reentrant lock in self.lock
+
+    :param method: the method to synchronize
+    :return: the synchronized method
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,2 @@
+class InvalidCursorError(AttributeError):
+    pass
\ No newline at end of file
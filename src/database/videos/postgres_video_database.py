@@ -1,12 +1,17 @@
 import psycopg2
-from typing import NoReturn, List, Optional, NamedTuple, Tuple, Dict
-from src.database.videos.video_database import VideoData, VideoDatabase, Reaction, Comment
+from typing import NoReturn, List, Optional, NamedTuple, Tuple, Dict, Iterator, Collection
+from src.database.videos.video_database import VideoData, VideoDatabase, Reaction, Comment, SearchResultsPage, VideosPage, \
+    CommentsPage
 from src.database.videos.exceptions.no_more_videos_error import NoMoreVideosError
 import logging
 import os
 from datetime import datetime, timedelta
-from nltk import word_tokenize
 from src.database.utils.postgres_connection import PostgresUtils
+from src.database.utils.resource_versions import ResourceVersion, INITIAL_VERSION, BUMP_RESOURCE_VERSIONS_QUERY, \
+    GET_RESOURCE_VERSION_QUERY, sorted_resources
+from src.search.tokenizer import Tokenizer
+from src.search.search_profile import SearchQuery, cached_search_profile
+from src.single_flight import single_flight
 import math
 
 DATE_SCORE_PONDER = 0.2
@@ -14,6 +19,10 @@ VIDEO_COUNT_PONDER = 0.05
 APPROVAL_SCORE_PONDER = 0.5
 COMMENT_COUNT_PONDER = 0.4
 
+DEFAULT_TOKENIZER = "RegexTokenizer"
+MAX_SEARCH_QUERY_TOKENS = 20
+TOTAL_VIDEOS_CACHE_SECONDS = 30
+
 VIDEO_WITH_LIKES_QUERY = '''
 SELECT user_email, title, creation_time, visible, location, file_location, description, COALESCE(vr_likes.count, 0) as like_count, COALESCE(vr_dislikes.count, 0) as dislike_count
 FROM {videos_table_name} as v
@@ -34,7 +43,7 @@ ON v.title = vr_dislikes.video_title AND v.user_email = vr_dislikes.target_email
 '''
 
 VIDEO_INSERT_QUERY = """
-INSERT INTO {videos_table_names} (user_email, title, creation_time, visible, location, file_location, description)
+INSERT INTO {videos_table_name} (user_email, title, creation_time, visible, location, file_location, description)
 VALUES (%s, %s, %s, %s, %s, %s, %s)
 ON CONFLICT (user_email, title) DO UPDATE 
   SET creation_time = excluded.creation_time,
@@ -45,21 +54,26 @@ ON CONFLICT (user_email, title) DO UPDATE
 """
 
 VIDEO_DELETE_QUERY = """
-DELETE FROM {videos_table_names}
+DELETE FROM {videos_table_name}
 WHERE user_email=%s AND title=%s;
 """
 
+# Only the reactions of the user videos are counted, so they are looked up
+# in the video_reactions (target_email, video_title, reaction_type) index
 LIST_USER_VIDEOS_QUERY = """
-SELECT title, creation_time, visible, location, file_location, description, like_count, dislike_count
-FROM (
-{video_with_likes}
-) AS video_with_likes
-WHERE user_email = '%s'
-ORDER BY creation_time DESC
+SELECT v.title, v.creation_time, v.visible, v.location, v.file_location, v.description,
+COUNT(vr.reaction_type) FILTER (WHERE vr.reaction_type = 1) as like_count,
+COUNT(vr.reaction_type) FILTER (WHERE vr.reaction_type = 2) as dislike_count
+FROM {videos_table_name} as v
+LEFT JOIN {video_reactions_table_name} as vr
+ON vr.target_email = v.user_email AND vr.video_title = v.title
+WHERE v.user_email = %s
+GROUP BY 1, 2, 3, 4, 5, 6
+ORDER BY v.creation_time DESC
 """
 
 TOP_VIDEO_QUERY = """
-SELECT v.user_email, u.fullname, u.phone_number, u.photo, title, creation_time, visible, location, file_location, description, like_count, dislike_count, NOW() - creation_time as since, like_count-dislike_count as approval, video_count, COALESCE(comment_count, 0) as comment_count
+SELECT v.user_email, u.fullname, u.phone_number, md5(u.photo) as photo_hash, title, creation_time, visible, location, file_location, description, like_count, dislike_count, NOW() - creation_time as since, like_count-dislike_count as approval, video_count, COALESCE(comment_count, 0) as comment_count
 FROM (
 SELECT user_email, title, creation_time, visible, location, file_location, description, like_count, dislike_count
 FROM (
@@ -83,15 +97,23 @@ LIMIT 100
 """
 
 BASE_SEARCH_QUERY = """
-SELECT user_email, u.fullname, u.phone_number, u.photo, title, creation_time, visible, location, file_location, description, like_count, dislike_count
-FROM (
-SELECT * FROM (
-{video_with_likes}
-) AS video_with_likes
-WHERE (%s) AND visible = true
-ORDER BY RANDOM()) as v
+SELECT v.user_email, v.title, v.creation_time, v.visible, v.location, v.file_location, v.description
+FROM {videos_table_name} as v
 INNER JOIN {users_table_name} as u
 ON u.email = v.user_email
+WHERE ({where_conditions}) AND (v.visible = true OR v.user_email = ANY(%s))
+"""
+
+SEARCH_PAGE_DATA_QUERY = """
+SELECT page.user_email, u.fullname, u.phone_number, md5(u.photo) as photo_hash, page.title,
+COUNT(*) FILTER (WHERE vr.reaction_type = 1) as like_count,
+COUNT(*) FILTER (WHERE vr.reaction_type = 2) as dislike_count
+FROM unnest(%s::varchar[], %s::varchar[]) AS page(user_email, title)
+INNER JOIN {users_table_name} as u
+ON u.email = page.user_email
+LEFT JOIN {video_reactions_table_name} as vr
+ON vr.target_email = page.user_email AND vr.video_title = page.title
+GROUP BY 1,2,3,4,5
 """
 
 REACTION_INSERT_QUERY = """
@@ -118,7 +140,7 @@ VALUES (%s, %s, %s, %s, %s)
 """
 
 GET_COMMENTS_QUERY = """
-SELECT u.email, u.fullname, u.phone_number, u.photo, vc.comment, vc.datetime
+SELECT u.email, u.fullname, u.phone_number, md5(u.photo) as photo_hash, vc.comment, vc.datetime
 FROM {video_comments_table_name} vc
 INNER JOIN {users_table_name} as u
 ON u.email = vc.author_email
@@ -126,12 +148,41 @@ WHERE vc.video_owner_email = %s AND vc.video_title = %s
 ORDER BY vc.datetime DESC
 """
 
+INCREASE_COMMENT_COUNT_QUERY = """
+UPDATE {videos_table_name}
+SET comment_count = comment_count + 1
+WHERE user_email = %s AND title = %s
+"""
+
+GET_COMMENT_COUNT_QUERY = """
+SELECT comment_count FROM {videos_table_name}
+WHERE user_email = %s AND title = %s
+"""
+
+GET_COMMENTS_PAGE_QUERY = """
+SELECT u.email, u.fullname, u.phone_number, md5(u.photo) as photo_hash, vc.comment, vc.datetime, vc.id
+FROM {video_comments_table_name} vc
+INNER JOIN {users_table_name} as u
+ON u.email = vc.author_email
+WHERE vc.video_owner_email = %s AND vc.video_title = %s AND {keyset_condition}
+ORDER BY vc.datetime DESC, vc.id DESC
+LIMIT %s
+"""
+
+COMMENTS_PAGE_KEYSET_CONDITION = "(vc.datetime, vc.id) < (%s, %s)"
+
+GET_USER_PHOTO_QUERY = """
+SELECT photo FROM {users_table_name}
+WHERE md5(photo) = %s
+LIMIT 1
+"""
+
 COUNT_VIDEOS_QUERY = """
 SELECT COUNT(*) FROM {videos_table_name}
 """
 
 GET_PAGINATED_VIDEOS_QUERY = """
-SELECT user_email, u.fullname, u.phone_number, u.photo, title, creation_time, visible, location, file_location, description, like_count, dislike_count
+SELECT user_email, u.fullname, u.phone_number, md5(u.photo) as photo_hash, title, creation_time, visible, location, file_location, description, like_count, dislike_count
 FROM (
 SELECT * FROM (
 {video_with_likes}
@@ -142,8 +193,36 @@ ORDER BY creation_time DESC
 LIMIT %s OFFSET %s;
 """
 
-LIKE_SEARCH_TITLE_ELEMENT = "LOWER(title) LIKE '%{}%'"
-LIKE_SEARCH_DESCRIPTION_ELEMENT = "LOWER(description) LIKE '%{}%'"
+# The page is selected from the videos table alone so the
+# (creation_time, user_email, title) index can be scanned backwards
+# and only the reactions of the page are counted
+GET_VIDEOS_PAGE_QUERY = """
+SELECT v.user_email, u.fullname, u.phone_number, md5(u.photo) as photo_hash, v.title, v.creation_time, v.visible, v.location,
+v.file_location, v.description,
+COUNT(vr.reaction_type) FILTER (WHERE vr.reaction_type = 1) as like_count,
+COUNT(vr.reaction_type) FILTER (WHERE vr.reaction_type = 2) as dislike_count
+FROM (
+SELECT * FROM {videos_table_name}
+WHERE {keyset_condition}
+ORDER BY creation_time DESC, user_email DESC, title DESC
+LIMIT %s
+) as v
+INNER JOIN {users_table_name} as u
+ON u.email = v.user_email
+LEFT JOIN {video_reactions_table_name} as vr
+ON vr.target_email = v.user_email AND vr.video_title = v.title
+GROUP BY 1, 2, 3, 4, 5, 6, 7, 8, 9, 10
+ORDER BY v.creation_time DESC, v.user_email DESC, v.title DESC
+"""
+
+VIDEOS_PAGE_KEYSET_CONDITION = "(creation_time, user_email, title) < (%s, %s, %s)"
+
+LIKE_SEARCH_ELEMENT = "LOWER(v.title) LIKE %s OR LOWER(v.description) LIKE %s"
+
+# The queries run on every request, these are planned once per connection
+PREPARED_QUERIES = {"list_user_videos", "search_page_data", "reaction_search", "get_comments_page",
+                    "get_comments_page_after", "get_comment_count", "get_user_photo", "get_videos_page",
+                    "get_videos_page_after", "get_resource_version"}
 
 
 class PostgresVideoDatabase(VideoDatabase):
@@ -154,13 +233,18 @@ class PostgresVideoDatabase(VideoDatabase):
 
     def __init__(self, videos_table_name: str, users_table_name: str,
                  video_reactions_table_name: str, video_comments_table_name: str,
-                 postgr_host_env_name: str, postgr_user_env_name: str,
-                 postgr_pass_env_name: str, postgr_database_env_name: str):
+                 resource_versions_table_name: str, postgr_host_env_name: str, postgr_user_env_name: str,
+                 postgr_pass_env_name: str, postgr_database_env_name: str,
+                 tokenizer: str = DEFAULT_TOKENIZER):
 
         self.videos_table_name = videos_table_name
         self.users_table_name = users_table_name
         self.video_reactions_table_name = video_reactions_table_name
         self.video_comments_table_name = video_comments_table_name
+        self.resource_versions_table_name = resource_versions_table_name
+        self.tokenizer = Tokenizer.factory(tokenizer)
+        self.total_videos_cache = None
+        self.queries = self.build_queries()
         self.conn = PostgresUtils.get_postgres_connection(host=os.environ[postgr_host_env_name],
                                                           user=os.environ[postgr_user_env_name],
                                                           password=os.environ[postgr_pass_env_name],
@@ -171,6 +255,37 @@ class PostgresVideoDatabase(VideoDatabase):
             self.logger.error("Unable to connect to postgres database")
             raise ConnectionError("Unable to connect to postgres database")
 
+    def build_queries(self) -> Dict:
+        """
+        Formats the table names of the queries once
+
+        :return: a dict of query name to query or prepared query
+        """
+        table_names = {"videos_table_name": self.videos_table_name,
+                       "users_table_name": self.users_table_name,
+                       "video_reactions_table_name": self.video_reactions_table_name,
+                       "video_comments_table_name": self.video_comments_table_name,
+                       "resource_versions_table_name": self.resource_versions_table_name}
+        table_names["video_with_likes"] = VIDEO_WITH_LIKES_QUERY.format(**table_names)
+        queries = {"video_insert": VIDEO_INSERT_QUERY, "video_delete": VIDEO_DELETE_QUERY,
+                   "list_user_videos": LIST_USER_VIDEOS_QUERY, "top_video": TOP_VIDEO_QUERY,
+                   "search_page_data": SEARCH_PAGE_DATA_QUERY, "reaction_insert": REACTION_INSERT_QUERY,
+                   "reaction_search": REACTION_SEARCH_QUERY, "delete_reaction": DELETE_REACTION_QUERY,
+                   "comment_video": COMMENT_VIDEO_QUERY, "get_comments": GET_COMMENTS_QUERY,
+                   "increase_comment_count": INCREASE_COMMENT_COUNT_QUERY,
+                   "get_comment_count": GET_COMMENT_COUNT_QUERY, "get_user_photo": GET_USER_PHOTO_QUERY,
+                   "count_videos": COUNT_VIDEOS_QUERY, "get_paginated_videos": GET_PAGINATED_VIDEOS_QUERY,
+                   "bump_resource_versions": BUMP_RESOURCE_VERSIONS_QUERY,
+                   "get_resource_version": GET_RESOURCE_VERSION_QUERY}
+        queries = {name: query.format(**table_names) for name, query in queries.items()}
+        queries["get_comments_page"] = GET_COMMENTS_PAGE_QUERY.format(keyset_condition="true", **table_names)
+        queries["get_comments_page_after"] = GET_COMMENTS_PAGE_QUERY.format(
+            keyset_condition=COMMENTS_PAGE_KEYSET_CONDITION, **table_names)
+        queries["get_videos_page"] = GET_VIDEOS_PAGE_QUERY.format(keyset_condition="true", **table_names)
+        queries["get_videos_page_after"] = GET_VIDEOS_PAGE_QUERY.format(
+            keyset_condition=VIDEOS_PAGE_KEYSET_CONDITION, **table_names)
+        return PostgresUtils.prepare_queries(queries, PREPARED_QUERIES)
+
     def add_video(self, user_email: str, video_data: VideoData) -> NoReturn:
         """
         Adds a video to the database
@@ -178,15 +293,18 @@ class PostgresVideoDatabase(VideoDatabase):
         :param user_email: the email of the user owner of the video
         :param video_data: the video data to upload
         """
-        cursor = self.conn.cursor()
         self.logger.debug("Saving video for user with email %s" % user_email)
-        PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     VIDEO_INSERT_QUERY.format(videos_table_names=self.videos_table_name),
-                                     (user_email, video_data.title, video_data.creation_time.isoformat(),
-                                      video_data.visible, video_data.location, video_data.file_location,
-                                      video_data.description))
-        self.conn.commit()
-        cursor.close()
+
+        def save_video(cursor):
+            PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                         self.queries["video_insert"],
+                                         (user_email, video_data.title, video_data.creation_time.isoformat(),
+                                          video_data.visible, video_data.location, video_data.file_location,
+                                          video_data.description))
+            self.bump_videos_version(cursor, user_email)
+
+        PostgresUtils.run_transaction(self.logger, self.conn, save_video)
+        self.total_videos_cache = None
 
     def delete_video(self, user_email: str, video_title: str) -> NoReturn:
         """
@@ -195,14 +313,18 @@ class PostgresVideoDatabase(VideoDatabase):
         :param user_email: the user owner of the video
         :param video_title: the video title
         """
-        cursor = self.conn.cursor()
         self.logger.debug("Deleting video for user with email %s" % user_email)
-        PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     VIDEO_DELETE_QUERY.format(videos_table_names=self.videos_table_name),
-                                     (user_email, video_title))
-        self.conn.commit()
-        cursor.close()
 
+        def delete(cursor):
+            PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                         self.queries["video_delete"],
+                                         (user_email, video_title))
+            self.bump_videos_version(cursor, user_email)
+
+        PostgresUtils.run_transaction(self.logger, self.conn, delete)
+        self.total_videos_cache = None
+
+    @single_flight
     def list_user_videos(self, user_email: str) -> List[Tuple[VideoData, Dict[Reaction, int]]]:
         """
         Get all the user videos
@@ -213,11 +335,7 @@ class PostgresVideoDatabase(VideoDatabase):
         self.logger.debug("Listing videos for user with email %s" % user_email)
         cursor = self.conn.cursor()
         PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     LIST_USER_VIDEOS_QUERY.format(video_with_likes=
-                                     VIDEO_WITH_LIKES_QUERY.format(
-                                         videos_table_name=self.videos_table_name,
-                                         video_reactions_table_name=self.video_reactions_table_name))
-                                     % user_email)
+                                     self.queries["list_user_videos"], (user_email,))
         result = cursor.fetchall()
         # title, creation_time, visible, location, file_location, description, likes, dislikes
         result = [(VideoData(title=r[0], creation_time=r[1], visible=r[2], location=r[3],
@@ -228,6 +346,7 @@ class PostgresVideoDatabase(VideoDatabase):
 
         return result
 
+    @single_flight
     def list_top_videos(self) -> List[Tuple[Dict, VideoData, Dict[Reaction, int]]]:
         """
         Get top videos
@@ -239,15 +358,9 @@ class PostgresVideoDatabase(VideoDatabase):
         cursor = self.conn.cursor()
 
         PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     TOP_VIDEO_QUERY.format(video_with_likes=
-                                     VIDEO_WITH_LIKES_QUERY.format(
-                                         videos_table_name=self.videos_table_name,
-                                         video_reactions_table_name=self.video_reactions_table_name),
-                                         users_table_name=self.users_table_name,
-                                         videos_table_name=self.videos_table_name,
-                                         video_comments_table_name=self.video_comments_table_name))
+                                     self.queries["top_video"])
         result = cursor.fetchall()
-        # 0:user_email, fullname, phone_number, photo, title, creation_time, visible, location, file_location, description, likes, dislikes
+        # 0:user_email, fullname, phone_number, photo_hash, title, creation_time, visible, location, file_location, description, likes, dislikes
 
         # 12:since, approval, video_count, comment_count
         max_since = max(max([r[12] for r in result]).total_seconds(), 1)
@@ -271,7 +384,7 @@ class PostgresVideoDatabase(VideoDatabase):
                                    file_location=r[8], description=r[9])
                          for r in filtered_result]
         result_emails = [{"email": r[0], "fullname": r[1], "phone_number": r[2],
-                          "photo": r[3]} for r in filtered_result]
+                          "photo_hash": r[3]} for r in filtered_result]
         result_reactions = [{Reaction.like: r[10], Reaction.dislike: r[11]} for r in filtered_result]
         cursor.close()
 
@@ -279,65 +392,76 @@ class PostgresVideoDatabase(VideoDatabase):
 
     @staticmethod
     def build_search_query(tokenized_query: List[str], videos_table_name: str,
-                           users_table_name: str, video_reactions_table_name: str) -> str:
+                           users_table_name: str, private_owners: Collection[str] = ()) -> Tuple[str, Tuple]:
         """
-        Builds the query for searching
+        Builds the query for searching the candidate videos, the visible ones and the private ones of private_owners
+
+        :return: the query and its parameters
         """
-        where_conditions = []
+        where_conditions = " OR ".join([LIKE_SEARCH_ELEMENT] * len(tokenized_query))
+        params = []
         for token in tokenized_query:
-            where_conditions.append(LIKE_SEARCH_TITLE_ELEMENT.format(token))
-            where_conditions.append("OR")
-            where_conditions.append(LIKE_SEARCH_DESCRIPTION_ELEMENT.format(token))
-            where_conditions.append("OR")
-        where_conditions = " ".join(where_conditions[:-1])
-        return BASE_SEARCH_QUERY.format(users_table_name=users_table_name,
-                                        video_with_likes=
-                                        VIDEO_WITH_LIKES_QUERY.format(videos_table_name=videos_table_name,
-                                                                      video_reactions_table_name=video_reactions_table_name)
-                                        ) % where_conditions
-
-    def search_videos(self, search_query: str) -> List[Tuple[Dict, VideoData, Dict[Reaction, int]]]:
+            like_token = "%%%s%%" % token.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params += [like_token, like_token]
+        params.append(list(private_owners))
+        return BASE_SEARCH_QUERY.format(videos_table_name=videos_table_name,
+                                        users_table_name=users_table_name,
+                                        where_conditions=where_conditions), tuple(params)
+
+    def search_videos(self, search_query: str, limit: Optional[int] = None,
+                      cursor: Optional[str] = None, with_total: bool = False,
+                      private_owners: Collection[str] = ()) -> SearchResultsPage:
         """
-        Searches videos with a query
+        Searches videos with a query, the private videos are only searched if their owner is in private_owners
+        The results are ordered by relevance, ties are broken by owner email and title
+
+        :raises:
+            InvalidCursorError: the cursor is malformed
 
         :param search_query: the query to search
-        :return: a list of (user data, video data, reactions counts)
+        :param limit: the maximum amount of results to return, None for all of them
+        :param cursor: the cursor returned with the previous page, None for the first one
+        :param with_total: whether to count the total amount of matching videos
+        :param private_owners: the owners whose private videos can be found, like the searcher and their friends
+        :return: a page of search results
         """
-        tokenized_query = word_tokenize(search_query.lower())[:20]
-        bigrams_query = [tokenized_query[i:i + 2] for i in range(len(tokenized_query) - 2 + 1)]
+        search = SearchQuery.from_text(self.tokenizer, search_query, MAX_SEARCH_QUERY_TOKENS)
+        if cursor:
+            self.decode_search_cursor(cursor)
+        if not search.tokens:
+            return SearchResultsPage(results=[], total=(0 if with_total else None))
 
         self.logger.debug("Searching query %s" % search_query)
-        cursor = self.conn.cursor()
-        query = self.build_search_query(tokenized_query, self.videos_table_name, self.users_table_name,
-                                        self.video_reactions_table_name)
-        PostgresUtils.safe_query_run(self.logger, self.conn, cursor, query)
-        result = cursor.fetchall()
-        # user_email, fullname, phone_number, photo, title, creation_time, visible, location, file_location, description, likes, dislikes
-        result_videos = [VideoData(title=r[4], creation_time=r[5], visible=r[6], location=r[7],
-                                   file_location=r[8], description=r[9])
-                         for r in result]
-        result_emails = [{"email": r[0], "fullname": r[1], "phone_number": r[2],
-                          "photo": r[3]} for r in result]
-        result_reactions = [{Reaction.like: r[10], Reaction.dislike: r[11]} for r in result]
-        cursor.close()
+        cursor_db = self.conn.cursor()
+        query, params = self.build_search_query(search.tokens, self.videos_table_name, self.users_table_name,
+                                                private_owners)
+        PostgresUtils.safe_query_run(self.logger, self.conn, cursor_db, query, params)
+        result = cursor_db.fetchall()
+        # user_email, title, creation_time, visible, location, file_location, description
+        scored_videos = []
+        for r in result:
+            v = VideoData(title=r[1], creation_time=r[2], visible=r[3], location=r[4],
+                          file_location=r[5], description=r[6])
+            score = cached_search_profile(self.tokenizer, v.title, v.description).score(search)
+            if score > 0:
+                scored_videos.append((score, r[0], v))
+        page, next_cursor = self.page_scored_videos(scored_videos, limit, cursor)
+
+        # Only the videos in the page need user data and reaction counts
+        PostgresUtils.safe_query_run(self.logger, self.conn, cursor_db,
+                                     self.queries["search_page_data"],
+                                     ([e for _, e, _ in page], [v.title for _, _, v in page]))
+        # user_email, fullname, phone_number, photo_hash, title, likes, dislikes
+        page_data = {(r[0], r[4]): r for r in cursor_db.fetchall()}
+        cursor_db.close()
 
         result = []
-        for u, v, r in zip(result_emails, result_videos, result_reactions):
-            word_count = 0
-            desc_count = 0
-            tokenized_title = word_tokenize(v.title.lower())
-            bigrams_title = [tokenized_title[i:i + 2] for i in range(len(tokenized_title) - 2 + 1)]
-            tokenized_desc = (word_tokenize(v.description[:1000].lower()) if v.description else [])
-            for w in tokenized_query:
-                word_count += len([t for t in tokenized_title if t == w])
-                desc_count += len([t for t in tokenized_desc if t == w])
-            for b in bigrams_query:
-                word_count += len([t for t in bigrams_title if t == b])
-            if word_count > 0 or desc_count > 0:
-                result.append((u, v, r, word_count * 0.8 + desc_count * 0.2))
-        result = sorted(result, key=lambda x: x[3], reverse=True)
-        result = [(r[0], r[1], r[2]) for r in result]
-        return result
+        for _, e, v in page:
+            r = page_data[(e, v.title)]
+            result.append(({"email": r[0], "fullname": r[1], "phone_number": r[2], "photo_hash": r[3]},
+                           v, {Reaction.like: r[5], Reaction.dislike: r[6]}))
+        return SearchResultsPage(results=result, next_cursor=next_cursor,
+                                 total=(len(scored_videos) if with_total else None))
 
     def react_video(self, actor_email: str, target_email: str,
                     video_title: str, reaction: Reaction) -> NoReturn:
@@ -349,14 +473,15 @@ class PostgresVideoDatabase(VideoDatabase):
         :param video_title: the title of the video
         :param reaction: the type of reaction
         """
-        cursor = self.conn.cursor()
         self.logger.debug("User %s reacting to video" % actor_email)
-        PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     REACTION_INSERT_QUERY.format(
-                                         video_reactions_table_name=self.video_reactions_table_name),
-                                     (actor_email, target_email, video_title, reaction.value))
-        self.conn.commit()
-        cursor.close()
+
+        def react(cursor):
+            PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                         self.queries["reaction_insert"],
+                                         (actor_email, target_email, video_title, reaction.value))
+            self.bump_videos_version(cursor, target_email)
+
+        PostgresUtils.run_transaction(self.logger, self.conn, react)
 
     def get_video_reaction(self, actor_email: str, target_email: str, video_title: str) -> Optional[Reaction]:
         """
@@ -370,8 +495,7 @@ class PostgresVideoDatabase(VideoDatabase):
         """
         cursor = self.conn.cursor()
         PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     REACTION_SEARCH_QUERY.format(
-                                         video_reactions_table_name=self.video_reactions_table_name),
+                                     self.queries["reaction_search"],
                                      (actor_email, target_email, video_title))
         reaction = cursor.fetchone()
         if not reaction:
@@ -388,14 +512,16 @@ class PostgresVideoDatabase(VideoDatabase):
         :param target_email: the email of the owner of the video
         :param video_title: the title of the video
         """
-        cursor = self.conn.cursor()
         self.logger.debug("Deleting reaction for user with email %s" % actor_email)
-        PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     DELETE_REACTION_QUERY.format(
-                                         video_reactions_table_name=self.video_reactions_table_name),
-                                     (actor_email, target_email, video_title))
-        self.conn.commit()
-        cursor.close()
+
+        def delete(cursor):
+            PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                         self.queries["delete_reaction"],
+                                         (actor_email, target_email, video_title))
+            if cursor.rowcount:
+                self.bump_videos_version(cursor, target_email)
+
+        PostgresUtils.run_transaction(self.logger, self.conn, delete)
 
     def comment_video(self, actor_email: str, target_email: str, video_title: str,
                       comment: str) -> NoReturn:
@@ -407,15 +533,21 @@ class PostgresVideoDatabase(VideoDatabase):
         :param video_title: the video title
         :param comment: the comment
         """
-        cursor = self.conn.cursor()
         self.logger.debug("User %s commenting video" % actor_email)
-        PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     COMMENT_VIDEO_QUERY.format(
-                                         video_comments_table_name=self.video_comments_table_name),
-                                     (actor_email, target_email, video_title, comment, datetime.now().isoformat()))
-        self.conn.commit()
-        cursor.close()
 
+        def add_comment(cursor):
+            PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                         self.queries["comment_video"],
+                                         (actor_email, target_email, video_title, comment,
+                                          datetime.now().isoformat()))
+            PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                         self.queries["increase_comment_count"],
+                                         (target_email, video_title))
+            self.bump_videos_version(cursor, target_email)
+
+        PostgresUtils.run_transaction(self.logger, self.conn, add_comment)
+
+    @single_flight
     def get_comments(self, target_email: str, video_title: str) -> Tuple[List[Dict], List[Comment]]:
         """
         Get all the comments for a video
@@ -428,18 +560,92 @@ class PostgresVideoDatabase(VideoDatabase):
         cursor = self.conn.cursor()
 
         PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     GET_COMMENTS_QUERY.format(
-                                         video_comments_table_name=self.video_comments_table_name,
-                                         users_table_name=self.users_table_name),
+                                     self.queries["get_comments"],
                                      (target_email, video_title))
         result = cursor.fetchall()
-        # u.email, u.fullname, u.phone_number, u.photo, vc.comment, vc.datetime
+        # u.email, u.fullname, u.phone_number, photo_hash, vc.comment, vc.datetime
         result_comments = [Comment(content=r[4], timestamp=r[5]) for r in result]
         result_users = [{"email": r[0], "fullname": r[1], "phone_number": r[2],
-                         "photo": r[3]} for r in result]
+                         "photo_hash": r[3]} for r in result]
         cursor.close()
         return result_users, result_comments
 
+    def stream_comments(self, target_email: str, video_title: str) -> Iterator[Tuple[Dict, Comment]]:
+        """
+        Get all the comments for a video while they are consumed, they are read from a server side cursor
+
+        :param target_email: the email of the owner of the video
+        :param video_title: the title of the video
+        :return: an iterator of (user data, comment)
+        """
+        self.logger.debug("Streaming comments for %s video of %s" % (target_email, video_title))
+        rows = PostgresUtils.stream_query(self.logger, self.conn, self.queries["get_comments"],
+                                          (target_email, video_title))
+        # u.email, u.fullname, u.phone_number, photo_hash, vc.comment, vc.datetime
+        for r in rows:
+            yield ({"email": r[0], "fullname": r[1], "phone_number": r[2], "photo_hash": r[3]},
+                   Comment(content=r[4], timestamp=r[5]))
+
+    @single_flight
+    def get_comments_page(self, target_email: str, video_title: str, limit: int,
+                          cursor: Optional[str] = None) -> CommentsPage:
+        """
+        Get a page of the comments for a video, newest first
+
+        :raises:
+            InvalidCursorError: the cursor is malformed
+
+        :param target_email: the email of the owner of the video
+        :param video_title: the title of the video
+        :param limit: the maximum amount of comments in the page
+        :param cursor: the cursor returned with the previous page, None for the first one
+        :return: a page of comments
+        """
+        query = self.queries["get_comments_page"]
+        params = (target_email, video_title)
+        if cursor:
+            query = self.queries["get_comments_page_after"]
+            params += self.decode_comments_cursor(cursor)
+        params += (limit + 1,)
+        self.logger.debug("Listing a page of comments for %s video of %s" % (target_email, video_title))
+        cursor_db = self.conn.cursor()
+        PostgresUtils.safe_query_run(self.logger, self.conn, cursor_db,
+                                     query, params)
+        result = cursor_db.fetchall()
+        PostgresUtils.safe_query_run(self.logger, self.conn, cursor_db,
+                                     self.queries["get_comment_count"],
+                                     (target_email, video_title))
+        comment_count = cursor_db.fetchone()
+        self.conn.commit()
+        cursor_db.close()
+        next_cursor = None
+        if len(result) > limit:
+            result = result[:limit]
+            next_cursor = self.encode_comments_cursor(result[-1][5], result[-1][6])
+        # u.email, u.fullname, u.phone_number, photo_hash, vc.comment, vc.datetime, vc.id
+        result_comments = [Comment(content=r[4], timestamp=r[5]) for r in result]
+        result_users = [{"email": r[0], "fullname": r[1], "phone_number": r[2],
+                         "photo_hash": r[3]} for r in result]
+        return CommentsPage(users=result_users, comments=result_comments, next_cursor=next_cursor,
+                            total=(comment_count[0] if comment_count else 0))
+
+    @single_flight
+    def get_user_photo(self, photo_hash: str) -> Optional[str]:
+        """
+        Gets the photo of an user by its hash, the one sent in the user data of the listings
+
+        :param photo_hash: the hash of the photo
+        :return: the base64 of the photo or None if no user has that photo
+        """
+        cursor = self.conn.cursor()
+        PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                     self.queries["get_user_photo"],
+                                     (photo_hash,))
+        result = cursor.fetchone()
+        self.conn.commit()
+        cursor.close()
+        return result[0] if result else None
+
     def get_paginated_videos(self, page: int, per_page: int) -> Tuple[
         List[Tuple[Dict, VideoData, Dict[Reaction, int]]], int]:
         """
@@ -454,32 +660,141 @@ class PostgresVideoDatabase(VideoDatabase):
         """
         self.logger.debug("Geting paginated videos for page %d with %d per page" % (page, per_page))
 
-        cursor = self.conn.cursor()
-
-        PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     COUNT_VIDEOS_QUERY.format(videos_table_name=self.videos_table_name))
-        result = cursor.fetchone()
-
-        pages = int(math.ceil(result[0] / per_page))
+        pages = int(math.ceil(self.get_total_videos() / per_page))
         if not page < pages and page != 0:
             raise NoMoreVideosError
 
+        cursor = self.conn.cursor()
         PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
-                                     GET_PAGINATED_VIDEOS_QUERY.format(
-                                         video_with_likes=VIDEO_WITH_LIKES_QUERY.format(
-                                             videos_table_name=self.videos_table_name,
-                                             video_reactions_table_name=self.video_reactions_table_name),
-                                         users_table_name=self.users_table_name),
+                                     self.queries["get_paginated_videos"],
                                      (per_page, page * per_page))
         result = cursor.fetchall()
         self.conn.commit()
         cursor.close()
-        # user_email, fullname, phone_number, photo, title, creation_time, visible, location, file_location, description, likes, dislikes
+        # user_email, fullname, phone_number, photo_hash, title, creation_time, visible, location, file_location, description, likes, dislikes
         result_videos = [VideoData(title=r[4], creation_time=r[5], visible=r[6], location=r[7],
                                    file_location=r[8], description=r[9])
                          for r in result]
         result_emails = [{"email": r[0], "fullname": r[1], "phone_number": r[2],
-                          "photo": r[3]} for r in result]
+                          "photo_hash": r[3]} for r in result]
         result_reactions = [{Reaction.like: r[10], Reaction.dislike: r[11]} for r in result]
 
         return list(zip(result_emails, result_videos, result_reactions)), pages
+
+    def stream_paginated_videos(self, page: int, per_page: int) -> Tuple[
+        Iterator[Tuple[Dict, VideoData, Dict[Reaction, int]]], int]:
+        """
+        Get all the videos paginated while they are consumed, they are read from a server side cursor
+
+        :raises:
+            NoMoreVideosError: if the page does not exist, page 0 always exist
+
+        :param page: the page requested
+        :param per_page: the amount of videos per page
+        :return: an iterator of (user data, video data, reactions counts) and the number of pages
+        """
+        self.logger.debug("Streaming paginated videos for page %d with %d per page" % (page, per_page))
+
+        pages = int(math.ceil(self.get_total_videos() / per_page))
+        if not page < pages and page != 0:
+            raise NoMoreVideosError
+
+        def videos():
+            rows = PostgresUtils.stream_query(self.logger, self.conn, self.queries["get_paginated_videos"],
+                                              (per_page, page * per_page))
+            # user_email, fullname, phone_number, photo_hash, title, creation_time, visible, location, file_location, description, likes, dislikes
+            for r in rows:
+                yield ({"email": r[0], "fullname": r[1], "phone_number": r[2], "photo_hash": r[3]},
+                       VideoData(title=r[4], creation_time=r[5], visible=r[6], location=r[7],
+                                 file_location=r[8], description=r[9]),
+                       {Reaction.like: r[10], Reaction.dislike: r[11]})
+
+        return videos(), pages
+
+    def get_total_videos(self) -> int:
+        """
+        Counts all the videos
+        The count is cached for a few seconds because it needs a full scan, it is
+        refreshed when this instance adds or deletes a video
+
+        :return: the amount of videos
+        """
+        # Read once, other threads may invalidate it meanwhile
+        cached = self.total_videos_cache
+        if cached and cached[1] > datetime.now():
+            return cached[0]
+        cursor = self.conn.cursor()
+        PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                     self.queries["count_videos"])
+        total = cursor.fetchone()[0]
+        self.conn.commit()
+        cursor.close()
+        self.total_videos_cache = (total, datetime.now() + timedelta(seconds=TOTAL_VIDEOS_CACHE_SECONDS))
+        return total
+
+    def get_videos_page(self, limit: int, cursor: Optional[str] = None) -> VideosPage:
+        """
+        Get a page of all the videos using a cursor instead of a page number
+        The videos are ordered by creation time, owner email and title descending
+
+        :raises:
+            InvalidCursorError: the cursor is malformed
+
+        :param limit: the maximum amount of videos in the page
+        :param cursor: the cursor returned with the previous page, None for the first one
+        :return: a page of videos
+        """
+        query = self.queries["get_videos_page"]
+        params = (limit + 1,)
+        if cursor:
+            query = self.queries["get_videos_page_after"]
+            params = self.decode_videos_cursor(cursor) + params
+        self.logger.debug("Getting videos page of %d videos" % limit)
+        cursor_db = self.conn.cursor()
+        PostgresUtils.safe_query_run(self.logger, self.conn, cursor_db,
+                                     query, params)
+        result = cursor_db.fetchall()
+        self.conn.commit()
+        cursor_db.close()
+        next_cursor = None
+        if len(result) > limit:
+            result = result[:limit]
+            next_cursor = self.encode_videos_cursor(result[-1][5], result[-1][0], result[-1][4])
+        # user_email, fullname, phone_number, photo_hash, title, creation_time, visible, location, file_location, description, likes, dislikes
+        result_videos = [VideoData(title=r[4], creation_time=r[5], visible=r[6], location=r[7],
+                                   file_location=r[8], description=r[9])
+                         for r in result]
+        result_emails = [{"email": r[0], "fullname": r[1], "phone_number": r[2],
+                          "photo_hash": r[3]} for r in result]
+        result_reactions = [{Reaction.like: r[10], Reaction.dislike: r[11]} for r in result]
+        return VideosPage(results=list(zip(result_emails, result_videos, result_reactions)),
+                          next_cursor=next_cursor, total=self.get_total_videos())
+
+    def bump_videos_version(self, cursor, user_email: str) -> NoReturn:
+        """
+        Increments the version of the videos of a user and of all the videos, in the transaction that changes them
+
+        :param cursor: the cursor of the transaction
+        :param user_email: the owner of the video that changed
+        """
+        PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                     self.queries["bump_resource_versions"],
+                                     (sorted_resources(self.changed_resources(user_email)),))
+
+    @single_flight
+    def get_videos_version(self, user_email: Optional[str] = None) -> ResourceVersion:
+        """
+        Gets the version of the videos, it changes when a video is added or deleted and
+        when a video is reacted or commented
+
+        :param user_email: the owner of the videos, None for all the videos
+        :return: the version
+        """
+        cursor = self.conn.cursor()
+        PostgresUtils.safe_query_run(self.logger, self.conn, cursor,
+                                     self.queries["get_resource_version"],
+                                     (self.videos_resource(user_email),))
+        result = cursor.fetchone()
+        self.conn.commit()
+        cursor.close()
+        return ResourceVersion(*result) if result else INITIAL_VERSION
@@ -1,7 +1,19 @@
-from typing import NoReturn, List, Optional, NamedTuple, Tuple, Dict
+from typing import NoReturn, List, Optional, NamedTuple, Tuple, Dict, Iterator, Collection
 from abc import abstractmethod
 from enum import Enum
 from datetime import datetime
+from src.database.videos.exceptions.invalid_cursor_error import InvalidCursorError
+from src.database.utils.resource_versions import ResourceVersion
+import base64
+import binascii
+import heapq
+import json
+
+CURSOR_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+# The versioned resources, all the videos (the top videos) and the videos of a user with their reactions and comments
+ALL_VIDEOS_RESOURCE = "videos"
+USER_VIDEOS_RESOURCE = "videos:%s"
 
 
 class Reaction(Enum):
@@ -39,6 +51,47 @@ class VideoData(NamedTuple):
     description: Optional[str] = None
 
 
+class SearchResultsPage(NamedTuple):
+    """
+    A page of search results
+
+    results: a list of (user data, video data, reactions counts)
+    next_cursor: the cursor for getting the next page, None if this is the last one
+    total: the amount of videos matching the query, None if it was not requested
+    """
+    results: List[Tuple[Dict, VideoData, Dict[Reaction, int]]]
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
+
+
+class VideosPage(NamedTuple):
+    """
+    A page of videos ordered from the newest to the oldest
+
+    results: a list of (user data, video data, reactions counts)
+    next_cursor: the cursor for getting the next page, None if this is the last one
+    total: the amount of videos, it may be a few seconds outdated
+    """
+    results: List[Tuple[Dict, VideoData, Dict[Reaction, int]]]
+    next_cursor: Optional[str] = None
+    total: int = 0
+
+
+class CommentsPage(NamedTuple):
+    """
+    A page of comments of a video ordered from the newest to the oldest
+
+    users: the data of the authors of the comments
+    comments: the comments
+    next_cursor: the cursor for getting the next page, None if this is the last one
+    total: the amount of comments of the video
+    """
+    users: List[Dict]
+    comments: List[Comment]
+    next_cursor: Optional[str] = None
+    total: int = 0
+
+
 class VideoDatabase:
     """
     Video database abstraction
@@ -80,12 +133,22 @@ class VideoDatabase:
         """
 
     @abstractmethod
-    def search_videos(self, search_query: str) -> List[Tuple[Dict, VideoData, Dict[Reaction, int]]]:
+    def search_videos(self, search_query: str, limit: Optional[int] = None,
+                      cursor: Optional[str] = None, with_total: bool = False,
+                      private_owners: Collection[str] = ()) -> SearchResultsPage:
         """
-        Searches videos with a query
+        Searches videos with a query, the private videos are only searched if their owner is in private_owners
+        The results are ordered by relevance, ties are broken by owner email and title
+
+        :raises:
+            InvalidCursorError: the cursor is malformed
 
         :param search_query: the query to search
-        :return: a list of (user data, video data, reactions counts)
+        :param limit: the maximum amount of results to return, None for all of them
+        :param cursor: the cursor returned with the previous page, None for the first one
+        :param with_total: whether to count the total amount of matching videos
+        :param private_owners: the owners whose private videos can be found, like the searcher and their friends
+        :return: a page of search results
         """
 
     @abstractmethod
@@ -145,6 +208,42 @@ class VideoDatabase:
         :return: a tuple of (list of user data, list of comments)
         """
 
+    def stream_comments(self, target_email: str, video_title: str) -> Iterator[Tuple[Dict, Comment]]:
+        """
+        Get all the comments for a video while they are consumed
+        By default they are all fetched at once, the backends may fetch them a few at a time
+
+        :param target_email: the email of the owner of the video
+        :param video_title: the title of the video
+        :return: an iterator of (user data, comment)
+        """
+        return zip(*self.get_comments(target_email, video_title))
+
+    @abstractmethod
+    def get_comments_page(self, target_email: str, video_title: str, limit: int,
+                          cursor: Optional[str] = None) -> CommentsPage:
+        """
+        Get a page of the comments for a video, newest first
+
+        :raises:
+            InvalidCursorError: the cursor is malformed
+
+        :param target_email: the email of the owner of the video
+        :param video_title: the title of the video
+        :param limit: the maximum amount of comments in the page
+        :param cursor: the cursor returned with the previous page, None for the first one
+        :return: a page of comments
+        """
+
+    @abstractmethod
+    def get_user_photo(self, photo_hash: str) -> Optional[str]:
+        """
+        Gets the photo of an user by its hash, the one sent in the user data of the listings
+
+        :param photo_hash: the hash of the photo
+        :return: the base64 of the photo or None if no user has that photo
+        """
+
     @abstractmethod
     def get_paginated_videos(self, page: int, per_page: int) -> Tuple[
         List[Tuple[Dict, VideoData, Dict[Reaction, int]]], int]:
@@ -159,6 +258,191 @@ class VideoDatabase:
         :return: a list of (user data, video data, reactions counts) and the number of pages
         """
 
+    def stream_paginated_videos(self, page: int, per_page: int) -> Tuple[
+        Iterator[Tuple[Dict, VideoData, Dict[Reaction, int]]], int]:
+        """
+        Get all the videos paginated while they are consumed
+        By default they are all fetched at once, the backends may fetch them a few at a time
+
+        :raises:
+            NoMoreVideosError: if the page does not exist, page 0 always exist
+
+        :param page: the page requested
+        :param per_page: the amount of videos per page
+        :return: an iterator of (user data, video data, reactions counts) and the number of pages
+        """
+        videos, pages = self.get_paginated_videos(page, per_page)
+        return iter(videos), pages
+
+    @abstractmethod
+    def get_videos_page(self, limit: int, cursor: Optional[str] = None) -> VideosPage:
+        """
+        Get a page of all the videos using a cursor instead of a page number
+        The videos are ordered by creation time, owner email and title descending
+
+        :raises:
+            InvalidCursorError: the cursor is malformed
+
+        :param limit: the maximum amount of videos in the page
+        :param cursor: the cursor returned with the previous page, None for the first one
+        :return: a page of videos
+        """
+
+    @abstractmethod
+    def get_videos_version(self, user_email: Optional[str] = None) -> ResourceVersion:
+        """
+        Gets the version of the videos, it changes when a video is added or deleted and
+        when a video is reacted or commented
+
+        :param user_email: the owner of the videos, None for all the videos
+        :return: the version
+        """
+
+    @staticmethod
+    def videos_resource(user_email: Optional[str] = None) -> str:
+        """
+        The versioned resource of the videos of a user or of all the videos
+
+        :param user_email: the owner of the videos, None for all the videos
+        :return: the resource
+        """
+        return USER_VIDEOS_RESOURCE % user_email if user_email else ALL_VIDEOS_RESOURCE
+
+    @staticmethod
+    def changed_resources(user_email: str) -> List[str]:
+        """
+        The resources that change when a video of a user changes
+
+        :param user_email: the owner of the video
+        :return: the resources
+        """
+        return [ALL_VIDEOS_RESOURCE, USER_VIDEOS_RESOURCE % user_email]
+
+    @staticmethod
+    def encode_videos_cursor(creation_time: datetime, user_email: str, video_title: str) -> str:
+        """
+        Encodes the position of a video in the videos listing as an opaque cursor
+
+        :param creation_time: the creation time of the video
+        :param user_email: the email of the owner of the video
+        :param video_title: the title of the video
+        :return: the cursor
+        """
+        return base64.urlsafe_b64encode(json.dumps([creation_time.strftime(CURSOR_DATETIME_FORMAT), user_email,
+                                                    video_title]).encode()).decode()
+
+    @staticmethod
+    def decode_videos_cursor(cursor: str) -> Tuple[datetime, str, str]:
+        """
+        Decodes a cursor created with encode_videos_cursor
+
+        :raises:
+            InvalidCursorError: the cursor is malformed
+
+        :param cursor: the cursor to decode
+        :return: a tuple (creation time, owner email, video title)
+        """
+        try:
+            creation_time, user_email, video_title = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            creation_time = datetime.strptime(creation_time, CURSOR_DATETIME_FORMAT)
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+            raise InvalidCursorError
+        if not isinstance(user_email, str) or not isinstance(video_title, str):
+            raise InvalidCursorError
+        return creation_time, user_email, video_title
+
+    @staticmethod
+    def encode_comments_cursor(timestamp: datetime, comment_id: int) -> str:
+        """
+        Encodes the position of a comment as an opaque cursor
+
+        :param timestamp: the timestamp of the comment
+        :param comment_id: the id of the comment
+        :return: the cursor
+        """
+        return base64.urlsafe_b64encode(json.dumps([timestamp.strftime(CURSOR_DATETIME_FORMAT),
+                                                    comment_id]).encode()).decode()
+
+    @staticmethod
+    def decode_comments_cursor(cursor: str) -> Tuple[datetime, int]:
+        """
+        Decodes a cursor created with encode_comments_cursor
+
+        :raises:
+            InvalidCursorError: the cursor is malformed
+
+        :param cursor: the cursor to decode
+        :return: a tuple (timestamp, comment id)
+        """
+        try:
+            timestamp, comment_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            timestamp = datetime.strptime(timestamp, CURSOR_DATETIME_FORMAT)
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+            raise InvalidCursorError
+        if not isinstance(comment_id, int):
+            raise InvalidCursorError
+        return timestamp, comment_id
+
+    @staticmethod
+    def encode_search_cursor(negative_score: float, user_email: str, video_title: str) -> str:
+        """
+        Encodes the position of a search result as an opaque cursor
+
+        :param negative_score: the negated score of the result
+        :param user_email: the email of the owner of the video
+        :param video_title: the title of the video
+        :return: the cursor
+        """
+        return base64.urlsafe_b64encode(json.dumps([negative_score, user_email,
+                                                    video_title]).encode()).decode()
+
+    @staticmethod
+    def decode_search_cursor(cursor: str) -> Tuple[float, str, str]:
+        """
+        Decodes a cursor created with encode_search_cursor
+
+        :raises:
+            InvalidCursorError: the cursor is malformed
+
+        :param cursor: the cursor to decode
+        :return: a tuple (negative score, owner email, video title)
+        """
+        try:
+            negative_score, user_email, video_title = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+            raise InvalidCursorError
+        if not isinstance(negative_score, (int, float)) or not isinstance(user_email, str) or \
+                not isinstance(video_title, str):
+            raise InvalidCursorError
+        return float(negative_score), user_email, video_title
+
+    @staticmethod
+    def page_scored_videos(scored_videos: List[Tuple[float, str, VideoData]], limit: Optional[int],
+                           cursor: Optional[str]) -> Tuple[List[Tuple[float, str, VideoData]], Optional[str]]:
+        """
+        Gets the page of scored videos that comes after the cursor
+        Just the videos in the page are sorted, not all of them
+
+        :raises:
+            InvalidCursorError: the cursor is malformed
+
+        :param scored_videos: a list of (score, owner email, video data)
+        :param limit: the maximum amount of videos in the page, None for all of them
+        :param cursor: the cursor returned with the previous page, None for the first one
+        :return: the page of scored videos and the cursor for the next one
+        """
+        sort_key = lambda x: (-x[0], x[1], x[2].title)
+        if cursor:
+            cursor_position = VideoDatabase.decode_search_cursor(cursor)
+            scored_videos = [s for s in scored_videos if sort_key(s) > cursor_position]
+        if limit is None:
+            return sorted(scored_videos, key=sort_key), None
+        page = heapq.nsmallest(limit + 1, scored_videos, key=sort_key)
+        if len(page) <= limit:
+            return page, None
+        page = page[:limit]
+        return page, VideoDatabase.encode_search_cursor(*sort_key(page[-1]))
+
     @classmethod
     def factory(cls, name: str, *args, **kwargs) -> 'VideoDatabase':
         """
@@ -1,24 +1,47 @@
-from typing import NoReturn, List, Optional, NamedTuple, Tuple, Dict
+from typing import NoReturn, List, Optional, NamedTuple, Tuple, Dict, Collection
 from abc import abstractmethod
 from datetime import datetime
-from src.database.videos.video_database import VideoData, VideoDatabase, Reaction, Comment
+from src.database.videos.video_database import VideoData, VideoDatabase, Reaction, Comment, SearchResultsPage, VideosPage, \
+    CommentsPage
 from src.database.videos.exceptions.no_more_videos_error import NoMoreVideosError
-from nltk import word_tokenize
+from src.search.tokenizer import Tokenizer
+from src.search.search_profile import SearchProfile, SearchQuery
+import heapq
 import math
+from src.database.utils.synchronized import synchronized
+from src.database.utils.resource_versions import RamResourceVersions, ResourceVersion
+import threading
+
+DEFAULT_TOKENIZER = "RegexTokenizer"
 
 
 class RamVideoDatabase(VideoDatabase):
     """
     Video ram database
+    Every video is indexed by owner and title, the reactions are kept by actor
+    with running counters so every video operation is O(1)
     """
-    videos_by_user: Dict[str, List[VideoData]]
-    current_id: int
+    videos_by_user: Dict[str, Dict[str, VideoData]]
+    reactions: Dict[Tuple[str, str], Dict[str, Reaction]]
+    reaction_counts: Dict[Tuple[str, str], Dict[Reaction, int]]
+    comments: Dict[Tuple[str, str], List[Tuple[str, Comment]]]
+
+    def __init__(self, tokenizer: str = DEFAULT_TOKENIZER):
+        """
 
-    def __init__(self):
+        :param tokenizer: the name of the tokenizer used for searching
+        """
         self.videos_by_user = {}
         self.reactions = {}
+        self.reaction_counts = {}
         self.comments = {}
+        self.tokenizer = Tokenizer.factory(tokenizer)
+        self.search_profiles = {}
+        self.resource_versions = RamResourceVersions()
+        # The backend is shared by the requests served in threads
+        self.lock = threading.RLock()
 
+    @synchronized
     def add_video(self, user_email: str, video_data: VideoData) -> NoReturn:
         """
         Adds a video to the database
@@ -26,11 +49,16 @@ class RamVideoDatabase(VideoDatabase):
         :param user_email: the email of the user owner of the video
         :param video_data: the video data to upload
         """
+        self.resource_versions.bump(*self.changed_resources(user_email))
         if user_email not in self.videos_by_user:
-            self.videos_by_user[user_email] = [video_data]
-        else:
-            self.videos_by_user[user_email].append(video_data)
+            self.videos_by_user[user_email] = {}
+        self.videos_by_user[user_email].pop(video_data.title, None)
+        self.videos_by_user[user_email][video_data.title] = video_data
+        self.search_profiles[(user_email, video_data.title)] = SearchProfile.from_video(self.tokenizer,
+                                                                                       video_data.title,
+                                                                                       video_data.description)
 
+    @synchronized
     def delete_video(self, user_email: str, video_title: str) -> NoReturn:
         """
         Deletes a video from the database
@@ -38,10 +66,15 @@ class RamVideoDatabase(VideoDatabase):
         :param user_email: the user owner of the video
         :param video_title: the video title
         """
+        self.resource_versions.bump(*self.changed_resources(user_email))
         if user_email in self.videos_by_user:
-            self.videos_by_user[user_email] = [v for v in self.videos_by_user[user_email]
-                                               if v.title!=video_title]
+            self.videos_by_user[user_email].pop(video_title, None)
+        self.search_profiles.pop((user_email, video_title), None)
+        self.reactions.pop((user_email, video_title), None)
+        self.reaction_counts.pop((user_email, video_title), None)
+        self.comments.pop((user_email, video_title), None)
 
+    @synchronized
     def get_video_reactions(self, target_email: str, video_title: str) -> Dict[Reaction, int]:
         """
         Gets the video reaction counts
@@ -50,13 +83,11 @@ class RamVideoDatabase(VideoDatabase):
         :param video_title: the video title
         :return: a dict of counts
         """
-        result = {Reaction.like: 0, Reaction.dislike: 0}
-        if target_email not in self.reactions or video_title not in self.reactions[target_email]:
-            return result
-        for _, r in self.reactions[target_email][video_title]:
-            result[r] += 1
-        return result
+        if (target_email, video_title) not in self.reaction_counts:
+            return {Reaction.like: 0, Reaction.dislike: 0}
+        return dict(self.reaction_counts[(target_email, video_title)])
 
+    @synchronized
     def list_user_videos(self, user_email: str) -> List[Tuple[VideoData, Dict[Reaction, int]]]:
         """
         Get all the user videos
@@ -64,10 +95,13 @@ class RamVideoDatabase(VideoDatabase):
         :param user_email: the user's email
         :return: a list (video data, reactions counts)
         """
-        videos = list(reversed(self.videos_by_user[user_email]))
+        if user_email not in self.videos_by_user:
+            return []
+        videos = list(reversed(list(self.videos_by_user[user_email].values())))
         return [(v, self.get_video_reactions(user_email, v.title)) for v in videos]
 
 
+    @synchronized
     def list_top_videos(self) -> List[Tuple[Dict, VideoData, Dict[Reaction, int]]]:
         """
         Get top videos
@@ -76,40 +110,44 @@ class RamVideoDatabase(VideoDatabase):
         """
         result = []
         for k, v in self.videos_by_user.items():
-            for i in range(len(v)):
-                if v[i].visible:
-                    result.append(({"email": k}, v[i], self.get_video_reactions(k, v[i].title)))
+            for video in v.values():
+                if video.visible:
+                    result.append(({"email": k}, video, self.get_video_reactions(k, video.title)))
         return result
 
-    def search_videos(self, search_query: str) -> List[Tuple[Dict, VideoData, Dict[Reaction, int]]]:
+    @synchronized
+    def search_videos(self, search_query: str, limit: Optional[int] = None,
+                      cursor: Optional[str] = None, with_total: bool = False,
+                      private_owners: Collection[str] = ()) -> SearchResultsPage:
         """
-        Searches videos with a query
+        Searches videos with a query, the private videos are only searched if their owner is in private_owners
+        The results are ordered by relevance, ties are broken by owner email and title
+
+        :raises:
+            InvalidCursorError: the cursor is malformed
 
         :param search_query: the query to search
-        :return: a list of (user data, video data, reactions counts)
+        :param limit: the maximum amount of results to return, None for all of them
+        :param cursor: the cursor returned with the previous page, None for the first one
+        :param with_total: whether to count the total amount of matching videos
+        :param private_owners: the owners whose private videos can be found, like the searcher and their friends
+        :return: a page of search results
         """
-        tokenized_query = word_tokenize(search_query.lower())
-        bigrams_query = [tokenized_query[i:i + 2] for i in range(len(tokenized_query) - 2 + 1)]
-        result = []
+        query = SearchQuery.from_text(self.tokenizer, search_query)
+        private_owners = set(private_owners)
+        scored_videos = []
         for k, v in self.videos_by_user.items():
-            for i in range(len(v)):
-                if v[i].visible:
-                    word_count = 0
-                    desc_count = 0
-                    tokenized_title = word_tokenize(v[i].title.lower())
-                    bigrams_title = [tokenized_title[i:i + 2] for i in range(len(tokenized_title) - 2 + 1)]
-                    tokenized_desc = (word_tokenize(v[i].description[:1000].lower()) if v[i].description else [])
-                    for w in tokenized_query:
-                        word_count += len([t for t in tokenized_title if t == w])
-                        desc_count += len([t for t in tokenized_desc if t == w])
-                    for b in bigrams_query:
-                        word_count += len([t for t in bigrams_title if t == b])
-                    if word_count > 0 or desc_count > 0:
-                        result.append(({"email": k}, v[i], word_count * 0.8 + desc_count * 0.2))
-        result = sorted(result, key=lambda x:x[2],reverse=True)
-        result = [(r[0],r[1], self.get_video_reactions(r[0]["email"], r[1].title)) for r in result]
-        return result
+            for video in v.values():
+                if video.visible or k in private_owners:
+                    score = self.search_profiles[(k, video.title)].score(query)
+                    if score > 0:
+                        scored_videos.append((score, k, video))
+        page, next_cursor = self.page_scored_videos(scored_videos, limit, cursor)
+        result = [({"email": e}, v, self.get_video_reactions(e, v.title)) for _, e, v in page]
+        return SearchResultsPage(results=result, next_cursor=next_cursor,
+                                 total=(len(scored_videos) if with_total else None))
 
+    @synchronized
     def react_video(self, actor_email: str, target_email: str,
                    video_title: str, reaction: Reaction) -> NoReturn:
         """
@@ -121,12 +159,14 @@ class RamVideoDatabase(VideoDatabase):
         :param reaction: the type of reaction
         """
         self.delete_reaction(actor_email, target_email, video_title)
-        if target_email not in self.reactions:
-            self.reactions[target_email] = {}
-        if video_title not in self.reactions[target_email]:
-            self.reactions[target_email][video_title] = []
-        self.reactions[target_email][video_title].append((actor_email, reaction))
+        self.resource_versions.bump(*self.changed_resources(target_email))
+        if (target_email, video_title) not in self.reactions:
+            self.reactions[(target_email, video_title)] = {}
+            self.reaction_counts[(target_email, video_title)] = {Reaction.like: 0, Reaction.dislike: 0}
+        self.reactions[(target_email, video_title)][actor_email] = reaction
+        self.reaction_counts[(target_email, video_title)][reaction] += 1
 
+    @synchronized
     def get_video_reaction(self, actor_email: str, target_email: str, video_title: str) -> Optional[Reaction]:
         """
         Gets the reaction of the user
@@ -137,14 +177,11 @@ class RamVideoDatabase(VideoDatabase):
         :param video_title: the video title
         :return: a reaction or None
         """
-        if target_email not in self.reactions or video_title not in self.reactions[target_email]:
+        if (target_email, video_title) not in self.reactions:
             return None
-        reaction = [r for a, r in self.reactions[target_email][video_title] if a == actor_email]
-        if not reaction:
-            return None
-        else:
-            return reaction[0]
+        return self.reactions[(target_email, video_title)].get(actor_email)
 
+    @synchronized
     def delete_reaction(self, actor_email: str, target_email: str,
                         video_title: str) -> NoReturn:
         """
@@ -154,10 +191,14 @@ class RamVideoDatabase(VideoDatabase):
         :param target_email: the email of the owner of the video
         :param video_title: the title of the video
         """
-        if target_email not in self.reactions or video_title not in self.reactions[target_email]:
+        if (target_email, video_title) not in self.reactions:
             return
-        self.reactions[target_email][video_title] = [r for r in self.reactions[target_email][video_title] if r[0] != actor_email]
+        reaction = self.reactions[(target_email, video_title)].pop(actor_email, None)
+        if reaction:
+            self.resource_versions.bump(*self.changed_resources(target_email))
+            self.reaction_counts[(target_email, video_title)][reaction] -= 1
 
+    @synchronized
     def comment_video(self, actor_email: str, target_email: str, video_title: str,
                       comment: str) -> NoReturn:
         """
@@ -168,12 +209,14 @@ class RamVideoDatabase(VideoDatabase):
         :param video_title: the video title
         :param comment: the comment
         """
+        self.resource_versions.bump(*self.changed_resources(target_email))
         if not (target_email, video_title) in self.comments:
             self.comments[(target_email, video_title)] = []
         self.comments[(target_email, video_title)].append((actor_email,
                                                            Comment(content=comment,
                                                                    timestamp=datetime.now())))
 
+    @synchronized
     def get_comments(self, target_email: str, video_title: str) -> Tuple[List[Dict], List[Comment]]:
         """
         Get all the comments for a video
@@ -189,6 +232,47 @@ class RamVideoDatabase(VideoDatabase):
         comment_data = [t[1] for t in comment_tuples]
         return user_data, comment_data
 
+    @synchronized
+    def get_comments_page(self, target_email: str, video_title: str, limit: int,
+                          cursor: Optional[str] = None) -> CommentsPage:
+        """
+        Get a page of the comments for a video, newest first
+        The id of a comment is its position in the comments of the video
+
+        :raises:
+            InvalidCursorError: the cursor is malformed
+
+        :param target_email: the email of the owner of the video
+        :param video_title: the title of the video
+        :param limit: the maximum amount of comments in the page
+        :param cursor: the cursor returned with the previous page, None for the first one
+        :return: a page of comments
+        """
+        video_comments = self.comments.get((target_email, video_title), [])
+        end = len(video_comments)
+        if cursor:
+            end = min(self.decode_comments_cursor(cursor)[1], end)
+        start = max(end - limit, 0)
+        comment_tuples = list(reversed(video_comments[start:end]))
+        next_cursor = None
+        if start > 0:
+            next_cursor = self.encode_comments_cursor(comment_tuples[-1][1].timestamp, start)
+        return CommentsPage(users=[{"email": t[0]} for t in comment_tuples],
+                            comments=[t[1] for t in comment_tuples],
+                            next_cursor=next_cursor, total=len(video_comments))
+
+    @synchronized
+    def get_user_photo(self, photo_hash: str) -> Optional[str]:
+        """
+        Gets the photo of an user by its hash, the one sent in the user data of the listings
+        The ram database does not have the users data so there are no photos
+
+        :param photo_hash: the hash of the photo
+        :return: the base64 of the photo or None if no user has that photo
+        """
+        return None
+
+    @synchronized
     def get_paginated_videos(self, page: int, per_page: int) -> Tuple[
         List[Tuple[Dict, VideoData, Dict[Reaction, int]]], int]:
         """
@@ -202,7 +286,7 @@ class RamVideoDatabase(VideoDatabase):
         :return: a list of (user data, video data, reactions counts) and the number of pages
         """
         all_videos = sorted([(k,v) for k,v in self.videos_by_user.items()], key=lambda x: x[0])
-        all_videos = [(k, video) for k,v in all_videos for video in v]
+        all_videos = [(k, video) for k,v in all_videos for video in v.values()]
         pages = int(math.ceil(len(all_videos) / per_page))
         if not page < pages and page != 0:
             raise NoMoreVideosError
@@ -210,4 +294,41 @@ class RamVideoDatabase(VideoDatabase):
         result = []
         for e, v in page_videos:
             result.append(({"email": e}, v, self.get_video_reactions(e, v.title)))
-        return result, pages
\ No newline at end of file
+        return result, pages
+
+    @synchronized
+    def get_videos_page(self, limit: int, cursor: Optional[str] = None) -> VideosPage:
+        """
+        Get a page of all the videos using a cursor instead of a page number
+        The videos are ordered by creation time, owner email and title descending
+
+        :raises:
+            InvalidCursorError: the cursor is malformed
+
+        :param limit: the maximum amount of videos in the page
+        :param cursor: the cursor returned with the previous page, None for the first one
+        :return: a page of videos
+        """
+        sort_key = lambda x: (x[1].creation_time, x[0], x[1].title)
+        all_videos = [(k, video) for k, v in self.videos_by_user.items() for video in v.values()]
+        total = len(all_videos)
+        if cursor:
+            cursor_position = self.decode_videos_cursor(cursor)
+            all_videos = [v for v in all_videos if sort_key(v) < cursor_position]
+        page_videos = heapq.nlargest(limit + 1, all_videos, key=sort_key)
+        next_cursor = None
+        if len(page_videos) > limit:
+            page_videos = page_videos[:limit]
+            next_cursor = self.encode_videos_cursor(*sort_key(page_videos[-1]))
+        result = [({"email": e}, v, self.get_video_reactions(e, v.title)) for e, v in page_videos]
+        return VideosPage(results=result, next_cursor=next_cursor, total=total)
+
+    def get_videos_version(self, user_email: Optional[str] = None) -> ResourceVersion:
+        """
+        Gets the version of the videos, it changes when a video is added or deleted and
+        when a video is reacted or commented
+
+        :param user_email: the owner of the videos, None for all the videos
+        :return: the version
+        """
+        return self.resource_versions.get(self.videos_resource(user_email))
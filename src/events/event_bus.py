@@ -0,0 +1,94 @@
+from typing import NamedTuple, NoReturn, Dict, Optional
+from abc import abstractmethod
+import queue
+
+MAX_PENDING_EVENTS = 100
+
+
+class Event(NamedTuple):
+    """
+    An event pushed to a connected user
+
+    kind: the kind of the event, the same of the push notification payloads ("message", "friendship_request")
+    payload: the data of the event
+    """
+    kind: str
+    payload: Dict
+
+
+class Subscription:
+    """
+    The pending events of a connected user
+    """
+
+    def __init__(self, user_email: str, max_pending_events: int = MAX_PENDING_EVENTS):
+        self.user_email = user_email
+        self.events = queue.Queue(maxsize=max_pending_events)
+
+    def put(self, event: Event) -> bool:
+        """
+        Adds an event without blocking
+
+        :param event: the event to add
+        :return: False if the event was dropped because the subscriber is not reading them
+        """
+        try:
+            self.events.put_nowait(event)
+            return True
+        except queue.Full:
+            return False
+
+    def get(self, timeout: float) -> Optional[Event]:
+        """
+        Waits for the next event
+
+        :param timeout: the maximum amount of seconds to wait
+        :return: the event or None if there was not any
+        """
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBus:
+    """
+    Publish & subscribe of the events of the users
+    """
+
+    @abstractmethod
+    def publish(self, user_email: str, event: Event) -> NoReturn:
+        """
+        Publishes an event to every connection of a user
+
+        :param user_email: the email of the user receiving the event
+        :param event: the event
+        """
+
+    @abstractmethod
+    def subscribe(self, user_email: str) -> Subscription:
+        """
+        Subscribes to the events of a user
+
+        :param user_email: the email of the user
+        :return: the subscription to read the events from
+        """
+
+    @abstractmethod
+    def unsubscribe(self, subscription: Subscription) -> NoReturn:
+        """
+        Stops receiving events in a subscription
+
+        :param subscription: the subscription returned by subscribe
+        """
+
+    @classmethod
+    def factory(cls, name: str, *args, **kwargs) -> 'EventBus':
+        """
+        Factory pattern for event bus
+
+        :param name: the name of the event bus to create in the factory
+        :return: an event bus object
+        """
+        event_bus_types = {cls.__name__: cls for cls in EventBus.__subclasses__()}
+        return event_bus_types[name](*args, **kwargs)
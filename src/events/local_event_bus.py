@@ -0,0 +1,53 @@
+from typing import NoReturn, Dict, Set
+from src.events.event_bus import EventBus, Event, Subscription
+import logging
+import threading
+
+
+class LocalEventBus(EventBus):
+    """
+    In process event bus, only the connections of this process receive the events
+    """
+    logger = logging.getLogger(__module__)
+    subscriptions: Dict[str, Set[Subscription]]
+
+    def __init__(self):
+        self.subscriptions = {}
+        self.lock = threading.Lock()
+
+    def publish(self, user_email: str, event: Event) -> NoReturn:
+        """
+        Publishes an event to every connection of a user
+
+        :param user_email: the email of the user receiving the event
+        :param event: the event
+        """
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(user_email, ()))
+        for subscription in subscriptions:
+            if not subscription.put(event):
+                self.logger.warning("Dropping %s event for %s, too many pending events" % (event.kind, user_email))
+
+    def subscribe(self, user_email: str) -> Subscription:
+        """
+        Subscribes to the events of a user
+
+        :param user_email: the email of the user
+        :return: the subscription to read the events from
+        """
+        subscription = Subscription(user_email)
+        with self.lock:
+            self.subscriptions.setdefault(user_email, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> NoReturn:
+        """
+        Stops receiving events in a subscription
+
+        :param subscription: the subscription returned by subscribe
+        """
+        with self.lock:
+            user_subscriptions = self.subscriptions.get(subscription.user_email, set())
+            user_subscriptions.discard(subscription)
+            if not user_subscriptions:
+                self.subscriptions.pop(subscription.user_email, None)
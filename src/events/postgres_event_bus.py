@@ -0,0 +1,139 @@
+from typing import NoReturn, List
+from src.events.event_bus import EventBus, Event, Subscription
+from src.events.local_event_bus import LocalEventBus
+from src.database.utils.postgres_connection import PostgresUtils
+import logging
+import threading
+import select
+import json
+import time
+import os
+import psycopg2
+
+NOTIFY_QUERY = """
+SELECT pg_notify(%s, %s)
+"""
+
+LISTEN_TIMEOUT_SECONDS = 5
+RECONNECT_SECONDS = 5
+
+
+class PostgresEventBus(EventBus):
+    """
+    Event bus shared by every node through postgres LISTEN/NOTIFY
+
+    The events are notified in a channel and a listener thread of each process
+    dispatches them to the connections of that process
+    """
+    logger = logging.getLogger(__module__)
+
+    def __init__(self, channel_name: str,
+                 postgr_host_env_name: str, postgr_user_env_name: str,
+                 postgr_pass_env_name: str, postgr_database_env_name: str):
+        self.channel_name = channel_name
+        self.local_event_bus = LocalEventBus()
+        self.connection_params = {"host": os.environ[postgr_host_env_name],
+                                  "user": os.environ[postgr_user_env_name],
+                                  "password": os.environ[postgr_pass_env_name],
+                                  "database": os.environ[postgr_database_env_name]}
+        self.listen_conn = None
+        self.listener = None
+        self.listener_lock = threading.Lock()
+        self.conn = PostgresUtils.get_postgres_connection(**self.connection_params)
+        if self.conn.closed == 0:
+            self.logger.info("Connected to postgres database")
+        else:
+            self.logger.error("Unable to connect to postgres database")
+            raise ConnectionError("Unable to connect to postgres database")
+
+    def publish(self, user_email: str, event: Event) -> NoReturn:
+        """
+        Publishes an event to every connection of a user in any node
+        The notification is sent when the transaction commits, payloads should be under 8000 bytes
+
+        :param user_email: the email of the user receiving the event
+        :param event: the event
+        """
+        cursor = self.conn.cursor()
+        PostgresUtils.safe_query_run(self.logger, self.conn, cursor, NOTIFY_QUERY,
+                                     (self.channel_name, json.dumps({"user_email": user_email, "kind": event.kind,
+                                                                     "payload": event.payload})))
+        self.conn.commit()
+        cursor.close()
+
+    def subscribe(self, user_email: str) -> Subscription:
+        """
+        Subscribes to the events of a user, the first subscription starts the listener
+
+        :param user_email: the email of the user
+        :return: the subscription to read the events from
+        """
+        with self.listener_lock:
+            if not self.listener:
+                self.listener = threading.Thread(target=self.listen_forever, daemon=True)
+                self.listener.start()
+        return self.local_event_bus.subscribe(user_email)
+
+    def unsubscribe(self, subscription: Subscription) -> NoReturn:
+        """
+        Stops receiving events in a subscription
+
+        :param subscription: the subscription returned by subscribe
+        """
+        self.local_event_bus.unsubscribe(subscription)
+
+    def listen(self) -> NoReturn:
+        """
+        Opens the connection that listens to the channel, it is not shared because it is always waiting
+        """
+        if not self.listen_conn:
+            self.listen_conn = psycopg2.connect(**self.connection_params)
+        self.listen_conn.autocommit = True
+        cursor = self.listen_conn.cursor()
+        cursor.execute('LISTEN "%s"' % self.channel_name)
+        cursor.close()
+
+    def wait_notifications(self, timeout: float) -> List[str]:
+        """
+        Waits for the notifications of the channel
+
+        :param timeout: the maximum amount of seconds to wait
+        :return: the payloads received
+        """
+        if self.listen_conn.notifies or select.select([self.listen_conn], [], [], timeout) != ([], [], []):
+            self.listen_conn.poll()
+        payloads = [n.payload for n in self.listen_conn.notifies]
+        self.listen_conn.notifies.clear()
+        return payloads
+
+    def dispatch_notifications(self, timeout: float) -> NoReturn:
+        """
+        Dispatches the notifications received to the local connections
+
+        :param timeout: the maximum amount of seconds to wait for notifications
+        """
+        for payload in self.wait_notifications(timeout):
+            try:
+                notification = json.loads(payload)
+                event = Event(kind=notification["kind"], payload=notification["payload"])
+                self.local_event_bus.publish(notification["user_email"], event)
+            except (ValueError, KeyError, TypeError):
+                self.logger.warning("Ignoring malformed event %s" % payload)
+
+    def listen_forever(self) -> NoReturn:
+        """
+        Listener loop, reconnects if the connection is lost
+        """
+        while True:
+            try:
+                self.listen()
+                while True:
+                    self.dispatch_notifications(LISTEN_TIMEOUT_SECONDS)
+            except Exception:
+                self.logger.exception("Events listener connection lost, reconnecting")
+                try:
+                    self.listen_conn.close()
+                except Exception:
+                    pass
+                self.listen_conn = None
+                time.sleep(RECONNECT_SECONDS)
@@ -1,5 +1,6 @@
 from io import BytesIO
 import base64
+import hashlib
 from PIL import Image
 import math
 from typing import Tuple, Optional
@@ -13,10 +14,11 @@ class Photo:
         if not base64_img:
             base64_img = DEFAULT_PHOTO
         try:
-            Image.open(BytesIO(base64.b64decode(base64_img)))
+            image = Image.open(BytesIO(base64.b64decode(base64_img)))
         except Exception:
             raise NotAnImageException
         self.photo_base64 = base64_img
+        self.mimetype = Image.MIME.get(image.format, "application/octet-stream")
 
     @staticmethod
     def get_target_crop_square(width, height, target) -> Tuple[int, int, int, int]:
@@ -58,4 +60,20 @@ class Photo:
         return cls(base64.b64encode(buffered.getvalue()).decode())
 
     def get_base64(self) -> str:
-        return self.photo_base64
\ No newline at end of file
+        return self.photo_base64
+
+    def get_bytes(self) -> bytes:
+        return base64.b64decode(self.photo_base64)
+
+    def get_mimetype(self) -> str:
+        return self.mimetype
+
+    @staticmethod
+    def content_hash(base64_img: str) -> str:
+        """
+        Hashes the base64 of a photo, it is the same as postgres md5(photo)
+
+        :param base64_img: the base64 of the photo
+        :return: the hex digest of the hash
+        """
+        return hashlib.md5(base64_img.encode()).hexdigest()
\ No newline at end of file
@@ -0,0 +1,280 @@
+from typing import Callable, Dict, Optional, NoReturn, Tuple, Iterable
+from collections import OrderedDict
+from flask import request, make_response, Response
+from werkzeug.urls import url_encode
+from src.events.event_bus import EventBus, Event
+from src.database.response_cache.shared_response_cache import SharedResponseCache, CachedResponse
+from src.response_compression import SharedBodyResponse
+import logging
+import threading
+import time
+import uuid
+
+DEFAULT_MAX_ENTRIES = 256
+# Expired responses are kept a while, they are sent while another request recomputes them
+STALE_SECONDS = 60
+# The maximum amount of seconds a request waits for another one that is computing the same response
+STAMPEDE_WAIT_SECONDS = 2
+SHARED_POLL_SECONDS = 0.05
+REFRESH_LEASE_SECONDS = 10
+
+# The invalidations reach the other workers through the event bus, as the events of a recipient
+# that is not an email so no user receives them
+INVALIDATION_RECIPIENT = "#response_cache"
+INVALIDATION_EVENT_KIND = "response_cache_invalidation"
+
+# The rest of the headers are added by the after request functions, like the CORS and compression ones
+CACHED_HEADERS = {"Content-Type", "ETag", "Last-Modified", "Cache-Control"}
+
+
+class ResponseCache:
+    """
+    Cache of the responses of the public routes, the same for every user
+
+    The responses are kept in process with a LRU policy and, if there is a shared cache, in a second tier
+    shared by every worker. Only one request at a time recomputes an expired response, in this process
+    and between workers, the rest send the expired one or wait for it.
+    """
+    logger = logging.getLogger(__module__)
+    entries: Dict[str, Tuple[CachedResponse, Tuple[str, ...]]]
+    generations: Dict[str, int]
+    refreshing: Dict[str, threading.Event]
+
+    def __init__(self, event_bus: EventBus, shared: Optional[SharedResponseCache] = None,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, stale_seconds: float = STALE_SECONDS):
+        """
+
+        :param event_bus: the event bus to send the invalidations to the other workers
+        :param shared: the cache shared by every worker or None to only cache in process
+        :param max_entries: the maximum amount of responses cached in process
+        :param stale_seconds: the amount of seconds an expired response is kept
+        """
+        self.event_bus = event_bus
+        self.shared = shared
+        self.max_entries = max_entries
+        self.stale_seconds = stale_seconds
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.epoch = 0
+        self.refreshing = {}
+        self.lock = threading.Lock()
+        self.origin = uuid.uuid4().hex
+        self.subscription = event_bus.subscribe(INVALIDATION_RECIPIENT)
+
+    def cached(self, view: Callable, ttl: float, tags: Iterable[str] = ()) -> Callable:
+        """
+        Caches the successful responses of a route for every user
+
+        :param view: the view function of the route
+        :param ttl: the amount of seconds the responses are fresh
+        :param tags: the tags to invalidate the responses by
+        :return: the cached view function
+        """
+        tags = tuple(tags)
+
+        def wrapper(*args, **kwargs):
+            if request.method != "GET":
+                return view(*args, **kwargs)
+            key = "%s?%s" % (request.path, url_encode(request.args, sort=True))
+            response = self.get_response(key, ttl, tags, lambda: view(*args, **kwargs))
+            if not request.if_none_match:
+                # Like the Validator, the Last-Modified alone never gives a 304
+                return response
+            return response.make_conditional(request)
+
+        return wrapper
+
+    def get_response(self, key: str, ttl: float, tags: Tuple[str, ...],
+                     compute: Callable) -> Response:
+        """
+        Gets a response from the cache or computes it
+
+        :param key: the key of the response
+        :param ttl: the amount of seconds the response is fresh
+        :param tags: the tags to invalidate the response by
+        :param compute: computes the response, returns anything a view function returns
+        :return: the response
+        """
+        self.apply_invalidations()
+        cached = self.get_local(key)
+        if cached and cached.expires > time.time():
+            return self.to_response(cached)
+        with self.lock:
+            refreshing = self.refreshing.get(key)
+            if not refreshing:
+                self.refreshing[key] = threading.Event()
+        if refreshing:
+            if cached:
+                return self.to_response(cached)
+            refreshing.wait(STAMPEDE_WAIT_SECONDS)
+            cached = self.get_local(key)
+            if cached and cached.expires > time.time():
+                return self.to_response(cached)
+            return make_response(compute())
+        try:
+            return self.refresh(key, ttl, tags, compute, cached)
+        finally:
+            with self.lock:
+                self.refreshing.pop(key).set()
+
+    def refresh(self, key: str, ttl: float, tags: Tuple[str, ...], compute: Callable,
+                stale: Optional[CachedResponse]) -> Response:
+        """
+        Gets a response from the shared cache or computes it, only one request of this process calls it at a time
+
+        :param key: the key of the response
+        :param ttl: the amount of seconds the response is fresh
+        :param tags: the tags to invalidate the response by
+        :param compute: computes the response, returns anything a view function returns
+        :param stale: the expired response cached in process, if any
+        :return: the response
+        """
+        generation = self.generation(tags)
+        lease = None
+        if self.shared:
+            try:
+                shared_cached = self.shared.get(key)
+                if shared_cached and shared_cached.expires > time.time():
+                    self.set_local(key, shared_cached, tags, generation)
+                    return self.to_response(shared_cached)
+                lease = self.shared.acquire_refresh(key, list(tags), REFRESH_LEASE_SECONDS)
+                if not lease:
+                    # Another worker is computing it
+                    if shared_cached or stale:
+                        return self.to_response(shared_cached or stale)
+                    deadline = time.time() + STAMPEDE_WAIT_SECONDS
+                    while time.time() < deadline:
+                        time.sleep(SHARED_POLL_SECONDS)
+                        shared_cached = self.shared.get(key)
+                        if shared_cached and shared_cached.expires > time.time():
+                            self.set_local(key, shared_cached, tags, generation)
+                            return self.to_response(shared_cached)
+            except Exception:
+                self.logger.exception("Shared response cache error, computing the response")
+        response = make_response(compute())
+        if response.status_code != 200 or response.is_streamed:
+            return response
+        cached = CachedResponse(status=response.status_code,
+                                headers=[(name, value) for name, value in response.headers
+                                         if name in CACHED_HEADERS],
+                                body=response.get_data(), expires=time.time() + ttl)
+        self.set_local(key, cached, tags, generation)
+        if lease:
+            try:
+                self.shared.set(key, cached, lease)
+            except Exception:
+                self.logger.exception("Shared response cache error, the response is only cached in process")
+        return response
+
+    def invalidate(self, *tags: str) -> NoReturn:
+        """
+        Drops the cached responses with any of the tags, in every worker
+        It is called after the changes are saved, so the errors are only logged and the other workers
+        drop the responses when they expire
+
+        :param tags: the tags
+        """
+        self.invalidate_local(tags)
+        if self.shared:
+            try:
+                self.shared.invalidate(list(tags))
+            except Exception:
+                self.logger.exception("Shared response cache error, the responses expire with their ttl")
+        try:
+            self.event_bus.publish(INVALIDATION_RECIPIENT,
+                                   Event(kind=INVALIDATION_EVENT_KIND, payload={"tags": list(tags),
+                                                                                "origin": self.origin}))
+        except Exception:
+            self.logger.exception("Unable to publish the invalidation, the other workers drop the responses "
+                                  "with their ttl")
+
+    def invalidate_local(self, tags: Iterable[str]) -> NoReturn:
+        """
+        Drops the responses cached in process with any of the tags
+
+        :param tags: the tags
+        """
+        tags = set(tags)
+        with self.lock:
+            for tag in tags:
+                self.generations[tag] = self.generations.get(tag, 0) + 1
+            for key in [key for key, (_, entry_tags) in self.entries.items() if tags.intersection(entry_tags)]:
+                del self.entries[key]
+
+    def apply_invalidations(self) -> NoReturn:
+        """
+        Applies the invalidations sent by the other workers
+        """
+        if self.subscription.events.full():
+            # Some invalidations may have been dropped
+            with self.lock:
+                self.epoch += 1
+                self.entries.clear()
+        while True:
+            event = self.subscription.get(timeout=0)
+            if not event:
+                return
+            if event.kind == INVALIDATION_EVENT_KIND and event.payload.get("origin") != self.origin:
+                self.invalidate_local(event.payload.get("tags", []))
+
+    def generation(self, tags: Tuple[str, ...]) -> Tuple[int, ...]:
+        """
+        The generation of some tags, it changes when any of them is invalidated
+
+        :param tags: the tags
+        :return: the generation
+        """
+        with self.lock:
+            return self.current_generation(tags)
+
+    def current_generation(self, tags: Tuple[str, ...]) -> Tuple[int, ...]:
+        """
+        The generation of some tags, the lock should be held
+
+        :param tags: the tags
+        :return: the generation
+        """
+        return (self.epoch,) + tuple(self.generations.get(tag, 0) for tag in tags)
+
+    def get_local(self, key: str) -> Optional[CachedResponse]:
+        """
+        Gets a response cached in process
+
+        :param key: the key of the response
+        :return: the response, fresh or not, or None if it is not cached or expired too long ago
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if not entry or entry[0].expires + self.stale_seconds < time.time():
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def set_local(self, key: str, cached: CachedResponse, tags: Tuple[str, ...],
+                  generation: Tuple[int, ...]) -> NoReturn:
+        """
+        Caches a response in process, evicting the least recently used one if the cache is full
+        Nothing is cached if any of the tags was invalidated since the response started to be computed
+
+        :param key: the key of the response
+        :param cached: the response
+        :param tags: the tags to invalidate the response by
+        :param generation: the generation of the tags before computing the response
+        """
+        with self.lock:
+            if self.current_generation(tags) != generation:
+                return
+            self.entries[key] = (cached, tags)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    @staticmethod
+    def to_response(cached: CachedResponse) -> Response:
+        """
+        Builds a response from a cached one, its compressed body is cached too
+
+        :param cached: the cached response
+        :return: the response
+        """
+        return SharedBodyResponse(cached.body, status=cached.status, headers=cached.headers)
@@ -0,0 +1,178 @@
+from typing import Iterator, Optional, Tuple, Iterable
+from collections import OrderedDict
+from flask import Request, Response
+import threading
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Smaller bodies fit in a few packets anyway, compressing them only costs cpu
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+# The default brotli quality (11) is meant for static files, with 6 the listings are as small as
+# with gzip and compress faster (benchmarks/compression_benchmark.py)
+BROTLI_QUALITY = 6
+COMPRESSED_CACHE_BYTES = 16 * 1024 * 1024
+
+# Images are already compressed and the events must arrive as soon as they are sent
+COMPRESSIBLE_MIMETYPES = {"application/json", "text/html", "text/plain", "text/css", "application/javascript",
+                          "application/x-yaml", "text/yaml"}
+
+
+def available_encodings() -> Tuple[str, ...]:
+    """
+    The encodings the server can compress with, in order of preference
+
+    :return: the encodings
+    """
+    return ("br", "gzip") if brotli else ("gzip",)
+
+
+def choose_encoding(request: Request) -> Optional[str]:
+    """
+    Chooses the encoding of a response from the Accept-Encoding header of the request
+
+    :param request: the request
+    :return: the encoding or None if the response should not be compressed
+    """
+    best_encoding, best_quality = None, 0
+    for encoding in available_encodings():
+        quality = request.accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best_encoding, best_quality = encoding, quality
+    return best_encoding
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """
+    Compresses a body
+
+    :param body: the body
+    :param encoding: the encoding, br or gzip
+    :return: the compressed body
+    """
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # Not the gzip module, it writes the time in the header and the same body would compress different
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+def compress_stream(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    """
+    Compresses a streamed body chunk by chunk, every chunk is flushed so the client gets it
+    as soon as it is encoded
+
+    :param chunks: the chunks of the body
+    :param encoding: the encoding, br or gzip
+    :return: the compressed chunks
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        process, flush, finish = (compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH),
+                                  compressor.flush)
+    try:
+        for chunk in chunks:
+            compressed = process(chunk) + flush()
+            if compressed:
+                yield compressed
+        yield finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+class SharedBodyResponse(Response):
+    """
+    A response whose body is sent to many requests, like the ones of the response cache,
+    its compressed versions are cached
+    """
+
+
+class CompressedBodyCache:
+    """
+    The last compressed bodies, bounded by their total size
+
+    The same body is compressed once, the cached responses send the same body object
+    so finding it is just a lookup. Only the shared bodies are cached, the rest are never reused
+    and may have private data
+    """
+
+    def __init__(self, max_bytes: int = COMPRESSED_CACHE_BYTES):
+        """
+
+        :param max_bytes: the maximum size of the bodies and their compressed versions
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        """
+        Compresses a body or returns it compressed from the cache
+
+        :param body: the body
+        :param encoding: the encoding, br or gzip
+        :return: the compressed body
+        """
+        key = (encoding, body)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        compressed = compress(body, encoding)
+        entry_size = len(body) + len(compressed)
+        if entry_size > self.max_bytes:
+            return compressed
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = compressed
+                self.size += entry_size
+            while self.size > self.max_bytes:
+                (_, evicted_body), evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted_body) + len(evicted)
+        return compressed
+
+
+compressed_bodies = CompressedBodyCache()
+
+
+def compress_response(request: Request, response: Response) -> Response:
+    """
+    Compresses a response if the client accepts it and it is worth it, registered as an after request function
+
+    :param request: the request
+    :param response: the response
+    :return: the response, compressed or not
+    """
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES or response.direct_passthrough \
+            or "Content-Encoding" in response.headers or not 200 <= response.status_code < 300 \
+            or response.status_code == 204:
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding(request)
+    if not encoding:
+        return response
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        body = response.get_data()
+        if len(body) < MIN_COMPRESS_SIZE:
+            return response
+        if isinstance(response, SharedBodyResponse):
+            compressed = compressed_bodies.compress(body, encoding)
+        else:
+            compressed = compress(body, encoding)
+        if len(compressed) >= len(body):
+            return response
+        response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    return response
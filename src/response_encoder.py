@@ -0,0 +1,198 @@
+from typing import Any, Callable, Dict, Type, Iterator
+from datetime import datetime, date
+from flask import Response, stream_with_context
+from constants import messages
+from src.database.videos.video_database import VideoData, Comment, Reaction
+from src.database.friends.friend_database import PrivateMessage
+import collections.abc
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_MIMETYPE = "application/json"
+
+# The streamed responses are sent in chunks of at least this size
+STREAM_CHUNK_SIZE = 16 * 1024
+
+# Sent after the chunks of a streamed response that fails, it makes the json invalid so the clients
+# never take the truncated response as a whole one
+STREAM_ERROR_MARKER = b"\n" + (messages.ERROR_JSON % messages.RESPONSE_INTERRUPTED_ERROR).encode("utf-8")
+
+# The type of an object to the function that converts it to something json encodes natively
+ENCODERS: Dict[Type, Callable[[Any], Any]] = {}
+
+
+def register_encoder(encoded_type: Type) -> Callable:
+    """
+    Registers the encoder of a type for the json responses
+
+    :param encoded_type: the type to encode
+    :return: a decorator for the encoder function
+    """
+    def decorator(encoder: Callable[[Any], Any]) -> Callable[[Any], Any]:
+        ENCODERS[encoded_type] = encoder
+        return encoder
+
+    return decorator
+
+
+@register_encoder(VideoData)
+@register_encoder(Comment)
+@register_encoder(PrivateMessage)
+def encode_named_tuple(data) -> Dict:
+    return data._asdict()
+
+
+@register_encoder(datetime)
+@register_encoder(date)
+def encode_datetime(moment) -> str:
+    return moment.isoformat()
+
+
+def encode_reactions(reactions: Dict[Reaction, int]) -> Dict[str, int]:
+    """
+    Encodes the reaction counts of a video, reactions are dict keys so they can not be encoded by type
+
+    :param reactions: the reaction counts
+    :return: the reaction counts by reaction name
+    """
+    return {reaction.name: count for reaction, count in reactions.items()}
+
+
+def encode_object(obj: Any) -> Any:
+    """
+    Encodes the objects json does not know how to encode with the registered encoders
+
+    :param obj: the object
+    :return: the object encoded
+    """
+    encoder = ENCODERS.get(type(obj))
+    if encoder is None:
+        raise TypeError("Object of type %s is not JSON serializable" % type(obj).__name__)
+    return encoder(obj)
+
+
+def encode_tree(obj: Any) -> Any:
+    """
+    Encodes the registered types inside an object before the standard json module sees it,
+    it encodes named tuples as lists without asking the registered encoders
+
+    :param obj: the object
+    :return: the object with the registered types encoded
+    """
+    encoder = ENCODERS.get(type(obj))
+    if encoder is not None:
+        obj = encoder(obj)
+    if isinstance(obj, dict):
+        return {k: encode_tree(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [encode_tree(v) for v in obj]
+    return obj
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Encodes an object as json with orjson if it is installed or with the standard json module if not,
+    both give the same values but not always the same bytes, the floats may be written differently, like
+    0.00001 and 1e16 by orjson and 1e-05 and 1e+16 by json
+    The non string keys like the status codes of the statistics are encoded as strings
+
+    :param obj: the object to encode
+    :return: the utf-8 json
+    """
+    if orjson:
+        return orjson.dumps(obj, default=encode_object, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(encode_tree(obj), default=encode_object, separators=(",", ":"),
+                      ensure_ascii=False).encode("utf-8")
+
+
+def json_response(obj: Any, status: int = 200) -> Response:
+    """
+    Creates a json response
+
+    :param obj: the object to send
+    :param status: the http status
+    :return: the flask response
+    """
+    return Response(dumps(obj), status=status, mimetype=JSON_MIMETYPE)
+
+
+def is_json_array(obj: Any) -> bool:
+    """
+    Checks if an object is encoded as a json array element by element when streamed,
+    tuples are left out because the named tuples are encoded as objects
+
+    :param obj: the object
+    :return: if it is a list or an iterator
+    """
+    return isinstance(obj, (list, collections.abc.Iterator))
+
+
+def encode_pieces(obj: Any, top_level: bool = True) -> Iterator[bytes]:
+    """
+    Encodes an object as json piece by piece, the arrays are encoded element by element and the
+    top level object value by value, everything else at once
+
+    :param obj: the object, its keys should be strings
+    :param top_level: if the object is the whole response
+    :return: the pieces of the json
+    """
+    if top_level and isinstance(obj, dict):
+        yield b"{"
+        for i, (key, value) in enumerate(obj.items()):
+            yield (b"," if i else b"") + dumps(key) + b":"
+            yield from encode_pieces(value, top_level=False)
+        yield b"}"
+    elif is_json_array(obj):
+        yield b"["
+        for i, element in enumerate(obj):
+            yield (b"," if i else b"") + dumps(element)
+        yield b"]"
+    else:
+        yield dumps(obj)
+
+
+def stream_json(obj: Any, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Encodes an object as json while its iterators are consumed, gives the same bytes as dumps
+    with the iterators as lists
+    If an iterator fails before any chunk is sent the error is raised, so the server answers with an error
+    status. If it fails later the error marker is sent and the error is raised, so the server aborts the
+    connection and the json is invalid anyway
+
+    :param obj: the object to encode, a list or iterator or a dict with string keys
+    :param chunk_size: the minimum size of the chunks, the last one may be smaller
+    :return: the chunks of the utf-8 json
+    """
+    buffer = bytearray()
+    sent = False
+    try:
+        for piece in encode_pieces(obj):
+            buffer += piece
+            if len(buffer) >= chunk_size:
+                sent = True
+                yield bytes(buffer)
+                buffer.clear()
+    except Exception:
+        if sent:
+            yield STREAM_ERROR_MARKER
+        raise
+    if buffer:
+        yield bytes(buffer)
+
+
+def streamed_json_response(obj: Any, status: int = 200) -> Response:
+    """
+    Creates a json response that is encoded while it is sent, the iterators inside the object
+    are consumed after the handler returns but still inside the request context
+    Only for the listings read from a database cursor, the data already in memory is sent with json_response
+    because the errors of a streamed response can not change its status
+
+    :param obj: the object to send, a list or iterator or a dict with string keys
+    :param status: the http status
+    :return: the flask response
+    """
+    return Response(stream_with_context(stream_json(obj)), status=status, mimetype=JSON_MIMETYPE)
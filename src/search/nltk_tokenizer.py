@@ -0,0 +1,22 @@
+from typing import List
+from src.search.tokenizer import Tokenizer
+
+
+class NltkTokenizer(Tokenizer):
+    """
+    Tokenizer using nltk's word_tokenize (Punkt + Treebank)
+    nltk is imported only when this tokenizer is created because its import is slow
+    """
+
+    def __init__(self):
+        from nltk import word_tokenize
+        self.word_tokenize = word_tokenize
+
+    def tokenize(self, text: str) -> List[str]:
+        """
+        Splits a text into word tokens
+
+        :param text: the text to tokenize
+        :return: a list of tokens
+        """
+        return self.word_tokenize(text)
@@ -0,0 +1,95 @@
+from typing import NamedTuple, Dict, List, Tuple, Optional
+from collections import Counter
+from functools import lru_cache
+from src.search.tokenizer import Tokenizer
+
+TITLE_MATCH_PONDER = 0.8
+DESCRIPTION_MATCH_PONDER = 0.2
+DESCRIPTION_MAX_LENGTH = 1000
+PROFILE_CACHE_SIZE = 4096
+
+
+def bigrams(tokens: List[str]) -> List[Tuple[str, str]]:
+    """
+    Gets the consecutive pairs of tokens
+
+    :param tokens: the tokens
+    :return: a list of bigrams
+    """
+    return list(zip(tokens, tokens[1:]))
+
+
+class SearchQuery(NamedTuple):
+    """
+    A tokenized search query
+    """
+    tokens: List[str]
+    bigrams: List[Tuple[str, str]]
+
+    @classmethod
+    def from_text(cls, tokenizer: Tokenizer, text: str, max_tokens: Optional[int] = None) -> 'SearchQuery':
+        """
+        Tokenizes a search query
+
+        :param tokenizer: the tokenizer to use
+        :param text: the query
+        :param max_tokens: the maximum amount of tokens to consider, None for all of them
+        :return: the search query
+        """
+        tokens = tokenizer.tokenize(text.lower())[:max_tokens]
+        return cls(tokens=tokens, bigrams=bigrams(tokens))
+
+
+class SearchProfile(NamedTuple):
+    """
+    The token counts of a video used for scoring searches
+    """
+    title_tokens: Dict[str, int]
+    title_bigrams: Dict[Tuple[str, str], int]
+    description_tokens: Dict[str, int]
+
+    @classmethod
+    def from_video(cls, tokenizer: Tokenizer, title: str, description: Optional[str]) -> 'SearchProfile':
+        """
+        Tokenizes the texts of a video
+
+        :param tokenizer: the tokenizer to use
+        :param title: the title of the video
+        :param description: the description of the video
+        :return: the search profile
+        """
+        tokenized_title = tokenizer.tokenize(title.lower())
+        tokenized_desc = (tokenizer.tokenize(description[:DESCRIPTION_MAX_LENGTH].lower())
+                          if description else [])
+        return cls(title_tokens=Counter(tokenized_title),
+                   title_bigrams=Counter(bigrams(tokenized_title)),
+                   description_tokens=Counter(tokenized_desc))
+
+    def score(self, query: SearchQuery) -> float:
+        """
+        Scores the video for a query, title matches weight more than description ones
+
+        :param query: the search query
+        :return: the score, 0 if nothing matches
+        """
+        word_count = 0
+        desc_count = 0
+        for w in query.tokens:
+            word_count += self.title_tokens.get(w, 0)
+            desc_count += self.description_tokens.get(w, 0)
+        for b in query.bigrams:
+            word_count += self.title_bigrams.get(b, 0)
+        return word_count * TITLE_MATCH_PONDER + desc_count * DESCRIPTION_MATCH_PONDER
+
+
+@lru_cache(maxsize=PROFILE_CACHE_SIZE)
+def cached_search_profile(tokenizer: Tokenizer, title: str, description: Optional[str]) -> SearchProfile:
+    """
+    Same as SearchProfile.from_video but remembers the most used videos
+
+    :param tokenizer: the tokenizer to use
+    :param title: the title of the video
+    :param description: the description of the video
+    :return: the search profile
+    """
+    return SearchProfile.from_video(tokenizer, title, description)
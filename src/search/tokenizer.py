@@ -0,0 +1,28 @@
+from typing import List
+from abc import abstractmethod
+
+
+class Tokenizer:
+    """
+    Text tokenizer abstraction used for scoring searches
+    """
+
+    @abstractmethod
+    def tokenize(self, text: str) -> List[str]:
+        """
+        Splits a text into word tokens
+
+        :param text: the text to tokenize
+        :return: a list of tokens
+        """
+
+    @classmethod
+    def factory(cls, name: str, *args, **kwargs) -> 'Tokenizer':
+        """
+        Factory pattern for tokenizer
+
+        :param name: the name of the tokenizer to create in the factory
+        :return: a tokenizer object
+        """
+        tokenizer_types = {cls.__name__: cls for cls in Tokenizer.__subclasses__()}
+        return tokenizer_types[name](*args, **kwargs)
@@ -0,0 +1,142 @@
+from typing import Callable, Dict, Any, Hashable, NamedTuple, List, TypeVar
+from functools import wraps
+import threading
+import copy
+
+T = TypeVar('T')
+
+
+class SingleFlightStatistics(NamedTuple):
+    """
+    The statistics of the calls of a method
+
+    calls: the amount of calls
+    executions: the amount of calls that were executed, the rest joined an identical call in flight
+    """
+    calls: int
+    executions: int
+
+    @property
+    def coalesced(self) -> int:
+        return self.calls - self.executions
+
+    @property
+    def coalescing_ratio(self) -> float:
+        return self.coalesced / self.calls if self.calls else 0.0
+
+
+class InFlightCall:
+    """
+    A call being executed, the identical calls wait for its result
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.joined = 0
+
+
+class SingleFlight:
+    """
+    Executes only once the identical calls that happen at the same time, the calls that arrive while
+    one is in flight wait for it and get its result or its error
+
+    A joined call may get a result read before a write it did not wait for, like with any other concurrent read,
+    so the reads that authorize a request should not be coalesced.
+    Every caller of a coalesced call gets its own copy of the result and its own exception, chained to the one raised.
+    The waits use the threading primitives, so they also work in the thread pool of the ASGI worker
+    and with the greenlets of gevent that patches them.
+    """
+    in_flight: Dict[Hashable, InFlightCall]
+    statistics: Dict[str, List[int]]
+
+    def __init__(self):
+        self.in_flight = {}
+        self.statistics = {}
+        self.lock = threading.Lock()
+
+    def do(self, name: str, key: Hashable, function: Callable[[], T]) -> T:
+        """
+        Executes a call or joins an identical one in flight
+
+        :param name: the name of the method, for the statistics
+        :param key: identifies the identical calls
+        :param function: executes the call
+        :return: the result of the call
+        """
+        with self.lock:
+            statistics = self.statistics.setdefault(name, [0, 0])
+            statistics[0] += 1
+            call = self.in_flight.get(key)
+            leader = call is None
+            if leader:
+                statistics[1] += 1
+                call = self.in_flight[key] = InFlightCall()
+            else:
+                call.joined += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise fresh_error(call.error) from call.error
+            return copy.deepcopy(call.result)
+        try:
+            call.result = function()
+        except BaseException as err:
+            call.error = err
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+                joined = call.joined
+            call.done.set()
+        # The joined calls copy the result, the leader can not modify it while they do
+        return copy.deepcopy(call.result) if joined else call.result
+
+    def get_statistics(self) -> Dict[str, SingleFlightStatistics]:
+        """
+        Gets the statistics of the calls since the process started
+
+        :return: a dict of method name to its statistics
+        """
+        with self.lock:
+            return {name: SingleFlightStatistics(calls=calls, executions=executions)
+                    for name, (calls, executions) in self.statistics.items()}
+
+
+def fresh_error(error: BaseException) -> BaseException:
+    """
+    Creates an exception like another one, to raise it in another thread without sharing its traceback
+
+    :param error: the exception
+    :return: a copy of the exception or a RuntimeError if it can not be copied
+    """
+    try:
+        return copy.copy(error)
+    except Exception:
+        return RuntimeError("The coalesced call failed: %r" % error)
+
+
+single_flights = SingleFlight()
+
+
+def single_flight(method: Callable) -> Callable:
+    """
+    Coalesces the identical calls to a method of an object that are in flight at the same time,
+    the calls are identical if they have the same arguments
+
+    :param method: the method, its result should not be a generator and should be copyable
+    :return: the coalesced method
+    """
+    name = method.__qualname__
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (name, id(self), args, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return method(self, *args, **kwargs)
+        return single_flights.do(name, key, lambda: method(self, *args, **kwargs))
+
+    return wrapper
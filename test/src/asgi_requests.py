@@ -0,0 +1,35 @@
+from src.asgi_adapter import AsgiAdapter
+from typing import Dict, List, Tuple
+import asyncio
+
+
+async def asgi_request(app: AsgiAdapter, method: str, path: str, query_string: bytes = b"",
+                       body_chunks: Tuple[bytes, ...] = (b"",), headers: List = None) -> Tuple[Dict, bytes]:
+    scope = {"type": "http", "http_version": "1.1", "method": method, "scheme": "http", "path": path,
+             "query_string": query_string, "headers": headers or [(b"host", b"localhost")],
+             "client": ("127.0.0.1", 1234), "server": ("localhost", 8080)}
+    response = {"body": b""}
+    finished = asyncio.get_event_loop().create_future()
+    messages = [{"type": "http.request", "body": chunk, "more_body": i < len(body_chunks) - 1}
+                for i, chunk in enumerate(body_chunks)]
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await finished
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["start"] = message
+        else:
+            response["body"] += message["body"]
+            if not message["more_body"]:
+                finished.set_result(None)
+
+    await app(scope, receive, send)
+    return response["start"], response["body"]
+
+
+def run_request(*args, **kwargs) -> Tuple[Dict, bytes]:
+    return asyncio.run(asgi_request(*args, **kwargs))
@@ -69,7 +69,8 @@ create table chotuve.user_messages
 		constraint user_messages_users_email_fk_2
 			references chotuve.users,
 	message varchar,
-    datetime timestamp
+    datetime timestamp,
+	seq int
 );
 
 create unique index user_messages_id_uindex
@@ -91,6 +92,60 @@ create table chotuve.deleted_messages
 		primary key (id, deletor)
 );
 
+create table chotuve.deleted_conversations
+(
+	deletor varchar
+		constraint deleted_conversations_users_email_fk
+			references chotuve.users,
+	peer varchar
+		constraint deleted_conversations_users_email_fk_2
+			references chotuve.users,
+	datetime timestamp not null,
+	id int not null,
+	constraint deleted_conversations_pk
+		primary key (deletor, peer)
+);
+
+create table chotuve.conversations
+(
+	user_email varchar
+		constraint conversations_users_email_fk
+			references chotuve.users,
+	peer varchar
+		constraint conversations_users_email_fk_2
+			references chotuve.users,
+	last_message_id int not null,
+	last_message_datetime timestamp not null,
+	last_message_from_user varchar not null,
+	preview varchar not null,
+	unread int default 0 not null,
+	last_message_seq int default 0 not null,
+	constraint conversations_pk
+		primary key (user_email, peer)
+);
+
+create table chotuve.conversation_sequences
+(
+	user1 varchar
+		constraint conversation_sequences_users_email_fk
+			references chotuve.users,
+	user2 varchar
+		constraint conversation_sequences_users_email_fk_2
+			references chotuve.users,
+	last_seq int not null,
+	constraint conversation_sequences_pk
+		primary key (user1, user2)
+);
+
+create table chotuve.resource_versions
+(
+	resource varchar
+		constraint resource_versions_pk
+			primary key,
+	version bigint not null,
+	last_modified timestamp not null
+);
+
 INSERT INTO chotuve.users (email, fullname, phone_number, photo, password, admin)
 VALUES ('giancafferata@hotmail.com', 'Gianmarco', '1111', 'asd', 'asd123', false);
 
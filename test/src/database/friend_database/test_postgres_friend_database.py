@@ -1,7 +1,9 @@
 from src.database.friends.postgres_friend_database import PostgresFriendDatabase
+from src.database.friends.friend_database import Relationship
 from src.database.friends.exceptions.unexistent_friend_requests import UnexistentFriendRequest
 from src.database.friends.exceptions.users_already_friends_error import UsersAlreadyFriendsError
 from src.database.friends.exceptions.users_are_not_friends_error import UsersAreNotFriendsError
+from src.database.videos.exceptions.invalid_cursor_error import InvalidCursorError
 import pytest
 import psycopg2
 from typing import NamedTuple
@@ -17,7 +19,10 @@ def friend_postgres_database(monkeypatch, postgresql):
     aux_connect = psycopg2.connect
     monkeypatch.setattr(psycopg2, "connect", lambda *args, **kwargs: FakePostgres(0))
     monkeypatch.setattr(PostgresUtils, "get_postgres_connection", lambda *args, **kwargs: psycopg2.connect(*args, **kwargs))
-    database = PostgresFriendDatabase(*(["DUMB_ENV_NAME"]*9))
+    database = PostgresFriendDatabase("chotuve.friends", "chotuve.friend_requests", "chotuve.user_messages",
+                                      "chotuve.users", "chotuve.deleted_conversations", "chotuve.conversations",
+                                      "chotuve.conversation_sequences", "chotuve.resource_versions",
+                                      *(["DUMB_ENV_NAME"]*4))
     monkeypatch.setattr(psycopg2, "connect", aux_connect)
     with open("test/src/database/friend_database/config/initialize_db.sql", "r") as initialize_query:
         cursor = postgresql.cursor()
@@ -25,11 +30,6 @@ def friend_postgres_database(monkeypatch, postgresql):
         postgresql.commit()
         cursor.close()
     database.conn = postgresql
-    database.friends_table_name = "chotuve.friends"
-    database.friend_requests_table_name = "chotuve.friend_requests"
-    database.user_messages_table_name = "chotuve.user_messages"
-    database.users_table_name = "chotuve.users"
-    database.user_deleted_messages_table_name = "chotuve.deleted_messages"
     yield database
     postgresql.close()
 
@@ -37,7 +37,7 @@ def test_postgres_connection_error(monkeypatch, friend_postgres_database):
     aux_connect = psycopg2.connect
     monkeypatch.setattr(psycopg2, "connect", lambda *args, **kwargs: FakePostgres(1))
     with pytest.raises(ConnectionError):
-        database = PostgresFriendDatabase(*(["DUMB_ENV_NAME"] * 9))
+        database = PostgresFriendDatabase(*(["DUMB_ENV_NAME"] * 12))
     monkeypatch.setattr(psycopg2, "connect", aux_connect)
 
 def test_create_friend_request_ok(monkeypatch, friend_postgres_database):
@@ -82,6 +82,72 @@ def test_delete_friendship(monkeypatch, friend_postgres_database):
     assert not friend_postgres_database.are_friends('giancafferata@hotmail.com',
                                                     'cafferatagian@hotmail.com')
 
+def test_are_friends_many(monkeypatch, friend_postgres_database):
+    friend_postgres_database.create_friend_request('giancafferata@hotmail.com',
+                                                   'cafferatagian@hotmail.com')
+    friend_postgres_database.accept_friend_request('giancafferata@hotmail.com',
+                                                   'cafferatagian@hotmail.com')
+    assert friend_postgres_database.are_friends_many('giancafferata@hotmail.com', []) == set()
+    assert friend_postgres_database.are_friends_many('giancafferata@hotmail.com',
+                                                     ['cafferatagian@hotmail.com', 'asd@asd.com']) == \
+           {'cafferatagian@hotmail.com'}
+    assert friend_postgres_database.are_friends_many('cafferatagian@hotmail.com',
+                                                     ['giancafferata@hotmail.com', 'asd@asd.com']) == \
+           {'giancafferata@hotmail.com'}
+    assert friend_postgres_database.are_friends_many('asd@asd.com',
+                                                     ['giancafferata@hotmail.com',
+                                                      'cafferatagian@hotmail.com']) == set()
+
+def test_are_friends_cached_until_friendship_changes(monkeypatch, friend_postgres_database):
+    friend_postgres_database.create_friend_request('giancafferata@hotmail.com',
+                                                   'cafferatagian@hotmail.com')
+    assert not friend_postgres_database.are_friends('giancafferata@hotmail.com',
+                                                    'cafferatagian@hotmail.com')
+    cursor = friend_postgres_database.conn.cursor()
+    cursor.execute("INSERT INTO chotuve.friends (user1, user2) VALUES ('asd@asd.com', 'giancafferata@hotmail.com')")
+    friend_postgres_database.conn.commit()
+    cursor.close()
+    assert not friend_postgres_database.are_friends('giancafferata@hotmail.com', 'asd@asd.com')
+    assert friend_postgres_database.are_friends_many('giancafferata@hotmail.com', ['asd@asd.com']) == set()
+    friend_postgres_database.accept_friend_request('giancafferata@hotmail.com',
+                                                   'cafferatagian@hotmail.com')
+    assert friend_postgres_database.are_friends('giancafferata@hotmail.com', 'asd@asd.com')
+    assert friend_postgres_database.are_friends('giancafferata@hotmail.com', 'cafferatagian@hotmail.com')
+    friend_postgres_database.delete_friendship('cafferatagian@hotmail.com',
+                                               'giancafferata@hotmail.com')
+    assert not friend_postgres_database.are_friends('giancafferata@hotmail.com', 'cafferatagian@hotmail.com')
+    assert not friend_postgres_database.are_friends('cafferatagian@hotmail.com', 'giancafferata@hotmail.com')
+
+def test_are_friends_without_cache(monkeypatch, friend_postgres_database):
+    friend_postgres_database.friends_cache_seconds = 0
+    assert not friend_postgres_database.are_friends('giancafferata@hotmail.com', 'asd@asd.com')
+    cursor = friend_postgres_database.conn.cursor()
+    cursor.execute("INSERT INTO chotuve.friends (user1, user2) VALUES ('asd@asd.com', 'giancafferata@hotmail.com')")
+    friend_postgres_database.conn.commit()
+    cursor.close()
+    assert friend_postgres_database.are_friends('giancafferata@hotmail.com', 'asd@asd.com')
+    assert friend_postgres_database.are_friends_many('giancafferata@hotmail.com', ['asd@asd.com']) == \
+           {'asd@asd.com'}
+
+def test_get_relationship(monkeypatch, friend_postgres_database):
+    assert friend_postgres_database.get_relationship('giancafferata@hotmail.com',
+                                                     'cafferatagian@hotmail.com') == Relationship.no_contact
+    friend_postgres_database.create_friend_request('giancafferata@hotmail.com',
+                                                   'cafferatagian@hotmail.com')
+    assert friend_postgres_database.get_relationship('giancafferata@hotmail.com',
+                                                     'cafferatagian@hotmail.com') == Relationship.sent
+    assert friend_postgres_database.get_relationship('cafferatagian@hotmail.com',
+                                                     'giancafferata@hotmail.com') == Relationship.received
+    friend_postgres_database.accept_friend_request('giancafferata@hotmail.com',
+                                                   'cafferatagian@hotmail.com')
+    assert friend_postgres_database.get_relationship('giancafferata@hotmail.com',
+                                                     'cafferatagian@hotmail.com') == Relationship.friends
+    assert friend_postgres_database.get_relationship('cafferatagian@hotmail.com',
+                                                     'giancafferata@hotmail.com') == Relationship.friends
+    with pytest.raises(UnexistentFriendRequest):
+        friend_postgres_database.accept_friend_request('giancafferata@hotmail.com',
+                                                       'cafferatagian@hotmail.com')
+
 def test_reject_unexistent_friend_request(monkeypatch, friend_postgres_database):
     with pytest.raises(UnexistentFriendRequest):
         friend_postgres_database.reject_friend_request('giancafferata@hotmail.com',
@@ -251,4 +317,154 @@ def test_delete_conversation(monkeypatch, friend_postgres_database):
     assert len(message_data) == 0
     user_data, message_data = friend_postgres_database.get_conversations('giancafferata@hotmail.com')
     assert len(user_data) == 1
-    assert len(message_data) == 1
\ No newline at end of file
+    assert len(message_data) == 1
+
+def test_get_conversation_page(monkeypatch, friend_postgres_database):
+    friend_postgres_database.create_friend_request('giancafferata@hotmail.com',
+                                                   'cafferatagian@hotmail.com')
+    friend_postgres_database.accept_friend_request('giancafferata@hotmail.com',
+                                                   'cafferatagian@hotmail.com')
+    friend_postgres_database.send_message('giancafferata@hotmail.com','cafferatagian@hotmail.com',
+                                          "Hola")
+    friend_postgres_database.send_message('giancafferata@hotmail.com', 'cafferatagian@hotmail.com',
+                                          "todo bien?")
+    friend_postgres_database.send_message('cafferatagian@hotmail.com','giancafferata@hotmail.com',
+                                          "see")
+    page = friend_postgres_database.get_conversation_page('giancafferata@hotmail.com',
+                                                          'cafferatagian@hotmail.com', 2)
+    assert [m.message for m in page.messages] == ["see", "todo bien?"]
+    assert page.next_cursor
+    page = friend_postgres_database.get_conversation_page('giancafferata@hotmail.com',
+                                                          'cafferatagian@hotmail.com', 2, page.next_cursor)
+    assert [m.message for m in page.messages] == ["Hola"]
+    assert not page.next_cursor
+    friend_postgres_database.delete_conversation('cafferatagian@hotmail.com', 'giancafferata@hotmail.com')
+    page = friend_postgres_database.get_conversation_page('cafferatagian@hotmail.com',
+                                                          'giancafferata@hotmail.com', 2)
+    assert page.messages == []
+    assert not page.next_cursor
+    with pytest.raises(InvalidCursorError):
+        friend_postgres_database.get_conversation_page('giancafferata@hotmail.com',
+                                                       'cafferatagian@hotmail.com', 2, "asd")
+
+def test_conversations_summary(monkeypatch, friend_postgres_database):
+    friend_postgres_database.create_friend_request('giancafferata@hotmail.com',
+                                                   'cafferatagian@hotmail.com')
+    friend_postgres_database.accept_friend_request('giancafferata@hotmail.com',
+                                                   'cafferatagian@hotmail.com')
+    friend_postgres_database.send_message('giancafferata@hotmail.com','cafferatagian@hotmail.com',
+                                          "Hola")
+    friend_postgres_database.send_message('giancafferata@hotmail.com', 'cafferatagian@hotmail.com',
+                                          "a" * 300)
+    _, message_data = friend_postgres_database.get_conversations('cafferatagian@hotmail.com')
+    assert message_data[0].message == "a" * 200
+    assert message_data[0].from_user == 'giancafferata@hotmail.com'
+    assert message_data[0].to_user == 'cafferatagian@hotmail.com'
+    cursor = friend_postgres_database.conn.cursor()
+    cursor.execute("SELECT user_email, unread FROM chotuve.conversations ORDER BY 1")
+    assert cursor.fetchall() == [('cafferatagian@hotmail.com', 2), ('giancafferata@hotmail.com', 0)]
+    friend_postgres_database.delete_conversation('cafferatagian@hotmail.com', 'giancafferata@hotmail.com')
+    cursor.execute("SELECT user_email FROM chotuve.conversations")
+    assert cursor.fetchall() == [('giancafferata@hotmail.com',)]
+    cursor.close()
+
+
+def test_get_messages_since_mixed_case_emails(monkeypatch, friend_postgres_database):
+    cursor = friend_postgres_database.conn.cursor()
+    cursor.execute("INSERT INTO chotuve.users (email, fullname, phone_number, photo, password, admin) "
+                   "VALUES ('Gian@hotmail.com', 'Gianmarco', '1111', 'asd', 'asd123', false)")
+    friend_postgres_database.conn.commit()
+    cursor.close()
+    friend_postgres_database.create_friend_request('Gian@hotmail.com', 'cafferatagian@hotmail.com')
+    friend_postgres_database.accept_friend_request('Gian@hotmail.com', 'cafferatagian@hotmail.com')
+    friend_postgres_database.send_message('cafferatagian@hotmail.com', 'Gian@hotmail.com', "Hola")
+    friend_postgres_database.send_message('Gian@hotmail.com', 'cafferatagian@hotmail.com', "see")
+    new_messages = friend_postgres_database.get_messages_since('cafferatagian@hotmail.com',
+                                                               'Gian@hotmail.com', 1, 10)
+    assert [(m.message, m.seq) for m in new_messages] == [("see", 2)]
+
+
+def test_get_messages_since_and_unread_counts(monkeypatch, friend_postgres_database):
+    friend_postgres_database.create_friend_request('giancafferata@hotmail.com',
+                                                   'cafferatagian@hotmail.com')
+    friend_postgres_database.accept_friend_request('giancafferata@hotmail.com',
+                                                   'cafferatagian@hotmail.com')
+    assert friend_postgres_database.get_messages_since('giancafferata@hotmail.com',
+                                                       'cafferatagian@hotmail.com', 0, 10) == []
+    friend_postgres_database.send_message('giancafferata@hotmail.com', 'cafferatagian@hotmail.com',
+                                          "Hola")
+    friend_postgres_database.send_message('cafferatagian@hotmail.com', 'giancafferata@hotmail.com',
+                                          "see")
+    friend_postgres_database.send_message('giancafferata@hotmail.com', 'cafferatagian@hotmail.com',
+                                          "todo bien?")
+    new_messages = friend_postgres_database.get_messages_since('cafferatagian@hotmail.com',
+                                                               'giancafferata@hotmail.com', 1, 10)
+    assert [(m.message, m.seq) for m in new_messages] == [("see", 2), ("todo bien?", 3)]
+    new_messages = friend_postgres_database.get_messages_since('cafferatagian@hotmail.com',
+                                                               'giancafferata@hotmail.com', 0, 1)
+    assert [m.message for m in new_messages] == ["Hola"]
+    assert friend_postgres_database.get_messages_since('cafferatagian@hotmail.com',
+                                                       'giancafferata@hotmail.com', 3, 10) == []
+    assert friend_postgres_database.get_unread_counts('cafferatagian@hotmail.com') == \
+           {'giancafferata@hotmail.com': 2}
+    assert friend_postgres_database.get_unread_counts('giancafferata@hotmail.com') == \
+           {'cafferatagian@hotmail.com': 1}
+    friend_postgres_database.mark_conversation_read('cafferatagian@hotmail.com', 'giancafferata@hotmail.com')
+    assert friend_postgres_database.get_unread_counts('cafferatagian@hotmail.com') == {}
+    friend_postgres_database.delete_conversation('giancafferata@hotmail.com', 'cafferatagian@hotmail.com')
+    assert friend_postgres_database.get_messages_since('giancafferata@hotmail.com',
+                                                       'cafferatagian@hotmail.com', 0, 10) == []
+    assert friend_postgres_database.get_unread_counts('giancafferata@hotmail.com') == {}
+
+def test_mark_conversation_read_up_to(monkeypatch, friend_postgres_database):
+    friend_postgres_database.create_friend_request('giancafferata@hotmail.com',
+                                                   'cafferatagian@hotmail.com')
+    friend_postgres_database.accept_friend_request('giancafferata@hotmail.com',
+                                                   'cafferatagian@hotmail.com')
+    for message in ["Hola", "todo bien?", "che"]:
+        friend_postgres_database.send_message('giancafferata@hotmail.com', 'cafferatagian@hotmail.com',
+                                              message)
+    friend_postgres_database.send_message('cafferatagian@hotmail.com', 'giancafferata@hotmail.com',
+                                          "see")
+    friend_postgres_database.mark_conversation_read('cafferatagian@hotmail.com', 'giancafferata@hotmail.com',
+                                                    up_to_seq=1)
+    assert friend_postgres_database.get_unread_counts('cafferatagian@hotmail.com') == \
+           {'giancafferata@hotmail.com': 2}
+    friend_postgres_database.mark_conversation_read('cafferatagian@hotmail.com', 'giancafferata@hotmail.com',
+                                                    up_to_seq=0)
+    assert friend_postgres_database.get_unread_counts('cafferatagian@hotmail.com') == \
+           {'giancafferata@hotmail.com': 2}
+    friend_postgres_database.mark_conversation_read('cafferatagian@hotmail.com', 'giancafferata@hotmail.com',
+                                                    up_to_seq=3)
+    assert friend_postgres_database.get_unread_counts('cafferatagian@hotmail.com') == {}
+
+
+def test_friends_versions(monkeypatch, friend_postgres_database):
+    assert friend_postgres_database.get_friends_version('giancafferata@hotmail.com').version == 0
+    friend_postgres_database.create_friend_request('giancafferata@hotmail.com',
+                                                   'cafferatagian@hotmail.com')
+    assert friend_postgres_database.get_friends_version('giancafferata@hotmail.com').version == 0
+    friend_postgres_database.accept_friend_request('giancafferata@hotmail.com',
+                                                   'cafferatagian@hotmail.com')
+    assert friend_postgres_database.get_friends_version('giancafferata@hotmail.com').version == 1
+    assert friend_postgres_database.get_friends_version('cafferatagian@hotmail.com').version == 1
+    friend_postgres_database.delete_friendship('giancafferata@hotmail.com',
+                                               'cafferatagian@hotmail.com')
+    friend_postgres_database.delete_friendship('giancafferata@hotmail.com',
+                                               'cafferatagian@hotmail.com')
+    assert friend_postgres_database.get_friends_version('giancafferata@hotmail.com').version == 2
+    assert friend_postgres_database.get_friends_version('cafferatagian@hotmail.com').version == 2
+
+def test_existence_checks_after_altering_the_tables(friend_postgres_database):
+    friend_postgres_database.friends_cache_seconds = 0
+    friend_postgres_database.create_friend_request('giancafferata@hotmail.com', 'cafferatagian@hotmail.com')
+    assert friend_postgres_database.exists_friend_request('giancafferata@hotmail.com', 'cafferatagian@hotmail.com')
+    assert not friend_postgres_database.are_friends('giancafferata@hotmail.com', 'cafferatagian@hotmail.com')
+    cursor = friend_postgres_database.conn.cursor()
+    cursor.execute("ALTER TABLE chotuve.friend_requests ADD COLUMN message varchar")
+    cursor.execute("ALTER TABLE chotuve.friends ADD COLUMN since timestamp")
+    friend_postgres_database.conn.commit()
+    cursor.close()
+    assert friend_postgres_database.exists_friend_request('giancafferata@hotmail.com', 'cafferatagian@hotmail.com')
+    friend_postgres_database.accept_friend_request('giancafferata@hotmail.com', 'cafferatagian@hotmail.com')
+    assert friend_postgres_database.are_friends('giancafferata@hotmail.com', 'cafferatagian@hotmail.com')
\ No newline at end of file
@@ -0,0 +1,307 @@
+from src.database.migrations.postgres_migrator import PostgresMigrator
+from migrate_database import configured_table_names
+from src.database.migrations.schema_migrations import MIGRATIONS, IndexTemplate, DEFAULT_TABLE_NAMES
+from src.database.friends.friend_database import CONVERSATION_PREVIEW_LENGTH
+from src.database.migrations.exceptions.missing_indexes_error import MissingIndexesError
+from src.database.videos import postgres_video_database
+from src.database.friends import postgres_friend_database
+from src.database.statistics import postgres_statistics_database
+from src.database.notifications import postgres_expo_notification_database
+from src.database.response_cache import postgres_shared_response_cache
+from src.database.utils.postgres_connection import PostgresUtils, PreparedQuery
+from datetime import datetime
+import pytest
+import psycopg2
+from typing import NamedTuple, Dict, List, Set, Tuple
+import yaml
+import os
+
+
+class FakePostgres(NamedTuple):
+    closed: int
+
+
+HOT_QUERIES_PARAMS = {
+    "check_friends": ("a@a.com", "b@b.com"),
+    "are_friends_many": ("a@a.com", "a@a.com", ["b@b.com"], "a@a.com", ["b@b.com"]),
+    "check_friend_request": ("a@a.com", "b@b.com"),
+    "get_relationship": ("a@a.com", "b@b.com", "b@b.com", "a@a.com", "a@a.com", "b@b.com"),
+    "all_friends": ("a@a.com", "a@a.com"),
+    "friend_request": ("a@a.com",),
+    "send_message": ("a@a.com", "b@b.com", "hola", datetime.now(), 1),
+    "count_rows_conversation": ("a@a.com", "b@b.com") * 3,
+    "get_paginated_conversation": ("a@a.com", "b@b.com") * 3 + (10, 0),
+    "get_conversations": ("a@a.com",),
+    "get_conversation_page": ("a@a.com", "b@b.com", "a@a.com", "b@b.com", 11, "b@b.com", "a@a.com", 11, 11),
+    "get_conversation_page_before": ("a@a.com", "b@b.com", "a@a.com", "b@b.com", datetime.now(), 1, 11,
+                                     "b@b.com", "a@a.com", datetime.now(), 1, 11, 11),
+    "last_conversation_seq": ("a@a.com", "b@b.com"),
+    "get_messages_since": ("a@a.com", "b@b.com", "a@a.com", "b@b.com", 1, 11, "b@b.com", "a@a.com", 1, 11, 11),
+    "get_unread_counts": ("a@a.com",),
+    "list_user_videos": ("a@a.com",),
+    "search_page_data": (["a@a.com"], ["video"]),
+    "reaction_search": ("a@a.com", "b@b.com", "video"),
+    "get_comments_page": ("a@a.com", "video", 11),
+    "get_comments_page_after": ("a@a.com", "video", datetime.now(), 1, 11),
+    "get_comment_count": ("a@a.com", "video"),
+    "get_user_photo": ("d41d8cd98f00b204e9800998ecf8427e",),
+    "get_videos_page": (11,),
+    "get_videos_page_after": (datetime.now(), "a@a.com", "video", 11),
+    "add_api_call": ("alias", "/health", 200, datetime.now(), 0.1, "GET"),
+    "search_notification_token": ("a@a.com",),
+    "get_resource_version": ("videos",),
+    "get_response": ("/videos/top?",)
+}
+
+
+@pytest.fixture(scope="function")
+def postgres_migrator(monkeypatch, postgresql):
+    os.environ["DUMB_ENV_NAME"] = "dummy"
+    aux_connect = psycopg2.connect
+    monkeypatch.setattr(psycopg2, "connect", lambda *args, **kwargs: FakePostgres(0))
+    monkeypatch.setattr(PostgresUtils, "get_postgres_connection",
+                        lambda *args, **kwargs: psycopg2.connect(*args, **kwargs))
+    migrator = PostgresMigrator("chotuve.schema_migrations", *(["DUMB_ENV_NAME"] * 4))
+    monkeypatch.setattr(psycopg2, "connect", aux_connect)
+    with open("test/src/database/migrations/config/initialize_db.sql", "r") as initialize_query:
+        cursor = postgresql.cursor()
+        cursor.execute(initialize_query.read())
+        postgresql.commit()
+        cursor.close()
+    migrator.conn = postgresql
+    yield migrator
+    postgresql.close()
+
+
+def hot_queries(monkeypatch) -> Dict[str, PreparedQuery]:
+    """
+    Builds the prepared queries of every postgres backend
+    """
+    with monkeypatch.context() as patch:
+        patch.setattr(psycopg2, "connect", lambda *args, **kwargs: FakePostgres(0))
+        databases = [postgres_video_database.PostgresVideoDatabase(
+                         "chotuve.videos", "chotuve.users", "chotuve.video_reactions", "chotuve.video_comments",
+                         "chotuve.resource_versions", *(["DUMB_ENV_NAME"] * 4)),
+                     postgres_friend_database.PostgresFriendDatabase(
+                         "chotuve.friends", "chotuve.friend_requests", "chotuve.user_messages", "chotuve.users",
+                         "chotuve.deleted_conversations", "chotuve.conversations", "chotuve.conversation_sequences",
+                         "chotuve.resource_versions", *(["DUMB_ENV_NAME"] * 4)),
+                     postgres_statistics_database.PostgresStatisticsDatabase(
+                         "chotuve.app_server_api_calls", *(["DUMB_ENV_NAME"] * 5)),
+                     postgres_expo_notification_database.PostgresExpoNotificationDatabase(
+                         "chotuve.user_notification_tokens", *(["DUMB_ENV_NAME"] * 4)),
+                     postgres_shared_response_cache.PostgresSharedResponseCache(
+                         "chotuve.response_cache", *(["DUMB_ENV_NAME"] * 4))]
+    return {name: query for database in databases for name, query in database.queries.items()
+            if isinstance(query, PreparedQuery)}
+
+
+def schema_columns(cursor) -> Set[Tuple[str, str, str]]:
+    cursor.execute("SELECT table_name, column_name, data_type FROM information_schema.columns "
+                   "WHERE table_schema = 'chotuve'")
+    return set(cursor.fetchall())
+
+
+def seq_scanned_relations(plan: Dict) -> List[str]:
+    relations = [plan["Relation Name"]] if plan["Node Type"] == "Seq Scan" else []
+    for subplan in plan.get("Plans", []):
+        relations += seq_scanned_relations(subplan)
+    return relations
+
+
+def test_postgres_connection_error(monkeypatch, postgres_migrator):
+    aux_connect = psycopg2.connect
+    monkeypatch.setattr(psycopg2, "connect", lambda *args, **kwargs: FakePostgres(1))
+    with pytest.raises(ConnectionError):
+        PostgresMigrator(*(["DUMB_ENV_NAME"] * 5))
+    monkeypatch.setattr(psycopg2, "connect", aux_connect)
+
+
+def test_migrate_applies_every_migration_once(postgres_migrator):
+    assert postgres_migrator.migrate() == [m.version for m in MIGRATIONS]
+    assert postgres_migrator.migrate() == []
+
+
+def test_migrate_counts_existing_comments(postgres_migrator):
+    cursor = postgres_migrator.conn.cursor()
+    cursor.execute("""
+INSERT INTO chotuve.users (email, fullname, phone_number, photo, admin, password)
+VALUES ('a@a.com', 'A', '1111', 'asd', false, 'asd');
+INSERT INTO chotuve.videos (user_email, title, creation_time, visible, location, file_location, description)
+VALUES ('a@a.com', 'video', NOW(), true, 'Buenos Aires', 'location', 'description');
+INSERT INTO chotuve.video_comments (author_email, video_owner_email, video_title, comment, datetime)
+VALUES ('a@a.com', 'a@a.com', 'video', 'primero', NOW()), ('a@a.com', 'a@a.com', 'video', 'segundo', NOW());
+""")
+    postgres_migrator.conn.commit()
+    postgres_migrator.migrate()
+    cursor.execute("SELECT comment_count FROM chotuve.videos")
+    assert cursor.fetchone()[0] == 2
+    cursor.execute("SELECT COUNT(DISTINCT id) FROM chotuve.video_comments")
+    assert cursor.fetchone()[0] == 2
+    cursor.close()
+
+
+def test_migrate_collapses_deleted_messages(postgres_migrator):
+    cursor = postgres_migrator.conn.cursor()
+    cursor.execute("""
+INSERT INTO chotuve.users (email, fullname, phone_number, photo, admin, password)
+VALUES ('a@a.com', 'A', '1111', 'asd', false, 'asd'), ('b@b.com', 'B', '1111', 'asd', false, 'asd');
+INSERT INTO chotuve.user_messages (id, from_user, to_user, message, datetime)
+VALUES (1, 'a@a.com', 'b@b.com', 'hola', '2020-06-01 10:00'), (2, 'b@b.com', 'a@a.com', 'see', '2020-06-01 11:00'),
+(3, 'a@a.com', 'b@b.com', 'chau', '2020-06-01 12:00');
+INSERT INTO chotuve.deleted_messages (id, deletor) VALUES (1, 'b@b.com'), (2, 'b@b.com');
+""")
+    postgres_migrator.conn.commit()
+    postgres_migrator.migrate()
+    cursor.execute("SELECT deletor, peer, id FROM chotuve.deleted_conversations")
+    assert cursor.fetchall() == [("b@b.com", "a@a.com", 2)]
+    cursor.execute("SELECT COUNT(*) FROM chotuve.deleted_messages")
+    assert cursor.fetchone()[0] == 0
+    cursor.execute("SELECT user_email, peer, last_message_id, preview FROM chotuve.conversations ORDER BY 1")
+    assert cursor.fetchall() == [("a@a.com", "b@b.com", 3, "chau"), ("b@b.com", "a@a.com", 3, "chau")]
+    cursor.close()
+
+
+def test_migrate_cuts_the_previews_like_the_backends(postgres_migrator):
+    message = "hola " * CONVERSATION_PREVIEW_LENGTH
+    cursor = postgres_migrator.conn.cursor()
+    cursor.execute("""
+INSERT INTO chotuve.users (email, fullname, phone_number, photo, admin, password)
+VALUES ('a@a.com', 'A', '1111', 'asd', false, 'asd'), ('b@b.com', 'B', '1111', 'asd', false, 'asd');
+INSERT INTO chotuve.user_messages (id, from_user, to_user, message, datetime)
+VALUES (1, 'a@a.com', 'b@b.com', %s, '2020-06-01 10:00');
+""", (message,))
+    postgres_migrator.conn.commit()
+    postgres_migrator.migrate()
+    cursor.execute("SELECT DISTINCT preview FROM chotuve.conversations")
+    assert cursor.fetchall() == [(message[:CONVERSATION_PREVIEW_LENGTH],)]
+    cursor.close()
+
+
+def test_migrate_numbers_conversation_messages(postgres_migrator):
+    cursor = postgres_migrator.conn.cursor()
+    cursor.execute("""
+INSERT INTO chotuve.users (email, fullname, phone_number, photo, admin, password)
+VALUES ('a@a.com', 'A', '1111', 'asd', false, 'asd'), ('b@b.com', 'B', '1111', 'asd', false, 'asd'),
+('c@c.com', 'C', '1111', 'asd', false, 'asd');
+INSERT INTO chotuve.user_messages (id, from_user, to_user, message, datetime)
+VALUES (1, 'b@b.com', 'a@a.com', 'hola', '2020-06-01 10:00'), (2, 'c@c.com', 'a@a.com', 'hey', '2020-06-01 10:30'),
+(3, 'a@a.com', 'b@b.com', 'chau', '2020-06-01 11:00');
+""")
+    postgres_migrator.conn.commit()
+    postgres_migrator.migrate()
+    cursor.execute("SELECT id, seq FROM chotuve.user_messages ORDER BY id")
+    assert cursor.fetchall() == [(1, 1), (2, 1), (3, 2)]
+    cursor.execute("SELECT user1, user2, last_seq FROM chotuve.conversation_sequences ORDER BY 1, 2")
+    assert cursor.fetchall() == [("a@a.com", "b@b.com", 2), ("a@a.com", "c@c.com", 1)]
+    cursor.execute("SELECT user_email, peer, last_message_seq FROM chotuve.conversations ORDER BY 1, 2")
+    assert cursor.fetchall() == [("a@a.com", "b@b.com", 2), ("a@a.com", "c@c.com", 1),
+                                 ("b@b.com", "a@a.com", 2), ("c@c.com", "a@a.com", 1)]
+    cursor.close()
+
+
+@pytest.mark.parametrize("backend_schema", ["video_database", "friend_database", "statistics_database",
+                                            "notifications_database", "response_cache"])
+def test_migrations_create_the_schema_of_the_backends(postgres_migrator, backend_schema):
+    # The backends are tested against their own schemas, every column they have must come from a migration
+    postgres_migrator.migrate()
+    cursor = postgres_migrator.conn.cursor()
+    migrated_columns = schema_columns(cursor)
+    cursor.execute("DROP SCHEMA chotuve CASCADE")
+    with open("test/src/database/%s/config/initialize_db.sql" % backend_schema, "r") as initialize_query:
+        cursor.execute(initialize_query.read())
+    backend_columns = schema_columns(cursor)
+    postgres_migrator.conn.rollback()
+    cursor.close()
+    assert backend_columns - migrated_columns == set()
+
+
+def test_migrate_orders_conversation_sequences_by_code_point(postgres_migrator):
+    postgres_migrator.migrate(MIGRATIONS[:8])
+    cursor = postgres_migrator.conn.cursor()
+    # The version 6 with a case insensitive collation keyed the conversation as (a, B), then the backend
+    # keyed it as (B, a) and numbered the next message from 1 again
+    cursor.execute("""
+INSERT INTO chotuve.users (email, fullname, phone_number, photo, admin, password)
+VALUES ('a@a.com', 'A', '1111', 'asd', false, 'asd'), ('B@b.com', 'B', '1111', 'asd', false, 'asd');
+INSERT INTO chotuve.user_messages (id, from_user, to_user, message, datetime, seq)
+VALUES (1, 'B@b.com', 'a@a.com', 'hola', '2020-06-01 10:00', 1), (2, 'a@a.com', 'B@b.com', 'see', '2020-06-01 11:00', 2),
+(3, 'a@a.com', 'B@b.com', 'chau', '2020-06-01 12:00', 1);
+INSERT INTO chotuve.conversation_sequences (user1, user2, last_seq)
+VALUES ('a@a.com', 'B@b.com', 2), ('B@b.com', 'a@a.com', 1);
+INSERT INTO chotuve.conversations (user_email, peer, last_message_id, last_message_datetime, last_message_from_user,
+preview, last_message_seq)
+VALUES ('a@a.com', 'B@b.com', 3, '2020-06-01 12:00', 'a@a.com', 'chau', 2),
+('B@b.com', 'a@a.com', 3, '2020-06-01 12:00', 'a@a.com', 'chau', 2);
+""")
+    postgres_migrator.conn.commit()
+    assert postgres_migrator.migrate() == [9]
+    cursor.execute("SELECT id, seq FROM chotuve.user_messages ORDER BY id")
+    assert cursor.fetchall() == [(1, 1), (2, 2), (3, 3)]
+    cursor.execute("SELECT user1, user2, last_seq FROM chotuve.conversation_sequences")
+    assert cursor.fetchall() == [tuple(sorted(("a@a.com", "B@b.com"))) + (3,)]
+    cursor.execute("SELECT user_email, last_message_seq FROM chotuve.conversations")
+    assert set(cursor.fetchall()) == {("a@a.com", 3), ("B@b.com", 3)}
+    cursor.close()
+
+
+def test_index_definition_in_the_schema_of_its_table():
+    index = IndexTemplate(name="videos_creation_time_index", table="videos_table_name", columns="creation_time")
+    definition = index.definition(dict(DEFAULT_TABLE_NAMES, videos_table_name="other.videos"))
+    assert definition.name == "other.videos_creation_time_index"
+    assert definition.statement == "CREATE INDEX IF NOT EXISTS videos_creation_time_index ON other.videos (creation_time)"
+    assert index.definition(dict(DEFAULT_TABLE_NAMES, videos_table_name="videos")).name == \
+           "videos_creation_time_index"
+
+
+def test_migrate_the_configured_tables(postgres_migrator):
+    with open("test/src/database/migrations/config/initialize_db.sql", "r") as initialize_query:
+        cursor = postgres_migrator.conn.cursor()
+        cursor.execute(initialize_query.read().replace("chotuve", "other"))
+        postgres_migrator.conn.commit()
+    postgres_migrator.table_names = {key: name.replace("chotuve.", "other.")
+                                     for key, name in DEFAULT_TABLE_NAMES.items()}
+    assert postgres_migrator.migrate() == [m.version for m in MIGRATIONS]
+    assert postgres_migrator.missing_indexes() == []
+    cursor.execute("SELECT table_schema, table_name FROM information_schema.tables "
+                   "WHERE table_name IN ('resource_versions', 'response_cache', 'conversations')")
+    assert {schema for schema, _ in cursor.fetchall()} == {"other"}
+    cursor.execute("SELECT to_regclass('chotuve.videos_creation_time_index')")
+    assert cursor.fetchone()[0] is None
+    cursor.close()
+
+
+def test_configured_table_names():
+    with open("config/deploy_conf.yml", "r") as yaml_file:
+        config_dict = yaml.load(yaml_file, Loader=yaml.Loader)
+    table_names = configured_table_names(config_dict)
+    assert table_names["videos_table_name"] == "chotuve.videos"
+    assert table_names["app_server_api_calls_table"] == "chotuve.app_server_api_calls"
+    table_names.update(config_dict["migrations"]["table_names"])
+    assert set(DEFAULT_TABLE_NAMES.keys()) - set(table_names.keys()) == set()
+
+
+def test_verify_indexes_not_migrated(postgres_migrator):
+    with pytest.raises(MissingIndexesError):
+        postgres_migrator.verify_indexes()
+
+
+def test_verify_indexes_migrated(postgres_migrator):
+    postgres_migrator.migrate()
+    assert postgres_migrator.missing_indexes() == []
+    postgres_migrator.verify_indexes()
+
+
+def test_hot_queries_do_not_seq_scan(monkeypatch, postgres_migrator):
+    postgres_migrator.migrate()
+    queries = hot_queries(monkeypatch)
+    assert set(queries.keys()) == set(HOT_QUERIES_PARAMS.keys())
+    cursor = postgres_migrator.conn.cursor()
+    # The tables are empty, without seq scans the planner only falls back to them if no index can be used
+    cursor.execute("SET enable_seqscan = off")
+    for name, query in queries.items():
+        cursor.execute("EXPLAIN (FORMAT JSON) " + query.query, HOT_QUERIES_PARAMS[name])
+        plan = cursor.fetchone()[0][0]["Plan"]
+        assert seq_scanned_relations(plan) == [], name
+    postgres_migrator.conn.rollback()
+    cursor.close()
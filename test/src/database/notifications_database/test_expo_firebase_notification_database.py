@@ -33,7 +33,7 @@ def notifications_postgres_database(monkeypatch, postgresql):
     monkeypatch.setattr(psycopg2, "connect", lambda *args, **kwargs: FakePostgres(0))
     monkeypatch.setattr(PostgresUtils, "get_postgres_connection",
                         lambda *args, **kwargs: psycopg2.connect(*args, **kwargs))
-    database = PostgresExpoNotificationDatabase(*(["DUMB_ENV_NAME"] * 5))
+    database = PostgresExpoNotificationDatabase("chotuve.user_notification_tokens", *(["DUMB_ENV_NAME"] * 4))
     monkeypatch.setattr(psycopg2, "connect", aux_connect)
     with open("test/src/database/notifications_database/config/initialize_db.sql", "r") as initialize_query:
         cursor = postgresql.cursor()
@@ -41,7 +41,6 @@ def notifications_postgres_database(monkeypatch, postgresql):
         postgresql.commit()
         cursor.close()
     database.conn = postgresql
-    database.notification_tokens_table_name = "chotuve.user_notification_tokens"
     yield database
     postgresql.close()
 
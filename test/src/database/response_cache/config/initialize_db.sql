@@ -0,0 +1,13 @@
+create schema chotuve;
+
+create unlogged table chotuve.response_cache
+(
+    key              varchar primary key,
+    tags             varchar[] not null default '{}',
+    status           integer,
+    headers          text,
+    body             bytea,
+    expires          double precision,
+    lease            varchar,
+    refreshing_until double precision
+);
@@ -0,0 +1,85 @@
+from src.database.response_cache.postgres_shared_response_cache import PostgresSharedResponseCache
+from src.database.response_cache.shared_response_cache import CachedResponse
+import pytest
+import psycopg2
+from typing import NamedTuple
+import time
+import os
+from src.database.utils.postgres_connection import PostgresUtils
+
+class FakePostgres(NamedTuple):
+    closed: int
+
+def cached_response(body: bytes, expires_in: float = 30) -> CachedResponse:
+    return CachedResponse(status=200, headers=[("Content-Type", "application/json"), ("ETag", 'W/"asd"')],
+                          body=body, expires=time.time() + expires_in)
+
+@pytest.fixture(scope="function")
+def shared_response_cache(monkeypatch, postgresql):
+    os.environ["DUMB_ENV_NAME"] = "dummy"
+    aux_connect = psycopg2.connect
+    monkeypatch.setattr(psycopg2, "connect", lambda *args, **kwargs: FakePostgres(0))
+    monkeypatch.setattr(PostgresUtils, "get_postgres_connection",
+                        lambda *args, **kwargs: psycopg2.connect(*args, **kwargs))
+    cache = PostgresSharedResponseCache("chotuve.response_cache", *(["DUMB_ENV_NAME"] * 4))
+    monkeypatch.setattr(psycopg2, "connect", aux_connect)
+    with open("test/src/database/response_cache/config/initialize_db.sql", "r") as initialize_query:
+        cursor = postgresql.cursor()
+        cursor.execute(initialize_query.read())
+        postgresql.commit()
+        cursor.close()
+    cache.conn = postgresql
+    yield cache
+    postgresql.close()
+
+def test_postgres_connection_error(monkeypatch, shared_response_cache):
+    aux_connect = psycopg2.connect
+    monkeypatch.setattr(psycopg2, "connect", lambda *args, **kwargs: FakePostgres(1))
+    with pytest.raises(ConnectionError):
+        PostgresSharedResponseCache(*(["DUMB_ENV_NAME"] * 5))
+    monkeypatch.setattr(psycopg2, "connect", aux_connect)
+
+def test_set_and_get(shared_response_cache):
+    assert shared_response_cache.get("/videos/top?") is None
+    lease = shared_response_cache.acquire_refresh("/videos/top?", ["videos"], 10)
+    assert lease
+    assert shared_response_cache.get("/videos/top?") is None
+    response = cached_response(b"[1, 2]")
+    shared_response_cache.set("/videos/top?", response, lease)
+    assert shared_response_cache.get("/videos/top?") == response
+
+def test_only_one_refresh_at_a_time(shared_response_cache):
+    lease = shared_response_cache.acquire_refresh("/videos/top?", ["videos"], 10)
+    assert lease
+    assert shared_response_cache.acquire_refresh("/videos/top?", ["videos"], 10) is None
+    assert shared_response_cache.acquire_refresh("/app_servers?", [], 10)
+    shared_response_cache.set("/videos/top?", cached_response(b"[]"), lease)
+    assert shared_response_cache.acquire_refresh("/videos/top?", ["videos"], 10)
+
+def test_expired_lease_can_be_taken(shared_response_cache):
+    assert shared_response_cache.acquire_refresh("/videos/top?", ["videos"], -1)
+    assert shared_response_cache.acquire_refresh("/videos/top?", ["videos"], 10)
+
+def test_invalidate(shared_response_cache):
+    lease = shared_response_cache.acquire_refresh("/videos/top?", ["videos"], 10)
+    shared_response_cache.set("/videos/top?", cached_response(b"[]"), lease)
+    lease = shared_response_cache.acquire_refresh("/app_servers?", [], 10)
+    shared_response_cache.set("/app_servers?", cached_response(b"{}"), lease)
+    shared_response_cache.invalidate(["videos", "videos:asd@asd.com"])
+    assert shared_response_cache.get("/videos/top?") is None
+    assert shared_response_cache.get("/app_servers?") is not None
+
+def test_invalidated_while_refreshing_is_not_cached(shared_response_cache):
+    lease = shared_response_cache.acquire_refresh("/videos/top?", ["videos"], 10)
+    shared_response_cache.invalidate(["videos"])
+    shared_response_cache.set("/videos/top?", cached_response(b"[]"), lease)
+    assert shared_response_cache.get("/videos/top?") is None
+
+def test_stale_responses_are_dropped(shared_response_cache):
+    lease = shared_response_cache.acquire_refresh("/videos/top?", ["videos"], 10)
+    shared_response_cache.set("/videos/top?", cached_response(b"[]", expires_in=-30), lease)
+    assert shared_response_cache.get("/videos/top?") is not None
+    shared_response_cache.stale_seconds = 10
+    lease = shared_response_cache.acquire_refresh("/app_servers?", [], 10)
+    shared_response_cache.set("/app_servers?", cached_response(b"{}"), lease)
+    assert shared_response_cache.get("/videos/top?") is None
@@ -20,7 +20,7 @@ def statistics_postgres_database(monkeypatch, postgresql):
     monkeypatch.setattr(psycopg2, "connect", lambda *args, **kwargs: FakePostgres(0))
     monkeypatch.setattr(PostgresUtils, "get_postgres_connection",
                         lambda *args, **kwargs: psycopg2.connect(*args, **kwargs))
-    database = PostgresStatisticsDatabase(*(["DUMB_ENV_NAME"]*6))
+    database = PostgresStatisticsDatabase("chotuve.app_server_api_calls", *(["DUMB_ENV_NAME"]*5))
     monkeypatch.setattr(psycopg2, "connect", aux_connect)
     with open("test/src/database/statistics_database/config/initialize_db.sql", "r") as initialize_query:
         cursor = postgresql.cursor()
@@ -28,7 +28,6 @@ def statistics_postgres_database(monkeypatch, postgresql):
         postgresql.commit()
         cursor.close()
     database.conn = postgresql
-    database.app_server_api_calls_table = "chotuve.app_server_api_calls"
     database.server_alias = "test"
     yield database
     postgresql.close()
@@ -0,0 +1,269 @@
+import gc
+import logging
+import threading
+import time
+import psycopg2
+import pytest
+from src.database.utils.postgres_connection import PreparedQuery, PostgresUtils, PooledConnection
+from src.database.utils.exceptions.pool_exhausted_error import PoolExhaustedError
+
+logger = logging.getLogger(__name__)
+
+
+class FakeCursor:
+    def close(self):
+        pass
+
+
+class FakeServerCursor(FakeCursor):
+    def __init__(self, name, rows):
+        self.name = name
+        self.rows = rows
+        self.itersize = 2000
+        self.executed = None
+
+    def execute(self, query, params=None):
+        self.executed = (query, params)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class FakeConnection:
+    def __init__(self, rows=()):
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = 0
+        self.rows = list(rows)
+        self.server_cursors = []
+
+    def cursor(self, name=None):
+        if name:
+            self.server_cursors.append(FakeServerCursor(name, self.rows))
+            return self.server_cursors[-1]
+        return FakeCursor()
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class FakeDatabaseError(Exception):
+    def __init__(self, pgcode):
+        super().__init__(pgcode)
+        self.pgcode = pgcode
+
+
+def test_prepared_query_positional_params():
+    query = PreparedQuery.from_query("SELECT * FROM t WHERE a = %s AND b LIKE '%%x' AND c = %s")
+    assert query.name.startswith("stmt_")
+    assert query.prepare_statement == "PREPARE %s AS SELECT * FROM t WHERE a = $1 AND b LIKE '%%x' AND c = $2" \
+           % query.name
+    assert query.execute_statement == "EXECUTE %s (%%s, %%s)" % query.name
+
+
+def test_prepared_query_without_params():
+    query = PreparedQuery.from_query("SELECT COUNT(*) FROM t")
+    assert query.execute_statement == "EXECUTE %s" % query.name
+
+
+def test_equal_queries_share_statement():
+    assert PreparedQuery.from_query("SELECT 1").name == PreparedQuery.from_query("SELECT 1").name
+    assert PreparedQuery.from_query("SELECT 1").name != PreparedQuery.from_query("SELECT 2").name
+
+
+def test_prepare_queries_only_prepares_the_given_ones():
+    queries = PostgresUtils.prepare_queries({"hot": "SELECT %s", "cold": "SELECT 1"}, {"hot"})
+    assert isinstance(queries["hot"], PreparedQuery)
+    assert queries["cold"] == "SELECT 1"
+
+
+def test_run_transaction_commits_once():
+    connection = FakeConnection()
+    assert PostgresUtils.run_transaction(logger, connection, lambda cursor: 42) == 42
+    assert connection.commits == 1
+    assert connection.rollbacks == 0
+
+
+def test_run_transaction_retries_serialization_failures():
+    connection = FakeConnection()
+    attempts = []
+
+    def work(cursor):
+        attempts.append(cursor)
+        if len(attempts) < 3:
+            raise FakeDatabaseError("40001")
+        return "done"
+
+    assert PostgresUtils.run_transaction(logger, connection, work) == "done"
+    assert len(attempts) == 3
+    assert connection.rollbacks == 2
+    assert connection.commits == 1
+
+
+def test_run_transaction_gives_up_after_retries():
+    connection = FakeConnection()
+
+    def work(cursor):
+        raise FakeDatabaseError("40P01")
+
+    with pytest.raises(FakeDatabaseError):
+        PostgresUtils.run_transaction(logger, connection, work, retries=2)
+    assert connection.rollbacks == 3
+    assert connection.commits == 0
+
+
+def test_run_transaction_raises_other_errors_without_retrying():
+    connection = FakeConnection()
+    attempts = []
+
+    def work(cursor):
+        attempts.append(cursor)
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        PostgresUtils.run_transaction(logger, connection, work)
+    assert len(attempts) == 1
+    assert connection.rollbacks == 1
+
+
+@pytest.fixture(scope="function")
+def fake_pool(monkeypatch):
+    monkeypatch.setattr(psycopg2, "connect", lambda *args, **kwargs: FakeConnection())
+    pool = PooledConnection(2, host="dummy")
+    yield pool
+    PostgresUtils.release_connections()
+
+
+def test_pooled_connection_is_per_thread(fake_pool):
+    main_connection = fake_pool.checkout()
+    assert fake_pool.checkout() is main_connection
+    other_connections = []
+    thread = threading.Thread(target=lambda: other_connections.append(fake_pool.checkout()))
+    thread.start()
+    thread.join()
+    assert other_connections[0] is not main_connection
+
+
+def test_release_rolls_back_and_reuses_connection(fake_pool):
+    fake_pool.commit()
+    connection = fake_pool.checkout()
+    PostgresUtils.release_connections()
+    assert connection.rollbacks == 1
+    assert fake_pool.checkout() is connection
+    assert connection.commits == 1
+
+
+def test_closed_connections_are_not_reused(fake_pool):
+    connection = fake_pool.checkout()
+    connection.closed = 1
+    PostgresUtils.release_connections()
+    assert fake_pool.checkout() is not connection
+
+
+def test_checkout_waits_for_a_free_connection(fake_pool):
+    holding = threading.Event()
+    release = threading.Event()
+    checked_out = []
+
+    def hold_connection():
+        fake_pool.checkout()
+        holding.set()
+        release.wait()
+        PostgresUtils.release_connections()
+
+    holders = [threading.Thread(target=hold_connection) for _ in range(2)]
+    for holder in holders:
+        holding.clear()
+        holder.start()
+        holding.wait()
+    waiter = threading.Thread(target=lambda: checked_out.append(fake_pool.checkout()))
+    waiter.start()
+    time.sleep(0.1)
+    assert checked_out == []
+    release.set()
+    waiter.join(1)
+    assert len(checked_out) == 1
+
+
+def hold_connections(pool: PooledConnection, amount: int) -> threading.Event:
+    holding = threading.Barrier(amount + 1)
+    release = threading.Event()
+
+    def hold_connection():
+        pool.checkout()
+        holding.wait()
+        release.wait()
+        PostgresUtils.release_connections()
+
+    for _ in range(amount):
+        threading.Thread(target=hold_connection).start()
+    holding.wait()
+    return release
+
+
+def test_checkout_times_out_when_the_pool_is_exhausted(monkeypatch):
+    monkeypatch.setattr(psycopg2, "connect", lambda *args, **kwargs: FakeConnection())
+    pool = PooledConnection(1, timeout=0.1, host="dummy")
+    release = hold_connections(pool, 1)
+    with pytest.raises(PoolExhaustedError):
+        pool.checkout()
+    release.set()
+
+
+def test_connections_of_ended_threads_return_to_the_pool(monkeypatch):
+    monkeypatch.setattr(psycopg2, "connect", lambda *args, **kwargs: FakeConnection())
+    pool = PooledConnection(1, timeout=1, host="dummy")
+    thread_connection = []
+    thread = threading.Thread(target=lambda: thread_connection.append(pool.checkout()))
+    thread.start()
+    thread.join()
+    gc.collect()
+    assert pool.checkout() is thread_connection[0]
+    assert thread_connection[0].rollbacks == 1
+    PostgresUtils.release_connections()
+
+
+def test_get_postgres_connection_pool_size_from_environment(monkeypatch):
+    monkeypatch.setattr("src.database.utils.postgres_connection.postgres_connections", {})
+    monkeypatch.setattr(psycopg2, "connect", lambda *args, **kwargs: FakeConnection())
+    monkeypatch.setenv("POSTGRES_POOL_SIZE", "2")
+    monkeypatch.setenv("POSTGRES_POOL_TIMEOUT", "0.1")
+    pool = PostgresUtils.get_postgres_connection("host", "user", "password", "database")
+    assert pool.timeout == 0.1
+    release = hold_connections(pool, 2)
+    with pytest.raises(PoolExhaustedError):
+        pool.checkout()
+    release.set()
+
+
+def test_get_postgres_connection_shares_pool(monkeypatch):
+    monkeypatch.setattr("src.database.utils.postgres_connection.postgres_connections", {})
+    pool = PostgresUtils.get_postgres_connection("host", "user", "password", "database")
+    assert isinstance(pool, PooledConnection)
+    assert PostgresUtils.get_postgres_connection("host", "user", "password", "database") is pool
+    assert PostgresUtils.get_postgres_connection("host", "user", "password", "other") is not pool
+
+
+def test_stream_query_runs_prepared_queries_as_plain_queries():
+    connection = FakeConnection(rows=[(1,), (2,), (3,)])
+    rows = PostgresUtils.stream_query(logger, connection, PreparedQuery.from_query("SELECT %s"), (1,), 2)
+    assert list(rows) == [(1,), (2,), (3,)]
+    assert connection.server_cursors[0].executed == ("SELECT %s", (1,))
+    assert connection.server_cursors[0].itersize == 2
+    assert connection.rollbacks == 1
+
+
+def test_stream_query_ends_the_transaction_when_closed():
+    connection = FakeConnection(rows=[(1,), (2,), (3,)])
+    rows = PostgresUtils.stream_query(logger, connection, "SELECT 1")
+    assert next(rows) == (1,)
+    assert connection.rollbacks == 0
+    rows.close()
+    assert connection.rollbacks == 1
+
+
+def test_cooperate_with_gevent_without_gevent():
+    assert not PostgresUtils.cooperate_with_gevent()
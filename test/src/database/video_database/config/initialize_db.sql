@@ -18,6 +18,9 @@ alter table chotuve.users
 	add constraint users_pk
 		primary key (email);
 
+create index users_photo_md5_index
+	on chotuve.users (md5(photo));
+
 create table chotuve.videos
 (
 	user_email varchar
@@ -29,10 +32,14 @@ create table chotuve.videos
 	location varchar,
 	file_location varchar,
 	description varchar,
+	comment_count int default 0 not null,
 	constraint videos_pk
 		primary key (user_email, title)
 );
 
+create index videos_creation_time_index
+	on chotuve.videos (creation_time, user_email, title);
+
 create table chotuve.video_reactions
 (
 	reactor_email varchar
@@ -49,6 +56,7 @@ create table chotuve.video_reactions
 
 create table chotuve.video_comments
 (
+	id serial,
 	author_email varchar
 		constraint video_comments_users_email_fk
 			references chotuve.users,
@@ -62,6 +70,18 @@ create table chotuve.video_comments
 		foreign key (video_owner_email, video_title) references chotuve.videos
 );
 
+create index video_comments_video_datetime_index
+	on chotuve.video_comments (video_owner_email, video_title, datetime, id);
+
+create table chotuve.resource_versions
+(
+	resource varchar
+		constraint resource_versions_pk
+			primary key,
+	version bigint not null,
+	last_modified timestamp not null
+);
+
 INSERT INTO chotuve.users (email, fullname, phone_number, photo, password, admin)
 VALUES ('giancafferata@hotmail.com', 'Gianmarco', '1111', 'asd', 'asd123', false);
 
@@ -1,5 +1,6 @@
 from src.database.videos.postgres_video_database import PostgresVideoDatabase
 from src.database.videos.exceptions.no_more_videos_error import NoMoreVideosError
+from src.database.videos.exceptions.invalid_cursor_error import InvalidCursorError
 from src.database.videos.video_database import VideoData, Reaction
 import datetime
 import pytest
@@ -9,6 +10,7 @@ import requests
 import os
 from io import BytesIO
 from src.database.utils.postgres_connection import PostgresUtils
+from src.model.photo import Photo
 import time
 
 
@@ -32,7 +34,9 @@ def video_postgres_database(monkeypatch, postgresql):
     monkeypatch.setattr(psycopg2, "connect", lambda *args, **kwargs: FakePostgres(0))
     monkeypatch.setattr(PostgresUtils, "get_postgres_connection",
                         lambda *args, **kwargs: psycopg2.connect(*args, **kwargs))
-    database = PostgresVideoDatabase(*(["DUMB_ENV_NAME"] * 8))
+    database = PostgresVideoDatabase("chotuve.videos", "chotuve.users", "chotuve.video_reactions",
+                                     "chotuve.video_comments", "chotuve.resource_versions",
+                                     *(["DUMB_ENV_NAME"] * 4))
     monkeypatch.setattr(psycopg2, "connect", aux_connect)
     with open("test/src/database/video_database/config/initialize_db.sql", "r") as initialize_query:
         cursor = postgresql.cursor()
@@ -40,10 +44,6 @@ def video_postgres_database(monkeypatch, postgresql):
         postgresql.commit()
         cursor.close()
     database.conn = postgresql
-    database.videos_table_name = "chotuve.videos"
-    database.users_table_name = "chotuve.users"
-    database.video_reactions_table_name = "chotuve.video_reactions"
-    database.video_comments_table_name = "chotuve.video_comments"
     yield database
     postgresql.close()
 
@@ -52,7 +52,7 @@ def test_postgres_connection_error(monkeypatch, video_postgres_database):
     aux_connect = psycopg2.connect
     monkeypatch.setattr(psycopg2, "connect", lambda *args, **kwargs: FakePostgres(1))
     with pytest.raises(ConnectionError):
-        database = PostgresVideoDatabase(*(["DUMB_ENV_NAME"] * 8))
+        database = PostgresVideoDatabase(*(["DUMB_ENV_NAME"] * 9))
     monkeypatch.setattr(psycopg2, "connect", aux_connect)
 
 
@@ -83,6 +83,25 @@ def test_delete_videos_and_query(monkeypatch, video_postgres_database):
     assert videos[0][0].title == fake_video_data2.title
 
 
+def test_videos_versions(monkeypatch, video_postgres_database):
+    assert video_postgres_database.get_videos_version().version == 0
+    video_postgres_database.add_video("giancafferata@hotmail.com", fake_video_data)
+    first_version = video_postgres_database.get_videos_version("giancafferata@hotmail.com")
+    assert first_version.version == 1
+    assert video_postgres_database.get_videos_version().version == 1
+    assert video_postgres_database.get_videos_version("cafferatagian@hotmail.com").version == 0
+    video_postgres_database.react_video("cafferatagian@hotmail.com", "giancafferata@hotmail.com",
+                                        fake_video_data.title, Reaction.like)
+    video_postgres_database.comment_video("cafferatagian@hotmail.com", "giancafferata@hotmail.com",
+                                          fake_video_data.title, "Hola")
+    video_postgres_database.delete_reaction("cafferatagian@hotmail.com", "giancafferata@hotmail.com",
+                                            fake_video_data.title)
+    last_version = video_postgres_database.get_videos_version("giancafferata@hotmail.com")
+    assert last_version.version == 4
+    assert last_version.last_modified >= first_version.last_modified
+    assert video_postgres_database.get_videos_version().version == 4
+
+
 def test_add_video_and_get_top(monkeypatch, video_postgres_database):
     videos = video_postgres_database.list_user_videos("giancafferata@hotmail.com")
     assert len(videos) == 0
@@ -90,6 +109,12 @@ def test_add_video_and_get_top(monkeypatch, video_postgres_database):
     videos = video_postgres_database.list_top_videos()
     assert len(videos) == 1
     assert videos[0][0]["email"] == "giancafferata@hotmail.com"
+    assert videos[0][0]["photo_hash"] == Photo.content_hash("asd")
+
+
+def test_get_user_photo(monkeypatch, video_postgres_database):
+    assert video_postgres_database.get_user_photo(Photo.content_hash("asd")) == "asd"
+    assert video_postgres_database.get_user_photo(Photo.content_hash("unexistent")) is None
 
 
 def test_add_two_videos_and_search(monkeypatch, video_postgres_database):
@@ -97,18 +122,64 @@ def test_add_two_videos_and_search(monkeypatch, video_postgres_database):
     video_postgres_database.add_video("giancafferata@hotmail.com", fake_video_data2)
     videos = video_postgres_database.list_user_videos("giancafferata@hotmail.com")
     assert len(videos) == 2
-    assert len(video_postgres_database.search_videos("titulo")) == 1
-    assert len(video_postgres_database.search_videos("Titulo")) == 1
-    assert len(video_postgres_database.search_videos("titulo2")) == 1
-    assert len(video_postgres_database.search_videos("Titulo2")) == 1
-    assert len(video_postgres_database.search_videos("descripcion")) == 1
-    assert len(video_postgres_database.search_videos("descripcion2")) == 1
-    assert len(video_postgres_database.search_videos("coso")) == 2
-    search_result = video_postgres_database.search_videos("coso titulo")
+    assert len(video_postgres_database.search_videos("titulo").results) == 1
+    assert len(video_postgres_database.search_videos("Titulo").results) == 1
+    assert len(video_postgres_database.search_videos("titulo2").results) == 1
+    assert len(video_postgres_database.search_videos("Titulo2").results) == 1
+    assert len(video_postgres_database.search_videos("descripcion").results) == 1
+    assert len(video_postgres_database.search_videos("descripcion2").results) == 1
+    assert len(video_postgres_database.search_videos("coso").results) == 2
+    search_result = video_postgres_database.search_videos("coso titulo").results
     assert len(search_result) == 2
     assert search_result[0][1].title == "Titulo"
 
 
+def test_search_paginated(monkeypatch, video_postgres_database):
+    video_postgres_database.add_video("giancafferata@hotmail.com", fake_video_data)
+    video_postgres_database.add_video("giancafferata@hotmail.com", fake_video_data2)
+    video_postgres_database.add_video("asd@asd.com", fake_video_data2)
+    video_postgres_database.react_video('cafferatagian@hotmail.com', 'giancafferata@hotmail.com',
+                                        'Titulo', Reaction.like)
+    page1 = video_postgres_database.search_videos("coso titulo", limit=2, with_total=True)
+    assert page1.total == 3
+    assert len(page1.results) == 2
+    assert page1.results[0][0]["email"] == "giancafferata@hotmail.com"
+    assert page1.results[0][0]["fullname"] == "Gianmarco"
+    assert page1.results[0][1].title == "Titulo"
+    assert page1.results[0][2][Reaction.like] == 1
+    assert page1.results[1][0]["email"] == "asd@asd.com"
+    assert page1.results[1][1].title == "Titulo2"
+    assert page1.next_cursor
+    page2 = video_postgres_database.search_videos("coso titulo", limit=2, cursor=page1.next_cursor)
+    assert page2.total is None
+    assert len(page2.results) == 1
+    assert page2.results[0][0]["email"] == "giancafferata@hotmail.com"
+    assert page2.results[0][1].title == "Titulo2"
+    assert page2.results[0][2][Reaction.like] == 0
+    assert not page2.next_cursor
+    with pytest.raises(InvalidCursorError):
+        video_postgres_database.search_videos("coso titulo", limit=2, cursor="asd")
+
+
+def test_search_private_videos_of_the_given_owners(monkeypatch, video_postgres_database):
+    private_video_data = fake_video_data2._replace(visible=False)
+    video_postgres_database.add_video("giancafferata@hotmail.com", fake_video_data)
+    video_postgres_database.add_video("giancafferata@hotmail.com", private_video_data)
+    video_postgres_database.add_video("asd@asd.com", private_video_data)
+    page = video_postgres_database.search_videos("coso titulo", limit=1, with_total=True)
+    assert page.total == 1
+    assert [v.title for u, v, r in page.results] == ["Titulo"]
+    assert not page.next_cursor
+    page1 = video_postgres_database.search_videos("coso titulo", limit=1, with_total=True,
+                                                  private_owners=["giancafferata@hotmail.com"])
+    assert page1.total == 2
+    assert [(u["email"], v.title) for u, v, r in page1.results] == [("giancafferata@hotmail.com", "Titulo")]
+    page2 = video_postgres_database.search_videos("coso titulo", limit=1, cursor=page1.next_cursor,
+                                                  private_owners=["giancafferata@hotmail.com"])
+    assert [(u["email"], v.title) for u, v, r in page2.results] == [("giancafferata@hotmail.com", "Titulo2")]
+    assert not page2.next_cursor
+
+
 def test_react_video(monkeypatch, video_postgres_database):
     video_postgres_database.add_video("giancafferata@hotmail.com", fake_video_data)
     videos = video_postgres_database.list_user_videos("giancafferata@hotmail.com")
@@ -169,6 +240,39 @@ def test_comment_video_and_query(monkeypatch, video_postgres_database):
     assert comments2[0].content == "Comentario 2"
 
 
+def test_stream_comments(monkeypatch, video_postgres_database):
+    video_postgres_database.add_video("giancafferata@hotmail.com", fake_video_data)
+    for i in range(5):
+        video_postgres_database.comment_video('asd@asd.com', 'giancafferata@hotmail.com',
+                                              fake_video_data.title, "Comentario %d" % i)
+    users, comments = video_postgres_database.get_comments('giancafferata@hotmail.com', fake_video_data.title)
+    streamed = video_postgres_database.stream_comments('giancafferata@hotmail.com', fake_video_data.title)
+    assert list(streamed) == list(zip(users, comments))
+    assert list(video_postgres_database.stream_comments('giancafferata@hotmail.com', "Unexistent")) == []
+    # The connection is usable after the stream
+    assert len(video_postgres_database.get_comments('giancafferata@hotmail.com', fake_video_data.title)[1]) == 5
+
+
+def test_comment_video_and_query_page(monkeypatch, video_postgres_database):
+    video_postgres_database.add_video("giancafferata@hotmail.com", fake_video_data)
+    for i in range(3):
+        video_postgres_database.comment_video('asd@asd.com', 'giancafferata@hotmail.com',
+                                              fake_video_data.title, "Comentario %d" % i)
+    page1 = video_postgres_database.get_comments_page('giancafferata@hotmail.com', fake_video_data.title, 2)
+    assert page1.total == 3
+    assert [c.content for c in page1.comments] == ["Comentario 2", "Comentario 1"]
+    assert page1.users[0]["email"] == 'asd@asd.com'
+    page2 = video_postgres_database.get_comments_page('giancafferata@hotmail.com', fake_video_data.title, 2,
+                                                      page1.next_cursor)
+    assert [c.content for c in page2.comments] == ["Comentario 0"]
+    assert page2.next_cursor is None
+    empty_page = video_postgres_database.get_comments_page('giancafferata@hotmail.com', "Unexistent", 2)
+    assert empty_page.comments == []
+    assert empty_page.total == 0
+    with pytest.raises(InvalidCursorError):
+        video_postgres_database.get_comments_page('giancafferata@hotmail.com', fake_video_data.title, 2, "asd")
+
+
 def test_add_videos_and_get_paginated(monkeypatch, video_postgres_database):
     page_empty = video_postgres_database.get_paginated_videos(page=0, per_page=1)
     assert page_empty[1] == 0
@@ -204,3 +308,37 @@ def test_add_videos_and_get_paginated(monkeypatch, video_postgres_database):
     assert page2[0][0][1].title == "Titulo"
     with pytest.raises(NoMoreVideosError):
         video_postgres_database.get_paginated_videos(page=2, per_page=2)
+
+    for page in range(2):
+        streamed, pages = video_postgres_database.stream_paginated_videos(page=page, per_page=2)
+        assert pages == 2
+        assert list(streamed) == video_postgres_database.get_paginated_videos(page=page, per_page=2)[0]
+    with pytest.raises(NoMoreVideosError):
+        video_postgres_database.stream_paginated_videos(page=2, per_page=2)
+
+
+def test_add_videos_and_get_videos_page(monkeypatch, video_postgres_database):
+    page_empty = video_postgres_database.get_videos_page(limit=2)
+    assert page_empty.results == []
+    assert page_empty.next_cursor is None
+    assert page_empty.total == 0
+
+    now = datetime.datetime.now()
+    for i, email in enumerate(["giancafferata@hotmail.com", "asd@asd.com", "giancafferata@hotmail.com"]):
+        video_postgres_database.add_video(email, VideoData(title="Titulo%d" % i, description="Descripcion coso",
+                                                           creation_time=now + datetime.timedelta(minutes=i),
+                                                           visible=True, location="Buenos Aires",
+                                                           file_location="file_location"))
+    video_postgres_database.react_video("asd@asd.com", "giancafferata@hotmail.com", "Titulo2", Reaction.like)
+
+    page1 = video_postgres_database.get_videos_page(limit=2)
+    assert page1.total == 3
+    assert [v[1].title for v in page1.results] == ["Titulo2", "Titulo1"]
+    assert page1.results[0][0]["email"] == "giancafferata@hotmail.com"
+    assert page1.results[0][2] == {Reaction.like: 1, Reaction.dislike: 0}
+    assert page1.next_cursor is not None
+    page2 = video_postgres_database.get_videos_page(limit=2, cursor=page1.next_cursor)
+    assert [v[1].title for v in page2.results] == ["Titulo0"]
+    assert page2.next_cursor is None
+    with pytest.raises(InvalidCursorError):
+        video_postgres_database.get_videos_page(limit=2, cursor="asd")
@@ -0,0 +1,39 @@
+from src.events.local_event_bus import LocalEventBus
+from src.events.event_bus import EventBus, Event, MAX_PENDING_EVENTS
+
+
+def test_factory():
+    assert isinstance(EventBus.factory("LocalEventBus"), LocalEventBus)
+
+
+def test_publish_to_every_subscription_of_the_user():
+    event_bus = LocalEventBus()
+    first = event_bus.subscribe("a@a.com")
+    second = event_bus.subscribe("a@a.com")
+    other = event_bus.subscribe("b@b.com")
+    event_bus.publish("a@a.com", Event(kind="message", payload={"from": "b@b.com", "message": "hola"}))
+    assert first.get(0) == Event(kind="message", payload={"from": "b@b.com", "message": "hola"})
+    assert second.get(0).payload["message"] == "hola"
+    assert other.get(0) is None
+
+
+def test_unsubscribe():
+    event_bus = LocalEventBus()
+    subscription = event_bus.subscribe("a@a.com")
+    event_bus.unsubscribe(subscription)
+    event_bus.publish("a@a.com", Event(kind="friendship_request", payload={"from": "b@b.com"}))
+    assert subscription.get(0) is None
+    assert event_bus.subscriptions == {}
+
+
+def test_slow_subscriptions_drop_events():
+    event_bus = LocalEventBus()
+    subscription = event_bus.subscribe("a@a.com")
+    for i in range(MAX_PENDING_EVENTS + 1):
+        event_bus.publish("a@a.com", Event(kind="message", payload={"message": str(i)}))
+    received = []
+    event = subscription.get(0)
+    while event:
+        received.append(event.payload["message"])
+        event = subscription.get(0)
+    assert received == [str(i) for i in range(MAX_PENDING_EVENTS)]
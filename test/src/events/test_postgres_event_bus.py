@@ -0,0 +1,53 @@
+from src.events.postgres_event_bus import PostgresEventBus
+from src.events.event_bus import Event
+from src.database.utils.postgres_connection import PostgresUtils
+import pytest
+import psycopg2
+from typing import NamedTuple
+import os
+
+
+class FakePostgres(NamedTuple):
+    closed: int
+
+
+@pytest.fixture(scope="function")
+def postgres_event_bus(monkeypatch, postgresql):
+    os.environ["DUMB_ENV_NAME"] = "dummy"
+    aux_connect = psycopg2.connect
+    monkeypatch.setattr(psycopg2, "connect", lambda *args, **kwargs: FakePostgres(0))
+    monkeypatch.setattr(PostgresUtils, "get_postgres_connection",
+                        lambda *args, **kwargs: psycopg2.connect(*args, **kwargs))
+    event_bus = PostgresEventBus("chotuve_events", *(["DUMB_ENV_NAME"] * 4))
+    monkeypatch.setattr(psycopg2, "connect", aux_connect)
+    event_bus.conn = postgresql
+    event_bus.listen_conn = postgresql
+    event_bus.listen()
+    yield event_bus
+    postgresql.close()
+
+
+def test_postgres_connection_error(monkeypatch, postgres_event_bus):
+    aux_connect = psycopg2.connect
+    monkeypatch.setattr(psycopg2, "connect", lambda *args, **kwargs: FakePostgres(1))
+    with pytest.raises(ConnectionError):
+        PostgresEventBus(*(["DUMB_ENV_NAME"] * 5))
+    monkeypatch.setattr(psycopg2, "connect", aux_connect)
+
+
+def test_publish_is_dispatched_to_local_subscriptions(postgres_event_bus):
+    subscription = postgres_event_bus.local_event_bus.subscribe("a@a.com")
+    other = postgres_event_bus.local_event_bus.subscribe("b@b.com")
+    postgres_event_bus.publish("a@a.com", Event(kind="message", payload={"from": "b@b.com", "message": "hola"}))
+    postgres_event_bus.dispatch_notifications(1)
+    assert subscription.get(0) == Event(kind="message", payload={"from": "b@b.com", "message": "hola"})
+    assert other.get(0) is None
+
+
+def test_malformed_notifications_are_ignored(postgres_event_bus):
+    subscription = postgres_event_bus.local_event_bus.subscribe("a@a.com")
+    cursor = postgres_event_bus.conn.cursor()
+    cursor.execute("SELECT pg_notify('chotuve_events', 'asd')")
+    cursor.close()
+    postgres_event_bus.dispatch_notifications(1)
+    assert subscription.get(0) is None
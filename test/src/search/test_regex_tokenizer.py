@@ -0,0 +1,45 @@
+import unittest
+from src.search.tokenizer import Tokenizer
+from src.search.search_profile import SearchQuery, SearchProfile
+
+
+class TestUnitsRegexTokenizer(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tokenizer = Tokenizer.factory("RegexTokenizer")
+
+    def test_words_and_punctuation(self):
+        self.assertEqual(self.tokenizer.tokenize("hola, como va? todo bien..."),
+                         ["hola", ",", "como", "va", "?", "todo", "bien", "..."])
+
+    def test_keeps_numbers_and_hyphenated_words(self):
+        self.assertEqual(self.tokenizer.tokenize("bien-venidos a las 10:30 con 1,000 personas"),
+                         ["bien-venidos", "a", "las", "10:30", "con", "1,000", "personas"])
+
+    def test_splits_contractions(self):
+        self.assertEqual(self.tokenizer.tokenize("it's a cat, don't"),
+                         ["it", "'s", "a", "cat", ",", "do", "n't"])
+
+    def test_empty_text(self):
+        self.assertEqual(self.tokenizer.tokenize(""), [])
+
+
+class TestUnitsSearchProfile(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tokenizer = Tokenizer.factory("RegexTokenizer")
+
+    def test_title_weights_more_than_description(self):
+        query = SearchQuery.from_text(self.tokenizer, "Gatito")
+        title_match = SearchProfile.from_video(self.tokenizer, "Mi gatito", "un video")
+        description_match = SearchProfile.from_video(self.tokenizer, "Mi video", "un gatito")
+        self.assertGreater(title_match.score(query), description_match.score(query))
+        self.assertGreater(description_match.score(query), 0)
+
+    def test_no_match_scores_zero(self):
+        query = SearchQuery.from_text(self.tokenizer, "perro")
+        profile = SearchProfile.from_video(self.tokenizer, "Mi gatito", None)
+        self.assertEqual(profile.score(query), 0)
+
+    def test_query_max_tokens(self):
+        query = SearchQuery.from_text(self.tokenizer, "uno dos tres", 2)
+        self.assertEqual(query.tokens, ["uno", "dos"])
+        self.assertEqual(query.bigrams, [("uno", "dos")])
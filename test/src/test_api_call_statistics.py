@@ -9,7 +9,10 @@ from src.services.exceptions.user_already_registered_error import UserAlreadyReg
 from src.database.notifications.postgres_expo_notification_database import PostgresExpoNotificationDatabase
 from src.services.media_server import MediaServer
 import json
+import time
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from src.single_flight import single_flights
 
 class MockResponse(NamedTuple):
     json_dict: Dict
@@ -160,4 +163,35 @@ class TestAppServerStatistics(unittest.TestCase):
             self.assertEqual(app_servers[0]["is_healthy"], True)
             self.assertEqual(app_servers[0]["metrics"]["api_calls_last_7_days"], 4)
             self.assertEqual(app_servers[0]["metrics"]["status_500_rate_last_7_days"], 1/4)
-            self.assertEqual(app_servers[0]["metrics"]["status_400_rate_last_7_days"], 1/4)
\ No newline at end of file
+            self.assertEqual(app_servers[0]["metrics"]["status_400_rate_last_7_days"], 1/4)
+
+    def test_single_flight_statistics(self):
+        def slow_read():
+            time.sleep(0.2)
+            return ["asd@asd.com"]
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(lambda _: single_flights.do("Database.slow_read", "key", slow_read), range(8)))
+        AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
+        AuthServer.profile_query = MagicMock(return_value={"admin": True})
+        with self.app.test_client() as c:
+            response = c.get('/single_flight_statistics', headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            statistics = json.loads(response.data)["Database.slow_read"]
+            self.assertGreaterEqual(statistics["calls"], 8)
+            self.assertGreater(statistics["coalesced"], 0)
+            self.assertEqual(statistics["calls"] - statistics["executions"], statistics["coalesced"])
+            self.assertGreater(statistics["coalescing_ratio"], 0)
+
+    def test_single_flight_statistics_only_for_admins(self):
+        with self.app.test_client() as c:
+            response = c.get('/single_flight_statistics')
+            self.assertEqual(response.status_code, 401)
+            self.assertNotIn("Access-Control-Allow-Origin", response.headers)
+        AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
+        AuthServer.profile_query = MagicMock(return_value={"admin": False})
+        with self.app.test_client() as c:
+            response = c.get('/single_flight_statistics', headers={"Authorization": "Bearer %s" % "asd123",
+                                                                   "Origin": "http://example.com"})
+            self.assertEqual(response.status_code, 403)
+            self.assertNotIn("Access-Control-Allow-Origin", response.headers)
+
@@ -0,0 +1,94 @@
+from src.asgi_adapter import AsgiAdapter
+from test.src.asgi_requests import asgi_request, run_request
+import asyncio
+import threading
+import time
+import json
+
+def echo_application(environ, start_response):
+    body = environ["wsgi.input"].read()
+    start_response("201 Created", [("Content-Type", "application/json")])
+    return [json.dumps({"method": environ["REQUEST_METHOD"], "path": environ["PATH_INFO"],
+                        "query": environ["QUERY_STRING"], "body": body.decode(),
+                        "content_type": environ.get("CONTENT_TYPE"),
+                        "accept": environ.get("HTTP_ACCEPT")}).encode()]
+
+def test_request_reaches_wsgi_application():
+    start, body = run_request(AsgiAdapter(echo_application), "POST", "/user/video", b"a=1",
+                              (b"hola ", b"mundo"), [(b"content-type", b"text/plain"), (b"accept", b"a"),
+                                                     (b"accept", b"b")])
+    assert start["status"] == 201
+    assert start["headers"] == [(b"content-type", b"application/json")]
+    assert json.loads(body) == {"method": "POST", "path": "/user/video", "query": "a=1", "body": "hola mundo",
+                                "content_type": "text/plain", "accept": "a,b"}
+
+def test_requests_run_concurrently():
+    def slow_application(environ, start_response):
+        time.sleep(0.2)
+        start_response("200 OK", [])
+        return [b"ok"]
+
+    app = AsgiAdapter(slow_application, 50)
+    start = time.perf_counter()
+
+    async def many_requests():
+        await asyncio.gather(*[asgi_request(app, "GET", "/") for _ in range(50)])
+
+    asyncio.run(many_requests())
+    assert time.perf_counter() - start < 0.2 * 10
+
+def test_streamed_response_stops_on_disconnect():
+    closed = threading.Event()
+
+    def stream_application(environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/event-stream")])
+
+        def stream():
+            try:
+                while True:
+                    yield b"data: hola\n\n"
+                    time.sleep(0.01)
+            finally:
+                closed.set()
+        return stream()
+
+    async def request():
+        chunks = []
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+        disconnect = asyncio.get_event_loop().create_future()
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await disconnect
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body":
+                chunks.append(message["body"])
+                if len(chunks) == 3 and not disconnect.done():
+                    disconnect.set_result(None)
+
+        await AsgiAdapter(stream_application)({"type": "http", "method": "GET", "path": "/user/events"},
+                                              receive, send)
+        return chunks
+
+    assert asyncio.run(request())[:3] == [b"data: hola\n\n"] * 3
+    assert closed.wait(1)
+
+def test_lifespan():
+    sent = []
+
+    async def lifespan():
+        messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        await AsgiAdapter(echo_application)({"type": "lifespan"}, receive, send)
+
+    asyncio.run(lifespan())
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
@@ -113,4 +113,67 @@ class TestCommentEndpoints(unittest.TestCase):
             assert comments_data[0]["user"]["email"] == "asd@asd.com"
             assert comments_data[0]["comment"]["content"] == "Asd2"
             assert comments_data[1]["user"]["email"] == "asd@asd.com"
-            assert comments_data[1]["comment"]["content"] == "Asd"
\ No newline at end of file
+            assert comments_data[1]["comment"]["content"] == "Asd"
+
+    def test_get_video_comments_paginated(self):
+        AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
+        MediaServer.upload_video = MagicMock(return_value="")
+        with self.app.test_client() as c:
+            c.post('/user/video', query_string={"email": "asd@asd.com"},
+                   data={"title": "Hola", "location": "Buenos Aires",
+                         "visible":"true","video": (BytesIO(), 'video')},
+                   headers={"Authorization": "Bearer %s" % "asd123"})
+            for comment in ["Asd", "Asd2", "Asd3"]:
+                c.post('/videos/comment', json={"target_email": "asd@asd.com",
+                                                "video_title": "Hola",
+                                                "comment": comment},
+                       headers={"Authorization": "Bearer %s" % "asd123"})
+            response = c.get('/videos/comments', query_string={"other_user_email": "asd@asd.com",
+                                                               "video_title": "Hola", "limit": 2},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            comments_page = json.loads(response.data)
+            assert comments_page["total"] == 3
+            assert [c["comment"]["content"] for c in comments_page["results"]] == ["Asd3", "Asd2"]
+            response = c.get('/videos/comments', query_string={"other_user_email": "asd@asd.com",
+                                                               "video_title": "Hola", "limit": 2,
+                                                               "cursor": comments_page["next_cursor"]},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            comments_page = json.loads(response.data)
+            assert [c["comment"]["content"] for c in comments_page["results"]] == ["Asd"]
+            assert comments_page["next_cursor"] is None
+            response = c.get('/videos/comments', query_string={"other_user_email": "asd@asd.com",
+                                                               "video_title": "Hola", "cursor": "asd"},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 400)
+
+    def test_get_video_comments_conditional_get(self):
+        AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
+        MediaServer.upload_video = MagicMock(return_value="")
+        with self.app.test_client() as c:
+            response = c.post('/user/video', query_string={"email": "asd@asd.com"},
+                              data={"title": "Hola", "location": "Buenos Aires",
+                                    "visible":"true","video": (BytesIO(), 'video')},
+                              headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            response = c.get('/videos/comments', query_string={"other_user_email": "asd@asd.com",
+                                                               "video_title": "Hola"},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            etag = response.headers["ETag"]
+            response = c.get('/videos/comments', query_string={"other_user_email": "asd@asd.com",
+                                                               "video_title": "Hola"},
+                             headers={"Authorization": "Bearer %s" % "asd123", "If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+            response = c.post('/videos/comment', json={"target_email": "asd@asd.com",
+                                                       "video_title": "Hola",
+                                                       "comment": "Asd"},
+                              headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            response = c.get('/videos/comments', query_string={"other_user_email": "asd@asd.com",
+                                                               "video_title": "Hola"},
+                             headers={"Authorization": "Bearer %s" % "asd123", "If-None-Match": etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(json.loads(response.data)), 1)
+
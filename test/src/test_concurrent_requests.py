@@ -0,0 +1,97 @@
+from create_application import create_application
+import unittest
+from src.services.auth_server import AuthServer
+from concurrent.futures import ThreadPoolExecutor
+import os
+from unittest.mock import MagicMock
+import requests
+from typing import NamedTuple, Dict
+import json
+import time
+from src.database.notifications.postgres_expo_notification_database import PostgresExpoNotificationDatabase
+
+THREADS = 16
+MESSAGES_PER_CONVERSATION = 20
+
+class MockResponse(NamedTuple):
+    json_dict: Dict
+    status_code: int
+
+    def json(self):
+        return self.json_dict
+
+    def raise_for_status(self):
+        return None
+
+class TestConcurrentRequests(unittest.TestCase):
+    def setUp(self) -> None:
+        os.environ["AUTH_ENDPOINT_URL"] = "google.com"
+        os.environ["AUTH_SERVER_SECRET"] = "secret"
+        os.environ["SERVER_ALIAS"] = "Jenny"
+        os.environ["SERVER_HEALTH_ENDPOINT"] = "google.com"
+        os.environ["MEDIA_ENDPOINT_URL"] = "google.com"
+        requests.post = MagicMock(return_value=MockResponse({"api_key": "dummy"}, 200))
+        self.notification_database_init = PostgresExpoNotificationDatabase.__init__
+        self.notify = PostgresExpoNotificationDatabase.notify
+        PostgresExpoNotificationDatabase.notify = MagicMock(return_value=None)
+        PostgresExpoNotificationDatabase.__init__ = lambda *args, **kwargs: None
+        self.app = create_application()
+        self.app.testing = True
+        self.get_logged_email = AuthServer.get_logged_email
+        self.profile_query = AuthServer.profile_query
+
+        # The token is the user, with some latency so the requests overlap
+        def logged_email(token):
+            time.sleep(0.001)
+            return "%s@asd.com" % token
+        AuthServer.get_logged_email = MagicMock(side_effect=logged_email)
+        AuthServer.profile_query = MagicMock(side_effect=lambda email: {"email": email})
+
+    def tearDown(self):
+        AuthServer.get_logged_email = self.get_logged_email
+        AuthServer.profile_query = self.profile_query
+        PostgresExpoNotificationDatabase.__init__ = self.notification_database_init
+        PostgresExpoNotificationDatabase.notify = self.notify
+
+    def post(self, token: str, path: str, body: Dict) -> int:
+        with self.app.test_client() as c:
+            return c.post(path, json=body, headers={"Authorization": "Bearer %s" % token}).status_code
+
+    def get(self, token: str, path: str, query_string: Dict) -> Dict:
+        with self.app.test_client() as c:
+            response = c.get(path, query_string=query_string, headers={"Authorization": "Bearer %s" % token})
+            self.assertEqual(response.status_code, 200)
+            return json.loads(response.data)
+
+    def test_concurrent_friend_requests(self):
+        with ThreadPoolExecutor(THREADS) as executor:
+            statuses = list(executor.map(lambda i: self.post("user%d" % i, '/user/friend_request',
+                                                             {"other_user_email": "hub@asd.com"}),
+                                         range(THREADS * 4)))
+        self.assertEqual(statuses, [200] * THREADS * 4)
+        requesters = [user["email"] for user in self.get("hub", '/user/friend_requests', {})]
+        self.assertEqual(sorted(requesters), sorted(["user%d@asd.com" % i for i in range(THREADS * 4)]))
+
+    def test_concurrent_conversations_do_not_mix(self):
+        for i in range(THREADS):
+            self.assertEqual(self.post("a%d" % i, '/user/friend_request', {"other_user_email": "b%d@asd.com" % i}),
+                             200)
+            self.assertEqual(self.post("b%d" % i, '/user/friend_request/accept',
+                                       {"other_user_email": "a%d@asd.com" % i}), 200)
+
+        def chat(i: int):
+            for j in range(MESSAGES_PER_CONVERSATION):
+                sender, receiver = ("a%d" % i, "b%d" % i) if j % 2 == 0 else ("b%d" % i, "a%d" % i)
+                self.assertEqual(self.post(sender, '/user/message', {"other_user_email": "%s@asd.com" % receiver,
+                                                                     "message": "%s %d" % (sender, j)}), 200)
+            return self.get("a%d" % i, '/user/messages_with', {"other_user_email": "b%d@asd.com" % i,
+                                                                "since": 0})["messages"]
+
+        with ThreadPoolExecutor(THREADS) as executor:
+            conversations = list(executor.map(chat, range(THREADS)))
+        for i, conversation in enumerate(conversations):
+            self.assertEqual([m["seq"] for m in conversation], list(range(1, MESSAGES_PER_CONVERSATION + 1)))
+            for j, message in enumerate(conversation):
+                sender = "a%d" % i if j % 2 == 0 else "b%d" % i
+                self.assertEqual(message["from_user"], "%s@asd.com" % sender)
+                self.assertEqual(message["message"], "%s %d" % (sender, j))
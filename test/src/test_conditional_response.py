@@ -0,0 +1,63 @@
+from src import conditional_response
+from src.conditional_response import Validator, VALIDATOR_LIFETIME_SECONDS
+from src.database.utils.resource_versions import ResourceVersion, INITIAL_VERSION
+from flask import Flask, request
+from datetime import datetime, timedelta
+from werkzeug.http import http_date
+
+NOW = 1600000000 + 30
+VERSION = ResourceVersion(version=3, last_modified=datetime.utcfromtimestamp(NOW - 10))
+
+app = Flask(__name__)
+
+def validator(monkeypatch, *parts, versions=(VERSION,), now=NOW) -> Validator:
+    monkeypatch.setattr(conditional_response.time, "time", lambda: now)
+    return Validator.from_versions(list(versions), *parts)
+
+def not_modified(validator: Validator, headers):
+    with app.test_request_context(headers=headers):
+        return validator.not_modified(request)
+
+def test_same_versions_same_validator(monkeypatch):
+    assert validator(monkeypatch, True) == validator(monkeypatch, True)
+    assert validator(monkeypatch, True).etag != validator(monkeypatch, False).etag
+    assert validator(monkeypatch).etag != validator(monkeypatch, versions=(VERSION._replace(version=4),)).etag
+
+def test_validator_changes_with_the_time(monkeypatch):
+    first = validator(monkeypatch, versions=(INITIAL_VERSION,))
+    assert first == validator(monkeypatch, versions=(INITIAL_VERSION,), now=NOW + 1)
+    later = validator(monkeypatch, versions=(INITIAL_VERSION,), now=NOW + VALIDATOR_LIFETIME_SECONDS)
+    assert later.etag != first.etag
+    assert later.last_modified > first.last_modified
+
+def test_last_modified_of_the_last_change(monkeypatch):
+    assert validator(monkeypatch).last_modified == VERSION.last_modified
+    assert validator(monkeypatch, versions=(INITIAL_VERSION,)).last_modified == \
+           datetime.utcfromtimestamp(NOW - NOW % VALIDATOR_LIFETIME_SECONDS)
+
+def test_not_modified_if_none_match(monkeypatch):
+    current = validator(monkeypatch)
+    response = not_modified(current, {"If-None-Match": 'W/"other", W/"%s"' % current.etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == 'W/"%s"' % current.etag
+    assert not_modified(current, {"If-None-Match": '"%s"' % current.etag}).status_code == 304
+    assert not_modified(current, {"If-None-Match": 'W/"other"'}) is None
+    assert not_modified(current, {}) is None
+
+def test_if_modified_since_is_ignored(monkeypatch):
+    current = validator(monkeypatch, True)
+    assert not_modified(current, {"If-Modified-Since": http_date(current.last_modified)}) is None
+    assert not_modified(current, {"If-Modified-Since": http_date(current.last_modified + timedelta(days=1))}) is None
+    assert not_modified(current, {"If-Modified-Since": http_date(current.last_modified),
+                                  "If-None-Match": 'W/"other"'}) is None
+    assert not_modified(current, {"If-Modified-Since": http_date(current.last_modified),
+                                  "If-None-Match": 'W/"%s"' % current.etag}).status_code == 304
+
+def test_add_to_response(monkeypatch):
+    current = validator(monkeypatch)
+    with app.test_request_context():
+        response = current.add_to(app.response_class("[]", mimetype="application/json"))
+    assert response.headers["ETag"] == 'W/"%s"' % current.etag
+    assert response.last_modified == current.last_modified
+    assert response.cache_control.private
+    assert response.cache_control.no_cache
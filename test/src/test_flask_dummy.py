@@ -1,4 +1,5 @@
-from create_application import create_application
+from create_application import create_application, create_asgi_application
+from test.src.asgi_requests import run_request
 import unittest
 import os
 from unittest.mock import MagicMock
@@ -35,3 +36,10 @@ class TestFlaskDummy(unittest.TestCase):
         with self.app.test_client() as c:
             response = c.get('/health')
             self.assertEqual(response.status_code, 200)
+
+    def test_api_health_asgi(self):
+        app = create_asgi_application()
+        start, body = run_request(app, "GET", "/health")
+        self.assertEqual(start["status"], 200)
+        with self.app.test_client() as c:
+            self.assertEqual(body, c.get('/health').data)
@@ -241,6 +241,38 @@ class TestFriendshipEndpoints(unittest.TestCase):
             self.assertEqual(response.status_code, 200)
             self.assertEqual(len(json.loads(response.data)),0)
 
+    def test_user_delete_frienship_removes_it_for_both_users(self):
+        AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
+        AuthServer.profile_query = MagicMock(return_value={"email": "gian@asd.com",
+                                                           "fullname": "Gianmarco",
+                                                           "password": "asd123",
+                                                           "phone_number": "1111",
+                                                           "photo": ""})
+        with self.app.test_client() as c:
+            response = c.post('/user/friend_request', json={"other_user_email": "gian@asd.com"},
+                              headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            AuthServer.get_logged_email = MagicMock(return_value="gian@asd.com")
+            response = c.post('/user/friend_request/accept', json={"other_user_email": "asd@asd.com"},
+                              headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            response = c.delete('/user/friend', query_string={"other_user_email": "asd@asd.com"},
+                                headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
+            response = c.get('/user/friends', query_string={"email": "asd@asd.com"},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(json.loads(response.data)),0)
+            response = c.post('/user/friend_request', json={"other_user_email": "gian@asd.com"},
+                              headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            AuthServer.get_logged_email = MagicMock(return_value="gian@asd.com")
+            response = c.get('/user/friend_requests',
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(json.loads(response.data)),1)
+
     def test_user_reject_friend_request_ok(self):
         AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
         AuthServer.profile_query = MagicMock(return_value={"email": "gian@asd.com",
@@ -345,3 +377,42 @@ class TestFriendshipEndpoints(unittest.TestCase):
             self.assertEqual(response.status_code, 200)
             status = json.loads(response.data)
             self.assertEqual(status["status"], "friends")
+
+    def test_user_list_friends_conditional_get(self):
+        AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
+        AuthServer.profile_query = MagicMock(return_value={"email": "gian@asd.com"})
+        with self.app.test_client() as c:
+            response = c.get('/user/friends', query_string={"email": "asd@asd.com"},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            etag = response.headers["ETag"]
+            response = c.get('/user/friends', query_string={"email": "asd@asd.com"},
+                             headers={"Authorization": "Bearer %s" % "asd123", "If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+            response = c.post('/user/friend_request', json={"other_user_email": "gian@asd.com"},
+                              headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            AuthServer.get_logged_email = MagicMock(return_value="gian@asd.com")
+            response = c.post('/user/friend_request/accept', json={"other_user_email": "asd@asd.com"},
+                              headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
+            response = c.get('/user/friends', query_string={"email": "asd@asd.com"},
+                             headers={"Authorization": "Bearer %s" % "asd123", "If-None-Match": etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(json.loads(response.data)), 1)
+
+    def test_user_list_friends_etag_kept_when_no_friendship_is_deleted(self):
+        AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
+        AuthServer.profile_query = MagicMock(return_value={"email": "gian@asd.com"})
+        with self.app.test_client() as c:
+            response = c.get('/user/friends', query_string={"email": "asd@asd.com"},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            etag = response.headers["ETag"]
+            response = c.delete('/user/friend', query_string={"other_user_email": "gian@asd.com"},
+                                headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            response = c.get('/user/friends', query_string={"email": "asd@asd.com"},
+                             headers={"Authorization": "Bearer %s" % "asd123", "If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+
@@ -7,12 +7,13 @@ from src.database.friends.exceptions.unexistent_requestor_user_error import Unex
 from src.database.friends.exceptions.unexistent_target_user_error import UnexistentTargetUserError
 from src.database.friends.exceptions.unexistent_friend_requests import UnexistentFriendRequest
 import os
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 import requests
 from typing import NamedTuple, Dict
 import json
 import time
 from src.database.notifications.postgres_expo_notification_database import PostgresExpoNotificationDatabase
+from src.events.local_event_bus import LocalEventBus
 
 class MockResponse(NamedTuple):
     json_dict: Dict
@@ -163,6 +164,141 @@ class TestMessagesEndpoints(unittest.TestCase):
             self.assertEqual(messages["messages"][0]["from_user"], "gian@asd.com")
             self.assertEqual(messages["messages"][1]["message"], "hola")
 
+    def test_send_and_get_messages_with_cursor(self):
+        AuthServer.profile_query = MagicMock(return_value={})
+        with self.app.test_client() as c:
+            for i in range(3):
+                AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
+                response = c.post('/user/message', json={"other_user_email": "gian@asd.com",
+                                                         "message": "hola %d" % i},
+                                  headers={"Authorization": "Bearer %s" % "asd123"})
+                self.assertEqual(response.status_code, 200)
+                AuthServer.get_logged_email = MagicMock(return_value="gian@asd.com")
+                response = c.post('/user/message', json={"other_user_email": "asd@asd.com",
+                                                         "message": "chau %d" % i},
+                                  headers={"Authorization": "Bearer %s" % "asd123"})
+                self.assertEqual(response.status_code, 200)
+
+            received = []
+            query_string = {"other_user_email": "asd@asd.com", "limit": 4}
+            while True:
+                response = c.get('/user/messages_with', query_string=query_string,
+                                 headers={"Authorization": "Bearer %s" % "asd123"})
+                self.assertEqual(response.status_code, 200)
+                page = json.loads(response.data)
+                self.assertTrue(len(page["messages"]) <= 4)
+                received += [m["message"] for m in page["messages"]]
+                if not page["next_cursor"]:
+                    break
+                query_string["before"] = page["next_cursor"]
+            self.assertEqual(received, ["chau 2", "hola 2", "chau 1", "hola 1", "chau 0", "hola 0"])
+
+    def test_get_messages_invalid_cursor(self):
+        AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
+        with self.app.test_client() as c:
+            response = c.get('/user/messages_with', query_string={"other_user_email": "gian@asd.com",
+                                                                  "before": "asd"},
+                              headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 400)
+            response = c.get('/user/messages_with', query_string={"other_user_email": "gian@asd.com",
+                                                                  "limit": 0},
+                              headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 400)
+
+    def test_get_messages_since_and_unread_counts(self):
+        AuthServer.profile_query = MagicMock(return_value={})
+        with self.app.test_client() as c:
+            AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
+            for i in range(2):
+                response = c.post('/user/message', json={"other_user_email": "gian@asd.com",
+                                                         "message": "hola %d" % i},
+                                  headers={"Authorization": "Bearer %s" % "asd123"})
+                self.assertEqual(response.status_code, 200)
+            AuthServer.get_logged_email = MagicMock(return_value="gian@asd.com")
+            response = c.get('/user/unread_counts', headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.data), {"asd@asd.com": 2})
+            response = c.get('/user/messages_with', query_string={"other_user_email": "asd@asd.com", "since": 1},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            new_messages = json.loads(response.data)["messages"]
+            self.assertEqual([(m["message"], m["seq"]) for m in new_messages], [("hola 1", 2)])
+            response = c.get('/user/unread_counts', headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(json.loads(response.data), {})
+            response = c.get('/user/messages_with', query_string={"other_user_email": "asd@asd.com", "since": 2},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.data), {"messages": []})
+            response = c.get('/user/messages_with', query_string={"other_user_email": "asd@asd.com", "since": -1},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("since", json.loads(response.data)["message"])
+            response = c.get('/user/messages_with', query_string={"other_user_email": "asd@asd.com", "since": 2,
+                                                                  "limit": 0},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("limit", json.loads(response.data)["message"])
+
+    def test_get_messages_since_truncated_by_limit(self):
+        AuthServer.profile_query = MagicMock(return_value={})
+        with self.app.test_client() as c:
+            AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
+            for i in range(3):
+                response = c.post('/user/message', json={"other_user_email": "gian@asd.com",
+                                                         "message": "hola %d" % i},
+                                  headers={"Authorization": "Bearer %s" % "asd123"})
+                self.assertEqual(response.status_code, 200)
+            AuthServer.get_logged_email = MagicMock(return_value="gian@asd.com")
+            response = c.get('/user/messages_with', query_string={"other_user_email": "asd@asd.com", "since": 0,
+                                                                  "limit": 2},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            new_messages = json.loads(response.data)["messages"]
+            self.assertEqual([m["seq"] for m in new_messages], [1, 2])
+            response = c.get('/user/unread_counts', headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(json.loads(response.data), {"asd@asd.com": 1})
+            response = c.get('/user/messages_with', query_string={"other_user_email": "asd@asd.com", "since": 2,
+                                                                  "limit": 2},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual([m["seq"] for m in json.loads(response.data)["messages"]], [3])
+            response = c.get('/user/unread_counts', headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(json.loads(response.data), {})
+
+    def test_send_message_when_the_event_cannot_be_published(self):
+        AuthServer.profile_query = MagicMock(return_value={})
+        with self.app.test_client() as c, \
+                patch.object(LocalEventBus, "publish", MagicMock(side_effect=ConnectionError)):
+            AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
+            response = c.post('/user/message', json={"other_user_email": "gian@asd.com",
+                                                     "message": "hola"},
+                              headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            AuthServer.get_logged_email = MagicMock(return_value="gian@asd.com")
+            response = c.get('/user/messages_with', query_string={"other_user_email": "asd@asd.com", "since": 0},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual([m["message"] for m in json.loads(response.data)["messages"]], ["hola"])
+
+    def test_events_stream_receives_messages(self):
+        AuthServer.profile_query = MagicMock(return_value={})
+        with self.app.test_client() as c:
+            AuthServer.get_logged_email = MagicMock(return_value="gian@asd.com")
+            events = c.get('/user/events', headers={"Authorization": "Bearer %s" % "asd123"}, buffered=False)
+            self.assertEqual(events.status_code, 200)
+            self.assertEqual(events.mimetype, "text/event-stream")
+            stream = iter(events.response)
+            self.assertEqual(next(stream), b": connected\n\n")
+
+            AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
+            response = c.post('/user/message', json={"other_user_email": "gian@asd.com",
+                                                     "message": "hola"},
+                              headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            event = next(stream).decode()
+            self.assertTrue(event.startswith("event: message\ndata: "))
+            self.assertEqual(json.loads(event.split("data: ")[1]),
+                             {"kind": "message", "from": "asd@asd.com", "message": "hola"})
+            events.close()
+
     def test_send_and_get_conversations(self):
         AuthServer.profile_query = MagicMock(return_value={})
         with self.app.test_client() as c:
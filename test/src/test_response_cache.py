@@ -0,0 +1,196 @@
+from src import response_cache
+from src.response_cache import ResponseCache
+from src.response_encoder import json_response
+from src.conditional_response import Validator
+from src.database.response_cache.shared_response_cache import SharedResponseCache, CachedResponse
+from src.database.utils.resource_versions import INITIAL_VERSION
+from src.events.local_event_bus import LocalEventBus
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from unittest.mock import MagicMock
+from flask import Flask, request
+import threading
+import pytest
+import json
+import time
+import uuid
+
+
+class InMemorySharedResponseCache(SharedResponseCache):
+    """
+    Shared tier of the tests, the workers are caches with the same instance
+    """
+    responses: Dict[str, Tuple[Optional[CachedResponse], List[str], Optional[str], float]]
+
+    def __init__(self):
+        self.responses = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            return self.responses.get(key, (None,))[0]
+
+    def acquire_refresh(self, key, tags, lease_seconds):
+        with self.lock:
+            response, _, lease, refreshing_until = self.responses.get(key, (None, [], None, 0))
+            if lease and refreshing_until > time.time():
+                return None
+            lease = uuid.uuid4().hex
+            self.responses[key] = (response, tags, lease, time.time() + lease_seconds)
+            return lease
+
+    def set(self, key, response, lease):
+        with self.lock:
+            if key in self.responses and self.responses[key][2] == lease:
+                self.responses[key] = (response, self.responses[key][1], None, 0)
+
+    def invalidate(self, tags):
+        with self.lock:
+            for key in [k for k, v in self.responses.items() if set(tags).intersection(v[1])]:
+                del self.responses[key]
+
+
+class Worker:
+    """
+    An app with a cached route that counts how many times it is computed
+    """
+
+    def __init__(self, event_bus: LocalEventBus, shared: Optional[SharedResponseCache] = None,
+                 ttl: float = 30, delay: float = 0):
+        self.cache = ResponseCache(event_bus, shared)
+        self.computed = 0
+        self.status = 200
+        self.app = Flask(__name__)
+
+        def top():
+            time.sleep(delay)
+            self.computed += 1
+            if self.status != 200:
+                return "error", self.status
+            response = json_response({"computed": self.computed, "page": request.args.get("page")})
+            return Validator.from_versions([INITIAL_VERSION]).add_to(response)
+
+        self.app.add_url_rule('/top', 'top', self.cache.cached(top, ttl=ttl, tags=["videos"]))
+        self.app.add_url_rule('/servers', 'servers', self.cache.cached(top, ttl=ttl))
+
+    def get(self, path: str = '/top', **kwargs):
+        with self.app.test_client() as c:
+            return c.get(path, **kwargs)
+
+
+@pytest.fixture
+def event_bus():
+    return LocalEventBus()
+
+
+def test_caches_until_ttl(event_bus):
+    worker = Worker(event_bus, ttl=0.2)
+    assert json.loads(worker.get().data)["computed"] == 1
+    assert json.loads(worker.get().data)["computed"] == 1
+    assert worker.get(query_string={"page": "2"}).status_code == 200
+    assert worker.computed == 2
+    time.sleep(0.3)
+    assert json.loads(worker.get().data)["computed"] == 3
+
+
+def test_cached_response_is_conditional(event_bus):
+    worker = Worker(event_bus)
+    etag = worker.get().headers["ETag"]
+    response = worker.get(headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert worker.computed == 1
+
+
+def test_errors_are_not_cached(event_bus):
+    worker = Worker(event_bus)
+    worker.status = 500
+    assert worker.get().status_code == 500
+    assert worker.get().status_code == 500
+    assert worker.computed == 2
+
+
+def test_invalidate_by_tag(event_bus):
+    worker = Worker(event_bus)
+    worker.get()
+    worker.get('/servers')
+    worker.cache.invalidate("videos", "videos:asd@asd.com")
+    worker.get()
+    worker.get('/servers')
+    assert worker.computed == 3
+
+
+def test_invalidate_when_the_event_cannot_be_published(monkeypatch, event_bus):
+    worker = Worker(event_bus)
+    worker.get()
+    monkeypatch.setattr(event_bus, "publish", MagicMock(side_effect=ConnectionError))
+    worker.cache.invalidate("videos")
+    worker.get()
+    assert worker.computed == 2
+
+
+def test_invalidate_other_workers(event_bus):
+    worker, other_worker = Worker(event_bus), Worker(event_bus)
+    worker.get()
+    other_worker.get()
+    worker.cache.invalidate("videos")
+    other_worker.get()
+    assert other_worker.computed == 2
+
+
+def test_invalidated_while_computing_is_not_cached(event_bus):
+    worker = Worker(event_bus, delay=0.2)
+    with ThreadPoolExecutor(1) as executor:
+        future = executor.submit(worker.get)
+        time.sleep(0.1)
+        worker.cache.invalidate("videos")
+        future.result()
+    worker.get()
+    assert worker.computed == 2
+
+
+def test_concurrent_misses_compute_once(event_bus):
+    worker = Worker(event_bus, delay=0.2)
+    with ThreadPoolExecutor(8) as executor:
+        responses = list(executor.map(lambda _: worker.get(), range(8)))
+    assert [json.loads(r.data)["computed"] for r in responses] == [1] * 8
+    assert worker.computed == 1
+
+
+def test_expired_response_sent_while_recomputing(event_bus):
+    worker = Worker(event_bus, ttl=0.1, delay=0.2)
+    worker.get()
+    time.sleep(0.15)
+    with ThreadPoolExecutor(4) as executor:
+        responses = list(executor.map(lambda _: worker.get(), range(4)))
+    assert sorted(json.loads(r.data)["computed"] for r in responses) == [1, 1, 1, 2]
+    assert worker.computed == 2
+
+
+def test_shared_between_workers(event_bus):
+    shared = InMemorySharedResponseCache()
+    worker, other_worker = Worker(event_bus, shared), Worker(event_bus, shared)
+    worker.get()
+    assert json.loads(other_worker.get().data)["computed"] == 1
+    assert other_worker.computed == 0
+    other_worker.cache.invalidate("videos")
+    assert json.loads(worker.get().data)["computed"] == 2
+
+
+def test_only_one_worker_recomputes(monkeypatch, event_bus):
+    monkeypatch.setattr(response_cache, "SHARED_POLL_SECONDS", 0.01)
+    shared = InMemorySharedResponseCache()
+    workers = [Worker(event_bus, shared, delay=0.2) for _ in range(4)]
+    with ThreadPoolExecutor(4) as executor:
+        responses = list(executor.map(lambda worker: worker.get(), workers))
+    assert [r.status_code for r in responses] == [200] * 4
+    assert sum(worker.computed for worker in workers) == 1
+
+
+def test_shared_cache_errors_fall_back_to_compute(event_bus):
+    shared = InMemorySharedResponseCache()
+    shared.get = None
+    worker = Worker(event_bus, shared)
+    assert worker.get().status_code == 200
+    assert worker.get().status_code == 200
+    assert worker.computed == 1
@@ -0,0 +1,98 @@
+from src import response_compression
+from src.response_compression import compress_response, CompressedBodyCache, MIN_COMPRESS_SIZE, SharedBodyResponse
+from src.response_encoder import json_response, streamed_json_response
+from flask import Flask, Response, request
+import pytest
+import json
+import zlib
+
+BODY = [{"email": "user%d@asd.com" % i, "description": "Un video muy largo " * 10} for i in range(50)]
+
+app = Flask(__name__)
+
+def compressed(response: Response, accept_encoding: str = "gzip, deflate, br") -> Response:
+    with app.test_request_context(headers={"Accept-Encoding": accept_encoding}):
+        response = compress_response(request, response)
+        response.set_data(b"".join(response.response))
+        return response
+
+def gunzip(data: bytes) -> bytes:
+    return zlib.decompress(data, 31)
+
+def test_json_is_gzipped(monkeypatch):
+    monkeypatch.setattr(response_compression, "brotli", None)
+    response = compressed(json_response(BODY))
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.vary
+    assert int(response.headers["Content-Length"]) == len(response.get_data())
+    assert json.loads(gunzip(response.get_data())) == BODY
+
+@pytest.mark.skipif(response_compression.brotli is None, reason="brotli is not installed")
+def test_brotli_is_preferred():
+    response = compressed(json_response(BODY))
+    assert response.headers["Content-Encoding"] == "br"
+    assert json.loads(response_compression.brotli.decompress(response.get_data())) == BODY
+    assert compressed(json_response(BODY), "gzip;q=1, br;q=0.5").headers["Content-Encoding"] == "gzip"
+
+def test_not_accepted_encodings_are_not_used():
+    assert "Content-Encoding" not in compressed(json_response(BODY), "").headers
+    assert "Content-Encoding" not in compressed(json_response(BODY), "gzip;q=0, deflate").headers
+
+def test_small_bodies_are_not_compressed():
+    response = compressed(json_response({"status": "ok"}))
+    assert len(response.get_data()) < MIN_COMPRESS_SIZE
+    assert "Content-Encoding" not in response.headers
+    assert "Accept-Encoding" in response.vary
+
+def test_compressed_content_is_not_compressed_again():
+    assert "Content-Encoding" not in compressed(Response(b"\xff" * 4096, mimetype="image/jpeg")).headers
+    assert "Content-Encoding" not in compressed(Response(b"data: hola\n\n" * 1024,
+                                                        mimetype="text/event-stream")).headers
+    encoded = Response(zlib.compress(b"a" * 4096), mimetype="application/json", headers={"Content-Encoding": "deflate"})
+    assert compressed(encoded).headers["Content-Encoding"] == "deflate"
+
+def test_errors_are_not_compressed():
+    assert "Content-Encoding" not in compressed(json_response(BODY, 500)).headers
+
+def test_streamed_json_is_gzipped(monkeypatch):
+    monkeypatch.setattr(response_compression, "brotli", None)
+    with app.test_request_context(headers={"Accept-Encoding": "gzip"}):
+        response = compress_response(request, streamed_json_response(iter(BODY)))
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Content-Length" not in response.headers
+        chunks = list(response.response)
+    assert json.loads(gunzip(b"".join(chunks))) == BODY
+    # Every chunk can be decompressed as soon as it arrives
+    decompressor = zlib.decompressobj(31)
+    assert decompressor.decompress(chunks[0])
+
+def test_same_body_is_compressed_once(monkeypatch):
+    compressions = []
+    compress = response_compression.compress
+    monkeypatch.setattr(response_compression, "compress",
+                        lambda body, encoding: compressions.append(encoding) or compress(body, encoding))
+    cache = CompressedBodyCache()
+    body = json.dumps(BODY).encode()
+    assert gunzip(cache.compress(body, "gzip")) == body
+    assert gunzip(cache.compress(body, "gzip")) == body
+    assert compressions == ["gzip"]
+
+def test_only_shared_bodies_are_cached(monkeypatch):
+    monkeypatch.setattr(response_compression, "brotli", None)
+    monkeypatch.setattr(response_compression, "compressed_bodies", CompressedBodyCache())
+    body = json.dumps(BODY).encode()
+    private = compressed(Response(body, mimetype="application/json"))
+    assert json.loads(gunzip(private.get_data())) == BODY
+    assert response_compression.compressed_bodies.entries == {}
+    shared = compressed(SharedBodyResponse(body, mimetype="application/json"))
+    assert json.loads(gunzip(shared.get_data())) == BODY
+    assert ("gzip", body) in response_compression.compressed_bodies.entries
+
+def test_compressed_cache_is_bounded():
+    cache = CompressedBodyCache(max_bytes=3000)
+    bodies = [(b"%d" % i) * 1000 for i in range(5)]
+    for body in bodies:
+        cache.compress(body, "gzip")
+    assert cache.size <= 3000
+    assert ("gzip", bodies[-1]) in cache.entries
+    assert ("gzip", bodies[0]) not in cache.entries
@@ -0,0 +1,105 @@
+from src import response_encoder
+from src.response_encoder import dumps, json_response, encode_reactions, stream_json, streamed_json_response, \
+    STREAM_ERROR_MARKER
+from src.database.videos.video_database import VideoData, Comment, Reaction
+from src.database.friends.friend_database import PrivateMessage
+from datetime import datetime, date
+from flask import Flask
+import pytest
+import json
+
+TIMESTAMP = datetime(2020, 6, 1, 12, 30, 5, 1234)
+
+RESPONSE = {"video": VideoData(title="Título", location="Buenos Aires", creation_time=TIMESTAMP,
+                               file_location="wwww.google.com/video", visible=True, description="ñandú"),
+            "reactions": encode_reactions({Reaction.like: 2, Reaction.dislike: 1}),
+            "comments": [{"user": {"email": "asd@asd.com"}, "comment": Comment(content="hola", timestamp=TIMESTAMP)}],
+            "messages": [PrivateMessage(from_user="asd@asd.com", to_user="qwe@qwe.com", timestamp=TIMESTAMP,
+                                        message="hola", seq=1)],
+            "day": date(2020, 6, 1),
+            "by_status": {200: 3, 404: 1},
+            "cursor": None}
+
+def test_named_tuples_and_dates_are_encoded():
+    assert json.loads(dumps(RESPONSE)) == {
+        "video": {"title": "Título", "location": "Buenos Aires", "creation_time": TIMESTAMP.isoformat(),
+                  "file_location": "wwww.google.com/video", "visible": True, "description": "ñandú"},
+        "reactions": {"like": 2, "dislike": 1},
+        "comments": [{"user": {"email": "asd@asd.com"},
+                      "comment": {"content": "hola", "timestamp": TIMESTAMP.isoformat()}}],
+        "messages": [{"from_user": "asd@asd.com", "to_user": "qwe@qwe.com", "timestamp": TIMESTAMP.isoformat(),
+                      "message": "hola", "seq": 1}],
+        "day": "2020-06-01",
+        "by_status": {"200": 3, "404": 1},
+        "cursor": None}
+
+FLOATS = {"mean_time": 0.1, "tiny": 0.00001, "huge": 1e16, "negative": -2.5e-8, "whole": 3.0}
+
+@pytest.mark.skipif(response_encoder.orjson is None, reason="orjson is not installed")
+def test_standard_json_and_orjson_give_the_same_bytes(monkeypatch):
+    orjson_bytes = dumps(RESPONSE)
+    orjson_floats = dumps(FLOATS)
+    monkeypatch.setattr(response_encoder, "orjson", None)
+    assert dumps(RESPONSE) == orjson_bytes
+    # The floats keep their values but not their notation
+    assert json.loads(dumps(FLOATS)) == json.loads(orjson_floats) == FLOATS
+
+def test_unknown_types_are_not_encoded():
+    with pytest.raises(TypeError):
+        dumps({"object": object()})
+
+def test_json_response():
+    response = json_response([Comment(content="hola", timestamp=TIMESTAMP)], 201)
+    assert response.status_code == 201
+    assert response.mimetype == "application/json"
+    assert json.loads(response.get_data()) == [{"content": "hola", "timestamp": TIMESTAMP.isoformat()}]
+
+def test_streamed_json_gives_the_same_bytes():
+    comments = [{"user": {"email": "asd%d@asd.com" % i}, "comment": Comment(content="hola %d" % i, timestamp=TIMESTAMP)}
+                for i in range(100)]
+    assert b"".join(stream_json(iter(comments), 64)) == dumps(comments)
+    assert b"".join(stream_json(comments)) == dumps(comments)
+    assert b"".join(stream_json({"results": iter(comments), "next_cursor": None, "total": 100}, 64)) == \
+           dumps({"results": comments, "next_cursor": None, "total": 100})
+    assert b"".join(stream_json(iter([]))) == dumps([])
+    assert b"".join(stream_json(RESPONSE)) == dumps(RESPONSE)
+
+def test_streamed_json_is_sent_in_chunks():
+    chunks = list(stream_json(({"number": i} for i in range(1000)), 1024))
+    assert len(chunks) > 1
+    assert all(len(chunk) >= 1024 for chunk in chunks[:-1])
+
+def test_streamed_json_is_encoded_while_it_is_sent():
+    consumed = []
+
+    def elements():
+        for i in range(3):
+            consumed.append(i)
+            yield {"number": i}
+
+    with Flask(__name__).test_request_context():
+        response = streamed_json_response(elements())
+        assert consumed == []
+        assert response.mimetype == "application/json"
+        assert response.is_streamed
+        assert json.loads(b"".join(response.response)) == [{"number": 0}, {"number": 1}, {"number": 2}]
+
+def failing_elements(amount: int):
+    for i in range(amount):
+        yield {"number": i}
+    raise ConnectionError
+
+def test_streamed_json_error_before_sending_is_raised():
+    chunks = stream_json(failing_elements(3), 1024)
+    with pytest.raises(ConnectionError):
+        next(chunks)
+
+def test_streamed_json_error_after_sending_invalidates_the_json():
+    chunks = stream_json(failing_elements(1000), 1024)
+    sent = [next(chunks)]
+    with pytest.raises(ConnectionError):
+        for chunk in chunks:
+            sent.append(chunk)
+    assert sent[-1] == STREAM_ERROR_MARKER
+    with pytest.raises(ValueError):
+        json.loads(b"".join(sent))
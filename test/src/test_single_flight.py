@@ -0,0 +1,141 @@
+from src.single_flight import SingleFlight, single_flight, single_flights
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
+import pytest
+import time
+
+CALLS = 8
+
+
+class SlowDatabase:
+    def __init__(self):
+        self.executions = 0
+        self.lock = threading.Lock()
+
+    @single_flight
+    def list_user_videos(self, user_email: str, fail: bool = False):
+        with self.lock:
+            self.executions += 1
+        time.sleep(0.2)
+        if fail:
+            raise ValueError(user_email)
+        return [user_email]
+
+    @single_flight
+    def search_many(self, user_emails):
+        with self.lock:
+            self.executions += 1
+        return user_emails
+
+
+def test_concurrent_identical_calls_execute_once():
+    database = SlowDatabase()
+    with ThreadPoolExecutor(CALLS) as executor:
+        results = list(executor.map(lambda _: database.list_user_videos("asd@asd.com"), range(CALLS)))
+    assert results == [["asd@asd.com"]] * CALLS
+    assert database.executions == 1
+    statistics = single_flights.get_statistics()["SlowDatabase.list_user_videos"]
+    assert statistics.coalesced >= CALLS - 1
+
+
+def test_different_arguments_execute_separately():
+    database = SlowDatabase()
+    with ThreadPoolExecutor(CALLS) as executor:
+        results = list(executor.map(lambda i: database.list_user_videos("%d@asd.com" % (i % 2)), range(CALLS)))
+    assert sorted(results) == sorted([["0@asd.com"], ["1@asd.com"]] * (CALLS // 2))
+    assert database.executions == 2
+
+
+def test_different_objects_execute_separately():
+    databases = [SlowDatabase(), SlowDatabase()]
+    with ThreadPoolExecutor(2) as executor:
+        list(executor.map(lambda database: database.list_user_videos("asd@asd.com"), databases))
+    assert [database.executions for database in databases] == [1, 1]
+
+
+def test_consecutive_calls_are_not_cached():
+    database = SlowDatabase()
+    database.list_user_videos("asd@asd.com")
+    database.list_user_videos("asd@asd.com")
+    assert database.executions == 2
+
+
+def test_errors_are_shared():
+    database = SlowDatabase()
+
+    def call(_):
+        with pytest.raises(ValueError) as error:
+            database.list_user_videos("asd@asd.com", fail=True)
+        return error.value
+    with ThreadPoolExecutor(CALLS) as executor:
+        errors = list(executor.map(call, range(CALLS)))
+    assert database.executions == 1
+    assert len({id(error) for error in errors}) == CALLS
+    raised = [error for error in errors if error.__cause__ is None]
+    assert len(raised) == 1
+    assert all(error.__cause__ is raised[0] for error in errors if error is not raised[0])
+    assert all(error.args == ("asd@asd.com",) for error in errors)
+    assert database.list_user_videos("asd@asd.com") == ["asd@asd.com"]
+
+
+def test_every_caller_gets_its_own_result():
+    database = SlowDatabase()
+    with ThreadPoolExecutor(CALLS) as executor:
+        results = list(executor.map(lambda _: database.list_user_videos("asd@asd.com"), range(CALLS)))
+    assert database.executions == 1
+    assert len({id(result) for result in results}) == CALLS
+    results[0].append("qwe@qwe.com")
+    assert results[1:] == [["asd@asd.com"]] * (CALLS - 1)
+
+
+def test_uncopyable_errors_are_chained():
+    class UncopyableError(Exception):
+        def __init__(self, code):
+            super().__init__()
+            self.code = code
+
+    group = SingleFlight()
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        time.sleep(0.2)
+        raise UncopyableError(1)
+
+    with ThreadPoolExecutor(1) as executor:
+        leader = executor.submit(group.do, "method", "key", fail)
+        started.wait()
+        with pytest.raises(RuntimeError) as error:
+            group.do("method", "key", fail)
+        assert isinstance(error.value.__cause__, UncopyableError)
+        with pytest.raises(UncopyableError):
+            leader.result()
+
+
+def test_unhashable_arguments_are_not_coalesced():
+    database = SlowDatabase()
+    assert database.search_many(["asd@asd.com"]) == ["asd@asd.com"]
+    assert database.executions == 1
+
+
+def test_calls_from_the_event_loop_threads():
+    database = SlowDatabase()
+
+    async def run(executor: ThreadPoolExecutor):
+        loop = asyncio.get_event_loop()
+        return await asyncio.gather(*[loop.run_in_executor(executor, database.list_user_videos, "asd@asd.com")
+                                      for _ in range(CALLS)])
+    with ThreadPoolExecutor(CALLS) as executor:
+        assert asyncio.run(run(executor)) == [["asd@asd.com"]] * CALLS
+    assert database.executions == 1
+
+
+def test_statistics():
+    group = SingleFlight()
+    assert group.get_statistics() == {}
+    group.do("method", "key", lambda: 1)
+    group.do("method", "key", lambda: 1)
+    statistics = group.get_statistics()["method"]
+    assert (statistics.calls, statistics.executions, statistics.coalesced) == (2, 2, 0)
+    assert statistics.coalescing_ratio == 0.0
@@ -5,8 +5,12 @@ from src.services.auth_server import AuthServer
 from src.services.exceptions.invalid_video_format_error import InvalidVideoFormatError
 from src.services.exceptions.unexistent_video_error import UnexistentVideoError
 from src.database.notifications.postgres_expo_notification_database import PostgresExpoNotificationDatabase
+from src.database.videos.video_ram_database import RamVideoDatabase
+from src.database.friends.ram_friend_database import RamFriendDatabase
+from src.model.photo import DEFAULT_PHOTO, Photo
 import os
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
+from src.events.local_event_bus import LocalEventBus
 import requests
 from typing import NamedTuple, Dict
 from io import BytesIO
@@ -92,6 +96,26 @@ class TestVideoEndpoints(unittest.TestCase):
                               headers={"Authorization": "Bearer %s" % "asd123"})
             self.assertEqual(response.status_code, 200)
 
+    def test_video_changes_when_the_invalidation_cannot_be_published(self):
+        AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
+        MediaServer.upload_video = MagicMock(return_value="")
+        with self.app.test_client() as c, \
+                patch.object(LocalEventBus, "publish", MagicMock(side_effect=ConnectionError)):
+            response = c.post('/user/video', query_string={"email": "asd@asd.com"},
+                              data={"title": "Hola", "location": "Buenos Aires",
+                                    "visible": "true", "video": (BytesIO(), 'video')},
+                              headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            response = c.post('/videos/reaction', json={"target_email": "asd@asd.com",
+                                                        "video_title": "Hola",
+                                                        "reaction": "like"},
+                              headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            response = c.get('/user/videos', query_string={"email": "asd@asd.com"},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(len(json.loads(response.data)), 1)
+            self.assertEqual(json.loads(response.data)[0]["reactions"]["like"], 1)
+
     def test_user_upload_two_videos_ok(self):
         AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
         MediaServer.upload_video = MagicMock(return_value="")
@@ -298,6 +322,78 @@ class TestVideoEndpoints(unittest.TestCase):
             self.assertEqual(data[3]["video"]["title"], "Hola")
             self.assertEqual(data[4]["video"]["title"], "Nada")
 
+    def test_user_upload_videos_and_search_paginated(self):
+        AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
+        MediaServer.upload_video = MagicMock(return_value="")
+        with self.app.test_client() as c:
+            for title in ["Hola", "Hola como", "Hola como estas"]:
+                response = c.post('/user/video', query_string={"email": "asd@asd.com"},
+                                  data={"title": title, "location": "Buenos Aires",
+                                        "visible": "true", "video": (BytesIO(), 'video')},
+                                  headers={"Authorization": "Bearer %s" % "asd123"})
+                self.assertEqual(response.status_code, 200)
+            response = c.get('/videos/search', query_string={"query": "hola como estas", "limit": 2,
+                                                             "with_total": "true"},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.data)
+            self.assertEqual(data["total"], 3)
+            self.assertEqual(len(data["results"]), 2)
+            self.assertEqual(data["results"][0]["video"]["title"], "Hola como estas")
+            self.assertEqual(data["results"][1]["video"]["title"], "Hola como")
+            response = c.get('/videos/search', query_string={"query": "hola como estas", "limit": 2,
+                                                             "cursor": data["next_cursor"]},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.data)
+            self.assertEqual(data["total"], None)
+            self.assertEqual(data["next_cursor"], None)
+            self.assertEqual(len(data["results"]), 1)
+            self.assertEqual(data["results"][0]["video"]["title"], "Hola")
+
+    def test_user_search_paginated_with_private_videos(self):
+        MediaServer.upload_video = MagicMock(return_value="")
+        with self.app.test_client() as c:
+            for email, title, visible in [("asd@asd.com", "Hola", "true"),
+                                          ("asd@asd.com", "Hola como", "false"),
+                                          ("stranger@asd.com", "Hola como estas", "false"),
+                                          ("friend@asd.com", "Hola como estas amigo", "false"),
+                                          ("stranger@asd.com", "Chau", "true")]:
+                AuthServer.get_logged_email = MagicMock(return_value=email)
+                response = c.post('/user/video', query_string={"email": email},
+                                  data={"title": title, "location": "Buenos Aires",
+                                        "visible": visible, "video": (BytesIO(), 'video')},
+                                  headers={"Authorization": "Bearer %s" % "asd123"})
+                self.assertEqual(response.status_code, 200)
+            AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
+            with patch.object(RamFriendDatabase, "get_friends", MagicMock(return_value=["friend@asd.com"])):
+                response = c.get('/videos/search', query_string={"query": "hola como estas", "limit": 2,
+                                                                 "with_total": "true"},
+                                 headers={"Authorization": "Bearer %s" % "asd123"})
+                self.assertEqual(response.status_code, 200)
+                data = json.loads(response.data)
+                self.assertEqual(data["total"], 3)
+                self.assertEqual([r["video"]["title"] for r in data["results"]],
+                                 ["Hola como estas amigo", "Hola como"])
+                response = c.get('/videos/search', query_string={"query": "hola como estas", "limit": 2,
+                                                                 "cursor": data["next_cursor"]},
+                                 headers={"Authorization": "Bearer %s" % "asd123"})
+                self.assertEqual(response.status_code, 200)
+                data = json.loads(response.data)
+                self.assertEqual([r["video"]["title"] for r in data["results"]], ["Hola"])
+                self.assertEqual(data["next_cursor"], None)
+
+    def test_user_search_invalid_pagination(self):
+        AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
+        with self.app.test_client() as c:
+            for limit in [0, -3, "asd"]:
+                response = c.get('/videos/search', query_string={"query": "hola", "limit": limit},
+                                 headers={"Authorization": "Bearer %s" % "asd123"})
+                self.assertEqual(response.status_code, 400)
+            response = c.get('/videos/search', query_string={"query": "hola", "cursor": "asd"},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 400)
+
     def test_video_reaction_not_json(self):
         AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
         MediaServer.upload_video = MagicMock(return_value="")
@@ -474,6 +570,15 @@ class TestVideoEndpoints(unittest.TestCase):
             self.assertEqual(json.loads(response.data)[0]["reactions"]["like"], 0)
             self.assertEqual(json.loads(response.data)[0]["reactions"]["dislike"], 0)
 
+            etag = response.headers["ETag"]
+            response = c.delete('/videos/reaction', query_string={"target_email": "asd@asd.com",
+                                                                  "video_title": "Hola"},
+                                headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            response = c.get('/user/videos', query_string={"email": "asd@asd.com"},
+                             headers={"Authorization": "Bearer %s" % "asd123", "If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+
     def test_list_videos_missing_params(self):
         AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
         MediaServer.upload_video = MagicMock(return_value="")
@@ -530,3 +635,158 @@ class TestVideoEndpoints(unittest.TestCase):
             response = c.get('/videos', query_string={"page": 1, "per_page": 2},
                              headers={"Authorization": "Bearer %s" % "asd123"})
             self.assertEqual(response.status_code, 404)
+
+    def test_list_videos_by_cursor(self):
+        AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
+        AuthServer.profile_query = MagicMock(return_value={"admin": True})
+        MediaServer.upload_video = MagicMock(return_value="")
+        with self.app.test_client() as c:
+            for title in ["Titulo", "Titulo 2", "Titulo 3"]:
+                c.post('/user/video', query_string={"email": "asd@asd.com"},
+                       data={"title": title, "location": "Buenos Aires",
+                             "visible": "true", "video": (BytesIO(), 'video')},
+                       headers={"Authorization": "Bearer %s" % "asd123"})
+            response = c.get('/videos', query_string={"limit": 2},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            page = json.loads(response.data)
+            self.assertEqual(page["total"], 3)
+            self.assertEqual([r["video"]["title"] for r in page["results"]], ["Titulo 3", "Titulo 2"])
+            response = c.get('/videos', query_string={"limit": 2, "cursor": page["next_cursor"]},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            page = json.loads(response.data)
+            self.assertEqual([r["video"]["title"] for r in page["results"]], ["Titulo"])
+            self.assertIsNone(page["next_cursor"])
+            response = c.get('/videos', query_string={"cursor": "asd"},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 400)
+            response = c.get('/videos', query_string={"limit": 0},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 400)
+
+    def test_video_deleted_and_uploaded_again_has_no_reactions(self):
+        AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
+        MediaServer.upload_video = MagicMock(return_value="")
+        MediaServer.delete_video = MagicMock(return_value=None)
+        with self.app.test_client() as c:
+            response = c.get('/user/videos', query_string={"email": "asd@asd.com"},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.data), [])
+            c.post('/user/video', query_string={"email": "asd@asd.com"},
+                   data={"title": "Hola", "location": "Buenos Aires",
+                         "visible": "true", "video": (BytesIO(), 'video')},
+                   headers={"Authorization": "Bearer %s" % "asd123"})
+            c.post('/videos/reaction', json={"target_email": "asd@asd.com", "video_title": "Hola",
+                                             "reaction": "like"},
+                   headers={"Authorization": "Bearer %s" % "asd123"})
+            response = c.delete('/user/video', query_string={"email": "asd@asd.com",
+                                                             "video_title": "Hola"},
+                                headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            c.post('/user/video', query_string={"email": "asd@asd.com"},
+                   data={"title": "Hola", "location": "Buenos Aires",
+                         "visible": "true", "video": (BytesIO(), 'video')},
+                   headers={"Authorization": "Bearer %s" % "asd123"})
+            response = c.get('/user/videos', query_string={"email": "asd@asd.com"},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(len(json.loads(response.data)), 1)
+            self.assertEqual(json.loads(response.data)[0]["reactions"]["like"], 0)
+            response = c.get('/videos/reaction', query_string={"target_email": "asd@asd.com",
+                                                               "video_title": "Hola"},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(json.loads(response.data)["reaction"], None)
+
+    def test_user_photo(self):
+        get_user_photo = RamVideoDatabase.get_user_photo
+        photo_hash = Photo.content_hash(DEFAULT_PHOTO)
+        photos = {photo_hash: DEFAULT_PHOTO, "broken": "bm90IGFuIGltYWdl"}
+        RamVideoDatabase.get_user_photo = MagicMock(side_effect=photos.get)
+        AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
+        headers = {"Authorization": "Bearer %s" % "asd123"}
+        try:
+            with self.app.test_client() as c:
+                response = c.get('/user/photo/%s' % photo_hash)
+                self.assertEqual(response.status_code, 401)
+                response = c.get('/user/photo/%s' % photo_hash, headers=headers)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.mimetype, "image/png")
+                self.assertEqual(response.data, Photo(DEFAULT_PHOTO).get_bytes())
+                self.assertIn("max-age", response.headers["Cache-Control"])
+                self.assertIn("private", response.headers["Cache-Control"])
+                etag = response.headers["ETag"]
+                response = c.get('/user/photo/%s' % photo_hash, headers=dict(headers, **{"If-None-Match": etag}))
+                self.assertEqual(response.status_code, 304)
+                response = c.get('/user/photo/asd', headers=headers)
+                self.assertEqual(response.status_code, 404)
+                response = c.get('/user/photo/broken', headers=headers)
+                self.assertEqual(response.status_code, 404)
+                self.assertIn("broken", json.loads(response.data)["message"])
+        finally:
+            RamVideoDatabase.get_user_photo = get_user_photo
+
+    def test_user_list_videos_conditional_get(self):
+        AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
+        MediaServer.upload_video = MagicMock(return_value="")
+        with self.app.test_client() as c:
+            response = c.post('/user/video', query_string={"email": "asd@asd.com"},
+                              data={"title": "Titulo", "location": "Buenos Aires",
+                                    "visible": "true", "video": (BytesIO(), 'video')},
+                              headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            response = c.get('/user/videos', query_string={"email": "asd@asd.com"},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            etag = response.headers["ETag"]
+            self.assertIsNotNone(response.last_modified)
+            response = c.get('/user/videos', query_string={"email": "asd@asd.com"},
+                             headers={"Authorization": "Bearer %s" % "asd123", "If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.headers["ETag"], etag)
+            self.assertEqual(response.data, b"")
+            response = c.post('/user/video', query_string={"email": "asd@asd.com"},
+                              data={"title": "Titulo 2", "location": "Buenos Aires",
+                                    "visible": "true", "video": (BytesIO(), 'video')},
+                              headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            response = c.get('/user/videos', query_string={"email": "asd@asd.com"},
+                             headers={"Authorization": "Bearer %s" % "asd123", "If-None-Match": etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response.headers["ETag"], etag)
+            self.assertEqual(len(json.loads(response.data)), 2)
+
+    def test_user_list_videos_etag_depends_on_private_videos_visibility(self):
+        AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
+        with self.app.test_client() as c:
+            response = c.get('/user/videos', query_string={"email": "asd@asd.com"},
+                             headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            etag = response.headers["ETag"]
+            AuthServer.get_logged_email = MagicMock(return_value="gian@asd.com")
+            response = c.get('/user/videos', query_string={"email": "asd@asd.com"},
+                             headers={"Authorization": "Bearer %s" % "asd123", "If-None-Match": etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_top_videos_conditional_get(self):
+        AuthServer.get_logged_email = MagicMock(return_value="asd@asd.com")
+        AuthServer.profile_query = MagicMock(return_value={"email": "asd@asd.com"})
+        MediaServer.upload_video = MagicMock(return_value="")
+        with self.app.test_client() as c:
+            response = c.get('/videos/top')
+            self.assertEqual(response.status_code, 200)
+            etag, last_modified = response.headers["ETag"], response.headers["Last-Modified"]
+            response = c.get('/videos/top', headers={"If-Modified-Since": last_modified})
+            self.assertEqual(response.status_code, 200)
+            response = c.get('/videos/top', headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+            response = c.post('/user/video', query_string={"email": "asd@asd.com"},
+                              data={"title": "Titulo", "location": "Buenos Aires",
+                                    "visible": "true", "video": (BytesIO(), 'video')},
+                              headers={"Authorization": "Bearer %s" % "asd123"})
+            self.assertEqual(response.status_code, 200)
+            response = c.get('/videos/top', headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(json.loads(response.data)), 1)
+